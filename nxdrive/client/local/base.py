@@ -11,15 +11,25 @@
 from pathlib import Path
 from tempfile import mkdtemp
 from time import mktime, strptime
-from typing import Any, Callable, List, Optional, Tuple, Type, Union
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    Union,
+)
 
 from nuxeo.utils import get_digest_algorithm
 
-from ...constants import LINUX, MAC, ROOT
+from ...constants import LINUX, MAC, ROOT, UNACCESSIBLE_HASH
 from ...exceptions import DuplicationDisabledError, NotFound, UnknownDigest
 from ...options import Options
 from ...utils import (
-    compute_digest,
+    compute_digests,
     force_decode,
     lock_path,
     path_is_unc_name,
@@ -31,6 +41,9 @@
     unset_path_readonly,
 )
 
+if TYPE_CHECKING:
+    from ...engine.digest_cache import DigestCache  # noqa
+
 __all__ = ("FileInfo", "get")
 
 log = getLogger(__name__)
@@ -49,6 +62,7 @@ def __init__(
         *,
         digest_func: str = "md5",
         digest_callback: Callable = None,
+        digest_cache: "DigestCache" = None,
         remote_ref: str = "",
         size: int = 0,
     ) -> None:
@@ -56,14 +70,21 @@ def __init__(
         # computation if the synchronization thread needs to be suspended
         self.digest_callback = digest_callback
 
+        # Digests of unchanged files are not computed again
+        self.digest_cache = digest_cache
+
         filepath = root / path
-        self.path = Path(unicodedata.normalize("NFC", str(path)))
-        self.filepath = Path(unicodedata.normalize("NFC", str(filepath)))
+        if unicodedata.is_normalized("NFC", str(filepath)):
+            self.path = Path(path)
+            self.filepath = filepath
+        else:
+            self.path = Path(unicodedata.normalize("NFC", str(path)))
+            self.filepath = Path(unicodedata.normalize("NFC", str(filepath)))
 
-        # NXDRIVE-188: normalize name on the file system if not normalized
-        if not MAC and filepath.exists() and self.filepath != filepath:
-            log.info(f"Forcing normalization of {filepath!r} to {self.filepath!r}")
-            safe_rename(filepath, self.filepath)
+            # NXDRIVE-188: normalize name on the file system if not normalized
+            if not MAC and filepath.exists():
+                log.info(f"Forcing normalization of {filepath!r} to {self.filepath!r}")
+                safe_rename(filepath, self.filepath)
 
         if folderish:
             size = 0
@@ -84,6 +105,9 @@ def __init__(
         # Function to use
         self._digest_func = digest_func
 
+        # Digests already computed, by function
+        self._digests: Dict[str, str] = {}
+
         # Precompute base name once and for all as it's often useful in practice
         self.name = self.filepath.name
 
@@ -97,7 +121,34 @@ def __repr__(self) -> str:
     def get_digest(self, *, digest_func: str = None) -> str:
         """Lazy computation of the digest."""
         digest_func = str(digest_func or self._digest_func)
-        return compute_digest(self.filepath, digest_func, callback=self.digest_callback)
+        return self.get_digests(digest_func)[digest_func]
+
+    def get_digests(
+        self, *digest_funcs: str, callback: Callable = None
+    ) -> Dict[str, str]:
+        """Lazy computation of several digests, in a single read of the file.
+        *callback* is called instead of the digest callback, when computing them
+        from another thread (see engine/hashing.py).
+        """
+        missing = [func for func in digest_funcs if func not in self._digests]
+        if missing:
+            callback = callback or self.digest_callback
+            if self.digest_cache:
+                digests = self.digest_cache.get_digests(
+                    self.filepath, missing, callback=callback
+                )
+            else:
+                digests = compute_digests(self.filepath, missing, callback=callback)
+
+            # Unaccessible files are checked again on the next call
+            self._digests.update(
+                (func, digest)
+                for func, digest in digests.items()
+                if digest != UNACCESSIBLE_HASH
+            )
+        else:
+            digests = {}
+        return {func: digests.get(func) or self._digests[func] for func in digest_funcs}
 
 
 class LocalClientMixin:
@@ -109,6 +160,7 @@ def __init__(
         /,
         *,
         digest_callback: Callable = None,
+        digest_cache: "DigestCache" = None,
         download_dir: Path = ROOT,
     ) -> None:
         self._digest_func = "md5"
@@ -117,6 +169,9 @@ def __init__(
         # computation if the synchronization thread needs to be suspended
         self.digest_callback = digest_callback
 
+        # Digests of unchanged files are not computed again
+        self.digest_cache = digest_cache
+
         self.base_folder = base_folder.resolve()
 
         # The download folder from the engine, mostly used in .rename()
@@ -261,6 +316,11 @@ def get_info(self, ref: Path, /, *, check: bool = True) -> FileInfo:
 
         folderish = os_path.is_dir()
         stat_info = os_path.stat()
+        return self._get_info(ref, os_path, folderish, stat_info)
+
+    def _get_info(
+        self, ref: Path, os_path: Path, folderish: bool, stat_info: os.stat_result, /
+    ) -> FileInfo:
         size = 0 if folderish else stat_info.st_size
         try:
             mtime = datetime.utcfromtimestamp(stat_info.st_mtime)
@@ -283,6 +343,7 @@ def get_info(self, ref: Path, /, *, check: bool = True) -> FileInfo:
             mtime,
             digest_func=self._digest_func,
             digest_callback=self.digest_callback,
+            digest_cache=self.digest_cache,
             remote_ref=remote_ref,
             size=size,
         )
@@ -329,7 +390,9 @@ def is_equal_digests(
         digest = file_info.get_digest(digest_func=remote_digest_algorithm)
         return digest == remote_digest
 
-    def is_ignored(self, parent_ref: Path, file_name: str, /) -> bool:
+    def is_ignored(
+        self, parent_ref: Path, file_name: str, /, *, check_parents: bool = True
+    ) -> bool:
         """Note: added parent_ref to be able to filter on size if needed."""
 
         file_name = safe_filename(force_decode(file_name.lower()))
@@ -341,7 +404,7 @@ def is_ignored(self, parent_ref: Path, file_name: str, /) -> bool:
 
         # NXDRIVE-655: need to check every parent if they are ignored
         result = False
-        if parent_ref != ROOT:
+        if check_parents and parent_ref != ROOT:
             file_name = parent_ref.name
             parent_ref = parent_ref.parent
             result = self.is_ignored(parent_ref, file_name)
@@ -350,24 +413,34 @@ def is_ignored(self, parent_ref: Path, file_name: str, /) -> bool:
 
     def _get_children_info(self, ref: Path, /) -> List[FileInfo]:
         os_path = self.abspath(ref)
-        result = []
+        result: List[FileInfo] = []
+
+        # Children share the same parents, check them only once
+        if ref != ROOT and self.is_ignored(ref.parent, ref.name):
+            log.info(f"Ignoring children of banned folder {os_path!r}")
+            return result
+        temp_folder = Options.nxdrive_home / "tmp"
+        in_temp_folder = temp_folder == os_path or temp_folder in os_path.parents
+
+        # DirEntry objects cache the file type, and the whole stat() result on Windows
+        with os.scandir(os_path) as it:
+            entries = sorted((Path(entry.path), entry) for entry in it)
 
-        for child in sorted(os_path.iterdir()):
-            if self.is_ignored(ref, child.name) or self.is_temp_file(child):
+        for child, entry in entries:
+            if in_temp_folder or self.is_ignored(ref, child.name, check_parents=False):
                 log.info(f"Ignoring banned file {child.name!r} in {os_path!r}")
                 continue
 
             child_ref = ref / child.name
             try:
-                info = self.get_info(child_ref)
-            except NotFound:
+                info = self._get_info(child_ref, child, entry.is_dir(), entry.stat())
+            except FileNotFoundError:
                 log.warning(
                     "The child file has been deleted in the mean time"
                     " or while reading some of its attributes"
                 )
                 continue
-            if info:
-                result.append(info)
+            result.append(info)
 
         return result
 
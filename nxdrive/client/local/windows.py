@@ -64,7 +64,9 @@ def has_folder_icon(self, ref: Path, /) -> bool:
         """Check if the folder icon is set."""
         return (self.abspath(ref) / "desktop.ini").is_file()
 
-    def is_ignored(self, parent_ref: Path, file_name: str, /) -> bool:
+    def is_ignored(
+        self, parent_ref: Path, file_name: str, /, *, check_parents: bool = True
+    ) -> bool:
         """Note: added parent_ref to be able to filter on size if needed."""
 
         file_name = safe_filename(force_decode(file_name.lower()))
@@ -90,7 +92,7 @@ def is_ignored(self, parent_ref: Path, file_name: str, /) -> bool:
 
         # NXDRIVE-655: need to check every parent if they are ignored
         result = False
-        if parent_ref != ROOT:
+        if check_parents and parent_ref != ROOT:
             file_name = parent_ref.name
             parent_ref = parent_ref.parent
             result = self.is_ignored(parent_ref, file_name)
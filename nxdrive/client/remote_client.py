@@ -40,7 +40,7 @@
     TX_TIMEOUT,
     TransferStatus,
 )
-from ..engine.activity import Action, DownloadAction, UploadAction, VerificationAction
+from ..engine.activity import Action, DownloadAction, UploadAction
 from ..exceptions import DownloadPaused, NotFound, ScrollDescendantsError, UploadPaused
 from ..feature import Feature
 from ..metrics.constants import (
@@ -68,7 +68,7 @@
 from ..options import Options
 from ..qt.imports import QApplication
 from ..utils import (
-    compute_digest,
+    StreamDigest,
     encrypt,
     force_decode,
     get_current_locale,
@@ -79,6 +79,12 @@
     unlock_path,
 )
 from .proxy import Proxy
+from .segments import (
+    SegmentedDownloader,
+    SegmentMap,
+    content_range_size,
+    preallocate,
+)
 from .uploader import BaseUploader
 from .uploader.sync import SyncUploader
 
@@ -420,20 +426,67 @@ def download(
             f"Downloading file from {url!r} to {file_out!r} with digest={digest!r}"
         )
 
+        # Digests computed while downloading: the remote one to check the file
+        # integrity, and those asked by the caller, to not read the file again.
+        digests: Optional[Dict[str, str]] = kwargs.pop("digests", None)
+        streamed = StreamDigest(get_digest_algorithm(digest) or "", *(digests or {}))
+        # The size of the blob, when known by the caller
+        expected_size: Optional[int] = kwargs.pop("size", None)
+
         headers: Dict[str, str] = {}
         downloaded = 0
+        download: Optional[Download] = None
+        segments: Optional[SegmentMap] = None
+        segment_size = Options.download_segment_size * 1024 * 1024
+        first_segment = 0
+        probing = False
         if file_out:
-            # Retrieve current size of the TMP file, if any, to know where to start the download
-            with suppress(FileNotFoundError):
-                downloaded = file_out.stat().st_size
-                headers = {"Range": f"bytes={downloaded}-"}
-
-        resp = self.client.request(
-            "GET",
-            url.replace(self.client.host, ""),
-            headers=headers,
-            ssl_verify=self.verification_needed,
-        )
+            # Retrieve the eventual ongoing download
+            download = self.dao.get_download(path=file_path)
+
+            if download and download.segments and file_out.is_file():
+                # Resume a segmented download from its first missing segment
+                segments = SegmentMap(
+                    download.filesize, download.segment_size, bitmap=download.segments
+                )
+                first_segment = (segments.missing() or [segments.count - 1])[0]
+                start, end = segments.range(first_segment)
+                headers = {"Range": f"bytes={start}-{end}"}
+            else:
+                # Retrieve current size of the TMP file, if any, to know where to start the download
+                with suppress(FileNotFoundError):
+                    downloaded = file_out.stat().st_size
+                    headers = {"Range": f"bytes={downloaded}-"}
+
+            if (
+                not headers
+                and Options.download_segment_threads > 1
+                and (expected_size is None or expected_size > segment_size)
+            ):
+                # Only ask for the first segment, the response tells if the server honours ranges
+                headers = {"Range": f"bytes=0-{segment_size - 1}"}
+                probing = True
+
+        try:
+            resp = self.client.request(
+                "GET",
+                url.replace(self.client.host, ""),
+                headers=headers,
+                ssl_verify=self.verification_needed,
+            )
+        except HTTPError as exc:
+            if not probing or exc.status != 416:
+                raise
+            # No range can be satisfied on an empty file
+            log.debug(
+                f"Ranges not satisfiable for {file_path!r}, downloading it in one go"
+            )
+            probing = False
+            resp = self.client.request(
+                "GET",
+                url.replace(self.client.host, ""),
+                ssl_verify=self.verification_needed,
+            )
 
         if not file_out:
             # Return the pointer to the data
@@ -441,11 +494,24 @@ def download(
             del resp
             return result
 
-        size = int(resp.headers.get("Content-Length", 0)) if resp else 0
-        chunked = size > (Options.tmp_file_limit * 1024 * 1024)
-
-        # Retrieve the eventual ongoing download
-        download = self.dao.get_download(path=file_path)
+        total = content_range_size(resp)
+        if segments and total != segments.size:
+            # Ranges are not honoured anymore, start over with the whole file
+            log.info(f"Cannot resume the segmented download of {file_path!r}")
+            segments = None
+            file_out.unlink(missing_ok=True)
+            if download:
+                download.segments = None
+                self.dao.set_download_segments(download)
+        elif probing and total and total > segment_size:
+            segments = SegmentMap(total, segment_size)
+            preallocate(file_out, total)
+
+        if segments:
+            size = segments.size
+        else:
+            size = int(resp.headers.get("Content-Length", 0)) if resp else 0
+        chunked = segments is not None or size > (Options.tmp_file_limit * 1024 * 1024)
 
         if not download:
             # Add a new download entry in the database
@@ -462,6 +528,13 @@ def download(
             )
             self.dao.save_download(download)
 
+        if segments:
+            download.filesize = size
+            download.segment_size = segments.segment_size
+            download.segments = segments.to_bytes()
+            self.dao.set_download_segments(download)
+            downloaded = segments.stored_size()
+
         if chunked:
             action = DownloadAction(
                 file_path, size, tmppath=file_out, reporter=QApplication.instance()
@@ -470,7 +543,8 @@ def download(
             log.debug(
                 f"Download progression is {action.get_percent():.2f}% "
                 f"(data length is {sizeof_fmt(size)}, "
-                f"chunked is {chunked}, chunk size is {sizeof_fmt(FILE_BUFFER_SIZE)})"
+                f"chunked is {chunked}, chunk size is {sizeof_fmt(FILE_BUFFER_SIZE)}, "
+                f"segments are {segments!r})"
             )
 
         locker = unlock_path(file_out)
@@ -481,23 +555,31 @@ def download(
                 action.chunk_transfer_start_time_ns = monotonic_ns()
 
                 callback = kwargs.pop("callback", self.download_callback)
-                self.operations.save_to_file(
-                    action,
-                    resp,
-                    file_out,
-                    chunk_size=FILE_BUFFER_SIZE,
-                    callback=callback,
-                )
-
-                self.check_integrity(digest, action)
+                if segments:
+                    self._download_segments(
+                        url,
+                        download,
+                        segments,
+                        action,
+                        (first_segment, resp),
+                        callback,
+                        streamed,
+                    )
+                else:
+                    self._save_to_file(
+                        action, resp, file_out, downloaded, callback, streamed
+                    )
             else:
                 with memoryview(resp.content) as view, file_out.open(mode="wb") as f:
                     f.write(view)
+                    streamed.update(view)
                     # Force write of file to disk
                     f.flush()
                     os.fsync(f.fileno())
 
-                self.check_integrity_simple(digest, file_out)
+            self.check_integrity(digest, file_out, streamed)
+            if digests is not None:
+                digests.update(streamed.digests())
 
             # Download finished!
             download.status = TransferStatus.DONE
@@ -514,51 +596,84 @@ def download(
 
         return file_out
 
-    def check_integrity(self, digest: str, download_action: DownloadAction, /) -> None:
-        """
-        Check the integrity of a downloaded chunked file.
-        Update the progress of the verification during the computation of the digest.
-        """
-        if Options.disabled_file_integrity_check:
-            log.debug(
-                "disabled_file_integrity_check is True, skipping file integrity check then"
-            )
-            return
+    def _download_segments(
+        self,
+        url: str,
+        download: Download,
+        segments: SegmentMap,
+        action: DownloadAction,
+        first: Tuple[int, requests.Response],
+        callback: Any,
+        streamed: StreamDigest,
+        /,
+    ) -> None:
+        """Fetch the missing segments of a download, the *first* one is already requested."""
+        path = url.replace(self.client.host, "")
 
-        digester = get_digest_algorithm(digest)
-        if not digester:
-            log.warning(
-                f"Empty or non-standard digest {digest!r}, skipping the file integrity check"
+        def fetch(start: int, end: int) -> requests.Response:
+            return self.client.request(
+                "GET",
+                path,
+                headers={"Range": f"bytes={start}-{end}"},
+                ssl_verify=self.verification_needed,
             )
-            return
-
-        size = download_action.size
-        filepath = download_action.tmppath or download_action.filepath
 
-        # Terminate the download action to be able to start the verification one as we are allowing
-        # only 1 action per thread.
-        # Note that this is not really needed as the verification action would replace the download
-        # one, but let's do things right.
-        DownloadAction.finish_action()
-
-        verif_action = VerificationAction(
-            filepath, size, reporter=QApplication.instance()
+        def saved(segments: SegmentMap) -> None:
+            download.segments = segments.to_bytes()
+            self.dao.set_download_segments(download)
+
+        if callable(callback):
+            callback = (callback,)
+        downloader = SegmentedDownloader(
+            segments,
+            download.tmpname,
+            fetch,
+            workers=Options.download_segment_threads,
+        )
+        downloader.run(
+            action,
+            callbacks=callback or (),
+            saved=saved,
+            first=first,
+            digest=streamed,
         )
 
-        def callback(_: Path) -> None:
-            verif_action.progress += FILE_BUFFER_SIZE
-
-        try:
-            computed_digest = compute_digest(filepath, digester, callback=callback)
-            if digest != computed_digest:
-                # TMP file and Downloads table entry will be deleted
-                # by the calling method
-                raise CorruptedFile(filepath, digest, computed_digest)
-        finally:
-            VerificationAction.finish_action()
-
-    def check_integrity_simple(self, digest: str, file: Path, /) -> None:
-        """Check the integrity of a relatively small downloaded file."""
+    def _save_to_file(
+        self,
+        action: DownloadAction,
+        resp: requests.Response,
+        file_out: Path,
+        downloaded: int,
+        callback: Any,
+        streamed: StreamDigest,
+        /,
+    ) -> None:
+        """Append the content of *resp* to the *downloaded* bytes of *file_out*,
+        digests are computed on the fly.
+        """
+        if downloaded:
+            # Resumed download, only the bytes already there are read again
+            streamed.update_from_file(file_out, end=downloaded)
+
+        if callable(callback):
+            callback = (callback,)
+        with file_out.open(mode="ab") as f:
+            for chunk in resp.iter_content(chunk_size=FILE_BUFFER_SIZE):
+                # Check if synchronization thread was suspended
+                for cb in callback or ():
+                    cb(file_out)
+                action.progress += len(chunk)
+                f.write(chunk)
+                streamed.update(chunk)
+
+            # Force write of file to disk
+            f.flush()
+            os.fsync(f.fileno())
+
+    def check_integrity(
+        self, digest: str, file: Path, streamed: StreamDigest, /
+    ) -> None:
+        """Check the integrity of a downloaded file against the digest computed while downloading it."""
         if Options.disabled_file_integrity_check:
             log.debug(
                 "disabled_file_integrity_check is True, skipping file integrity check then"
@@ -572,7 +687,7 @@ def check_integrity_simple(self, digest: str, file: Path, /) -> None:
             )
             return
 
-        computed_digest = compute_digest(file, digester)
+        computed_digest = streamed.hexdigest(digester)
         if digest != computed_digest:
             raise CorruptedFile(file, digest, computed_digest)
 
@@ -690,6 +805,9 @@ def stream_content(
 
         Raises NotFound if file system item with id fs_item_id
         cannot be found
+
+        The digests of the content for the functions listed as keys of
+        the optional *digests* dict are set in it, computed while downloading.
         """
         if not fs_item_info:
             fs_item_info = self.get_fs_info(
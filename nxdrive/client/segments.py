@@ -0,0 +1,267 @@
+"""
+Download a file by byte ranges, several ranges at the same time.
+
+The file is split into segments of a fixed size, written at their offset in
+a preallocated temporary file. A bitmap of stored segments is saved in the
+Downloads table after each segment, so that an interrupted download only
+fetches the missing ones.
+
+The digests of the file are computed from the segments stored in a row, as
+soon as they are written: they are still in the page cache and the file is
+not read again once complete.
+"""
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+from pathlib import Path
+from queue import Queue
+from threading import Event
+from time import monotonic_ns
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+from requests import Response
+from requests.exceptions import ChunkedEncodingError, ConnectionError
+
+from ..constants import FILE_BUFFER_SIZE
+from ..engine.activity import DownloadAction
+from ..utils import StreamDigest
+
+__all__ = ("SegmentMap", "SegmentedDownloader", "content_range_size", "preallocate")
+
+log = getLogger(__name__)
+
+# "bytes 0-1023/4096" -> 4096
+_CONTENT_RANGE = re.compile(r"bytes\s+\d+-\d+/(\d+)")
+
+# Events sent by segment threads
+_DATA, _DONE, _ERROR = range(3)
+
+
+def content_range_size(resp: Optional[Response], /) -> Optional[int]:
+    """Return the full file size of a partial content response.
+    None when the server did not honour the requested range.
+    """
+    if resp is None or resp.status_code != 206:
+        return None
+    match = _CONTENT_RANGE.match(resp.headers.get("Content-Range", ""))
+    return int(match.group(1)) if match else None
+
+
+def preallocate(path: Path, size: int, /) -> None:
+    """Create the file *path* and reserve *size* bytes for it."""
+    with path.open(mode="wb") as f:
+        if hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(f.fileno(), 0, size)
+                return
+            except OSError:
+                # Not supported by the file system
+                pass
+        f.truncate(size)
+
+
+def _write_at(fd: int, data: bytes, offset: int, /) -> None:
+    view = memoryview(data)
+    while view:
+        if hasattr(os, "pwrite"):
+            written = os.pwrite(fd, view, offset)
+        else:
+            # Windows, the file descriptor is not shared between threads
+            os.lseek(fd, offset, os.SEEK_SET)
+            written = os.write(fd, view)
+        view = view[written:]
+        offset += written
+
+
+class SegmentMap:
+    """Segments of a file already stored in the temporary file, as a bitmap."""
+
+    def __init__(
+        self, size: int, segment_size: int, /, *, bitmap: bytes = None
+    ) -> None:
+        self.size = size
+        self.segment_size = segment_size
+        self.count = max(1, -(-size // segment_size))
+
+        length = (self.count + 7) // 8
+        if bitmap and len(bitmap) == length:
+            self._bitmap = bytearray(bitmap)
+        else:
+            self._bitmap = bytearray(length)
+
+    def __repr__(self) -> str:
+        return (
+            f"<{type(self).__name__} size={self.size}, segment_size={self.segment_size},"
+            f" stored={self.count - len(self.missing())}/{self.count}>"
+        )
+
+    def __contains__(self, index: int, /) -> bool:
+        return bool(self._bitmap[index >> 3] & (1 << (index & 7)))
+
+    def add(self, index: int, /) -> None:
+        self._bitmap[index >> 3] |= 1 << (index & 7)
+
+    def range(self, index: int, /) -> Tuple[int, int]:
+        """Return the first and last bytes of the segment, as in a Range header."""
+        start = index * self.segment_size
+        return start, min(start + self.segment_size, self.size) - 1
+
+    def missing(self) -> List[int]:
+        return [index for index in range(self.count) if index not in self]
+
+    def is_complete(self) -> bool:
+        return not self.missing()
+
+    def stored_size(self) -> int:
+        stored = (self.range(index) for index in range(self.count) if index in self)
+        return sum(end - start + 1 for start, end in stored)
+
+    def to_bytes(self) -> bytes:
+        return bytes(self._bitmap)
+
+
+class SegmentedDownloader:
+    """Fetch the missing segments of *segments* from up to *workers* threads.
+
+    *fetch* returns the response of a ranged GET, it is called from segment
+    threads. Progress, *callbacks* and *saved* are handled from the thread
+    calling .run(), for each chunk of data received.
+    """
+
+    def __init__(
+        self,
+        segments: SegmentMap,
+        file_out: Path,
+        fetch: Callable[[int, int], Response],
+        /,
+        *,
+        workers: int,
+        chunk_size: int = FILE_BUFFER_SIZE,
+    ) -> None:
+        self.segments = segments
+        self.file_out = file_out
+        self.fetch = fetch
+        self.workers = workers
+        self.chunk_size = chunk_size
+
+    def run(
+        self,
+        action: DownloadAction,
+        /,
+        *,
+        callbacks: Iterable[Callable[[Path], Any]] = (),
+        saved: Callable[[SegmentMap], None] = None,
+        first: Tuple[int, Response] = None,
+        digest: StreamDigest = None,
+    ) -> None:
+        """Download all missing segments, *first* is an already opened segment response.
+        *digest* is fed with the whole file content, in order.
+        """
+        todo = self.segments.missing()
+        hashed = 0
+
+        def hash_stored() -> None:
+            nonlocal hashed
+            while hashed < self.segments.count and hashed in self.segments:
+                start, end = self.segments.range(hashed)
+                digest.update_from_file(self.file_out, start=start, end=end + 1)
+                hashed += 1
+
+        events: Queue = Queue()
+        stop = Event()
+        running = 0
+        log.debug(
+            f"Downloading {len(todo)} segments of {self.file_out!r}"
+            f" with {self.workers} threads"
+        )
+
+        with ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="DownloadSegment"
+        ) as pool:
+
+            def start(index: int, resp: Response = None) -> None:
+                nonlocal running
+                todo.remove(index)
+                pool.submit(self._fetch_segment, index, resp, events, stop)
+                running += 1
+
+            try:
+                if digest:
+                    # Segments stored by a previous run
+                    hash_stored()
+
+                if first and first[0] in todo:
+                    start(*first)
+                elif first:
+                    # Already stored
+                    first[1].close()
+                while todo and running < self.workers:
+                    start(todo[0])
+
+                while running:
+                    kind, index, value = events.get()
+                    if kind == _ERROR:
+                        raise value
+
+                    if kind == _DATA:
+                        length, speed = value
+                        action.progress += length
+                        action.segment_speeds[index] = speed
+                        for callback in callbacks:
+                            callback(self.file_out)
+                        continue
+
+                    # A segment is complete
+                    running -= 1
+                    self.segments.add(index)
+                    if saved:
+                        saved(self.segments)
+                    if todo:
+                        start(todo[0])
+                    if digest:
+                        hash_stored()
+            finally:
+                # Let segment threads end as soon as possible
+                stop.set()
+
+    def _fetch_segment(
+        self, index: int, resp: Optional[Response], events: Queue, stop: Event, /
+    ) -> None:
+        try:
+            begin, end = self.segments.range(index)
+            if resp is None:
+                resp = self.fetch(begin, end)
+            if content_range_size(resp) != self.segments.size:
+                raise ConnectionError(
+                    f"Unexpected response for segment {index}: {resp}"
+                )
+
+            fd = os.open(self.file_out, os.O_WRONLY | getattr(os, "O_BINARY", 0))
+            try:
+                offset = begin
+                start_ns = monotonic_ns()
+                with resp:
+                    for chunk in resp.iter_content(chunk_size=self.chunk_size):
+                        if stop.is_set():
+                            return
+                        _write_at(fd, chunk, offset)
+                        offset += len(chunk)
+                        elapsed = (monotonic_ns() - start_ns) or 1
+                        speed = (offset - begin) * 1_000_000_000 / elapsed
+                        events.put((_DATA, index, (len(chunk), speed)))
+
+                if offset != end + 1:
+                    raise ChunkedEncodingError(
+                        f"Segment {index} is incomplete: got {offset - begin} bytes,"
+                        f" expected {end + 1 - begin}"
+                    )
+
+                # The segment must be on the disk before being marked as stored
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        except Exception as exc:
+            events.put((_ERROR, index, exc))
+        else:
+            events.put((_DONE, index, None))
@@ -25,6 +25,7 @@
 from ...options import Options
 from ...qt.imports import QApplication
 from ...utils import get_verify
+from .chunks import get_chunk_engine
 
 if TYPE_CHECKING:
     from ..remote_client import Remote  # noqa
@@ -338,8 +339,15 @@ def upload_chunks(self, transfer: Upload, blob: FileBlob, chunked: bool, /) -> N
                     transfer.batch = transfer.batch_obj.as_dict()
                     self.dao.update_upload(transfer)
 
+                # Send several chunks at the same time, when allowed
+                workers = min(Options.chunk_upload_threads, len(uploader._to_upload))
+                if workers > 1:
+                    chunks = get_chunk_engine(uploader, workers=workers).iter_upload()
+                else:
+                    chunks = uploader.iter_upload()
+
                 # If there is an UploadError, we catch it from the processor
-                for _ in uploader.iter_upload():
+                for _ in chunks:
                     # Ensure the batchId will not be purged while uploading the content
                     last_ping = self._ping_batch_id(transfer, last_ping)
 
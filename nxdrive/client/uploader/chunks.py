@@ -0,0 +1,192 @@
+"""
+Send the chunks of a same file from several threads.
+
+The Nuxeo batch handler, as well as S3 multipart uploads, accept chunks in
+any order: while the upload of a chunk is waiting for the server, the next
+ones are already on the wire. The upload state is still tracked on the
+uploader itself (uploaded chunks, S3 parts ETag) so that a paused or
+interrupted upload is resumed the usual way.
+"""
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from logging import getLogger
+from typing import Any, Generator, Set, Tuple
+
+from nuxeo.exceptions import UploadError
+from nuxeo.handlers.default import Uploader
+from nuxeo.handlers.s3 import ChunkUploaderS3
+
+__all__ = ("ChunkEngine", "ChunkEngineS3", "get_chunk_engine")
+
+log = getLogger(__name__)
+
+
+class ChunkEngine:
+    """Upload up to *workers* chunks of the *uploader* blob at the same time.
+
+    Chunks are read from their own file descriptor in each thread, and the
+    uploader state is only updated from the thread iterating over
+    .iter_upload(), as are callbacks run, between two completed chunks.
+    """
+
+    def __init__(self, uploader: Uploader, /, *, workers: int) -> None:
+        self.uploader = uploader
+        self.workers = workers
+        self.timeout = uploader.timeout(uploader.chunk_size)
+
+        # Chunks known to be stored on the server, from its own responses
+        self._confirmed: Set[int] = set(uploader.blob.uploadedChunkIds)
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__} workers={self.workers}, uploader={self.uploader!r}>"
+
+    def iter_upload(self) -> Generator[Uploader, None, None]:
+        """Same as Uploader.iter_upload(), it yields the uploader after each chunk."""
+        uploader = self.uploader
+        pending: Set[Future] = set()
+
+        with ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="ChunkUpload"
+        ) as pool:
+            try:
+                while uploader._to_upload:
+                    todo = list(reversed(uploader._to_upload))
+                    while todo or pending:
+                        while todo and len(pending) < self.workers:
+                            pending.add(pool.submit(self._send, todo.pop()))
+
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            index, data_len, response = future.result()
+                            self._sent(index, data_len, response)
+                            uploader._to_upload.remove(index)
+
+                            for callback in uploader.callback:
+                                callback(uploader)
+                            yield uploader
+
+                    # Check whether the server has received all chunks
+                    self._compute_chunks_left()
+            finally:
+                # Chunks already on the wire are left to finish
+                for future in pending:
+                    future.cancel()
+
+        self._complete()
+
+    def _offset(self, index: int, /) -> int:
+        return index * self.uploader.chunk_size
+
+    def _read(self, index: int, /) -> bytes:
+        with open(self.uploader.blob.path, "rb") as fd:
+            fd.seek(self._offset(index))
+            return fd.read(self.uploader.chunk_size)
+
+    def _send(self, index: int, /) -> Tuple[int, int, Any]:
+        """Upload one chunk, from a worker thread."""
+        uploader = self.uploader
+        data = self._read(index)
+        data_len = len(data)
+
+        # Headers are altered by the request, each chunk needs its own copy
+        response = uploader.service.send_data(
+            uploader.blob.name,
+            data,
+            uploader.path,
+            uploader.chunked,
+            index,
+            uploader.headers.copy(),
+            data_len=data_len,
+            timeout=self.timeout,
+        )
+        return index, data_len, response
+
+    def _sent(self, index: int, data_len: int, response: Any, /) -> None:
+        """Save the progression of a chunk upload."""
+        blob = self.uploader.blob
+        blob.fileIdx = response.fileIdx
+
+        # Responses of chunks sent at the same time may come back in any order,
+        # the server list of a response does not always include all previous chunks.
+        self._confirmed.update(int(idx) for idx in response.uploadedChunkIds)
+        blob.uploadedChunkIds = sorted(
+            self._confirmed | {index, *blob.uploadedChunkIds}
+        )
+        blob.uploadedSize += data_len
+
+    def _compute_chunks_left(self) -> None:
+        uploader = self.uploader
+        if len(self._confirmed) < uploader.chunk_count:
+            # Ask the server for the actual list, as the sequential upload does
+            # with the response of the last chunk.
+            _, uploaded = uploader.service.state(
+                uploader.path, uploader.blob, chunk_size=uploader.chunk_size
+            )
+            self._confirmed = set(uploaded)
+            uploader.blob.uploadedChunkIds = sorted(self._confirmed)
+        uploader._compute_chunks_left()
+        if uploader._to_upload:
+            log.warning(
+                f"Chunks {uploader._to_upload} of {uploader.blob.path!r}"
+                " are missing on the server, sending them again"
+            )
+
+    def _complete(self) -> None:
+        self.uploader._update_batch()
+
+
+class ChunkEngineS3(ChunkEngine):
+    """Upload up to *workers* parts of a S3 multipart upload at the same time."""
+
+    def _offset(self, index: int, /) -> int:
+        # S3 starts counting at 1
+        return (index - 1) * self.uploader.chunk_size
+
+    def _send(self, index: int, /) -> Tuple[int, int, Any]:
+        uploader = self.uploader
+        data = self._read(index)
+        data_len = len(data)
+
+        try:
+            response = uploader.s3_client.upload_part(
+                UploadId=uploader.batch.multiPartUploadId,
+                Bucket=uploader.bucket,
+                Key=uploader.key,
+                PartNumber=index,
+                Body=data,
+                ContentLength=data_len,
+            )
+        except Exception as exc:
+            raise UploadError(uploader.blob.path, chunk=index, info=str(exc))
+        return index, data_len, response
+
+    def _sent(self, index: int, data_len: int, response: Any, /) -> None:
+        uploader = self.uploader
+        uploader._data_packs.append({"ETag": response["ETag"], "PartNumber": index})
+        uploader.blob.uploadedChunkIds.append(index)
+        uploader.blob.uploadedSize += data_len
+
+    def _compute_chunks_left(self) -> None:
+        # A sent part is a stored part
+        self.uploader._compute_chunks_left()
+
+    def _complete(self) -> None:
+        uploader = self.uploader
+
+        # Parts have to be listed in ascending order
+        uploader._data_packs.sort(key=lambda part: part["PartNumber"])
+        response = uploader.s3_client.complete_multipart_upload(
+            Bucket=uploader.bucket,
+            Key=uploader.key,
+            UploadId=uploader.batch.multiPartUploadId,
+            MultipartUpload={"Parts": uploader._data_packs},
+        )
+
+        # Save the ETag for the batch.complete() call
+        uploader.batch.etag = response["ETag"]
+        uploader._update_batch()
+
+
+def get_chunk_engine(uploader: Uploader, /, *, workers: int) -> ChunkEngine:
+    """Return the engine uploading chunks of the given *uploader*."""
+    cls = ChunkEngineS3 if isinstance(uploader, ChunkUploaderS3) else ChunkEngine
+    return cls(uploader, workers=workers)
@@ -4,12 +4,15 @@
 import json
 from logging import getLogger
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
+from nuxeo.exceptions import HTTPError
+from nuxeo.models import FileBlob
 from nuxeo.utils import guess_mimetype
 
 from nxdrive.exceptions import NotFound
 
+from ...constants import TX_TIMEOUT, TransferStatus
 from ...engine.activity import LinkingAction, UploadAction
 from ...metrics.constants import (
     DT_DUPLICATE_BEHAVIOR,
@@ -18,8 +21,10 @@
     DT_FILE_SIZE,
     DT_SESSION_NUMBER,
     REQUEST_METRICS,
+    UPLOAD_PROVIDER,
 )
 from ...objects import DocPair, Upload
+from ...qt.imports import QApplication
 from . import BaseUploader
 
 log = getLogger(__name__)
@@ -78,31 +83,7 @@ def upload(
             return {}
 
         if doc_pair.folderish:
-            if not doc_pair.doc_type:
-                item = self.remote.upload_folder(
-                    doc_pair.remote_parent_path,
-                    {"title": doc_pair.local_name},
-                    headers={DT_SESSION_NUMBER: str(doc_pair.session)},
-                )
-            else:
-                try:
-                    payload = {
-                        "entity-type": "document",
-                        "name": doc_pair.local_name,
-                        "type": doc_pair.doc_type,
-                        "properties{'dc:title'}": doc_pair.local_name,
-                    }
-                    item = self.remote.upload_folder_type(
-                        doc_pair.remote_parent_path,
-                        payload,
-                        headers={DT_SESSION_NUMBER: str(doc_pair.session)},
-                    )
-                    filepath = f"{doc_pair.remote_parent_path}/{doc_pair.local_name}"
-                    item = self.remote.fetch(filepath)
-                except NotFound:
-                    raise NotFound(
-                        f"Could not find {filepath!r} on {self.remote.client.host}"
-                    )
+            item = self.create_folder(doc_pair)
             self.dao.update_remote_parent_path_dt(file_path, item["path"], item["uid"])
         else:
             # Only replace the document if the user wants to
@@ -134,3 +115,121 @@ def upload(
             )
         self.dao.save_session_item(doc_pair.session, item)
         return item
+
+    def create_folder(self, doc_pair: DocPair, /) -> Dict[str, Any]:
+        """Create the folderish document of the *doc_pair* on the server.
+        It does not alter the database, it can be called from any thread.
+        """
+        if not doc_pair.doc_type:
+            item = self.remote.upload_folder(
+                doc_pair.remote_parent_path,
+                {"title": doc_pair.local_name},
+                headers={DT_SESSION_NUMBER: str(doc_pair.session)},
+            )
+        else:
+            try:
+                payload = {
+                    "entity-type": "document",
+                    "name": doc_pair.local_name,
+                    "type": doc_pair.doc_type,
+                    "properties{'dc:title'}": doc_pair.local_name,
+                }
+                item = self.remote.upload_folder_type(
+                    doc_pair.remote_parent_path,
+                    payload,
+                    headers={DT_SESSION_NUMBER: str(doc_pair.session)},
+                )
+                filepath = f"{doc_pair.remote_parent_path}/{doc_pair.local_name}"
+                item = self.remote.fetch(filepath)
+            except NotFound:
+                raise NotFound(
+                    f"Could not find {filepath!r} on {self.remote.client.host}"
+                )
+        return item
+
+    def upload_small_files(
+        self, files: List[Tuple[Path, DocPair]], /, *, engine_uid: str = ""
+    ) -> List[Dict[str, Any]]:
+        """Upload small files in a single batch, and create all their documents at once.
+
+        All files share the same remote parent and duplicates behavior, and have
+        no document type (see EngineDAO.acquire_dt_small_files()). There is no
+        transfer saved in the database: if something fails before the documents
+        creation, all files will be uploaded again, with a new batch.
+
+        Return the created documents, in the *files* order.
+        """
+        doc_pair = files[0][1]
+        batch = self.remote.uploads.batch(
+            headers={REQUEST_METRICS: json.dumps({UPLOAD_PROVIDER: "nuxeo"})}
+        )
+        log.info(
+            f"Direct Transfer of {len(files)} small files into {doc_pair.remote_parent_path!r}"
+            f" ({doc_pair.remote_parent_ref!r}) with the batch {batch.uid!r}"
+        )
+
+        # Step 1: upload all blobs, each one at its own index of the batch
+        size = 0
+        for file_path, pair in files:
+            blob = FileBlob(str(file_path))
+            transfer = Upload(
+                None,
+                file_path,
+                TransferStatus.ONGOING,
+                engine=engine_uid,
+                filesize=blob.size,
+                is_direct_transfer=True,
+                doc_pair=pair.id,
+            )
+            transfer.batch_obj = batch
+            try:
+                self.upload_chunks(transfer, blob, False)
+            finally:
+                if blob.fd:
+                    blob.fd.close()
+            size += blob.size
+
+        # Step 2: create all documents from the batch
+        action = self.linking_action(
+            files[0][0],
+            size,
+            reporter=QApplication.instance(),
+            engine=engine_uid,
+            doc_pair=doc_pair.id,
+        )
+        action.is_direct_transfer = True
+        try:
+            res = self.remote.client.request(
+                "POST",
+                f"{self.remote.client.api_path}/upload/{batch.uid}/execute/FileManager.Import",
+                data={
+                    "params": {"overwite": doc_pair.duplicate_behavior == "override"},
+                    "context": {"currentDocument": doc_pair.remote_parent_path},
+                },
+                headers={
+                    "Nuxeo-Transaction-Timeout": str(TX_TIMEOUT),
+                    REQUEST_METRICS: json.dumps(
+                        {
+                            DT_DUPLICATE_BEHAVIOR: doc_pair.duplicate_behavior,
+                            DT_SESSION_NUMBER: doc_pair.session,
+                        }
+                    ),
+                },
+                timeout=TX_TIMEOUT,
+                ssl_verify=self.verification_needed,
+            ).json()
+        except Exception as exc:
+            log.warning(f"Error while linking blobs to docs: {exc!r}")
+            action.finalizing_status = "Error"
+            raise
+        finally:
+            action.finish_action()
+
+        docs: List[Dict[str, Any]] = (
+            res["entries"] if res.get("entity-type") == "documents" else [res]
+        )
+        if len(docs) != len(files):
+            err = f"Expected {len(files)} documents, the server created {len(docs)}"
+            log.warning(err)
+            raise HTTPError(status=500, message=err)
+        return docs
@@ -19,6 +19,7 @@
 TIMEOUT = 20  # Seconds
 STARTUP_PAGE_CONNECTION_TIMEOUT = 30  # Seconds
 FILE_BUFFER_SIZE = 1024**2  # 1 MiB
+DIGEST_BUFFER_SIZE = 8 * 1024**2  # 8 MiB
 MAX_LOG_DISPLAYED = 50000  # Lines
 BATCH_SIZE = 500  # Scroll descendants batch size (max is 1,000)
 
@@ -123,6 +124,13 @@ class DigestStatus(Enum):
     REMOTE_HASH_EXOTIC = 3
 
 
+class QueuePriority(Enum):
+    """Used to order pairs in the processing queues, lowest values are handled first."""
+
+    USER = 0
+    NORMAL = 1
+
+
 class TransferStatus(Enum):
     """Used to represent an upload/download status."""
 
@@ -1,26 +1,39 @@
 """
 Query formatting in this file is based on http://www.sqlstyle.guide/
 """
+import re
 import sys
-from contextlib import suppress
+from contextlib import contextmanager, suppress
 from logging import getLogger
 from pathlib import Path
-from sqlite3 import Connection, Cursor, DatabaseError, OperationalError, Row, connect
-from threading import RLock, local
-from typing import Any, Iterable, List, Optional, Type
+from sqlite3 import Connection, Cursor, DatabaseError, OperationalError, connect
+from threading import Lock, RLock, current_thread, local, main_thread
+from time import monotonic, sleep
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Type
 
 from ..constants import NO_SPACE_ERRORS
-from ..objects import DocPair
-from ..qt.imports import QObject
+from ..objects import DocPair, Metrics
+from ..options import Options
+from ..qt.imports import QObject, QThread
 from ..utils import current_thread_id
 from . import SCHEMA_VERSION
-from .utils import fix_db, restore_backup, save_backup
+from .utils import fix_db, is_healthy, restore_backup, save_backup
 
 log = getLogger(__name__)
 
+# Free pages returned to the file system at once by an incremental vacuum step
+VACUUM_PAGES = 256
+
+
+# Statements writing to the database, see BaseDAO._before_write()
+_WRITE_STATEMENT = re.compile(
+    r"\s*(INSERT|UPDATE|DELETE|REPLACE|CREATE|DROP|ALTER)\b", re.IGNORECASE
+)
+
 
 class AutoRetryCursor(Cursor):
     def execute(self, sql: str, parameters: Iterable[Any] = ()) -> Cursor:
+        self._before(sql)
         count = 1
         while True:
             count += 1
@@ -34,30 +47,148 @@ def execute(self, sql: str, parameters: Iterable[Any] = ()) -> Cursor:
                 if count > 5:
                     raise exc
 
+    def executemany(self, sql: str, seq_of_parameters: Iterable[Any]) -> Cursor:
+        self._before(sql)
+        return super().executemany(sql, seq_of_parameters)
+
+    def _before(self, sql: str, /) -> None:
+        self.connection.before(sql)
+
 
 class AutoRetryConnection(Connection):
+    # Called before every write statement, see BaseDAO._before_write()
+    write_hook: Optional[Callable[[], None]] = None
+
     def cursor(self, factory: Type[Cursor] = None) -> Cursor:
         factory = factory or AutoRetryCursor
         return super().cursor(factory)
 
+    # Connection shortcuts do not use .cursor()
+
+    def execute(self, sql: str, parameters: Iterable[Any] = ()) -> Cursor:
+        self.before(sql)
+        return super().execute(sql, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters: Iterable[Any]) -> Cursor:
+        self.before(sql)
+        return super().executemany(sql, seq_of_parameters)
+
+    def before(self, sql: str, /) -> None:
+        if self.write_hook and _WRITE_STATEMENT.match(sql):
+            self.write_hook()
+
+
+def thread_category() -> str:
+    """Name the kind of the current thread: its worker class, or "GUI" for the main thread."""
+    worker = getattr(QThread.currentThread(), "worker", None)
+    if worker is not None:
+        return type(worker).__name__
+    thread = current_thread()
+    if thread is main_thread():
+        return "GUI"
+    return thread.name.rstrip("0123456789-_") or "Thread"
+
+
+class MeasuredRLock:
+    """
+    A reentrant lock keeping an histogram of the time spent waiting for it,
+    by kind of thread. Acquiring a free lock is not measured.
+    """
+
+    # Upper bounds of the histogram buckets, in milliseconds
+    buckets = (1, 10, 100, 1000)
+    labels = ("<1ms", "<10ms", "<100ms", "<1s", ">=1s")
+
+    def __init__(self) -> None:
+        self._lock = RLock()
+        self._waits: Dict[str, List[int]] = {}
+        # Recursion level of the owner thread
+        self._depth = 0
+        # Number of threads waiting for the lock
+        self._waiting = 0
+        self._waiting_lock = Lock()
+        # Incremented every time the lock is released by its owner
+        self.releases = 0
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        if self._lock.acquire(blocking=False):
+            self._depth += 1
+            return True
+        if not blocking:
+            return False
+
+        start = monotonic()
+        with self._waiting_lock:
+            self._waiting += 1
+        try:
+            acquired = self._lock.acquire(timeout=timeout)
+        finally:
+            with self._waiting_lock:
+                self._waiting -= 1
+        if acquired:
+            self._depth += 1
+            self._record((monotonic() - start) * 1000)
+        return acquired
+
+    def release(self) -> None:
+        self._depth -= 1
+        released = not self._depth
+        if released:
+            self.releases += 1
+        self._lock.release()
+        if released and self._waiting:
+            # The lock is not fair: give waiting threads a chance to take it
+            sleep(0)
+
+    def __enter__(self) -> bool:
+        return self.acquire()
+
+    def __exit__(self, *_: Any) -> None:
+        self.release()
+
+    def _record(self, elapsed: float, /) -> None:
+        """Store the waiting time, called while holding the lock."""
+        histogram = self._waits.setdefault(thread_category(), [0] * len(self.labels))
+        for idx, bound in enumerate(self.buckets):
+            if elapsed < bound:
+                break
+        else:
+            idx = len(self.buckets)
+        histogram[idx] += 1
+
+    @property
+    def waits(self) -> Dict[str, Dict[str, int]]:
+        """The lock-wait histograms, by kind of thread."""
+        return {
+            category: dict(zip(self.labels, histogram))
+            for category, histogram in self._waits.copy().items()
+        }
+
 
 class BaseDAO(QObject):
-    _state_factory: Type[Row] = DocPair
+    _state_factory: Callable[[Cursor, Any], Any] = DocPair
     _journal_mode: str = "WAL"
 
     def __init__(self, db: Path, /) -> None:
         super().__init__()
 
         self.db = db
-        self.lock = RLock()
+        self.lock = MeasuredRLock()
 
         log.info(f"Create {type(self).__name__} on {self.db!r}")
 
+        # Duration of each opening phase, in milliseconds
+        self.startup_timings: Dict[str, int] = {}
+        self._corrupted = False
+
         exists = self.db.is_file()
-        if exists:
-            # Fix potential file corruption
+        shutdown = self._pop_shutdown_marker()
+        if exists and shutdown != "clean":
+            # Fix potential file corruption. After a crash, a quick check is
+            # enough, the full one is done in the background, while syncing.
             try:
-                fix_db(self.db)
+                with self._timed("integrity_check"):
+                    fix_db(self.db, quick=shutdown != "corrupted")
             except DatabaseError:
                 # The file is too damaged, we'll try and restore a backup.
                 exists = self.restore_backup()
@@ -66,14 +197,22 @@ def __init__(self, db: Path, /) -> None:
 
         self._engine_uid = self.db.stem.replace("ndrive_", "")
         self.in_tx: Optional[int] = None
-        self._tx_lock = RLock()
         self.conn: Optional[Connection] = None
         self._conns = local()
-        self.conn = self._create_main_conn()
-        if not self.conn:
-            raise RuntimeError("Unable to connect to database.")
-        c = self.conn.cursor()
-        self._init_db(c)
+        self._readers: List[Connection] = []
+        self._readers_lock = Lock()
+        self._next_reader = 0
+        self._write_statements = 0
+        self._write_transactions = 0
+        self._backup_conn: Optional[Connection] = None
+        self._backup_lock = Lock()
+        self._backup_version: Optional[int] = None
+        with self._timed("connection"):
+            self.conn = self._create_main_conn()
+            if not self.conn:
+                raise RuntimeError("Unable to connect to database.")
+            c = self.conn.cursor()
+            self._init_db(c)
 
         schema_version = 0
         if exists:
@@ -81,12 +220,18 @@ def __init__(self, db: Path, /) -> None:
         else:
             self.set_schema_version(c, schema_version)
         try:
-            self._migrate_db(schema_version)
+            with self._timed("migrations"):
+                self._migrate_db(schema_version)
         except Exception:
             self.migration_success = False
         else:
             self.migration_success = True
 
+        if exists and shutdown == "clean" and Options.database_auto_vacuum_conversion:
+            self._convert_auto_vacuum()
+        self._incremental_vacuum = c.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+        self._reset_write_metrics()
+
     def __repr__(self) -> str:
         return f"<{type(self).__name__} db={self.db!r}, exists={self.db.exists()}>"
 
@@ -125,9 +270,24 @@ def restore_backup(self) -> bool:
         return False
 
     def save_backup(self) -> bool:
+        """
+        Backup the database, unless nothing changed since the previous backup.
+        The lock is not needed: the backup is done from a dedicated connection,
+        on a snapshot of the database.
+        """
         try:
-            with self.lock:
-                return save_backup(self.db)
+            with self._backup_lock:
+                if not self._backup_conn:
+                    self._backup_conn = connect(str(self.db), check_same_thread=False)
+                # Changed every time another connection commits something
+                version = self._backup_conn.execute("PRAGMA data_version").fetchone()[0]
+                if version == self._backup_version:
+                    log.debug(f"No changes since the last backup of {self.db!r}")
+                    return False
+                saved = save_backup(self.db, source=self._backup_conn)
+                if saved:
+                    self._backup_version = version
+                return saved
         except OSError as exc:
             if exc.errno in NO_SPACE_ERRORS:
                 # Not being able to create a backup is critical,
@@ -141,6 +301,95 @@ def save_backup(self) -> bool:
             sys.excepthook(*sys.exc_info())
         return False
 
+    @contextmanager
+    def _timed(self, phase: str, /) -> Iterator[None]:
+        """Measure the duration of an opening *phase*."""
+        start = monotonic()
+        try:
+            yield
+        finally:
+            elapsed = int((monotonic() - start) * 1000)
+            self.startup_timings[phase] = elapsed
+            log.info(f"Opening {self.db.name}: {phase} done in {elapsed} ms")
+
+    @property
+    def _shutdown_marker(self) -> Path:
+        return self.db.with_name(f"{self.db.name}.shutdown")
+
+    def _pop_shutdown_marker(self) -> str:
+        """
+        Return how the database was closed last time: "clean", "corrupted"
+        (closed after a failed integrity check) or "" (crash or older version).
+        The marker is removed, so that a crash is detected at the next opening.
+        """
+        marker = self._shutdown_marker
+        try:
+            state = marker.read_text(encoding="utf-8").strip()
+            marker.unlink()
+        except OSError:
+            return ""
+        return state
+
+    def _write_shutdown_marker(self, state: str, /) -> None:
+        try:
+            self._shutdown_marker.write_text(state, encoding="utf-8")
+        except OSError:
+            log.warning(
+                f"Cannot write the shutdown marker of {self.db!r}", exc_info=True
+            )
+
+    def check_integrity(self) -> bool:
+        """
+        Full integrity check of the database.
+        It only reads the database, so that it does not block writers in WAL mode.
+        """
+        start = monotonic()
+        healthy = is_healthy(self.db)
+        self.startup_timings["last_integrity_check"] = int((monotonic() - start) * 1000)
+        if not healthy:
+            log.error(
+                f"Integrity check failed on {self.db!r}, it will be fixed at the next start"
+            )
+            self._corrupted = True
+            self._write_shutdown_marker("corrupted")
+        return healthy
+
+    def incremental_vacuum(self, *, pages: int = VACUUM_PAGES) -> int:
+        """
+        Return up to *pages* free pages to the file system, and return the count
+        of remaining free pages.
+
+        Databases created before the incremental auto-vacuum was enabled are
+        left untouched, see _convert_auto_vacuum().
+        """
+        if not self._incremental_vacuum:
+            return 0
+
+        with self.lock:
+            conn = self._get_write_connection()
+            if conn.execute("PRAGMA freelist_count").fetchone()[0]:
+                # A statement only frees one page per step, a script runs them all
+                conn.executescript(f"PRAGMA incremental_vacuum({int(pages)})")
+            return int(conn.execute("PRAGMA freelist_count").fetchone()[0])
+
+    def _convert_auto_vacuum(self) -> None:
+        """
+        Enable the incremental auto-vacuum on a database created before it was the default.
+        It needs a full VACUUM, rewriting the whole file: it is only done at opening,
+        after a clean shutdown, and when the database_auto_vacuum_conversion option is set.
+        """
+        with self.lock:
+            conn = self._get_write_connection()
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+                return
+            log.warning(
+                f"Enabling the incremental auto-vacuum on {self.db!r},"
+                " the whole database is rewritten"
+            )
+            with self._timed("auto_vacuum_conversion"):
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                conn.execute("VACUUM")
+
     def get_schema_version(self, cursor: Cursor, db_exists: bool) -> int:
         """
         Get the schema version stored in the database.
@@ -201,8 +450,17 @@ def _get_columns(self, cursor: Cursor, table: str, /) -> List[Any]:
         ]
 
     def _init_db(self, cursor: Cursor, /) -> None:
+        # Only effective on new databases, see _convert_auto_vacuum() for others
+        cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
         cursor.execute(f"PRAGMA journal_mode = {self._journal_mode}")
         cursor.execute("PRAGMA temp_store = MEMORY")
+        cursor.execute(f"PRAGMA synchronous = {Options.database_synchronous}")
+
+    @staticmethod
+    def _tune_connection(conn: Connection, /) -> None:
+        """Per connection settings, tunable using Options."""
+        conn.execute(f"PRAGMA cache_size = {int(Options.database_cache_size)}")
+        conn.execute(f"PRAGMA mmap_size = {int(Options.database_mmap_size)}")
 
     def _create_configuration_table(self, cursor: Cursor, /) -> None:
         cursor.execute(
@@ -214,6 +472,7 @@ def _create_configuration_table(self, cursor: Cursor, /) -> None:
         )
 
     def _create_main_conn(self) -> Connection:
+        """The writer connection, shared by all threads and protected by the lock."""
         log.info(
             f"Create main connection on {self.db!r} "
             f"(dir_exists={self.db.parent.exists()}, "
@@ -221,53 +480,193 @@ def _create_main_conn(self) -> Connection:
         )
         conn = connect(
             str(self.db),
-            check_same_thread=False,  # Don't check same thread for closing purpose
+            check_same_thread=False,  # Used from several threads, under self.lock
+            factory=AutoRetryConnection,
+            isolation_level=None,  # Autocommit mode
+            timeout=10,
+        )
+        conn.row_factory = self._state_factory
+        conn.write_hook = self._before_write
+        self._tune_connection(conn)
+        return conn
+
+    def _create_read_conn(self) -> Connection:
+        """A read-only connection, part of the readers pool."""
+        conn = connect(
+            f"{self.db.resolve().as_uri()}?mode=ro",
+            uri=True,
+            check_same_thread=False,  # Shared by threads when the pool is full
             factory=AutoRetryConnection,
             isolation_level=None,  # Autocommit mode
             timeout=10,
         )
         conn.row_factory = self._state_factory
+        conn.execute("PRAGMA temp_store = MEMORY")
+        self._tune_connection(conn)
         return conn
 
     def dispose(self) -> None:
         log.info(f"Disposing SQLite database {self.db!r}")
-        if hasattr(self._conns, "conn"):
-            self._conns.conn.close()
-            del self._conns.conn
+        with self._readers_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers.clear()
+        with self._backup_lock:
+            if self._backup_conn:
+                self._backup_conn.close()
+                self._backup_conn = None
         if self.conn:
             self.conn.close()
+            self._write_shutdown_marker("corrupted" if self._corrupted else "clean")
+
+    def _get_writer(self) -> Connection:
+        if self.conn is None:
+            self.conn = self._create_main_conn()
+        return self.conn
 
     def _get_write_connection(self) -> Connection:
-        if self.in_tx:
-            if self.conn is None:
-                self.conn = self._create_main_conn()
-            return self.conn
-        return self._get_read_connection()
+        return self._get_writer()
+
+    def _before_write(self) -> None:
+        """
+        Called before every write statement of the writer connection, under the lock:
+        count it, and open the batch transaction of the current thread if needed.
+        """
+        self._write_statements += 1
+        if getattr(self._conns, "batch_depth", 0) and not self.in_tx:
+            self._begin_batch(self._get_writer())
+        elif not self._get_writer().in_transaction:
+            # Autocommit mode: one transaction per statement
+            self._write_transactions += 1
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """
+        Group write statements of the current thread into bigger transactions.
+
+        Without it, every write statement is its own autocommit transaction.
+        Inside the context, the transaction is committed every
+        *Options.database_write_batch_size* statements or
+        *Options.database_write_batch_delay* milliseconds, and when leaving the
+        outermost context (even on error, like autocommit would have done).
+
+        The DAO lock is held while the transaction is open, so the context
+        should wrap database work only: no network calls, and no waiting on
+        another thread using the DAO (like stopping a Processor).
+        """
+        batch = self._conns
+        batch.batch_depth = getattr(batch, "batch_depth", 0) + 1
+        try:
+            yield
+        finally:
+            batch.batch_depth -= 1
+            if not batch.batch_depth:
+                self._commit_batch()
+                batch.batch_releases = None
+
+    def _begin_batch(self, conn: Connection, /) -> None:
+        """
+        Reuse the opened batch transaction, or start a new one.
+
+        A full transaction is committed, and the next one is only started once
+        the lock was released, so that other threads can write meanwhile:
+        statements are in autocommit mode until then.
+        """
+        batch = self._conns
+        if getattr(batch, "batch_start", None) is not None:
+            if not conn.in_transaction:
+                # SQLite rolled back the transaction by itself (I/O error, disk full, ...)
+                log.warning(f"Batch transaction rolled back on {self.db!r}")
+                batch.batch_start = None
+                self.lock.release()
+            elif (
+                batch.batch_statements < Options.database_write_batch_size
+                and (monotonic() - batch.batch_start) * 1000
+                < Options.database_write_batch_delay
+            ):
+                batch.batch_statements += 1
+                return
+            else:
+                self._commit_batch()
+                batch.batch_releases = self.lock.releases
+
+        if getattr(batch, "batch_releases", None) == self.lock.releases:
+            # Full transaction committed, the lock was not released since
+            self._write_transactions += 1
+            return
+
+        self.lock.acquire()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except Exception:
+            self.lock.release()
+            raise
+        batch.batch_start = monotonic()
+        batch.batch_statements = 1
+        batch.batch_releases = None
+        self._write_transactions += 1
+
+    def _commit_batch(self) -> None:
+        """Commit the batch transaction of the current thread, if any."""
+        batch = self._conns
+        if getattr(batch, "batch_start", None) is None:
+            return
+
+        batch.batch_start = None
+        conn = self.conn
+        try:
+            if conn.in_transaction:
+                conn.execute("COMMIT")
+        except Exception:
+            # Do not let the connection in a pending transaction
+            with suppress(Exception):
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            self.lock.release()
+
+    def _reset_write_metrics(self) -> None:
+        """Writes done while opening the database are not part of the metrics."""
+        self._write_statements = self._write_transactions = 0
+
+    def get_metrics(self) -> Metrics:
+        statements, transactions = self._write_statements, self._write_transactions
+        return {
+            "db_write_statements": statements,
+            "db_write_transactions": transactions,
+            "db_statements_per_transaction": (
+                round(statements / transactions, 2) if transactions else 0
+            ),
+            "db_readers": len(self._readers),
+            "db_lock_waits": self.lock.waits,
+            "db_startup_timings": self.startup_timings,
+            "db_incremental_vacuum": self._incremental_vacuum,
+        }
 
     def _get_read_connection(self) -> Connection:
-        # If in transaction
-        if self.in_tx is not None:
-            if current_thread_id() == self.in_tx:
-                if not self.conn:
-                    self.conn = self._create_main_conn()
-                # Return the write connection
-                return self.conn
-            log.debug("In transaction wait for read connection")
-            # Wait for the thread in transaction to finished
-            with self._tx_lock:
-                pass
-
-        if not hasattr(self._conns, "conn"):
-            self._conns.conn = connect(
-                str(self.db),
-                check_same_thread=False,  # Don't check same thread for closing purpose
-                factory=AutoRetryConnection,
-                isolation_level=None,  # Autocommit mode
-                timeout=10,
-            )
-            self._conns.conn.row_factory = self._state_factory
+        # The thread in a migration or in a batch transaction must see its own changes
+        in_batch = getattr(self._conns, "batch_start", None) is not None
+        if in_batch or (self.in_tx is not None and current_thread_id() == self.in_tx):
+            return self._get_writer()
+
+        conn: Optional[Connection] = getattr(self._conns, "reader", None)
+        if conn is None:
+            conn = self._conns.reader = self._get_reader()
+        return conn
 
-        return self._conns.conn  # type: ignore
+    def _get_reader(self) -> Connection:
+        """
+        Pick a connection from the readers pool for the current thread.
+        New connections are created until *Options.database_readers* is reached,
+        then existing ones are shared between threads.
+        """
+        with self._readers_lock:
+            if len(self._readers) < Options.database_readers:
+                self._readers.append(self._create_read_conn())
+                return self._readers[-1]
+            conn = self._readers[self._next_reader % len(self._readers)]
+            self._next_reader += 1
+            return conn
 
     def _delete_config(self, cursor: Cursor, name: str, /) -> None:
         cursor.execute("DELETE FROM Configuration WHERE name = ?", (name,))
@@ -4,7 +4,7 @@
 import json
 import os
 import shutil
-from contextlib import suppress
+from contextlib import contextmanager, suppress
 from datetime import datetime
 from logging import getLogger
 from os.path import basename
@@ -16,8 +16,10 @@
     Callable,
     Dict,
     Generator,
+    Iterable,
     List,
     Optional,
+    Sequence,
     Tuple,
     Union,
 )
@@ -26,13 +28,15 @@
 
 from .. import __version__
 from ..client.local import FileInfo
-from ..constants import ROOT, UNACCESSIBLE_HASH, WINDOWS, TransferStatus
+from ..constants import ROOT, UNACCESSIBLE_HASH, WINDOWS, QueuePriority, TransferStatus
 from ..exceptions import UnknownPairState
 from ..objects import (
+    STATES_COLUMNS,
     DocPair,
     DocPairs,
     Download,
     Filters,
+    FilterTrie,
     RemoteFileInfo,
     Session,
     Upload,
@@ -115,9 +119,18 @@ def __init__(self, db: Path, /) -> None:
 
         self.queue_manager: Optional["QueueManager"] = None
         self._items_count = 0
+        self._states_watchers: List[Callable[[str], None]] = []
+
+        # Direct Transfer folders created while items are still planned,
+        # local path -> (remote path, remote ref), see direct_transfer_planning()
+        self._dt_planners = 0
+        self._dt_folders: Dict[str, Tuple[str, str]] = {}
+
         self.get_syncing_count()
-        self._filters = self.get_filters()
-        self.reinit_processors()
+        self._load_filters()
+        with self._timed("processors"):
+            self.reinit_processors()
+        self._reset_write_metrics()
 
     def _migrate_state(self, cursor: Cursor, /) -> None:
         try:
@@ -651,6 +664,15 @@ def _create_state_table(cursor: Cursor, /, *, force: bool = False) -> None:
             "    UNIQUE(remote_ref, local_path))"
         )
 
+    @staticmethod
+    def _create_state_indexes(cursor: Cursor, /) -> None:
+        """Create the States table indexes, as the 0023, 0024 and 0027 migrations do."""
+        from .migrations.engine import engine_migrations
+
+        engine_migrations["0023_states_indexes"]._create_state_indexes(cursor)
+        engine_migrations["0024_states_queue"]._create_queue_index(cursor)
+        engine_migrations["0027_states_duplicates"]._create_duplicates_index(cursor)
+
     def _append_to_table(
         self, cursor: Cursor, table: str, field_data: Tuple[str, ...], /
     ) -> None:
@@ -674,6 +696,74 @@ def acquire_state(
                 raise
         raise OperationalError("Cannot acquire")
 
+    def acquire_dt_small_files(
+        self, thread_id: int, doc_pair: DocPair, size: int, count: int, /
+    ) -> DocPairs:
+        """
+        Acquire up to *count* other Direct Transfer files of the *doc_pair* folder,
+        not bigger than *size* bytes, to upload them all at once: the same session,
+        remote parent and duplicates behavior, and no document type nor transfer.
+        """
+        with self.lock:
+            c = self._get_write_connection().cursor()
+            doc_pairs: DocPairs = c.execute(
+                "SELECT * FROM States"
+                " WHERE local_parent_path = ?"
+                "   AND id != ?"
+                "   AND session = ?"
+                "   AND local_state = 'direct'"
+                "   AND remote_state = 'unknown'"
+                "   AND remote_parent_ref = ?"
+                "   AND duplicate_behavior = ?"
+                "   AND IFNULL(doc_type, '') = ''"
+                "   AND folderish = 0"
+                "   AND size <= ?"
+                "   AND processor = 0"
+                "   AND id NOT IN (SELECT doc_pair FROM Uploads WHERE doc_pair IS NOT NULL)"
+                " ORDER BY id"
+                " LIMIT ?",
+                (
+                    doc_pair.local_parent_path,
+                    doc_pair.id,
+                    doc_pair.session,
+                    doc_pair.remote_parent_ref,
+                    doc_pair.duplicate_behavior,
+                    size,
+                    count,
+                ),
+            ).fetchall()
+            c.executemany(
+                "UPDATE States SET processor = ? WHERE id = ?",
+                ((thread_id, pair.id) for pair in doc_pairs),
+            )
+            return doc_pairs
+
+    def acquire_dt_folders(
+        self, thread_id: int, session: int, count: int, /
+    ) -> DocPairs:
+        """
+        Acquire up to *count* Direct Transfer folders of the *session* ready to be created,
+        meaning their parent already exists on the server.
+        """
+        with self.lock:
+            c = self._get_write_connection().cursor()
+            doc_pairs: DocPairs = c.execute(
+                "SELECT * FROM States"
+                " WHERE session = ?"
+                "   AND local_state = 'direct'"
+                "   AND remote_state = 'unknown'"
+                "   AND folderish = 1"
+                "   AND processor = 0"
+                " ORDER BY id"
+                " LIMIT ?",
+                (session, count),
+            ).fetchall()
+            c.executemany(
+                "UPDATE States SET processor = ? WHERE id = ?",
+                ((thread_id, pair.id) for pair in doc_pairs),
+            )
+            return doc_pairs
+
     def release_state(self, thread_id: Optional[int], /) -> None:
         if thread_id is None:
             return
@@ -707,6 +797,12 @@ def acquire_processor(self, thread_id: int, row_id: int, /) -> bool:
     def _reinit_states(self, cursor: Cursor, /) -> None:
         cursor.execute("DROP TABLE States")
         self._create_state_table(cursor, force=True)
+        # Columns added by the 0022 and 0024 migrations
+        self._append_to_table(cursor, "States", ("doc_type", "VARCHAR"))
+        self._append_to_table(
+            cursor, "States", ("priority", "INTEGER", "DEFAULT", "(1)")
+        )
+        self._create_state_indexes(cursor)
         for config in (
             "remote_last_sync_date",
             "remote_last_event_log_id",
@@ -722,11 +818,59 @@ def reinit_states(self) -> None:
             c = con.cursor()
             self._reinit_states(c)
             con.execute("VACUUM")
+            if self._states_watchers:
+                # Triggers were dropped with the table
+                self._create_states_triggers(c)
+                self._states_changed("")
+
+    def watch_states(self, callback: Callable[[str], None], /) -> None:
+        """Call *callback* with the local path of every state inserted, deleted,
+        or whose sync status changed (see osi/extension.py::get_formatted_status()).
+        The empty string means that all states changed.
+
+        It is called by SQLite triggers, from the writing thread holding the lock:
+        the write and the call are atomic for anyone holding the lock too.
+        """
+        with self.lock:
+            self._states_watchers.append(callback)
+            if len(self._states_watchers) == 1:
+                self._create_states_triggers(self._get_writer().cursor())
+
+    def _create_states_triggers(self, cursor: Cursor, /) -> None:
+        """Create the temporary triggers of the writer connection calling watch_states() callbacks."""
+        cursor.connection.create_function("states_changed", 1, self._states_changed)
+        cursor.execute(
+            "CREATE TEMP TRIGGER IF NOT EXISTS states_inserted"
+            " AFTER INSERT ON main.States"
+            " BEGIN SELECT states_changed(NEW.local_path); END"
+        )
+        cursor.execute(
+            "CREATE TEMP TRIGGER IF NOT EXISTS states_deleted"
+            " AFTER DELETE ON main.States"
+            " BEGIN SELECT states_changed(OLD.local_path); END"
+        )
+        # Only columns used to compute the sync status
+        cursor.execute(
+            "CREATE TEMP TRIGGER IF NOT EXISTS states_updated"
+            " AFTER UPDATE OF local_path, local_state, pair_state, processor, error_count"
+            " ON main.States"
+            " BEGIN"
+            "     SELECT states_changed(OLD.local_path);"
+            "     SELECT states_changed(NEW.local_path)"
+            "      WHERE NEW.local_path IS NOT OLD.local_path;"
+            " END"
+        )
+
+    def _states_changed(self, local_path: Optional[str], /) -> None:
+        if local_path is None:
+            # Remotely created states are not on the disk yet
+            return
+        for callback in self._states_watchers:
+            callback(local_path)
 
     def reinit_processors(self) -> None:
         with self.lock:
-            con = self._get_write_connection()
-            c = con.cursor()
+            c = self._get_write_connection().cursor()
             c.execute("UPDATE States SET processor = 0")
             c.execute(
                 "UPDATE States"
@@ -735,7 +879,6 @@ def reinit_processors(self) -> None:
                 "       last_error = NULL"
                 " WHERE pair_state = 'synchronized'"
             )
-            con.execute("VACUUM")
 
     def delete_remote_state(self, doc_pair: DocPair, /) -> None:
         with self.lock:
@@ -747,10 +890,8 @@ def delete_remote_state(self, doc_pair: DocPair, /) -> None:
             )
             c.execute(f"{update} WHERE id = ?", ("remotely_deleted", doc_pair.id))
             if doc_pair.folderish:
-                c.execute(
-                    update + " " + self._get_recursive_remote_condition(doc_pair),
-                    ("parent_remotely_deleted",),
-                )
+                condition, params = self._get_recursive_remote_condition(doc_pair)
+                c.execute(f"{update} {condition}", ("parent_remotely_deleted", *params))
             # Only queue parent
             self._queue_pair_state(doc_pair.id, doc_pair.folderish, "remotely_deleted")
 
@@ -761,9 +902,12 @@ def delete_local_state(self, doc_pair: DocPair, /) -> None:
                 sql = "UPDATE States SET local_state = 'deleted', pair_state = 'locally_deleted'"
                 c.execute(f"{sql} WHERE id = ?", (doc_pair.id,))
                 if doc_pair.folderish:
-                    c.execute(f"{sql} {self._get_recursive_condition(doc_pair)}")
+                    condition, params = self._get_recursive_condition(doc_pair)
+                    c.execute(f"{sql} {condition}", params)
         finally:
             if self.queue_manager:
+                # Processors may wait for the lock held by a batch transaction
+                self._commit_batch()
                 self.queue_manager.interrupt_processors_on(
                     doc_pair.local_path, exact_match=False
                 )
@@ -825,12 +969,31 @@ def insert_local_state(
             if (parent is None and parent_path is None) or (
                 parent and parent.pair_state != "locally_created"
             ):
-                self._queue_pair_state(row_id, info.folderish, pair_state)
+                self._queue_pair_state(
+                    row_id, info.folderish, pair_state, size=info.size
+                )
 
             self._items_count += 1
 
             return row_id
 
+    @contextmanager
+    def direct_transfer_planning(self) -> Generator[None, None, None]:
+        """
+        Direct Transfer items are planned while their parents are being uploaded.
+        Remember the folders created meanwhile, to plan their late children
+        directly with their remote parent (see plan_many_direct_transfer_items()).
+        """
+        with self.lock:
+            self._dt_planners += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self._dt_planners -= 1
+                if not self._dt_planners:
+                    self._dt_folders.clear()
+
     def plan_many_direct_transfer_items(
         self, items: Tuple[Any, ...], session: int, /
     ) -> int:
@@ -840,6 +1003,15 @@ def plan_many_direct_transfer_items(
         It is recommended to now exceed 500 *items* for each call of this method.
         """
         with self.lock:
+            if self._dt_folders:
+                # Children of an already created folder are not waiting for it
+                items = tuple(
+                    item[:5] + self._dt_folders[item[1]] + item[7:9] + ("unknown",)
+                    if item[9] == "todo" and item[1] in self._dt_folders
+                    else item
+                    for item in items
+                )
+
             c = self._get_write_connection().cursor()
 
             # This will be needed later
@@ -851,8 +1023,9 @@ def plan_many_direct_transfer_items(
                 "INSERT INTO States "
                 "(local_path, local_parent_path, local_name, folderish, size, "
                 "remote_parent_path, remote_parent_ref, doc_type, duplicate_behavior, "
-                "local_state, remote_state, pair_state, session)"
-                f"VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'direct', ?, 'direct_transfer', {session})"
+                "local_state, remote_state, pair_state, session, priority)"
+                f"VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'direct', ?, 'direct_transfer', {session},"
+                f" {QueuePriority.USER.value})"
             )
             c.executemany(query, items)
             return current_max_row_id
@@ -927,41 +1100,113 @@ def get_last_files_count(self, *, direction: str = "", duration: int = None) ->
         )
 
     def _get_to_sync_condition(self) -> str:
+        # Must be kept in sync with the idx_states_to_sync partial index
         return "pair_state NOT IN ('synchronized', 'unsynchronized')"
 
-    def register_queue_manager(self, manager: "QueueManager", /) -> None:
-        """Register the queue manager and add all *pairs* to handle into the queue."""
+    @staticmethod
+    def _get_queue_condition(local: bool, /) -> str:
+        """Pair states handled by the local or the remote queues of the QueueManager."""
+        if local:
+            return "(pair_state GLOB 'locally*' OR pair_state GLOB 'direct_transfer*')"
+        return "(pair_state GLOB 'remotely*' OR pair_state GLOB 'parent_remotely*')"
+
+    def _get_queue_session_condition(self) -> str:
+        # Filter out Direct Transfer pairs when the associated session is not ongoing
+        # (it will generate potentially a lot of work for nothing as such pairs
+        #  will be skipped in the Processor then)
+        return (
+            "(session = 0"  # Pure synchronization transfers
+            f" OR session IN (SELECT uid FROM Sessions WHERE status = {TransferStatus.ONGOING.value}))"
+        )
 
+    def register_queue_manager(self, manager: "QueueManager", /) -> None:
+        """
+        Register the queue manager and tell it how many *pairs* are waiting to be handled.
+        Pairs are not loaded here, the queue manager pages them using get_queue_page().
+        """
         with self.lock:
             self.queue_manager = manager
 
             c = self._get_write_connection().cursor()
+            for local in (True, False):
+                query = (
+                    "SELECT folderish, COUNT(*) AS count FROM States"
+                    f" WHERE {self._get_to_sync_condition()}"
+                    f"   AND {self._get_queue_condition(local)}"
+                    f"   AND {self._get_queue_session_condition()}"
+                    " GROUP BY folderish"
+                )
+                for folderish, count in c.execute(query):
+                    manager.add_backlog(count, local=local, folderish=bool(folderish))
 
-            # Order by path to be sure to process parents before children.
-            # Note: filter out Direct Transfer pairs when the associated session is not ongoing
-            #       (it will generate potentially a lot of work for nothing as such pairs
-            #        will be skipped in the Processor then)
-            query = (
-                "SELECT * FROM States"
-                f"   WHERE {self._get_to_sync_condition()}"
-                "      AND (session = 0"  # Pure synchronization transfers
-                "           OR session IN (SELECT uid FROM Sessions WHERE status = ?))"
-                " ORDER BY local_path ASC"
-            )
-            pairs = c.execute(query, (TransferStatus.ONGOING.value,)).fetchall()
-
-            folders = {}
-            for pair in pairs:
-                # Add all the folders
-                if pair.folderish:
-                    folders[pair.local_path] = True
-                if pair.local_parent_path not in folders:
-                    self.queue_manager.push_ref(
-                        pair.id, pair.folderish, pair.pair_state
-                    )
+    def get_queue_page(
+        self,
+        *,
+        local: bool,
+        folderish: bool,
+        limit: int,
+        after: Optional[Tuple[int, int, int]] = None,
+    ) -> DocPairs:
+        """
+        Return the next *limit* pairs to handle for one of the QueueManager queues.
+        Pairs are ordered by (priority, size, id), *after* is the key of the last
+        pair of the previous page.
+
+        Pairs already acquired by a processor are skipped, as well as pairs
+        whose parent folder is being created: queue_children() will push them.
+        """
+        columns = self._projection(
+            ("id", "folderish", "pair_state", "priority", "size")
+        )
+        conditions = [
+            self._get_to_sync_condition(),
+            "folderish = ?",
+            "processor = 0",
+            self._get_queue_condition(local),
+            self._get_queue_session_condition(),
+            "NOT EXISTS (SELECT 1 FROM States AS parent"
+            "             WHERE parent.local_path = States.local_parent_path"
+            "               AND parent.folderish = 1"
+            "               AND parent.pair_state IN"
+            "                   ('locally_created', 'remotely_created', 'direct_transfer'))",
+        ]
+        params: List[Any] = [int(folderish)]
+        if after:
+            conditions.append("(priority, size, id) > (?, ?, ?)")
+            params.extend(after)
+        query = (
+            f"SELECT {columns} FROM States"
+            f" WHERE {' AND '.join(conditions)}"
+            " ORDER BY priority, size, id"
+            f" LIMIT {limit}"
+        )
+
+        # Use the write connection to also see pairs of an ongoing batch
+        with self.lock:
+            c = self._get_writer().cursor()
+            pairs: DocPairs = c.execute(query, params).fetchall()
+            return pairs
+
+    def prioritize_state(self, row: DocPair, /) -> None:
+        """Handle the *row* before any other pair of its queue, used for user actions."""
+        with self.lock:
+            c = self._get_write_connection().cursor()
+            c.execute(
+                "UPDATE States SET priority = ? WHERE id = ?",
+                (QueuePriority.USER.value, row.id),
+            )
+            row.priority = QueuePriority.USER.value
 
     def _queue_pair_state(
-        self, row_id: int, folderish: bool, pair_state: str, /, *, pair: DocPair = None
+        self,
+        row_id: int,
+        folderish: bool,
+        pair_state: str,
+        /,
+        *,
+        pair: DocPair = None,
+        size: int = 0,
+        priority: int = QueuePriority.NORMAL.value,
     ) -> None:
         if self.queue_manager and pair_state not in {"synchronized", "unsynchronized"}:
             if pair_state == "conflicted":
@@ -969,7 +1214,9 @@ def _queue_pair_state(
                 self.newConflict.emit(row_id)
             else:
                 log.debug(f"Push to queue: {pair_state}, pair={pair!r}")
-                self.queue_manager.push_ref(row_id, folderish, pair_state)
+                self.queue_manager.push_ref(
+                    row_id, folderish, pair_state, size=size, priority=priority
+                )
         else:
             log.debug(f"Will not push pair: {pair_state}, pair={pair!r}")
 
@@ -1061,7 +1308,7 @@ def update_local_state(
                     parent and parent.local_state != "created"
                 ):
                     self._queue_pair_state(
-                        row.id, info.folderish, row.pair_state, pair=row
+                        row.id, info.folderish, row.pair_state, pair=row, size=info.size
                     )
 
     def update_local_modification_time(self, row: DocPair, info: FileInfo, /) -> None:
@@ -1073,7 +1320,9 @@ def update_local_modification_time(self, row: DocPair, info: FileInfo, /) -> Non
             )
 
     def get_valid_duplicate_file(self, digest: str, /) -> Optional[DocPair]:
-        """Find a file already synced with the same digest as the given *digest*."""
+        """Find a file already synced with the same digest as the given *digest*.
+        The WHERE clause must be kept in sync with the idx_states_duplicates index.
+        """
         c = self._get_read_connection().cursor()
         doc_pair: Optional[DocPair] = c.execute(
             "SELECT *"
@@ -1085,10 +1334,74 @@ def get_valid_duplicate_file(self, digest: str, /) -> Optional[DocPair]:
         ).fetchone()
         return doc_pair
 
-    def get_remote_descendants(self, path: str, /) -> DocPairs:
+    def get_cached_digest(
+        self, dev: int, inode: int, algorithm: str, size: int, mtime_ns: int, /
+    ) -> Optional[str]:
+        """Return the digest of a file that did not change since it was cached."""
+        c = self._get_read_connection().cursor()
+        row = c.execute(
+            "SELECT digest"
+            "  FROM DigestCache"
+            " WHERE dev = ? AND inode = ? AND algorithm = ?"
+            "   AND size = ? AND mtime_ns = ?",
+            (dev, inode, algorithm, size, mtime_ns),
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_cached_digest(
+        self,
+        dev: int,
+        inode: int,
+        algorithm: str,
+        size: int,
+        mtime_ns: int,
+        digest: str,
+        last_used: int,
+        /,
+    ) -> None:
+        """Cache the *digest* of a file, it replaces the one of a previous file version."""
+        with self.lock:
+            c = self._get_write_connection().cursor()
+            c.execute(
+                "INSERT OR REPLACE INTO DigestCache"
+                " (dev, inode, algorithm, size, mtime_ns, digest, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (dev, inode, algorithm, size, mtime_ns, digest, last_used),
+            )
+
+    def touch_cached_digests(
+        self, keys: Iterable[Tuple[int, int, str]], last_used: int, /
+    ) -> None:
+        """Mark (dev, inode, algorithm) cached digests as recently used."""
+        with self.lock:
+            c = self._get_write_connection().cursor()
+            c.executemany(
+                "UPDATE DigestCache SET last_used = ?"
+                " WHERE dev = ? AND inode = ? AND algorithm = ?",
+                ((last_used, *key) for key in keys),
+            )
+
+    def evict_cached_digests(self, limit: int, /) -> int:
+        """Keep only the *limit* most recently used digests, return the count of removed ones."""
+        with self.lock:
+            c = self._get_write_connection().cursor()
+            c.execute(
+                "DELETE FROM DigestCache"
+                " WHERE rowid IN (SELECT rowid"
+                "                   FROM DigestCache"
+                "               ORDER BY last_used DESC"
+                "                  LIMIT -1 OFFSET ?)",
+                (limit,),
+            )
+            return c.rowcount
+
+    def get_remote_descendants(
+        self, path: str, /, *, columns: Sequence[str] = ()
+    ) -> DocPairs:
         c = self._get_read_connection().cursor()
+        condition, params = self._startswith("remote_parent_path", path)
         return c.execute(
-            "SELECT * FROM States WHERE remote_parent_path LIKE ?", (f"{path}%",)
+            f"SELECT {self._projection(columns)} FROM States WHERE {condition}", params
         ).fetchall()
 
     def get_remote_descendants_from_ref(self, ref: str, /) -> DocPairs:
@@ -1186,24 +1499,47 @@ def get_errors(self, *, limit: int = 3) -> DocPairs:
             "SELECT * FROM States WHERE error_count > ?", (limit,)
         ).fetchall()
 
-    def get_local_children(self, path: Path, /) -> DocPairs:
+    def get_local_children(
+        self, path: Path, /, *, columns: Sequence[str] = ()
+    ) -> DocPairs:
         c = self._get_read_connection().cursor()
         return c.execute(
-            "SELECT * FROM States WHERE local_parent_path = ?", (path,)
+            f"SELECT {self._projection(columns)} FROM States WHERE local_parent_path = ?",
+            (path,),
         ).fetchall()
 
+    def get_local_children_of(
+        self, paths: Sequence[Path], /, *, columns: Sequence[str] = ()
+    ) -> Dict[Path, DocPairs]:
+        """Fetch the children of several folders at once, grouped by folder."""
+        if columns and "local_parent_path" not in columns:
+            columns = ("local_parent_path", *columns)
+        projection = self._projection(columns)
+        children: Dict[Path, DocPairs] = {path: [] for path in paths}
+        c = self._get_read_connection().cursor()
+        for idx in range(0, len(paths), 500):
+            chunk = paths[idx : idx + 500]
+            placeholders = ", ".join("?" * len(chunk))
+            for pair in c.execute(
+                f"SELECT {projection} FROM States"
+                f" WHERE local_parent_path IN ({placeholders})",
+                chunk,
+            ):
+                children[pair.local_parent_path].append(pair)
+        return children
+
     def get_states_from_partial_local(
-        self, path: Path, /, *, strict: bool = True
+        self, path: Path, /, *, strict: bool = True, columns: Sequence[str] = ()
     ) -> DocPairs:
         c = self._get_read_connection().cursor()
 
         local_path = adapt_path(path)
         if local_path[-1] != "/" and strict:
             local_path += "/"
-        local_path += "%"
 
+        condition, params = self._startswith("local_path", local_path)
         return c.execute(
-            "SELECT * FROM States WHERE local_path LIKE ?", (local_path,)
+            f"SELECT {self._projection(columns)} FROM States WHERE {condition}", params
         ).fetchall()
 
     def get_first_state_from_partial_remote(self, ref: str, /) -> Optional[DocPair]:
@@ -1260,23 +1596,62 @@ def get_state_from_id(
             if from_write:
                 self.lock.release()
 
-    def _get_recursive_condition(self, doc_pair: DocPair, /) -> str:
-        path = self._escape(adapt_path(doc_pair.local_path))
-        res = (
-            f" WHERE (local_parent_path LIKE '{path}/%'"
-            f"        OR local_parent_path = '{path}')"
+    @staticmethod
+    def _projection(columns: Sequence[str], /) -> str:
+        """
+        Return the columns to SELECT from the States table: only *columns*,
+        or all of them when empty. Pairs will not have other attributes.
+        """
+        if not columns:
+            return "*"
+        unknown = set(columns).difference(STATES_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown States columns: {sorted(unknown)}")
+        return ", ".join(columns)
+
+    @staticmethod
+    def _startswith(column: str, prefix: str, /) -> Tuple[str, Tuple[str, ...]]:
+        """
+        Return the condition (and its parameters) matching all values of *column*
+        starting with *prefix*.
+
+        Contrary to a `LIKE 'prefix%'` predicate, the range comparison can use
+        the column index, is case sensitive and does not need any escaping.
+        """
+        if not prefix:
+            return "1", ()
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        return f"({column} >= ? AND {column} < ?)", (prefix, upper)
+
+    def _get_subtree_condition(
+        self, column: str, path: str, /
+    ) -> Tuple[str, Tuple[str, ...]]:
+        """Return the condition matching the *path* folder and all its descendants."""
+        condition, params = self._startswith(column, f"{path}/")
+        return f"({column} = ? OR {condition})", (path, *params)
+
+    def _get_recursive_condition(
+        self, doc_pair: DocPair, /
+    ) -> Tuple[str, Tuple[str, ...]]:
+        condition, params = self._get_subtree_condition(
+            "local_parent_path", adapt_path(doc_pair.local_path)
         )
         if doc_pair.remote_ref:
-            path = self._escape(f"{doc_pair.remote_parent_path}/{doc_pair.remote_ref}")
-            res += f" AND remote_parent_path LIKE '{path}%'"
-        return res
-
-    def _get_recursive_remote_condition(self, doc_pair: DocPair, /) -> str:
-        path = self._escape(f"{doc_pair.remote_parent_path}/{doc_pair.remote_ref}")
-        return (
-            f" WHERE remote_parent_path LIKE '{path}/%'"
-            f"    OR remote_parent_path = '{path}'"
+            remote_condition, remote_params = self._startswith(
+                "remote_parent_path",
+                f"{doc_pair.remote_parent_path}/{doc_pair.remote_ref}",
+            )
+            condition += f" AND {remote_condition}"
+            params += remote_params
+        return f" WHERE {condition}", params
+
+    def _get_recursive_remote_condition(
+        self, doc_pair: DocPair, /
+    ) -> Tuple[str, Tuple[str, ...]]:
+        condition, params = self._get_subtree_condition(
+            "remote_parent_path", f"{doc_pair.remote_parent_path}/{doc_pair.remote_ref}"
         )
+        return f" WHERE {condition}", params
 
     def replace_local_paths(self, old_path: Path, new_path: Path) -> None:
         """
@@ -1291,31 +1666,29 @@ def replace_local_paths(self, old_path: Path, new_path: Path) -> None:
 
         with self.lock:
             c = self._get_write_connection().cursor()
-            query = (
-                "UPDATE States"
-                "  SET local_parent_path = replace(local_parent_path, ?, ?),"
-                "      local_path = replace(local_path, ? , ?) "
-                "WHERE local_parent_path LIKE ? OR local_path LIKE ?"
-            )
-            c.execute(query, (old, new, old, new, f"{old}%", f"{old}%"))
+            for column in ("local_parent_path", "local_path"):
+                condition, params = self._startswith(column, old)
+                c.execute(
+                    "UPDATE States"
+                    f"  SET {column} = ? || substr({column}, ?)"
+                    f" WHERE {condition}",
+                    (new, len(old) + 1, *params),
+                )
 
     def update_remote_parent_path(self, doc_pair: DocPair, new_path: str, /) -> None:
         with self.lock:
             c = self._get_write_connection().cursor()
             if doc_pair.folderish:
-                count = len(
-                    self._escape(f"{doc_pair.remote_parent_path}/{doc_pair.remote_ref}")
-                )
-                path = self._escape(f"{new_path}/{doc_pair.remote_ref}")
-                query = (
+                old_path = f"{doc_pair.remote_parent_path}/{doc_pair.remote_ref}"
+                path = f"{new_path}/{doc_pair.remote_ref}"
+                condition, params = self._get_recursive_remote_condition(doc_pair)
+                log.debug(f"Update remote_parent_path from {old_path!r} to {path!r}")
+                c.execute(
                     "UPDATE States"
-                    f"  SET remote_parent_path = '{path}'"
-                    f"      || substr(remote_parent_path, {count + 1})"
-                    + self._get_recursive_remote_condition(doc_pair)
+                    "   SET remote_parent_path = ? || substr(remote_parent_path, ?)"
+                    + condition,
+                    (path, len(old_path) + 1, *params),
                 )
-
-                log.debug(f"Update remote_parent_path {query!r}")
-                c.execute(query)
             c.execute(
                 "UPDATE States SET remote_parent_path = ? WHERE id = ?",
                 (new_path, doc_pair.id),
@@ -1327,17 +1700,15 @@ def update_local_parent_path(
         with self.lock:
             c = self._get_write_connection().cursor()
             if doc_pair.folderish:
-                path = self._escape(adapt_path(new_path / new_name))
-                count = len(self._escape(adapt_path(doc_pair.local_path)))
-                query = (
+                path = adapt_path(new_path / new_name)
+                start = len(adapt_path(doc_pair.local_path)) + 1
+                condition, params = self._get_recursive_condition(doc_pair)
+                c.execute(
                     "UPDATE States"
-                    f"  SET local_parent_path = '{path}'"
-                    f"      || substr(local_parent_path, {count + 2}),"
-                    f"         local_path = '{path}'"
-                    f"      || substr(local_path, {count + 2}) "
-                    + self._get_recursive_condition(doc_pair)
+                    "   SET local_parent_path = ? || substr(local_parent_path, ?),"
+                    "       local_path = ? || substr(local_path, ?)" + condition,
+                    (path, start, path, start, *params),
                 )
-                c.execute(query)
             # Don't need to update the path as it is refresh later
             c.execute(
                 "UPDATE States SET local_parent_path = ? WHERE id = ?",
@@ -1368,6 +1739,11 @@ def update_remote_parent_path_dt(
                 " WHERE local_state = 'direct' AND remote_state = 'todo' AND local_parent_path = ?",
                 (remote_parent_path, remote_parent_ref, local_parent_path),
             )
+            if self._dt_planners:
+                self._dt_folders[adapt_path(local_parent_path)] = (
+                    remote_parent_path,
+                    remote_parent_ref,
+                )
 
             for doc_pair in doc_pairs:
                 doc_pair.remote_parent_path = remote_parent_path
@@ -1385,9 +1761,10 @@ def mark_descendants_remotely_created(self, doc_pair: DocPair, /) -> None:
                 "       remote_state = 'created',"
                 "       pair_state = 'remotely_created'"
             )
-            c.execute(f"{update} WHERE id = {doc_pair.id}")
+            c.execute(f"{update} WHERE id = ?", (doc_pair.id,))
             if doc_pair.folderish:
-                c.execute(f"{update} {self._get_recursive_condition(doc_pair)}")
+                condition, params = self._get_recursive_condition(doc_pair)
+                c.execute(f"{update} {condition}", params)
             self._queue_pair_state(doc_pair.id, doc_pair.folderish, doc_pair.pair_state)
 
     def remove_state(
@@ -1403,10 +1780,10 @@ def remove_state(
             c.execute("DELETE FROM States WHERE id = ?", (doc_pair.id,))
             if recursive and doc_pair.folderish:
                 if remote_recursion:
-                    condition = self._get_recursive_remote_condition(doc_pair)
+                    condition, params = self._get_recursive_remote_condition(doc_pair)
                 else:
-                    condition = self._get_recursive_condition(doc_pair)
-                c.execute("DELETE FROM States " + condition)
+                    condition, params = self._get_recursive_condition(doc_pair)
+                c.execute("DELETE FROM States " + condition, params)
 
     def remove_state_children(
         self, doc_pair: DocPair, /, *, remote_recursion: bool = False
@@ -1414,17 +1791,28 @@ def remove_state_children(
         with self.lock:
             c = self._get_write_connection().cursor()
             if remote_recursion:
-                condition = self._get_recursive_remote_condition(doc_pair)
+                condition, params = self._get_recursive_remote_condition(doc_pair)
             else:
-                condition = self._get_recursive_condition(doc_pair)
-            c.execute("DELETE FROM States " + condition)
+                condition, params = self._get_recursive_condition(doc_pair)
+            c.execute("DELETE FROM States " + condition, params)
 
-    def get_state_from_local(self, path: Path, /) -> Optional[DocPair]:
-        c = self._get_read_connection().cursor()
-        doc_pair: Optional[DocPair] = c.execute(
-            "SELECT * FROM States WHERE local_path = ?", (path,)
-        ).fetchone()
-        return doc_pair
+    def get_state_from_local(
+        self, path: Path, /, *, from_write: bool = False
+    ) -> Optional[DocPair]:
+        if from_write:
+            self.lock.acquire()
+            c = self._get_writer().cursor()
+        else:
+            c = self._get_read_connection().cursor()
+
+        try:
+            doc_pair: Optional[DocPair] = c.execute(
+                "SELECT * FROM States WHERE local_path = ?", (path,)
+            ).fetchone()
+            return doc_pair
+        finally:
+            if from_write:
+                self.lock.release()
 
     def insert_remote_state(
         self,
@@ -1478,7 +1866,9 @@ def insert_remote_state(
             if (parent is None and local_parent_path == ROOT) or (
                 parent and parent.pair_state != "remotely_created"
             ):
-                self._queue_pair_state(row_id, info.folderish, pair_state)
+                self._queue_pair_state(
+                    row_id, info.folderish, pair_state, size=info.size
+                )
             self._items_count += 1
             return row_id
 
@@ -1496,7 +1886,13 @@ def queue_children(self, row: DocPair, /) -> None:
             if children:
                 log.info(f"Queuing {len(children)} children of {row}")
                 for child in children:
-                    self._queue_pair_state(child.id, child.folderish, child.pair_state)
+                    self._queue_pair_state(
+                        child.id,
+                        child.folderish,
+                        child.pair_state,
+                        size=child.size,
+                        priority=child.priority,
+                    )
 
     def increase_error(
         self, row: DocPair, error: str, /, *, details: str = None, incr: int = 1
@@ -1528,7 +1924,13 @@ def reset_error(self, row: DocPair, /, *, last_error: str = None) -> None:
                 " WHERE id = ?",
                 (last_error, row.id),
             )
-            self._queue_pair_state(row.id, row.folderish, row.pair_state)
+            self._queue_pair_state(
+                row.id,
+                row.folderish,
+                row.pair_state,
+                size=row.size,
+                priority=row.priority,
+            )
             self._items_count += 1
             row.last_error = None
             row.error_count = 0
@@ -1548,7 +1950,9 @@ def _force_sync(self, row: DocPair, local: str, remote: str, pair: str, /) -> bo
                 "   AND version = ?",
                 (local, remote, pair, row.id, row.version),
             )
-            self._queue_pair_state(row.id, row.folderish, pair)
+            self._queue_pair_state(
+                row.id, row.folderish, pair, size=row.size, priority=row.priority
+            )
             if c.rowcount == 1:
                 self._items_count += 1
                 return True
@@ -1600,6 +2004,7 @@ def unset_unsychronised(self, row: DocPair, /) -> None:
         row.local_state = "created"
         row.remote_state = "unknown"
         row.pair_state = self._get_pair_state(row)
+        condition, params = self._startswith("local_path", adapt_path(row.local_path))
         with self.lock:
             c = self._get_write_connection().cursor()
             c.execute(
@@ -1611,13 +2016,13 @@ def unset_unsychronised(self, row: DocPair, /) -> None:
                 "       error_count = 0,"
                 "       last_sync_error_date = NULL,"
                 "       last_error = NULL"
-                " WHERE local_path LIKE ?",
+                f" WHERE {condition}",
                 (
                     row.local_state,
                     row.remote_state,
                     row.pair_state,
                     datetime.utcnow(),
-                    f"{adapt_path(row.local_path)}%",
+                    *params,
                 ),
             )
 
@@ -1647,6 +2052,7 @@ def synchronize_state(
                 "       local_digest = ?,"
                 "       last_sync_date = ?,"
                 "       processor = 0,"
+                f"       priority = {QueuePriority.NORMAL.value},"
                 "       last_error = NULL,"
                 "       last_error_details = NULL,"
                 "       error_count = 0,"
@@ -1674,6 +2080,7 @@ def synchronize_state(
                     "       pair_state = ?,"
                     "       last_sync_date = ?,"
                     "       processor = 0,"
+                    f"       priority = {QueuePriority.NORMAL.value},"
                     "       last_error = NULL,"
                     "       error_count = 0,"
                     "       last_sync_error_date = NULL"
@@ -1824,7 +2231,9 @@ def update_remote_state(
                 if (
                     parent and parent.pair_state != "remotely_created"
                 ) or parent is None:
-                    self._queue_pair_state(row.id, info.folderish, row.pair_state)
+                    self._queue_pair_state(
+                        row.id, info.folderish, row.pair_state, size=info.size
+                    )
         return True
 
     def _clean_filter_path(self, path: str, /) -> str:
@@ -1872,8 +2281,11 @@ def is_path_scanned(self, path: str, /) -> bool:
         return bool(row[0] > 0)
 
     def is_filter(self, path: str, /) -> bool:
-        path = self._clean_filter_path(path)
-        return any(path.startswith(_filter) for _filter in self._filters)
+        return path in self._filters_trie
+
+    def _load_filters(self) -> None:
+        self._filters = self.get_filters()
+        self._filters_trie = FilterTrie(self._filters)
 
     def get_filters(self) -> Filters:
         c = self._get_read_connection().cursor()
@@ -1899,7 +2311,7 @@ def add_filter(self, path: str, /) -> None:
 
             # TODO: Add this path as remotely_deleted?
 
-            self._filters = self.get_filters()
+            self._load_filters()
             self.get_syncing_count()
 
     def remove_filter(self, path: str, /) -> None:
@@ -1908,7 +2320,7 @@ def remove_filter(self, path: str, /) -> None:
         with self.lock:
             c = self._get_write_connection().cursor()
             c.execute("DELETE FROM Filters WHERE path LIKE ?", (f"{path}%",))
-            self._filters = self.get_filters()
+            self._load_filters()
             self.get_syncing_count()
 
     def get_downloads(self) -> Generator[Download, None, None]:
@@ -1931,6 +2343,9 @@ def get_downloads(self) -> Generator[Download, None, None]:
                 doc_pair=res.doc_pair,
                 tmpname=Path(res.tmpname),
                 url=res.url,
+                # Missing while running migrations older than the 0025 one
+                segment_size=getattr(res, "segment_size", 0),
+                segments=getattr(res, "segments", None),
             )
 
     def get_uploads(self) -> Generator[Upload, None, None]:
@@ -2115,9 +2530,9 @@ def create_session(
             self.sessionUpdated.emit(False)
             return int(c.lastrowid)
 
-    def update_session(self, uid: int, /) -> Optional[Session]:
+    def update_session(self, uid: int, /, *, count: int = 1) -> Optional[Session]:
         """
-        Increment the Session *uploaded_items* count.
+        Increment the Session *uploaded_items* count by *count*.
         Update the status if all files are uploaded.
         """
         with self.lock:
@@ -2125,7 +2540,7 @@ def update_session(self, uid: int, /) -> Optional[Session]:
             if not session:
                 return None
 
-            session.uploaded_items += 1
+            session.uploaded_items += count
             if session.uploaded_items == session.total_items:
                 session.status = TransferStatus.DONE
                 sql = "UPDATE Sessions SET uploaded = ?, status = ?, completed_on = CURRENT_TIMESTAMP WHERE uid = ?"
@@ -2151,6 +2566,17 @@ def change_session_status(self, uid: int, status: TransferStatus, /) -> None:
             )
             self.sessionUpdated.emit(False)
 
+    def increase_session_counts(self, uid: int, count: int, /) -> None:
+        """Increase the Session *total_items* and *planned_items* counts by *count*."""
+        with self.lock:
+            c = self._get_write_connection().cursor()
+            c.execute(
+                "UPDATE Sessions SET total = total + ?, planned_items = planned_items + ?"
+                " WHERE uid = ?",
+                (count, count, uid),
+            )
+            self.sessionUpdated.emit(False)
+
     def decrease_session_counts(self, uid: int, /) -> Optional[Session]:
         """
         Decrease the Session *total_items* and *planned_items* counts.
@@ -2292,6 +2718,21 @@ def save_download(self, download: Download, /) -> None:
             c.execute(sql, values)
             self.transferUpdated.emit()
 
+    def set_download_segments(self, download: Download, /) -> None:
+        """Update the segments map of a segmented *download*."""
+        with self.lock:
+            c = self._get_write_connection().cursor()
+            c.execute(
+                "UPDATE Downloads SET filesize = ?, segment_size = ?, segments = ?"
+                " WHERE path = ?",
+                (
+                    download.filesize,
+                    download.segment_size,
+                    download.segments,
+                    download.path,
+                ),
+            )
+
     def save_upload(self, upload: Upload, /) -> None:
         """New upload."""
         with self.lock:
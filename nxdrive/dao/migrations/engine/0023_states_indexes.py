@@ -0,0 +1,72 @@
+from sqlite3 import Cursor
+
+from ..migration import MigrationInterface
+
+
+class MigrationStatesIndexes(MigrationInterface):
+    def upgrade(self, cursor: Cursor) -> None:
+        """
+        Create secondary indexes on the States table.
+        """
+        self._create_state_indexes(cursor)
+
+    def downgrade(self, cursor: Cursor) -> None:
+        """Drop the secondary indexes of the States table."""
+        for index in (
+            "idx_states_local_path",
+            "idx_states_local_parent_path",
+            "idx_states_remote_parent_ref",
+            "idx_states_remote_parent_path",
+            "idx_states_pair_state",
+            "idx_states_processor",
+            "idx_states_to_sync",
+        ):
+            cursor.execute(f"DROP INDEX IF EXISTS {index}")
+
+    @property
+    def version(self) -> int:
+        return 23
+
+    @property
+    def previous_version(self) -> int:
+        return 22
+
+    @staticmethod
+    def _create_state_indexes(cursor: Cursor, /) -> None:
+        """Create the States table indexes."""
+        # Lookups by path: get_state_from_local(), get_local_children(), ...
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_states_local_path ON States (local_path)"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_states_local_parent_path"
+            " ON States (local_parent_path)"
+        )
+        # Lookups by remote parent: get_remote_children(), queue_children(), ...
+        # Note: lookups by remote_ref are already covered by the UNIQUE constraints.
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_states_remote_parent_ref"
+            " ON States (remote_parent_ref)"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_states_remote_parent_path"
+            " ON States (remote_parent_path)"
+        )
+        # Counters: get_unsynchronized_count(), get_conflict_count(), ...
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_states_pair_state ON States (pair_state)"
+        )
+        # release_processor()
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_states_processor ON States (processor)"
+        )
+        # register_queue_manager(): only pairs to sync, already sorted by path.
+        # The WHERE clause must be kept in sync with EngineDAO._get_to_sync_condition().
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_states_to_sync"
+            " ON States (local_path)"
+            " WHERE pair_state NOT IN ('synchronized', 'unsynchronized')"
+        )
+
+
+migration = MigrationStatesIndexes()
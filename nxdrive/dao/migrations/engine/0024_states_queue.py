@@ -0,0 +1,43 @@
+from sqlite3 import Cursor
+
+from ..migration import MigrationInterface
+
+
+class MigrationStatesQueue(MigrationInterface):
+    def upgrade(self, cursor: Cursor) -> None:
+        """
+        Add the priority column to the States table, and the index used
+        by the QueueManager to page pairs to handle.
+        """
+        cursor.execute("ALTER TABLE States ADD priority INTEGER DEFAULT (1)")
+        # Direct Transfer items are always requested by the user
+        cursor.execute("UPDATE States SET priority = 0 WHERE local_state = 'direct'")
+        # The size is part of the queue order, it must be comparable
+        cursor.execute("UPDATE States SET size = 0 WHERE size IS NULL")
+        self._create_queue_index(cursor)
+
+    def downgrade(self, cursor: Cursor) -> None:
+        """Drop the queue index and the priority column of the States table."""
+        cursor.execute("DROP INDEX IF EXISTS idx_states_queue")
+        cursor.execute("ALTER TABLE States DROP COLUMN priority")
+
+    @property
+    def version(self) -> int:
+        return 24
+
+    @property
+    def previous_version(self) -> int:
+        return 23
+
+    @staticmethod
+    def _create_queue_index(cursor: Cursor, /) -> None:
+        """Create the index used by EngineDAO.get_queue_page()."""
+        # The WHERE clause must be kept in sync with EngineDAO._get_to_sync_condition().
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_states_queue"
+            " ON States (folderish, priority, size, id)"
+            " WHERE pair_state NOT IN ('synchronized', 'unsynchronized')"
+        )
+
+
+migration = MigrationStatesQueue()
@@ -0,0 +1,29 @@
+from sqlite3 import Cursor
+
+from ..migration import MigrationInterface
+
+
+class MigrationDownloadsSegments(MigrationInterface):
+    def upgrade(self, cursor: Cursor) -> None:
+        """
+        Add the segment_size and segments columns to the Downloads table,
+        used to resume segmented downloads.
+        """
+        cursor.execute("ALTER TABLE Downloads ADD segment_size INTEGER DEFAULT (0)")
+        cursor.execute("ALTER TABLE Downloads ADD segments BLOB DEFAULT NULL")
+
+    def downgrade(self, cursor: Cursor) -> None:
+        """Drop the segments columns of the Downloads table."""
+        cursor.execute("ALTER TABLE Downloads DROP COLUMN segments")
+        cursor.execute("ALTER TABLE Downloads DROP COLUMN segment_size")
+
+    @property
+    def version(self) -> int:
+        return 25
+
+    @property
+    def previous_version(self) -> int:
+        return 24
+
+
+migration = MigrationDownloadsSegments()
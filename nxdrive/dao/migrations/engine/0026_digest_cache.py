@@ -0,0 +1,41 @@
+from sqlite3 import Cursor
+
+from ..migration import MigrationInterface
+
+
+class MigrationDigestCache(MigrationInterface):
+    def upgrade(self, cursor: Cursor) -> None:
+        """
+        Create the DigestCache table, used to not compute again digests of unchanged files.
+        """
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS DigestCache ("
+            "    dev          INTEGER NOT NULL,"
+            "    inode        INTEGER NOT NULL,"
+            "    algorithm    VARCHAR NOT NULL,"
+            "    size         INTEGER NOT NULL,"
+            "    mtime_ns     INTEGER NOT NULL,"
+            "    digest       VARCHAR NOT NULL,"
+            "    last_used    INTEGER NOT NULL,"
+            "    PRIMARY KEY (dev, inode, algorithm))"
+        )
+        # Eviction of the least recently used digests
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_digest_cache_last_used"
+            " ON DigestCache (last_used)"
+        )
+
+    def downgrade(self, cursor: Cursor) -> None:
+        """Drop the DigestCache table."""
+        cursor.execute("DROP TABLE IF EXISTS DigestCache")
+
+    @property
+    def version(self) -> int:
+        return 26
+
+    @property
+    def previous_version(self) -> int:
+        return 25
+
+
+migration = MigrationDigestCache()
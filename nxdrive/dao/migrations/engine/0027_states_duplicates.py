@@ -0,0 +1,36 @@
+from sqlite3 import Cursor
+
+from ..migration import MigrationInterface
+
+
+class MigrationStatesDuplicates(MigrationInterface):
+    def upgrade(self, cursor: Cursor) -> None:
+        """
+        Create the index used to find local duplicates of a content to download.
+        """
+        self._create_duplicates_index(cursor)
+
+    def downgrade(self, cursor: Cursor) -> None:
+        """Drop the duplicates index of the States table."""
+        cursor.execute("DROP INDEX IF EXISTS idx_states_duplicates")
+
+    @property
+    def version(self) -> int:
+        return 27
+
+    @property
+    def previous_version(self) -> int:
+        return 26
+
+    @staticmethod
+    def _create_duplicates_index(cursor: Cursor, /) -> None:
+        """Create the index used by EngineDAO.get_valid_duplicate_file()."""
+        # Only synchronized pairs are candidates, the index stays small while syncing
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_states_duplicates"
+            " ON States (local_digest)"
+            " WHERE pair_state = 'synchronized'"
+        )
+
+
+migration = MigrationStatesDuplicates()
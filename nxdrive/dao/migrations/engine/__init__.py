@@ -1,7 +1,15 @@
 import importlib
 from typing import Any, Dict
 
-__migrations_list = ["0021_initial_migration", "0022_initial_migration"]  # Keep sorted
+__migrations_list = [
+    "0021_initial_migration",
+    "0022_initial_migration",
+    "0023_states_indexes",
+    "0024_states_queue",
+    "0025_downloads_segments",
+    "0026_digest_cache",
+    "0027_states_duplicates",
+]  # Keep sorted
 
 
 def import_migrations() -> Dict[str, Any]:
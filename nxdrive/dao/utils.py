@@ -1,25 +1,39 @@
 import sqlite3
-from datetime import datetime, timedelta
+from contextlib import closing
+from datetime import datetime
 from logging import getLogger
-from os import fsync
 from pathlib import Path
-from shutil import copyfile
+from typing import Dict, Set, Tuple
 
-__all__ = ("fix_db", "restore_backup", "save_backup")
+__all__ = ("fix_db", "prune_backups", "restore_backup", "save_backup")
 
 log = getLogger(__name__)
 
+DAY = 24 * 60 * 60
+WEEK = 7 * DAY
 
-def is_healthy(database: Path, /) -> bool:
+# Pages copied at once by the backup API
+BACKUP_PAGES = 4096
+
+# Backups older than a day: (maximum age, one backup kept by period), in seconds
+BACKUP_RETENTION = ((WEEK, DAY), (4 * WEEK, WEEK))
+
+
+def is_healthy(database: Path, /, *, quick: bool = False) -> bool:
     """
     Integrity check of the entire database.
     http://www.sqlite.org/pragma.html#pragma_integrity_check
+
+    The *quick* check does not verify that indexes match their table, it
+    is much faster on big databases.
+    http://www.sqlite.org/pragma.html#pragma_quick_check
     """
 
-    log.info(f"Checking database integrity: {database!r}")
+    check = "quick_check" if quick else "integrity_check"
+    log.info(f"Checking database integrity ({check}): {database!r}")
     con = sqlite3.connect(str(database))
     try:
-        status = con.execute("PRAGMA integrity_check(1)").fetchone()
+        status = con.execute(f"PRAGMA {check}(1)").fetchone()
         return status[0] == "ok"
     finally:
         # According to the documentation:
@@ -28,148 +42,210 @@ def is_healthy(database: Path, /) -> bool:
         con.close()
 
 
-def dump(database: Path, dump_file: Path, /) -> None:
-    """
-    Dump the entire database content into `dump_file`.
-    This function provides the same capabilities as the .dump command
-    in the sqlite3 shell.
-    """
-
-    log.info(f"Dumping the database {database!r} into {dump_file!r}...")
-    with sqlite3.connect(str(database)) as con, dump_file.open(
-        mode="w", encoding="utf-8"
-    ) as f:
-        for line in con.iterdump():
-            f.write(f"{line}\n")
-
-        # Force write of file to disk
-        f.flush()
-        fsync(f.fileno())
-
-    log.info("Dump finished with success.")
-
-
-def read(dump_file: Path, database: Path, /) -> None:
-    """
-    Load the `dump_file` content into the given database.
-    This function provides the same capabilities as the .read command
-    in the sqlite3 shell.
-    """
-
-    log.info(f"Restoring {dump_file!r} into the database {database!r} ...")
-    with sqlite3.connect(str(database)) as con:
-        con.executescript(dump_file.read_text(encoding="utf-8"))
-    log.info("Restoration done with success.")
-
-
-def fix_db(database: Path, /, *, dump_file: Path = Path("dump.sql")) -> None:
+def fix_db(database: Path, /, *, quick: bool = False) -> None:
     """
     Re-generate the whole database content to fix eventual FS corruptions.
     This will prevent `sqlite3.DatabaseError: database disk image is malformed`
     issues.  The whole operation is quick and help saving disk space.
         >>> fix_db('ndrive_6bba111e18ba11e89cfd180373b6442e.db')
     Will raise sqlite3.DatabaseError in case of unrecoverable file.
+    Use *quick* to only run a quick check of the database integrity.
     """
-    if is_healthy(database):
+    if is_healthy(database, quick=quick):
         return
 
-    # setting the path of dumpfile where the databast file exists.
-    dump_file = database.parent.joinpath(dump_file)
     log.info(f"Re-generating the whole database content of {database!r}...")
-
-    # Dump
+    old_size = database.stat().st_size
+
+    # The dump is streamed into a brand new database, without an intermediate
+    # SQL text file. Unlike the backup API or VACUUM INTO, it goes on with
+    # whatever can still be read from damaged pages.
+    rebuilt = database.with_name(f"{database.name}.rebuilt")
+    rebuilt.unlink(missing_ok=True)
+    restored = False
     try:
-        old_size = database.stat().st_size
-        backup = database.with_name(f"{database.name}.or")
-        dump(database, dump_file)
-        copyfile(str(database), str(backup))
-        database.unlink()
+        with closing(sqlite3.connect(str(database))) as con, closing(
+            sqlite3.connect(str(rebuilt), isolation_level=None)
+        ) as new:
+            for statement in con.iterdump():
+                try:
+                    new.execute(statement)
+                except Exception:
+                    log.exception("Restoration error")
+                    log.info("Cancelling the operation")
+                    break
+            else:
+                restored = True
     except sqlite3.DatabaseError:
         # The file is so damaged we cannot save anything.
         # Forward the exception, and sorry for you :/
         log.exception("Database is not recoverable")
+        rebuilt.unlink(missing_ok=True)
         raise
     except Exception:
         log.exception("Dump error")
-        return
 
-    # Restore
-    try:
-        read(dump_file, database)
-        backup.unlink()
-    except Exception:
-        log.exception("Restoration error")
-        log.info("Cancelling the operation")
-        if not database.is_file():
-            backup.rename(database)
+    if not restored:
+        rebuilt.unlink(missing_ok=True)
         return
-    finally:
-        dump_file.unlink(missing_ok=True)
+
+    # The former WAL must not be applied to the new database
+    for file in _journals(database):
+        file.unlink(missing_ok=True)
+    rebuilt.replace(database)
 
     new_size = database.stat().st_size
     log.info(f"Re-generation completed, saved {(old_size - new_size) / 1024} Kb.")
 
 
+def _journals(database: Path, /) -> Tuple[Path, Path]:
+    return (
+        database.with_name(f"{database.name}-wal"),
+        database.with_name(f"{database.name}-shm"),
+    )
+
+
+def _copy(source: sqlite3.Connection, destination: Path, /) -> None:
+    """
+    Stream the *source* database into the *destination* file, using the
+    online backup API, *BACKUP_PAGES* pages at a time.
+    """
+
+    def progress(status: int, remaining: int, total: int) -> None:
+        log.debug(f"Copied {total - remaining}/{total} pages into {destination!r}")
+
+    with closing(sqlite3.connect(str(destination))) as dest:
+        source.backup(dest, pages=BACKUP_PAGES, progress=progress)
+        # Backups are standalone files, no need for WAL files around them
+        dest.execute("PRAGMA journal_mode = DELETE")
+
+
+def _get_backups(database: Path, /) -> Dict[int, Path]:
+    """Backups of the given *database*, by timestamp."""
+    backup_folder = database.with_name("backups")
+    prefix = f"{database.name}_"
+    return {
+        int(backup.name[len(prefix) :]): backup
+        for backup in backup_folder.glob(f"{prefix}*")
+        if backup.name[len(prefix) :].isdigit()
+    }
+
+
+def _is_usable(backup: Path, /) -> bool:
+    try:
+        return is_healthy(backup, quick=True)
+    except sqlite3.DatabaseError:
+        return False
+
+
 def restore_backup(database: Path, /) -> bool:
     """
     Restore a backup of a given database.
 
     For example, if the path is ~/.nuxeo-drive/manager.db,
     it will look for all files matching ~/.nuxeo-drive/backups/manager.db_*
-    and take the one with the most recent timestamp.
+    and take the most recent one that is not corrupted.
     """
 
     if not database:
         return False
 
-    backup_folder = database.with_name("backups")
-    if not backup_folder.is_dir():
+    if not database.with_name("backups").is_dir():
         log.info("No existing backup folder")
         return False
 
-    backups = list(backup_folder.glob(f"{database.name}_*"))
+    backups = _get_backups(database)
     if not backups:
         log.info(f"No backup available for {database}")
         return False
 
-    latest = max(backups, key=lambda p: int(p.name.split("_")[-1]))
-    log.info(f"Found a backup candidate, trying to restore {latest}")
-    database.unlink(missing_ok=True)
-    copyfile(latest, database)
-    return True
+    for _, backup in sorted(backups.items(), reverse=True):
+        log.info(f"Found a backup candidate, trying to restore {backup}")
+        if not _is_usable(backup):
+            log.warning(f"{backup} is corrupted, skipping")
+            continue
+
+        for file in (database, *_journals(database)):
+            file.unlink(missing_ok=True)
+        with closing(sqlite3.connect(str(backup))) as source:
+            _copy(source, database)
+        return True
+
+    log.info(f"No usable backup for {database}")
+    return False
 
 
-def save_backup(database: Path, /) -> bool:
+def prune_backups(database: Path, /, *, now: int = 0) -> None:
+    """
+    Remove the backups of the given *database* that are not part of a
+    retention tier (see *BACKUP_RETENTION*). Backups of the last 24 hours
+    are all kept.
+    """
+    now = now or int(datetime.now().timestamp())
+    kept: Set[Tuple[int, int]] = set()
+
+    for timestamp, backup in sorted(_get_backups(database).items(), reverse=True):
+        age = now - timestamp
+        if age < DAY:
+            continue
+
+        tier = next(
+            (idx for idx, (max_age, _) in enumerate(BACKUP_RETENTION) if age < max_age),
+            None,
+        )
+        if tier is not None:
+            # Keep the most recent backup of each period
+            bucket = (tier, timestamp // BACKUP_RETENTION[tier][1])
+            if bucket not in kept:
+                kept.add(bucket)
+                continue
+
+        log.debug(f"Removing old backup {backup}")
+        backup.unlink(missing_ok=True)
+
+
+def save_backup(database: Path, /, *, source: sqlite3.Connection = None) -> bool:
     """
     Save a backup of a given database.
 
     For example, if the path is ~/.nuxeo-drive/manager.db,
     a corresponding ~/.nuxeo-drive/backups/manager.db_1234567890 file
     will be created, where the numbers are the current timestamp.
+
+    The database is copied with the online backup API, from the *source*
+    connection if given. The copy is done in a read transaction: in WAL mode,
+    writers are not blocked, and their changes are not part of the backup.
     """
 
     if not (database and database.is_file()):
         log.info("No database to backup")
         return False
-    if not is_healthy(database):
-        log.info(f"{database} is corrupted, won't backup")
-        return False
 
     backup_folder = database.with_name("backups")
     backup_folder.mkdir(exist_ok=True)
 
-    yesterday = int((datetime.now() - timedelta(days=1)).timestamp())
-    old_backups = [
-        b
-        for b in backup_folder.glob(f"{database.name}_*")
-        if int(b.name.split("_")[-1]) < yesterday
-    ]
-    # Remove older backups
-    for backup in old_backups:
-        log.debug(f"Removing old backup {backup}")
-        backup.unlink(missing_ok=True)
+    tmp = backup_folder / f".{database.name}.tmp"
+    tmp.unlink(missing_ok=True)
+    con = source or sqlite3.connect(str(database))
+    try:
+        con.execute("BEGIN")
+        # Start the read transaction on the current snapshot
+        con.execute("SELECT COUNT(*) FROM sqlite_master").fetchall()
+        try:
+            _copy(con, tmp)
+        finally:
+            con.execute("ROLLBACK")
+    finally:
+        if not source:
+            con.close()
+
+    if not _is_usable(tmp):
+        log.info(f"{database} is corrupted, won't backup")
+        tmp.unlink(missing_ok=True)
+        return False
 
     backup = backup_folder / f"{database.name}_{int(datetime.now().timestamp())}"
     log.info(f"Creating backup {backup}")
-    copyfile(database, backup)
+    tmp.replace(backup)
+    prune_backups(database)
     return True
@@ -246,6 +246,8 @@ def purge(rel_path: Path) -> None:
             try:
                 # Don't update if digest are the same
                 info = self.local.get_info(ref)
+                # Digests are cached in the database of the account of the document
+                info.digest_cache = details.engine.digest_cache
                 current_digest = info.get_digest(digest_func=details.digest_func)
                 if current_digest != details.digest:
                     log.warning(
@@ -345,17 +347,10 @@ def _download(
         file_out.unlink(missing_ok=True)
 
         if pair:
-            existing_file_path = engine.local.abspath(pair.local_path)
-            try:
-                # copyfile() is used to prevent metadata copy
-                shutil.copyfile(existing_file_path, file_out)
-            except FileNotFoundError:
+            if not engine.copy_local_duplicate(pair, file_out):
                 pair = None
             else:
-                log.info(
-                    f"Local file matches remote digest {blob.digest!r}, "
-                    f"copied it from {existing_file_path!r}"
-                )
+                log.info(f"Local file matches remote digest {blob.digest!r}")
                 if pair.is_readonly():
                     log.info(f"Unsetting readonly flag on copied file {file_out!r}")
                     unset_path_readonly(file_out)
@@ -370,6 +365,7 @@ def _download(
                                 file_path,
                                 file_out,
                                 blob.digest,
+                                size=blob.size,
                                 callback=callback or self.stop_client,
                                 is_direct_edit=True,
                                 engine_uid=engine.uid,
@@ -851,6 +847,8 @@ def _handle_upload_queue(self) -> None:
             try:
                 # Don't update if digest are the same
                 info = self.local.get_info(ref)
+                # Digests are cached in the database of the account of the document
+                info.digest_cache = details.engine.digest_cache
                 current_digest = info.get_digest(digest_func=details.digest_func)
                 if current_digest == details.digest:
                     continue
@@ -1035,6 +1033,9 @@ def get_metrics(self) -> Metrics:
         metrics = super().get_metrics()
         if self._event_handler:
             metrics["fs_events"] = self._event_handler.counter
+        error_queue = self._error_queue.get_metrics()
+        metrics["error_queue_due"] = error_queue["due"]
+        metrics["error_queue_parked"] = error_queue["parked"]
         return {**metrics, **self._metrics}
 
     @tooltip("Setup watchdog")
@@ -212,6 +212,12 @@ def __init__(
     ) -> None:
         super().__init__("Download", filepath, size, tmppath=tmppath, reporter=reporter)
 
+        # The transfer speed of each segment of a segmented download, by segment index
+        self.segment_speeds: Dict[int, float] = {}
+
+    def export(self) -> Dict[str, Any]:
+        return {**super().export(), "segment_speeds": self.segment_speeds.copy()}
+
 
 class VerificationAction(FileAction):
     """Download: step 2/2 - Checking the file integrity."""
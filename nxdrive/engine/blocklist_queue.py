@@ -4,6 +4,8 @@
 from time import monotonic
 from typing import Dict, Generator
 
+from .delayed_queue import DelayedQueue
+
 __all__ = ("BlocklistQueue",)
 log = getLogger(__name__)
 
@@ -39,7 +41,7 @@ class BlocklistQueue:
     def __init__(self, *, delay: int = 30) -> None:
         self._delay = delay
 
-        self._queue: Dict[Path, BlocklistItem] = {}
+        self._queue: DelayedQueue[Path, BlocklistItem] = DelayedQueue()
         self._lock = Lock()
 
     def __repr__(self) -> str:
@@ -51,26 +53,40 @@ def __str__(self) -> str:
     def empty(self) -> bool:
         """Return True if the queue is empty, False otherwise."""
         with self._lock:
-            return not bool(self._queue)
+            return not self._queue
 
     def push(self, path: Path, /) -> None:
         with self._lock:
             item = BlocklistItem(path, next_try=self._delay)
             log.debug(f"Adding {item!r} for {self._delay} sec")
-            self._queue[path] = item
+            self._schedule(item)
 
     def repush(self, item: BlocklistItem, /, *, increase_wait: bool = True) -> None:
         # Only used in tests, but it is more practical to keep there.
         with self._lock:
             item.increase(next_try=None if increase_wait else self._delay)
-            self._queue[item.path] = item
+            self._schedule(item)
+
+    def _schedule(self, item: BlocklistItem, /) -> None:
+        self._queue.schedule(item.path, item, item._next_try)
 
     def get(self) -> Generator[BlocklistItem, None, None]:
         with self._lock:
             cur_time = int(monotonic())
-            for item in self._queue.copy().values():
-                if not item.check(cur_time):
-                    continue
+            while "due items":
+                due = self._queue.pop_due(cur_time)
+                if not due:
+                    break
 
+                item = due[1]
                 log.debug(f"Releasing {item!r}")
-                yield self._queue.pop(item.path)
+                yield item
+
+    def get_metrics(self) -> Dict[str, int]:
+        """Count items to release and items still waiting."""
+        with self._lock:
+            cur_time = int(monotonic())
+            return {
+                "due": self._queue.due_count(cur_time),
+                "parked": self._queue.parked_count(cur_time),
+            }
@@ -0,0 +1,122 @@
+from heapq import heapify, heappop, heappush
+from itertools import count
+from threading import Lock
+from typing import Dict, Generic, Hashable, List, Optional, Tuple, TypeVar
+
+__all__ = ("DelayedQueue",)
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class DelayedQueue(Generic[K, V]):
+    """Keyed items parked until their due time is passed.
+
+    Items are ordered in a min-heap by due time, so finding the due ones does
+    not involve looking at the parked ones. Removing or re-scheduling an item
+    leaves its former heap entry behind: such stale entries are skipped when
+    reached, and purged when they outnumber the live ones.
+
+    The unit of due times is up to the caller, as long as it is the same
+    for every *now* argument given to the queue.
+    """
+
+    def __init__(self) -> None:
+        # Heap of [due, sequence, key] entries, the sequence keeps the
+        # insertion order for items sharing the same due time.
+        self._heap: List[List] = []
+        self._items: Dict[K, Tuple[List, V]] = {}
+        self._counter = count()
+        self._lock = Lock()
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__} size={len(self._items)}>"
+
+    def __contains__(self, key: K, /) -> bool:
+        return key in self._items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __getitem__(self, key: K, /) -> V:
+        return self._items[key][1]
+
+    def get(self, key: K, /) -> Optional[V]:
+        item = self._items.get(key)
+        return item[1] if item else None
+
+    def values(self) -> List[V]:
+        """Snapshot of all items, due or not."""
+        with self._lock:
+            return [value for _, value in self._items.values()]
+
+    def schedule(self, key: K, value: V, due: float, /) -> None:
+        """Park *value* until *due*, replacing any item with the same *key*."""
+        with self._lock:
+            entry = [due, next(self._counter), key]
+            self._items[key] = (entry, value)
+            heappush(self._heap, entry)
+            if len(self._heap) > 2 * len(self._items) + 64:
+                self._purge()
+
+    def remove(self, key: K, /) -> Optional[V]:
+        """Cancel the item of the given *key*, return its value if any."""
+        with self._lock:
+            item = self._items.pop(key, None)
+            return item[1] if item else None
+
+    def pop_due(self, now: float, /) -> Optional[Tuple[K, V]]:
+        """Remove and return the earliest due item, if any."""
+        with self._lock:
+            heap = self._heap
+            while heap and heap[0][0] < now:
+                _, _, key = entry = heappop(heap)
+                item = self._items.get(key)
+                if item and item[0] is entry:
+                    del self._items[key]
+                    return key, item[1]
+            return None
+
+    def next_due(self) -> Optional[float]:
+        """Return the due time of the earliest item, if any."""
+        with self._lock:
+            heap = self._heap
+            while heap and not self._is_live(heap[0]):
+                heappop(heap)
+            return heap[0][0] if heap else None
+
+    def has_due(self, now: float, /) -> bool:
+        """Return True if at least one item is due."""
+        next_due = self.next_due()
+        return next_due is not None and next_due < now
+
+    def due_count(self, now: float, /) -> int:
+        """Count items that are due, without looking at the parked ones."""
+        with self._lock:
+            heap = self._heap
+            total = 0
+            # Children are never due before their parent: stop at parked entries
+            stack = [0] if heap else []
+            while stack:
+                idx = stack.pop()
+                entry = heap[idx]
+                if entry[0] >= now:
+                    continue
+                total += self._is_live(entry)
+                stack.extend(
+                    child for child in (2 * idx + 1, 2 * idx + 2) if child < len(heap)
+                )
+            return total
+
+    def parked_count(self, now: float, /) -> int:
+        """Count items that are not due yet."""
+        return len(self._items) - self.due_count(now)
+
+    def _is_live(self, entry: List, /) -> bool:
+        item = self._items.get(entry[2])
+        return item is not None and item[0] is entry
+
+    def _purge(self) -> None:
+        """Drop stale entries from the heap."""
+        self._heap = [entry for entry, _ in self._items.values()]
+        heapify(self._heap)
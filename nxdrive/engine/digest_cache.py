@@ -0,0 +1,153 @@
+"""
+Cache of the digests of local files, stored in the engine database.
+
+A digest is valid as long as its file is not modified: digests are cached by
+device, inode and digest function, along with the size and modification time
+of the file. They are only used if the file still has the same size and
+modification time, what a single stat() call tells, instead of reading the
+whole file again.
+"""
+import os
+from logging import getLogger
+from pathlib import Path
+from threading import Lock
+from time import time, time_ns
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Sequence, Tuple
+
+from ..constants import UNACCESSIBLE_HASH
+from ..objects import Metrics
+from ..options import Options
+from ..utils import compute_digests, safe_long_path
+
+if TYPE_CHECKING:
+    from ..dao.engine import EngineDAO  # noqa
+
+__all__ = ("DigestCache",)
+
+log = getLogger(__name__)
+
+# A file modified right after the computation of its digest may keep the same
+# modification time on file systems with a coarse time resolution (2 seconds on FAT).
+# Digests of recently modified files are not cached.
+_RACY_DELAY_NS = 2_000_000_000
+
+# SQLite integers are signed 64-bit, inodes of some file systems are bigger
+_MAX_INT = 2**63 - 1
+
+# (dev, inode, size, mtime_ns)
+FileKey = Tuple[int, int, int, int]
+
+
+class DigestCache:
+    """Compute digests of local files only when they are not cached yet, or outdated.
+
+    The least recently used digests are removed when there are more than
+    Options.digest_cache_size of them.
+    """
+
+    # Recently used digests are saved in the database by batches
+    touch_batch_size = 500
+
+    # The database is cleaned up every *evict_interval* new digests
+    evict_interval = 1000
+
+    def __init__(self, dao: "EngineDAO", /) -> None:
+        self.dao = dao
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = Lock()
+        self._touched: List[Tuple[int, int, str]] = []
+        self._stored = 0
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__} hits={self.hits}, misses={self.misses}>"
+
+    def get_digest(
+        self, path: Path, digest_func: str, /, *, callback: Callable = None
+    ) -> str:
+        """Return the digest of the file *path*, compute it only when needed."""
+        return self.get_digests(path, (digest_func,), callback=callback)[digest_func]
+
+    def get_digests(
+        self, path: Path, digest_funcs: Sequence[str], /, *, callback: Callable = None
+    ) -> Dict[str, str]:
+        """Return the digests of the file *path*, missing ones are computed in a single read."""
+        if not Options.digest_cache_size:
+            return compute_digests(path, digest_funcs, callback=callback)
+
+        digests: Dict[str, str] = {}
+        key = self._file_key(path)
+        if key:
+            dev, inode, size, mtime_ns = key
+            for digest_func in digest_funcs:
+                digest = self.dao.get_cached_digest(
+                    dev, inode, digest_func, size, mtime_ns
+                )
+                if digest:
+                    self._used(dev, inode, digest_func)
+                    digests[digest_func] = digest
+
+        missing = [func for func in digest_funcs if func not in digests]
+        if not missing:
+            return digests
+
+        with self._lock:
+            self.misses += len(missing)
+
+        computed = compute_digests(path, missing, callback=callback)
+        if (
+            key
+            and UNACCESSIBLE_HASH not in computed.values()
+            and time_ns() - key[3] > _RACY_DELAY_NS
+            # The file must not have been modified while computing its digests
+            and self._file_key(path) == key
+        ):
+            for digest_func, digest in computed.items():
+                self._store(key, digest_func, digest)
+        return {**digests, **computed}
+
+    def flush(self) -> None:
+        """Save recently used digests still in memory."""
+        with self._lock:
+            touched, self._touched = self._touched, []
+        if touched:
+            self.dao.touch_cached_digests(touched, int(time()))
+
+    def get_metrics(self) -> Metrics:
+        return {"digest_cache_hits": self.hits, "digest_cache_misses": self.misses}
+
+    @staticmethod
+    def _file_key(path: Path, /) -> Optional[FileKey]:
+        try:
+            stat = os.stat(safe_long_path(path))
+        except OSError:
+            return None
+
+        if not (0 < stat.st_ino <= _MAX_INT and 0 <= stat.st_dev <= _MAX_INT):
+            # No reliable file ID (some network shares, FAT on Windows, ...)
+            return None
+        return stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def _used(self, dev: int, inode: int, digest_func: str, /) -> None:
+        with self._lock:
+            self.hits += 1
+            self._touched.append((dev, inode, digest_func))
+            if len(self._touched) < self.touch_batch_size:
+                return
+        self.flush()
+
+    def _store(self, key: FileKey, digest_func: str, digest: str, /) -> None:
+        dev, inode, size, mtime_ns = key
+        self.dao.set_cached_digest(
+            dev, inode, digest_func, size, mtime_ns, digest, int(time())
+        )
+
+        with self._lock:
+            self._stored += 1
+            if self._stored % self.evict_interval:
+                return
+
+        removed = self.dao.evict_cached_digests(Options.digest_cache_size)
+        if removed:
+            log.debug(f"Removed {removed} least recently used digests from the cache")
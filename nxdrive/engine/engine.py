@@ -8,9 +8,19 @@
 from functools import partial
 from logging import getLogger
 from pathlib import Path
-from threading import Thread
+from threading import Lock, Thread
 from time import sleep
-from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Type
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Generator,
+    List,
+    Optional,
+    Tuple,
+    Type,
+)
 from urllib.parse import urlsplit
 
 import requests
@@ -43,12 +53,13 @@
     DT_SESSION_STATUS,
     SYNC_ROOT_COUNT,
 )
-from ..objects import Binder, DocPairs, EngineDef, Metrics, Session
+from ..objects import Binder, DocPair, DocPairs, EngineDef, Metrics, Session
 from ..options import Options
 from ..qt.imports import QObject, QThread, QThreadPool, pyqtSignal, pyqtSlot
 from ..state import State
 from ..utils import (
     client_certificate,
+    clone_file,
     current_thread_id,
     decrypt,
     encrypt,
@@ -62,8 +73,10 @@
     safe_long_path,
     set_path_readonly,
     unset_path_readonly,
+    walk_tree,
 )
 from .activity import Action, FileAction
+from .digest_cache import DigestCache
 from .processor import Processor
 from .queue_manager import QueueManager
 from .watcher.local_watcher import LocalWatcher
@@ -156,12 +169,6 @@ def __init__(
 
         self.local_folder = Path(definition.local_folder)
         self.folder = str(self.local_folder)
-        self.local = self.local_cls(
-            self.local_folder,
-            digest_callback=self.suspend_client,
-            download_dir=self.download_dir,
-        )
-
         self.uid = definition.uid
         self.name = definition.name
         self._proc_count = processors
@@ -172,6 +179,22 @@ def __init__(
         self._invalid_credentials = False
         self._offline_state = False
         self.dao = EngineDAO(self._get_db_file())
+        self.digest_cache = DigestCache(self.dao)
+
+        # Contents copied from local duplicates instead of being downloaded
+        self._local_copies = {
+            "local_copies": 0,
+            "local_copies_size": 0,
+            "local_copies_reflinks": 0,
+        }
+        self._local_copies_lock = Lock()
+
+        self.local = self.local_cls(
+            self.local_folder,
+            digest_callback=self.suspend_client,
+            digest_cache=self.digest_cache,
+            download_dir=self.download_dir,
+        )
 
         # The password is only set when binding an account for the 1st time,
         # then only the token will be available and used
@@ -577,7 +600,6 @@ def _direct_transfer(
         if not local_paths:
             return
 
-        all_paths = local_paths.keys()
         doc_type = None
         if document_type == self.doc_container_type:
             doc_type = None
@@ -589,45 +611,87 @@ def _direct_transfer(
             cont_type = None
         else:
             cont_type = container_type
-        items = [
+
+        # Only walk the selected roots, children may have been given too
+        roots = [
+            path
+            for path in sorted(local_paths)
+            if not any(parent in local_paths for parent in path.parents)
+        ]
+        top_paths = set(roots)
+        description = os.path.basename(roots[0])
+        if len(roots) > 1:
+            description = f"{description} (+{len(roots) - 1:,})"
+
+        # The planning counts as an item of the session until it ends,
+        # so that the session cannot be seen as done meanwhile
+        session_uid = self.dao.create_session(
+            remote_parent_path, remote_parent_ref, 1, self.uid, description
+        )
+
+        items = (
             (
                 path.as_posix(),
                 path.parent.as_posix(),
                 path.name,
-                path.is_dir(),
+                is_dir,
                 size,
                 remote_parent_path,
                 remote_parent_ref,
-                doc_type if not path.is_dir() else cont_type,
+                cont_type if is_dir else doc_type,
                 duplicate_behavior,
-                "todo" if path.parent in all_paths else "unknown",
+                "unknown" if path in top_paths else "todo",
             )
-            for path, size in sorted(local_paths.items())
-        ]
+            for path, is_dir, size in self._walk_direct_transfer(roots, local_paths)
+        )
 
-        # Add all paths into the database to plan the upload, by batch
+        # Add all paths into the database to plan the upload, by batch,
+        # and queue them right away: uploads start while the tree is walked
         bsize = Options.database_batch_size
         log.info("Planning items to Direct Transfer ...")
         log.debug(
             f" ... database_batch_size is {bsize}, duplicate_behavior is {duplicate_behavior!r}"
         )
-        current_max_row_id = -1
-        description = os.path.basename(items[0][0])
-        if len(items) > 1:
-            description = f"{description} (+{len(items) - 1:,})"
-        session_uid = self.dao.create_session(
-            remote_parent_path, remote_parent_ref, len(items), self.uid, description
-        )
+        planned = 0
+        with self.dao.direct_transfer_planning():
+            for batch_items in grouper(items, bsize):
+                session = self.dao.get_session(session_uid)
+                if not session or session.status is TransferStatus.CANCELLED:
+                    log.info(f" ... Session {session_uid} cancelled, stop planning")
+                    return
+
+                row_id = self.dao.plan_many_direct_transfer_items(
+                    batch_items, session_uid
+                )
+                self.dao.increase_session_counts(session_uid, len(batch_items))
+                self.dao.queue_many_direct_transfer_items(row_id)
+                planned += len(batch_items)
 
-        for batch_items in grouper(items, bsize):
-            row_id = self.dao.plan_many_direct_transfer_items(batch_items, session_uid)
-            if current_max_row_id == -1:
-                current_max_row_id = row_id
+        log.info(f" ... Planned {planned:,} item(s) to Direct Transfer, let's gooo!")
 
-        log.info(f" ... Planned {len(items):,} item(s) to Direct Transfer, let's gooo!")
+        with self.dao.lock:
+            session = self.dao.get_session(session_uid)
+            if not session or session.status is TransferStatus.CANCELLED:
+                return
+            session = self.dao.decrease_session_counts(session_uid)
+        self.handle_session_status(session)
 
-        # And add new pairs to the queue
-        self.dao.queue_many_direct_transfer_items(current_max_row_id)
+    @staticmethod
+    def _walk_direct_transfer(
+        roots: List[Path], local_paths: Dict[Path, int], /
+    ) -> Generator[Tuple[Path, bool, int], None, None]:
+        """Yield the Direct Transfer items (local_path, is_dir, size) of all *roots*."""
+        for root in roots:
+            try:
+                is_dir = root.is_dir()
+            except OSError:
+                log.warning(f"Error calling is_dir() on {root!r}", exc_info=True)
+                continue
+
+            if is_dir:
+                yield from walk_tree(root)
+            else:
+                yield root, False, local_paths[root]
 
     def handle_session_status(self, session: Optional[Session], /) -> None:
         """Check the session status and send a notification if finished."""
@@ -792,9 +856,18 @@ def resume(self) -> None:
         self.syncResumed.emit()
 
     def _resume_transfers(
-        self, nature: str, func: Callable, /, *, is_direct_transfer: bool = False
+        self,
+        nature: str,
+        func: Callable,
+        /,
+        *,
+        is_direct_transfer: bool = False,
+        prioritize: bool = False,
     ) -> None:
-        """Resume all transfers returned by the *func* function."""
+        """
+        Resume all transfers returned by the *func* function.
+        If *prioritize* is True, they are handled before other pairs of their queue.
+        """
         resume = self.dao.resume_transfer
         get_state = self.dao.get_state_from_id
 
@@ -810,6 +883,8 @@ def _resume_transfers(
 
             doc_pair = get_state(transfer.doc_pair)
             if doc_pair:
+                if prioritize:
+                    self.dao.prioritize_state(doc_pair)
                 self.queue_manager.push(doc_pair)
 
     def resume_transfer(
@@ -824,7 +899,9 @@ def resume_transfer(
             else self.dao.get_upload
         )
         func = partial(meth, uid=uid)  # type: ignore
-        self._resume_transfers(nature, func, is_direct_transfer=is_direct_transfer)
+        self._resume_transfers(
+            nature, func, is_direct_transfer=is_direct_transfer, prioritize=True
+        )
 
     def resume_suspended_transfers(self) -> None:
         """Resume all suspended transfers."""
@@ -1112,6 +1189,7 @@ def retry_pair(self, row_id: int, /) -> None:
         state = self.dao.get_state_from_id(row_id)
         if state is None:
             return
+        self.dao.prioritize_state(state)
         self.dao.reset_error(state)
 
     def ignore_pair(self, row_id: int, reason: str, /) -> None:
@@ -1124,11 +1202,13 @@ def ignore_pair(self, row_id: int, reason: str, /) -> None:
     def resolve_with_local(self, row_id: int, /) -> None:
         row = self.dao.get_state_from_id(row_id)
         if row:
+            self.dao.prioritize_state(row)
             self.dao.force_local(row)
 
     def resolve_with_remote(self, row_id: int, /) -> None:
         row = self.dao.get_state_from_id(row_id)
         if row:
+            self.dao.prioritize_state(row)
             self.dao.force_remote(row)
 
     @pyqtSlot()
@@ -1217,8 +1297,34 @@ def get_metrics(self) -> Metrics:
             "sync_folders": self.dao.get_sync_count(filetype="folder"),
             "syncing": self.dao.get_syncing_count(),
             "unsynchronized_files": self.dao.get_unsynchronized_count(),
+            **self.dao.get_metrics(),
+            **self.digest_cache.get_metrics(),
+            **self._local_copies,
         }
 
+    def copy_local_duplicate(self, pair: DocPair, file_out: Path, /) -> bool:
+        """Copy the content of the synchronized file of *pair* to *file_out*,
+        instead of downloading the same content again.
+        Return False if that file does not exist anymore.
+        """
+        file_in = self.local.abspath(pair.local_path)
+        try:
+            how = clone_file(file_in, file_out)
+        except (FileNotFoundError, IsADirectoryError):
+            # IsADirectoryError may raise if the local path stored in DB is pointing
+            #     to an obsolete path. And for whatever reason, that path points to
+            #     a folder ...
+            return False
+
+        size = file_out.stat().st_size
+        log.info(f"Copied {file_in!r} to {file_out!r} ({how}, {size:,} bytes)")
+        with self._local_copies_lock:
+            self._local_copies["local_copies"] += 1
+            self._local_copies["local_copies_size"] += size
+            if how == "reflink":
+                self._local_copies["local_copies_reflinks"] += 1
+        return True
+
     def get_conflicts(self) -> DocPairs:
         return self.dao.get_conflicts()
 
@@ -1273,6 +1379,7 @@ def stop(self) -> None:
         log.debug(f"Engine {self.uid} is stopping")
 
         self.dao.suspend_transfers()
+        self.digest_cache.flush()
 
         # Make a backup in case something happens
         self.dao.save_backup()
@@ -0,0 +1,117 @@
+"""
+Compute digests of local files from a pool of threads.
+
+hashlib releases the GIL while hashing, several files are then hashed at the
+same time, and all the digests needed for a same file are computed in a
+single read (like the local md5 and the remote sha256).
+
+Digest callbacks of the engine check the state of the calling thread (its
+processor, its current action), they cannot be called from the pool. Instead,
+the calling thread calls them while waiting for the digests, and stops the
+computation if they raise.
+"""
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from threading import Event, Lock
+from typing import Callable, Dict, Generator, Iterable, Optional, Set, Tuple
+
+from ..client.local import FileInfo
+from ..exceptions import ThreadInterrupt
+from ..options import Options
+
+__all__ = ("HashingService", "hashing")
+
+
+class HashingService:
+    """Compute digests of FileInfo objects from up to Options.hashing_threads threads.
+
+    Computed digests are kept on the FileInfo objects (and in the digest cache
+    of their local client), next .get_digest() calls do not read the files again.
+    """
+
+    # Seconds between two calls of the callback of the waiting thread
+    poll_interval = 0.1
+
+    def __init__(self) -> None:
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = Lock()
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__} workers={Options.hashing_threads}>"
+
+    def submit(
+        self, info: FileInfo, /, *digest_funcs: str, stop: Event = None
+    ) -> "Future[Dict[str, str]]":
+        """Compute the *digest_funcs* digests of *info* from the pool.
+        Setting the *stop* event interrupts the computation.
+        """
+        if not digest_funcs:
+            digest_funcs = (info._digest_func,)
+
+        def interrupted(_: object) -> None:
+            if stop and stop.is_set():
+                raise ThreadInterrupt()
+
+        return self.pool.submit(info.get_digests, *digest_funcs, callback=interrupted)
+
+    def get_digests(
+        self, info: FileInfo, /, *digest_funcs: str, callback: Callable = None
+    ) -> Dict[str, str]:
+        """Compute the *digest_funcs* digests of *info* from the pool, and wait for them.
+        *callback* is called from the current thread meanwhile.
+        """
+        digests = self.iter_digests((info,), *digest_funcs, callback=callback)
+        try:
+            return next(digests)[1]
+        finally:
+            digests.close()
+
+    def iter_digests(
+        self,
+        infos: Iterable[FileInfo],
+        /,
+        *digest_funcs: str,
+        callback: Callable = None,
+    ) -> Generator[Tuple[FileInfo, Dict[str, str]], None, None]:
+        """Compute digests of all *infos* from the pool, yield them as they are computed.
+        *callback* is called with the file path, from the current thread, while waiting.
+        """
+        stop = Event()
+        pending: Set[Future] = set()
+        try:
+            futures = {
+                self.submit(info, *digest_funcs, stop=stop): info for info in infos
+            }
+            pending = set(futures)
+            while pending:
+                done, pending = wait(
+                    pending, timeout=self.poll_interval, return_when=FIRST_COMPLETED
+                )
+                for future in done:
+                    yield futures[future], future.result()
+                if pending and callable(callback):
+                    callback(futures[next(iter(pending))].filepath)
+        finally:
+            # Interrupt computations still running, when the caller did
+            stop.set()
+            for future in pending:
+                future.cancel()
+
+    def prefetch(
+        self, infos: Iterable[FileInfo], /, *, callback: Callable = None
+    ) -> None:
+        """Compute the local digest of all *infos* at the same time, for later use."""
+        for _ in self.iter_digests(infos, callback=callback):
+            pass
+
+    @property
+    def pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if not self._pool:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=Options.hashing_threads, thread_name_prefix="Hashing"
+                )
+            return self._pool
+
+
+# The pool is shared by all engines, the number of CPUs does not depend on them
+hashing = HashingService()
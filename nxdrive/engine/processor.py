@@ -2,12 +2,13 @@
 import shutil
 import sqlite3
 import sys
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from contextlib import suppress
 from logging import getLogger
 from pathlib import Path
 from threading import Lock
 from time import monotonic_ns, sleep
-from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Set, Tuple
 
 from nuxeo.exceptions import (
     Conflict,
@@ -18,6 +19,7 @@
     Unauthorized,
     UploadError,
 )
+from nuxeo.utils import get_digest_algorithm
 from urllib3.exceptions import MaxRetryError
 
 from ..behavior import Behavior
@@ -44,7 +46,9 @@
     UploadCancelled,
     UploadPaused,
 )
+from ..feature import Feature
 from ..objects import DocPair, RemoteFileInfo
+from ..options import Options
 from ..qt.imports import pyqtSignal
 from ..utils import (
     digest_status,
@@ -53,6 +57,7 @@
     safe_filename,
     unlock_path,
 )
+from .hashing import hashing
 from .workers import EngineWorker
 
 if TYPE_CHECKING:
@@ -71,6 +76,9 @@ class Processor(EngineWorker):
     readonly_locks: Dict[str, Dict[Path, List[int]]] = {}
     readonly_locker = Lock()
 
+    # Maximum number of Direct Transfer folders acquired at once, for a same level
+    dt_folders_per_level = 1_000
+
     def __init__(self, engine: "Engine", item_getter: Callable, /) -> None:
         super().__init__(engine, engine.dao, "Processor")
         self._get_item = item_getter
@@ -308,10 +316,12 @@ def _get_next_doc_pair(self, item: DocPair) -> Optional[DocPair]:
         return None
 
     def _execute(self) -> None:
-        while "There are items in the queue":
+        while "There are items to handle":
             item = self._get_item()
             if not item:
-                break
+                # The item getter already waited for new items
+                self._interact()
+                continue
 
             doc_pair = self._get_next_doc_pair(item)
             if not doc_pair:
@@ -493,6 +503,7 @@ def _execute(self) -> None:
                 self._handle_pair_handler_exception(doc_pair, handler_name, exc)
             finally:
                 self.dao.release_state(self.thread_id)
+                self._current_doc_pair = None
 
             self._interact()
 
@@ -532,12 +543,13 @@ def _check_exists_on_the_server(self, doc_pair: DocPair, /) -> None:
 
             # Set the synced states and remote name
             doc_pair.remote_name = remote_info.name
-            self.dao.synchronize_state(doc_pair)
-            self.dao.update_last_transfer(doc_pair.id, "upload")
-            self.dao.update_remote_name(doc_pair.id, remote_info.name)
+            with self.dao.batch():
+                self.dao.synchronize_state(doc_pair)
+                self.dao.update_last_transfer(doc_pair.id, "upload")
+                self.dao.update_remote_name(doc_pair.id, remote_info.name)
 
-            # Transfer is completed, delete the upload from the database
-            self.remove_void_transfers(doc_pair)
+                # Transfer is completed, delete the upload from the database
+                self.remove_void_transfers(doc_pair)
 
             # Trigger a refresh of the systray menu
             self.pairSyncEnded.emit(self._current_metrics)
@@ -583,6 +595,14 @@ def _synchronize_direct_transfer(self, doc_pair: DocPair, /) -> None:
                 self._direct_transfer_cancel(doc_pair)
             return
 
+        # Folders ready to be created are created all at once
+        if self._direct_transfer_folders(doc_pair):
+            return
+
+        # Small files are uploaded all at once
+        if self._direct_transfer_small_files(doc_pair, path):
+            return
+
         # Do the upload
         self.remote.upload(
             path,
@@ -593,6 +613,193 @@ def _synchronize_direct_transfer(self, doc_pair: DocPair, /) -> None:
 
         self._direct_transfer_end(doc_pair, False)
 
+    def _direct_transfer_folders(self, doc_pair: DocPair, /) -> bool:
+        """
+        Create the *doc_pair* folder along with other folders of its session ready to be created,
+        level by level: folders of a level are created at the same time, and the children of every
+        created folder are released as soon as it is saved, files included.
+        Return False if the folder has to be created on its own.
+        """
+        workers = Options.dt_folder_threads
+        if workers < 2 or not doc_pair.folderish:
+            return False
+
+        uploader = DirectTransferUploader(self.remote)
+        level = [doc_pair]
+        level.extend(
+            self.dao.acquire_dt_folders(
+                self.thread_id, doc_pair.session, self.dt_folders_per_level - 1
+            )
+        )
+        with ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="DirectTransferFolders"
+        ) as pool:
+            while level:
+                self._direct_transfer_folders_level(pool, uploader, level, doc_pair)
+
+                session = self.dao.get_session(doc_pair.session)
+                if not session or session.status is not TransferStatus.ONGOING:
+                    break
+
+                # Folders released by the previous level
+                level = self.dao.acquire_dt_folders(
+                    self.thread_id, doc_pair.session, self.dt_folders_per_level
+                )
+        return True
+
+    def _direct_transfer_folders_level(
+        self,
+        pool: ThreadPoolExecutor,
+        uploader: DirectTransferUploader,
+        level: List[DocPair],
+        doc_pair: DocPair,
+        /,
+    ) -> None:
+        """
+        Create all folders of a *level* from the *pool*, results are saved as they come.
+        The error of the *doc_pair* folder is raised once the whole level is done.
+        """
+        futures: Dict[Future, DocPair] = {}
+        for pair in level:
+            path = pair.local_path if WINDOWS else Path(f"/{pair.local_path}")
+            # Missing folders will be handled on their own
+            if pair is doc_pair or path.is_dir():
+                futures[pool.submit(self._create_dt_folder, uploader, pair)] = pair
+
+        pending: Set[Future] = set(futures)
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                error = (
+                    self._direct_transfer_folders_created(futures, done, doc_pair)
+                    or error
+                )
+                self._interact()
+        except ThreadInterrupt:
+            # Folders being created have to be saved, else they would be created twice
+            for future in pending:
+                future.cancel()
+            done, _ = wait(pending)
+            self._direct_transfer_folders_created(futures, done, doc_pair)
+            raise
+
+        if error:
+            raise error
+
+    def _create_dt_folder(
+        self, uploader: DirectTransferUploader, doc_pair: DocPair, /
+    ) -> Dict[str, Any]:
+        """Create a folder on the server, from a worker thread."""
+        if doc_pair.duplicate_behavior == "ignore" and self.remote.exists_in_parent(
+            doc_pair.remote_parent_ref, doc_pair.local_name, True
+        ):
+            log.debug(
+                "Ignoring the transfer as a document already has the name"
+                f" {doc_pair.local_name!r} on the server"
+            )
+            return {}
+        return uploader.create_folder(doc_pair)
+
+    def _direct_transfer_folders_created(
+        self, futures: Dict[Future, DocPair], done: Set[Future], doc_pair: DocPair, /
+    ) -> Optional[BaseException]:
+        """
+        Save created folders at once and release their children.
+        Folders that could not be created are postponed, to be handled on their own,
+        but the error of the *doc_pair* folder is returned.
+        """
+        created: List[Tuple[DocPair, Dict[str, Any]]] = []
+        error: Optional[BaseException] = None
+        for future in done:
+            if future.cancelled():
+                continue
+            pair = futures[future]
+            exc = future.exception()
+            if exc is None:
+                created.append((pair, future.result()))
+            elif pair is doc_pair:
+                error = exc
+            else:
+                log.warning(f"Could not create the folder of {pair!r}: {exc!r}")
+                self._postpone_pair(pair, "Folder creation failed", exception=exc)
+
+        if created:
+            with self.dao.batch():
+                for pair, item in created:
+                    if item:
+                        path = (
+                            pair.local_path if WINDOWS else Path(f"/{pair.local_path}")
+                        )
+                        self.dao.update_remote_parent_path_dt(
+                            path, item["path"], item["uid"]
+                        )
+                        self.dao.save_session_item(pair.session, item)
+                    self.dao.remove_state(pair, recursive=False)
+
+            session = self.dao.get_session(doc_pair.session)
+            if session and session.status is not TransferStatus.CANCELLED:
+                session = self.dao.update_session(doc_pair.session, count=len(created))
+                self.engine.handle_session_status(session)
+
+            # For analytics
+            for pair, _ in created:
+                self.engine.manager.directTransferStats.emit(True, pair.size)
+
+        return error
+
+    def _direct_transfer_small_files(self, doc_pair: DocPair, path: Path, /) -> bool:
+        """
+        Upload the *doc_pair* file along with other small files of its folder, in a single batch.
+        Return False if the file has to be uploaded on its own.
+        """
+        count = Options.small_files_batch_size
+        size = Options.small_files_size_limit * 1024
+        if (
+            count < 2
+            or doc_pair.folderish
+            or doc_pair.size > size
+            or doc_pair.doc_type
+            # The server has to be asked for every file
+            or doc_pair.duplicate_behavior == "ignore"
+            # The S3 direct upload needs a completion step for every file
+            or (Feature.s3 and self.remote.uploads.has_s3())
+            # A paused upload has its own batch
+            or self.dao.get_dt_upload(doc_pair=doc_pair.id)
+        ):
+            return False
+
+        files = [(path, doc_pair)]
+        for pair in self.dao.acquire_dt_small_files(
+            self.thread_id, doc_pair, size, count - 1
+        ):
+            file = pair.local_path if WINDOWS else Path(f"/{pair.local_path}")
+            # Missing files will be handled on their own
+            if file.is_file():
+                files.append((file, pair))
+        if len(files) == 1:
+            return False
+
+        docs = DirectTransferUploader(self.remote).upload_small_files(
+            files, engine_uid=self.engine.uid
+        )
+
+        # Save all results at once
+        with self.dao.batch():
+            for (_, pair), doc in zip(files, docs):
+                self.dao.save_session_item(pair.session, doc)
+                self.dao.remove_state(pair, recursive=False)
+
+        session = self.dao.get_session(doc_pair.session)
+        if session and session.status is not TransferStatus.CANCELLED:
+            session = self.dao.update_session(doc_pair.session, count=len(files))
+            self.engine.handle_session_status(session)
+
+        # For analytics
+        for _, pair in files:
+            self.engine.manager.directTransferStats.emit(False, pair.size)
+        return True
+
     def _direct_transfer_cancel(self, doc_pair: DocPair, /) -> None:
         """Actions to do to cancel a Direct Transfer."""
         self._direct_transfer_end(doc_pair, True, recursive=True)
@@ -607,13 +814,14 @@ def _direct_transfer_end(
     ) -> None:
         """Actions to do to at the end of a Direct Transfer."""
 
-        # Transfer is completed, delete the upload from the database
-        self.dao.remove_transfer(
-            "upload", doc_pair=doc_pair.id, is_direct_transfer=True
-        )
+        with self.dao.batch():
+            # Transfer is completed, delete the upload from the database
+            self.dao.remove_transfer(
+                "upload", doc_pair=doc_pair.id, is_direct_transfer=True
+            )
 
-        # Clean-up
-        self.dao.remove_state(doc_pair, recursive=recursive)
+            # Clean-up
+            self.dao.remove_state(doc_pair, recursive=recursive)
 
         # Update session then handle the status
         session = self.dao.get_session(doc_pair.session)
@@ -667,27 +875,37 @@ def _synchronize_if_not_remotely_dirty(
 
         # Force computation of local digest to catch local modifications
         dynamic_states = False
-        if not (
-            doc_pair.folderish
-            or self.local.is_equal_digests(
-                None, doc_pair.remote_digest, doc_pair.local_path
-            )
-        ):
-            # Note: set 1st argument of is_equal_digests() to None
-            # to force digest computation
-            try:
-                info = self.local.get_info(doc_pair.local_path)
-            except NotFound:
+        remote_digest = doc_pair.remote_digest
+        if not (doc_pair.folderish or remote_digest is None):
+            remote_digest_algorithm = None
+            if remote_digest:
+                remote_digest_algorithm = get_digest_algorithm(remote_digest)
+                if not remote_digest_algorithm:
+                    raise UnknownDigest(str(remote_digest))
+
+            info = self.local.try_get_info(doc_pair.local_path)
+            if not info:
                 doc_pair.local_state = "created"
                 dynamic_states = True
             else:
-                doc_pair.local_digest = info.get_digest()
-                if doc_pair.local_digest != doc_pair.remote_digest:
-                    doc_pair.local_state = "modified"
-                    dynamic_states = True
+                # The local and remote digests are computed in a single read of the file
+                digest_funcs = {info._digest_func, remote_digest_algorithm} - {None}
+                digests = self._get_digests(info, *digest_funcs)
+                if (
+                    not remote_digest_algorithm
+                    or digests[remote_digest_algorithm] != remote_digest
+                ):
+                    doc_pair.local_digest = digests[info._digest_func]
+                    if doc_pair.local_digest != remote_digest:
+                        doc_pair.local_state = "modified"
+                        dynamic_states = True
 
         self.dao.synchronize_state(doc_pair, dynamic_states=dynamic_states)
 
+    def _get_digests(self, info: FileInfo, /, *digest_funcs: str) -> Dict[str, str]:
+        """Compute the *digest_funcs* digests of *info* from the hashing pool."""
+        return hashing.get_digests(info, *digest_funcs, callback=info.digest_callback)
+
     def _synchronize_locally_modified(self, doc_pair: DocPair, /) -> None:
         fs_item_info = None
         if doc_pair.local_digest == UNACCESSIBLE_HASH:
@@ -1207,7 +1425,10 @@ def _synchronize_deleted_unknown(self, doc_pair: DocPair, /) -> None:
         )
         self.dao.remove_state(doc_pair)
 
-    def _download_content(self, doc_pair: DocPair, file_path: Path, /) -> Path:
+    def _download_content(
+        self, doc_pair: DocPair, file_path: Path, /
+    ) -> Tuple[Path, Optional[str]]:
+        """Return the downloaded file and its local digest, when known without reading it."""
         # Check if the file is already on the HD
         pair = self.dao.get_valid_duplicate_file(doc_pair.remote_digest)
         tmp_folder = self.engine.download_dir / doc_pair.remote_ref.split("#")[-1]
@@ -1216,27 +1437,24 @@ def _download_content(self, doc_pair: DocPair, file_path: Path, /) -> Path:
         if pair:
             locker = unlock_path(file_out)
             try:
-                # copyfile() is used to prevent metadata copy
-                shutil.copyfile(self.local.abspath(pair.local_path), file_out)
-            except (FileNotFoundError, IsADirectoryError):
-                # IsADirectoryError may raise if the local path stored in DB is pointing
-                #     to an obsolete path. And for whatever reason, that path points to
-                #     a folder ...
-                # Let's re-download the file.
-                pass
-            else:
-                return file_out
+                if self.engine.copy_local_duplicate(pair, file_out):
+                    return file_out, None
+                # Else, let's re-download the file.
             finally:
                 lock_path(file_out, locker)
 
-        return self.remote.stream_content(
+        # The local digest is computed while downloading
+        digests = {self.local._digest_func: ""}
+        tmp_file = self.remote.stream_content(
             doc_pair.remote_ref,
             file_path,
             file_out,
             parent_fs_item_id=doc_pair.remote_parent_ref,
             engine_uid=self.engine.uid,
             doc_pair_id=doc_pair.id,
+            digests=digests,
         )
+        return tmp_file, digests[self.local._digest_func] or None
 
     def _update_remotely(self, doc_pair: DocPair, is_renaming: bool, /) -> None:
         os_path = self.local.abspath(doc_pair.local_path)
@@ -1246,7 +1464,7 @@ def _update_remotely(self, doc_pair: DocPair, is_renaming: bool, /) -> None:
         else:
             new_os_path = os_path
         log.info(f"Updating content of local file {os_path!r}")
-        tmp_file = self._download_content(doc_pair, new_os_path)
+        tmp_file, local_digest = self._download_content(doc_pair, new_os_path)
 
         # Delete original file and rename tmp file
         remote_id = self.local.get_remote_id(doc_pair.local_path)
@@ -1265,7 +1483,7 @@ def _update_remotely(self, doc_pair: DocPair, is_renaming: bool, /) -> None:
             updated_info.filepath, mtime=doc_pair.last_remote_updated
         )
 
-        doc_pair.local_digest = updated_info.get_digest()
+        doc_pair.local_digest = local_digest or updated_info.get_digest()
         self.dao.update_last_transfer(doc_pair.id, "download")
         self._refresh_local_state(doc_pair, updated_info)
 
@@ -1481,7 +1699,7 @@ def _create_remotely(
                 f"Creating local file {name!r} "
                 f"in {self.local.abspath(local_parent_path)!r}"
             )
-            tmp_file = self._download_content(doc_pair, os_path)
+            tmp_file, local_digest = self._download_content(doc_pair, os_path)
 
             # Set remote id on the TMP file already
             self.local.set_remote_id(tmp_file, doc_pair.remote_ref)
@@ -1494,6 +1712,8 @@ def _create_remotely(
             ctime = doc_pair.creation_date
             self.local.change_file_date(info.filepath, mtime=mtime, ctime=ctime)
 
+            if local_digest:
+                doc_pair.local_digest = local_digest
             self.dao.update_last_transfer(doc_pair.id, "download")
 
             # Clean-up the TMP file
@@ -1629,23 +1849,24 @@ def _handle_failed_remote_rename(
 
         try:
             info = self.local.rename(target_pair.local_path, target_pair.remote_name)
-            self.dao.update_local_state(source_pair, info, queue=False)
-            if source_pair != target_pair:
-                if target_pair.folderish:
-                    # Remove "new" created tree
-                    pairs = self.dao.get_states_from_partial_local(
-                        target_pair.local_path
-                    )
-                    for pair in pairs:
-                        self.dao.remove_state(pair)
-                    pairs = self.dao.get_states_from_partial_local(
-                        source_pair.local_path
-                    )
-                    for pair in pairs:
-                        self.dao.synchronize_state(pair)
-                else:
-                    self.dao.remove_state(target_pair)
-            self.dao.synchronize_state(source_pair)
+            with self.dao.batch():
+                self.dao.update_local_state(source_pair, info, queue=False)
+                if source_pair != target_pair:
+                    if target_pair.folderish:
+                        # Remove "new" created tree
+                        pairs = self.dao.get_states_from_partial_local(
+                            target_pair.local_path
+                        )
+                        for pair in pairs:
+                            self.dao.remove_state(pair)
+                        pairs = self.dao.get_states_from_partial_local(
+                            source_pair.local_path
+                        )
+                        for pair in pairs:
+                            self.dao.synchronize_state(pair)
+                    else:
+                        self.dao.remove_state(target_pair)
+                self.dao.synchronize_state(source_pair)
             return True
         except Exception:
             log.exception("Cannot rollback local modification")
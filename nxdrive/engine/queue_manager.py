@@ -1,17 +1,31 @@
 import time
+from collections import deque
 from contextlib import suppress
+from functools import partial
+from heapq import heappop, heappush
+from itertools import count
 from logging import getLogger
 from pathlib import Path
-from queue import Empty, Queue
-from threading import Lock
-from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Union
+from threading import Condition, Lock
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Deque,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
 from nuxeo.exceptions import OngoingRequestError
 
-from ..constants import WINDOWS
+from ..constants import WINDOWS, QueuePriority
 from ..objects import DocPair, Metrics
 from ..options import Options
 from ..qt.imports import QObject, QThread, QTimer, pyqtSignal, pyqtSlot
+from ..utils import current_thread_id
+from .delayed_queue import DelayedQueue
 from .processor import Processor
 
 if TYPE_CHECKING:
@@ -22,13 +36,26 @@
 
 log = getLogger(__name__)
 WINERROR_CODE_PROCESS_CANNOT_ACCESS_FILE = 32
+# Maximum time waited by an idle processor before checking for interruptions (in seconds)
+IDLE_TIMEOUT = 1.0
 
 
 class QueueItem:
-    def __init__(self, row_id: int, folderish: bool, pair_state: str, /) -> None:
+    def __init__(
+        self,
+        row_id: int,
+        folderish: bool,
+        pair_state: str,
+        /,
+        *,
+        size: int = 0,
+        priority: int = QueuePriority.NORMAL.value,
+    ) -> None:
         self.id = row_id
         self.folderish = folderish
         self.pair_state = pair_state
+        self.size = size
+        self.priority = priority
 
     def __repr__(self) -> str:
         return (
@@ -37,6 +64,135 @@ def __repr__(self) -> str:
         )
 
 
+Item = Union[DocPair, QueueItem]
+
+
+class PairQueue:
+    """
+    A queue of pairs to handle, backed by the States table.
+
+    At most *Options.queue_buffer_size* items are kept in memory, ordered by
+    priority, then by size for files, then by arrival. Items pushed while the
+    buffer is full are only kept in the database (the *backlog*), and they are
+    paged back by priority, using EngineDAO.get_queue_page(), once the buffer
+    is drained.
+    """
+
+    def __init__(self, dao: "EngineDAO", /, *, local: bool, folderish: bool) -> None:
+        self._dao = dao
+        self.local = local
+        self.folderish = folderish
+        self._lock = Lock()
+        self._page_lock = Lock()
+        self._heap: List[Tuple[int, int, int, Item]] = []
+        self._ids: Set[int] = set()
+        self._counter = count()
+
+        # Is there something to load from the database?
+        self._overflow = False
+        # The key of the last paged item, None when not paging
+        self._after: Optional[Tuple[int, int, int]] = None
+        self._paging = False
+        # Estimated count of items only stored in the database
+        self.backlog = 0
+
+    def __repr__(self) -> str:
+        return (
+            f"<{type(self).__name__} local={self.local!r},"
+            f" folderish={self.folderish!r}, size={self.qsize()}>"
+        )
+
+    @property
+    def queue(self) -> Deque[Item]:
+        """A copy of the items in memory, in the processing order."""
+        with self._lock:
+            return deque(entry[-1] for entry in sorted(self._heap))
+
+    def _key(self, item: Item, /) -> Tuple[int, int, int]:
+        priority = item.priority
+        if priority is None:
+            priority = QueuePriority.NORMAL.value
+        # Folders are handled by arrival, their children may depend on them
+        size = 0 if self.folderish else item.size or 0
+        return priority, size, next(self._counter)
+
+    def put(self, item: Item, /) -> None:
+        with self._lock:
+            if item.id in self._ids:
+                return
+            if len(self._heap) >= Options.queue_buffer_size:
+                self._overflow = True
+                self.backlog += 1
+                return
+            heappush(self._heap, (*self._key(item), item))
+            self._ids.add(item.id)
+
+    def get(self) -> Optional[Item]:
+        while "there is something to load":
+            with self._lock:
+                if self._heap:
+                    item = heappop(self._heap)[-1]
+                    self._ids.discard(item.id)
+                    return item
+                if not (self._overflow or self._paging):
+                    return None
+            self._load_page()
+
+    def _load_page(self) -> None:
+        """Load the next page of items from the database."""
+        with self._page_lock:
+            with self._lock:
+                if self._heap:
+                    # Already filled by another thread
+                    return
+                if not self._paging:
+                    # Start a new pass over the database
+                    self._overflow = False
+                    self._paging = True
+                    self._after = None
+                after = self._after
+
+            limit = Options.queue_buffer_size
+            pairs = self._dao.get_queue_page(
+                local=self.local, folderish=self.folderish, limit=limit, after=after
+            )
+            log.debug(f"Loaded {len(pairs)} pairs from the database into {self!r}")
+
+            with self._lock:
+                for pair in pairs:
+                    if pair.id not in self._ids:
+                        heappush(self._heap, (*self._key(pair), pair))
+                        self._ids.add(pair.id)
+                self.backlog = max(self.backlog - len(pairs), 0)
+                if pairs:
+                    last = pairs[-1]
+                    self._after = (last.priority, last.size, last.id)
+                if len(pairs) < limit:
+                    # End of the pass, restart only if items were dropped meanwhile
+                    self._paging = False
+                    if not self._overflow:
+                        self.backlog = 0
+
+    def add_backlog(self, count: int, /) -> None:
+        """Items waiting in the database, they will be loaded when needed."""
+        with self._lock:
+            self._overflow = True
+            self.backlog += count
+
+    def head_priority(self) -> int:
+        """The priority of the next item, used to pick a queue."""
+        with self._lock:
+            if self._heap:
+                return self._heap[0][0]
+        return QueuePriority.NORMAL.value
+
+    def empty(self) -> bool:
+        return not (self._heap or self._overflow or self._paging)
+
+    def qsize(self) -> int:
+        return len(self._heap) + self.backlog
+
+
 class QueueManager(QObject):
     # Always create thread from the main thread
     newItem = pyqtSignal(object)
@@ -54,10 +210,10 @@ def __init__(
         super().__init__()
         self.dao = dao
         self._engine = engine
-        self._local_folder_queue: Queue = Queue()
-        self._local_file_queue: Queue = Queue()
-        self._remote_file_queue: Queue = Queue()
-        self._remote_folder_queue: Queue = Queue()
+        self._local_folder_queue = PairQueue(dao, local=True, folderish=True)
+        self._local_file_queue = PairQueue(dao, local=True, folderish=False)
+        self._remote_file_queue = PairQueue(dao, local=False, folderish=False)
+        self._remote_folder_queue = PairQueue(dao, local=False, folderish=True)
         self._local_folder_enable = True
         self._local_file_enable = True
         self._remote_folder_enable = True
@@ -71,6 +227,14 @@ def __init__(
         self.set_max_processors(max_file_processors)
         self._processors_pool: List[QThread] = []
         self._get_file_lock = Lock()
+        self._file_queues = (self._local_file_queue, self._remote_file_queue)
+        self._file_queues_turn = 0
+
+        # Processors are long-lived: they wait for new items on that condition
+        self._new_items = Condition()
+        self._pushes = 0
+        # Threads IDs of processors handling an item
+        self._busy: Set[int] = set()
         # Should not operate on thread while we are inspecting them
         """
         This error required to add a lock for inspecting threads,
@@ -90,8 +254,9 @@ def __init__(
 
         # ERROR HANDLING
         self._error_lock = Lock()
-        self._on_error_queue: Dict[int, DocPair] = {}
+        self._on_error_queue: DelayedQueue[int, DocPair] = DelayedQueue()
         self._error_timer = QTimer()
+        self._error_timer.setSingleShot(True)
         self._error_timer.timeout.connect(self._on_error_timer)
         self.newError.connect(self._on_new_error)
         self.queueProcessing.connect(self.launch_processors)
@@ -108,6 +273,7 @@ def shutdown_processors(self) -> None:
         with suppress(TypeError):
             # TypeError: disconnect() failed between 'newItem' and 'launch_processors'
             self.newItem.disconnect(self.launch_processors)
+        self._wake_up()
 
     def set_max_processors(self, max_file_processors: int, /) -> None:
         if max_file_processors < 2:
@@ -138,39 +304,68 @@ def suspend(self) -> None:
         self.enable_local_folder_queue(False)
         self.enable_remote_file_queue(False)
         self.enable_remote_folder_queue(False)
+        self._wake_up()
+
+    def _wake_up(self) -> None:
+        """Wake up waiting processors, they will look for items to handle."""
+        with self._new_items:
+            self._pushes += 1
+            self._new_items.notify_all()
 
     def enable_local_file_queue(self, value: bool, /, *, emit: bool = True) -> None:
         self._local_file_enable = value
-        if self._local_file_thread is not None and not value:
-            self._local_file_thread.quit()
-        if value and emit:
-            self.queueProcessing.emit()
+        if value:
+            self._wake_up()
+            if emit:
+                self.queueProcessing.emit()
 
     def enable_local_folder_queue(self, value: bool, /, *, emit: bool = True) -> None:
         self._local_folder_enable = value
-        if self._local_folder_thread is not None and not value:
-            self._local_folder_thread.quit()
-        if value and emit:
-            self.queueProcessing.emit()
+        if value:
+            self._wake_up()
+            if emit:
+                self.queueProcessing.emit()
 
     def enable_remote_file_queue(self, value: bool, /, *, emit: bool = True) -> None:
         self._remote_file_enable = value
-        if self._remote_file_thread is not None and not value:
-            self._remote_file_thread.quit()
-        if value and emit:
-            self.queueProcessing.emit()
+        if value:
+            self._wake_up()
+            if emit:
+                self.queueProcessing.emit()
 
     def enable_remote_folder_queue(self, value: bool, /, *, emit: bool = True) -> None:
         self._remote_folder_enable = value
-        if self._remote_folder_thread is not None and not value:
-            self._remote_folder_thread.quit()
-        if value and emit:
-            self.queueProcessing.emit()
-
-    def push_ref(self, row_id: int, folderish: bool, pair_state: str, /) -> None:
-        self.push(QueueItem(row_id, folderish, pair_state))
+        if value:
+            self._wake_up()
+            if emit:
+                self.queueProcessing.emit()
+
+    def push_ref(
+        self,
+        row_id: int,
+        folderish: bool,
+        pair_state: str,
+        /,
+        *,
+        size: int = 0,
+        priority: int = QueuePriority.NORMAL.value,
+    ) -> None:
+        self.push(
+            QueueItem(row_id, folderish, pair_state, size=size, priority=priority)
+        )
 
-    def push(self, state: Union[DocPair, QueueItem], /) -> None:
+    def add_backlog(self, count: int, /, *, local: bool, folderish: bool) -> None:
+        """Tell that *count* pairs are waiting in the database. Called at startup."""
+        queue = {
+            (True, True): self._local_folder_queue,
+            (True, False): self._local_file_queue,
+            (False, True): self._remote_folder_queue,
+            (False, False): self._remote_file_queue,
+        }[(local, folderish)]
+        queue.add_backlog(count)
+        log.info(f"{count} pairs to handle in {queue!r}")
+
+    def push(self, state: Item, /) -> None:
         if state.pair_state is None:
             log.debug(f"Don't push an empty pair_state: {state!r}")
             return
@@ -192,6 +387,7 @@ def push(self, state: Union[DocPair, QueueItem], /) -> None:
                     "Pushed to _local_file_queue, now of size: "
                     f"{self._local_file_queue.qsize()}"
                 )
+            self._wake_up()
             self.newItem.emit(row_id)
         elif state.pair_state.startswith(("remotely", "parent_remotely")):
             if state.folderish:
@@ -208,6 +404,7 @@ def push(self, state: Union[DocPair, QueueItem], /) -> None:
                     "Pushed to _remote_file_queue, now of size: "
                     f"{self._remote_file_queue.qsize()}"
                 )
+            self._wake_up()
             self.newItem.emit(row_id)
         else:
             # deleted and conflicted
@@ -217,23 +414,40 @@ def push(self, state: Union[DocPair, QueueItem], /) -> None:
     def _on_error_timer(self) -> None:
         with self._error_lock:
             cur_time = int(time.time())
-            for doc_pair in self._on_error_queue.copy().values():
-                if doc_pair.error_next_try < cur_time:
-                    queue_item = QueueItem(
-                        doc_pair.id, doc_pair.folderish, doc_pair.pair_state
-                    )
-                    del self._on_error_queue[doc_pair.id]
-                    log.info(f"End of block period, pushing doc_pair: {doc_pair!r}")
-                    self.push(queue_item)
-            if not self._on_error_queue:
-                self._error_timer.stop()
+            while "due pairs":
+                due = self._on_error_queue.pop_due(cur_time)
+                if not due:
+                    break
+
+                doc_pair = due[1]
+                queue_item = QueueItem(
+                    doc_pair.id,
+                    doc_pair.folderish,
+                    doc_pair.pair_state,
+                    size=doc_pair.size,
+                    priority=doc_pair.priority,
+                )
+                log.info(f"End of block period, pushing doc_pair: {doc_pair!r}")
+                self.push(queue_item)
+        self._arm_error_timer()
+
+    def _arm_error_timer(self) -> None:
+        """Fire the error timer when the earliest blocked pair is due."""
+        next_try = self._on_error_queue.next_due()
+        if next_try is None:
+            self._error_timer.stop()
+            return
+
+        # Pairs are released once the current second is greater than their next try
+        delay = max(0.0, next_try + 1 - time.time())
+        self._error_timer.start(int(delay * 1000))
 
     def _is_on_error(self, row_id: int) -> bool:
         return row_id in self._on_error_queue
 
     @pyqtSlot()
     def _on_new_error(self) -> None:
-        self._error_timer.start(1000)
+        self._arm_error_timer()
 
     def get_errors_count(self) -> int:
         return len(self._on_error_queue)
@@ -275,7 +489,9 @@ def push_error(
             return
 
         with self._error_lock:
-            self._on_error_queue[doc_pair.id] = doc_pair
+            self._on_error_queue.schedule(
+                doc_pair.id, doc_pair, doc_pair.error_next_try
+            )
             try:
                 self.newError.emit(doc_pair.id)
             except RuntimeError:
@@ -283,89 +499,91 @@ def push_error(
                 # Happens on Windows when running old functional tests
                 pass
 
-    def _get_local_folder(self) -> Optional[DocPair]:
-        if self._local_folder_queue.empty():
+    def _get_local_folder(self) -> Optional[Item]:
+        if not self._local_folder_enable:
             return None
+        return self._get_from(self._local_folder_queue)
 
-        try:
-            state: DocPair = self._local_folder_queue.get(True, 3)
-        except Empty:
+    def _get_local_file(self) -> Optional[Item]:
+        if not self._local_file_enable:
             return None
-        else:
-            if not state:
-                return None
+        return self._get_from(self._local_file_queue)
 
-        if self._is_on_error(state.id):
-            return self._get_local_folder()
-
-        return state
-
-    def _get_local_file(self) -> Optional[DocPair]:
-        if self._local_file_queue.empty():
+    def _get_remote_folder(self) -> Optional[Item]:
+        if not self._remote_folder_enable:
             return None
+        return self._get_from(self._remote_folder_queue)
 
-        try:
-            state: DocPair = self._local_file_queue.get(True, 3)
-        except Empty:
+    def _get_remote_file(self) -> Optional[Item]:
+        if not self._remote_file_enable:
             return None
-        else:
-            if not state:
-                return None
+        return self._get_from(self._remote_file_queue)
 
-        if self._is_on_error(state.id):
-            return self._get_local_file()
+    def _get_from(self, queue: PairQueue, /) -> Optional[Item]:
+        while "there are items in the queue":
+            state = queue.get()
+            if state is None or not self._is_on_error(state.id):
+                return state
 
-        return state
-
-    def _get_remote_folder(self) -> Optional[DocPair]:
-        if self._remote_folder_queue.empty():
-            return None
-
-        try:
-            state: DocPair = self._remote_folder_queue.get(True, 3)
-        except Empty:
-            return None
-        else:
-            if not state:
-                return None
-
-        if self._is_on_error(state.id):
-            return self._get_remote_folder()
-
-        return state
-
-    def _get_remote_file(self) -> Optional[DocPair]:
-        if self._remote_file_queue.empty():
-            return None
-
-        try:
-            state: DocPair = self._remote_file_queue.get(True, 3)
-        except Empty:
-            return None
-        else:
-            if not state:
-                return None
-
-        if self._is_on_error(state.id):
-            return self._get_remote_file()
-
-        return state
-
-    def _get_file(self) -> Optional[DocPair]:
+    def _get_file(self) -> Optional[Item]:
+        """
+        Used by generic processors: take turns between local and remote files,
+        but user-requested pairs always come first.
+        """
         with self._get_file_lock:
-            if self._remote_file_queue.empty() and self._local_file_queue.empty():
-                return None
-            if self._remote_file_queue.qsize() > self._local_file_queue.qsize():
-                state = self._get_remote_file()
-            else:
-                state = self._get_local_file()
-        if state is not None and self._is_on_error(state.id):
-            return self._get_file()
-        return state
+            self._file_queues_turn ^= 1
+            queues = sorted(
+                self._file_queues[self._file_queues_turn :]
+                + self._file_queues[: self._file_queues_turn],
+                key=PairQueue.head_priority,
+            )
+            enabled = {
+                self._local_file_queue: self._local_file_enable,
+                self._remote_file_queue: self._remote_file_enable,
+            }
+            for queue in queues:
+                if not enabled[queue]:
+                    continue
+                state = self._get_from(queue)
+                if state is not None:
+                    return state
+        return None
+
+    def _next_item(self, get: Callable[[], Optional[Item]], /) -> Optional[Item]:
+        """
+        The item getter of processors: return the next item from *get*, or wait
+        for a new item to be pushed and return None. Processors never end on an
+        empty queue, they call that method again after checking interruptions.
+        Each call also means the previous item returned to the thread is handled.
+        """
+        thread_id = current_thread_id()
+        with self._new_items:
+            self._busy.add(thread_id)
+            pushes = self._pushes
+
+        item = None if self._disable else get()
+        if item is None:
+            with self._new_items:
+                self._busy.discard(thread_id)
+                # Do not wait if something was pushed in-between
+                if pushes == self._pushes:
+                    self._new_items.wait(IDLE_TIMEOUT)
+        return item
 
     @pyqtSlot()
     def _thread_finished(self) -> None:
         with self._thread_inspection:
+            with self._new_items:
+                for thread in (
+                    self._local_folder_thread,
+                    self._local_file_thread,
+                    self._remote_folder_thread,
+                    self._remote_file_thread,
+                    *self._processors_pool,
+                ):
+                    if thread is not None and thread.isFinished():
+                        # Interrupted while handling an item
+                        self._busy.discard(thread.worker.thread_id)
             for thread in self._processors_pool:
                 if thread.isFinished():
                     thread.quit()
@@ -399,24 +617,18 @@ def active(self) -> bool:
         return self.is_active()
 
     def is_active(self) -> bool:
-        return any(
-            {
-                self._local_folder_thread is not None,
-                self._local_file_thread is not None,
-                self._remote_file_thread is not None,
-                self._remote_folder_thread is not None,
-                len(self._processors_pool) > 0,
-            }
-        )
+        """Is there any processor handling an item?"""
+        return bool(self._busy)
 
     def _create_thread(self, item_getter: Callable, name: str, /) -> QThread:
-        processor = self._engine.create_processor(item_getter)
+        processor = self._engine.create_processor(partial(self._next_item, item_getter))
         thread = self._engine.create_thread(processor, name)
         thread.finished.connect(self._thread_finished)
         thread.start()
         return thread
 
     def get_metrics(self) -> Metrics:
+        errors_due = self._on_error_queue.due_count(int(time.time()))
         metrics = {
             "is_paused": self.is_paused(),
             "local_folder_queue": self._local_folder_queue.qsize(),
@@ -428,7 +640,10 @@ def get_metrics(self) -> Metrics:
             "local_file_thread": self._local_file_thread is not None,
             "local_folder_thread": self._local_folder_thread is not None,
             "error_queue": self.get_errors_count(),
+            "error_queue_due": errors_due,
+            "error_queue_parked": self.get_errors_count() - errors_due,
             "additional_processors": len(self._processors_pool),
+            "busy_processors": len(self._busy),
         }
         metrics["total_queue"] = (
             metrics["local_folder_queue"]
@@ -565,7 +780,7 @@ def launch_processors(self) -> None:
                 self._get_remote_file, "RemoteFileProcessor"
             )
 
-        if self._remote_file_queue.qsize() == 0 and self._local_file_queue.qsize() == 0:
+        if self._remote_file_queue.empty() and self._local_file_queue.empty():
             return
 
         while len(self._processors_pool) < self._max_processors:
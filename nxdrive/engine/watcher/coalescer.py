@@ -0,0 +1,277 @@
+import os
+from collections import deque
+from itertools import islice
+from queue import Empty, Queue
+from typing import Deque, Dict, Iterator, List, Optional, Set
+
+from watchdog.events import (
+    EVENT_TYPE_CLOSED,
+    EVENT_TYPE_CREATED,
+    EVENT_TYPE_DELETED,
+    EVENT_TYPE_MODIFIED,
+    EVENT_TYPE_MOVED,
+    FileCreatedEvent,
+    FileMovedEvent,
+    FileSystemEvent,
+)
+
+from ...constants import MAC
+from ...utils import current_milli_time
+
+__all__ = ("EventCoalescer",)
+
+# Events are released after this many debounce windows, even if their path is still busy
+MAX_HOLD_FACTOR = 10
+
+# Events only telling that the content may have changed
+MODIFICATIONS = (EVENT_TYPE_MODIFIED, EVENT_TYPE_CLOSED)
+
+
+class _Slot:
+    __slots__ = ("event", "first", "last")
+
+    def __init__(self, event: FileSystemEvent, now: int, /) -> None:
+        self.event: Optional[FileSystemEvent] = event
+        self.first = self.last = now
+
+
+class EventCoalescer:
+    """Collapse bursts of watchdog events on the same path.
+
+    Events are kept in their arrival order and merged with the pending
+    event of the same path, when there is one:
+
+        - created + modified (or closed) -> created
+        - modified + modified (or closed) -> modified
+        - modified + deleted -> deleted
+        - created + deleted -> nothing
+        - file created at A + moved from A to B -> created at B
+        - file moved from A to B + moved from B to C -> moved from A to C
+          (nothing when C is A)
+
+    Other events are queued as-is and end the merging on their path(s), so
+    that the order of events on the same path is never changed.
+
+    When a directory creation is cancelled, pending events on its
+    descendants are dropped too.
+
+    FSEvents may report a file creation for an existing file, so on macOS
+    a created event is not trusted to cancel or absorb a later event:
+    created + deleted -> deleted, and created + moved are kept as-is.
+
+    An event is released when nothing happened on its path for *delay*
+    milliseconds, and only after the events received before it on the same
+    path, on its parents or on its children.
+    """
+
+    _trust_created = not MAC
+
+    def __init__(self, *, delay: int) -> None:
+        self.delay = delay
+        self.max_hold = delay * MAX_HOLD_FACTOR
+
+        self._slots: Deque[_Slot] = deque()
+        # Pending slots that can still be merged, by path
+        self._mergeable: Dict[str, _Slot] = {}
+        self.raw = 0
+        self.effective = 0
+
+    def __repr__(self) -> str:
+        return (
+            f"<{type(self).__name__} delay={self.delay}, pending={len(self)},"
+            f" raw={self.raw}, effective={self.effective}>"
+        )
+
+    def __len__(self) -> int:
+        return sum(slot.event is not None for slot in self._slots)
+
+    def empty(self) -> bool:
+        return not any(slot.event is not None for slot in self._slots)
+
+    @property
+    def ratio(self) -> float:
+        """Raw events received by effective events released."""
+        return self.raw / self.effective if self.effective else 1.0
+
+    def feed(self, queue: Queue, /) -> None:
+        """Coalesce all events waiting in the watchdog *queue*."""
+        now = current_milli_time()
+        while "events":
+            try:
+                self.add(queue.get_nowait(), now=now)
+            except Empty:
+                return
+
+    def add(self, event: FileSystemEvent, /, *, now: int = None) -> None:
+        self.raw += 1
+        if now is None:
+            now = current_milli_time()
+        src = event.src_path
+        slot = self._mergeable.get(src)
+
+        if event.event_type == EVENT_TYPE_MOVED:
+            dest = event.dest_path
+            # A newer event on the destination must not be merged into older ones
+            self._mergeable.pop(dest, None)
+            if slot and not event.is_directory and self._merge_move(slot, event, now):
+                return
+            self._mergeable.pop(src, None)
+            self._append(event, now, key=None if event.is_directory else dest)
+            return
+
+        if slot and self._merge(slot, event, now):
+            return
+
+        mergeable = event.event_type == EVENT_TYPE_CREATED or (
+            event.event_type in MODIFICATIONS
+        )
+        self._mergeable.pop(src, None)
+        self._append(event, now, key=src if mergeable else None)
+
+    def pop_ready(self, *, now: int = None) -> List[FileSystemEvent]:
+        """Return all events ready to be handled, in their arrival order."""
+        if now is None:
+            now = current_milli_time()
+        slots = self._slots
+        # Events after the last ready one cannot hold it
+        last = max(
+            (idx for idx, slot in enumerate(slots) if self._ready(slot, now)),
+            default=-1,
+        )
+        if last < 0:
+            return []
+
+        events: List[FileSystemEvent] = []
+        # Paths of pending events, and their parents
+        busy: Set[str] = set()
+        busy_parents: Set[str] = set()
+
+        for slot in islice(slots, last + 1):
+            event = slot.event
+            if event is None:
+                continue
+            paths = list(_paths(event))
+            if not self._ready(slot, now) or (
+                busy and any(_related(path, busy, busy_parents) for path in paths)
+            ):
+                for path in paths:
+                    busy.add(path)
+                    busy_parents.update(_parents(path))
+                continue
+
+            self._forget(slot)
+            slot.event = None
+            events.append(event)
+
+        # Drop released and cancelled slots
+        self._slots = deque(slot for slot in slots if slot.event is not None)
+
+        self.effective += len(events)
+        return events
+
+    def _ready(self, slot: _Slot, now: int, /) -> bool:
+        """Return True if nothing happened on the path of *slot* for long enough."""
+        return slot.event is not None and (
+            now - slot.last >= self.delay or now - slot.first >= self.max_hold
+        )
+
+    def _append(self, event: FileSystemEvent, now: int, /, *, key: str = None) -> None:
+        slot = _Slot(event, now)
+        self._slots.append(slot)
+        if key is not None:
+            self._mergeable[key] = slot
+
+    def _forget(self, slot: _Slot, /) -> None:
+        for key in (slot.event.src_path, getattr(slot.event, "dest_path", None)):
+            if key is not None and self._mergeable.get(key) is slot:
+                del self._mergeable[key]
+
+    def _cancel(self, slot: _Slot, /) -> None:
+        self._forget(slot)
+        slot.event = None
+
+    def _cancel_children(self, slot: _Slot, /) -> None:
+        """Cancel events received after the directory creation of *slot*, on its descendants."""
+        prefix = os.path.join(slot.event.src_path, "")
+        found = False
+        for other in self._slots:
+            if other is slot:
+                found = True
+            elif (
+                found
+                and other.event is not None
+                and all(path.startswith(prefix) for path in _paths(other.event))
+            ):
+                self._cancel(other)
+
+    def _merge(self, slot: _Slot, event: FileSystemEvent, now: int, /) -> bool:
+        pending, new = slot.event.event_type, event.event_type
+        if slot.event.is_directory != event.is_directory:
+            return False
+
+        if new in MODIFICATIONS and (
+            pending == EVENT_TYPE_CREATED or pending in MODIFICATIONS
+        ):
+            slot.last = now
+            return True
+
+        if new == EVENT_TYPE_DELETED:
+            if pending == EVENT_TYPE_CREATED and self._trust_created:
+                if event.is_directory:
+                    self._cancel_children(slot)
+                self._cancel(slot)
+                return True
+            if pending == EVENT_TYPE_CREATED or pending in MODIFICATIONS:
+                self._forget(slot)
+                slot.event = event
+                slot.last = now
+                return True
+
+        return False
+
+    def _merge_move(self, slot: _Slot, event: FileSystemEvent, now: int, /) -> bool:
+        pending = slot.event
+        if pending.is_directory:
+            return False
+
+        src, dest = event.src_path, event.dest_path
+        if pending.event_type == EVENT_TYPE_CREATED:
+            if not self._trust_created:
+                return False
+            merged = FileCreatedEvent(dest)
+        elif pending.event_type == EVENT_TYPE_MOVED and pending.dest_path == src:
+            if pending.src_path == dest:
+                # Moved back to its original place
+                self._cancel(slot)
+                return True
+            merged = FileMovedEvent(pending.src_path, dest)
+        else:
+            return False
+
+        self._forget(slot)
+        slot.event = merged
+        slot.last = now
+        self._mergeable[dest] = slot
+        return True
+
+
+def _paths(event: FileSystemEvent, /) -> Iterator[str]:
+    yield event.src_path
+    if event.event_type == EVENT_TYPE_MOVED:
+        yield event.dest_path
+
+
+def _parents(path: str, /) -> Iterator[str]:
+    parent = os.path.dirname(path)
+    while parent != path:
+        yield parent
+        path, parent = parent, os.path.dirname(parent)
+
+
+def _related(path: str, busy: Set[str], busy_parents: Set[str], /) -> bool:
+    """Return True if *path*, one of its parents or one of its children is *busy*."""
+    return (
+        path in busy
+        or path in busy_parents
+        or any(parent in busy for parent in _parents(path))
+    )
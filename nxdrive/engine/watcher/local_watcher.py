@@ -2,13 +2,15 @@
 import re
 import sqlite3
 import sys
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from logging import getLogger
 from os.path import basename, splitext
 from pathlib import Path
 from queue import Queue
 from threading import Lock
 from time import mktime, sleep
-from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple
+from typing import TYPE_CHECKING, Deque, Dict, List, Optional, Set, Tuple
 
 from watchdog.events import FileSystemEvent, PatternMatchingEventHandler
 from watchdog.observers import Observer, api
@@ -17,7 +19,7 @@
 from ...constants import LINUX, MAC, ROOT, UNACCESSIBLE_HASH, WINDOWS
 from ...exceptions import ThreadInterrupt
 from ...feature import Feature
-from ...objects import DocPair, Metrics
+from ...objects import STATUS_COLUMNS, DocPair, DocPairs, Metrics
 from ...options import Options
 from ...qt.imports import pyqtSignal
 from ...utils import (
@@ -28,7 +30,10 @@
 )
 from ...utils import normalize_event_filename as normalize
 from ..activity import tooltip
+from ..delayed_queue import DelayedQueue
+from ..hashing import hashing
 from ..workers import EngineWorker, Worker
+from .coalescer import EventCoalescer
 
 if WINDOWS:
     import watchdog.observers as ob
@@ -51,6 +56,11 @@
 # Windows 2s between resolution of delete event
 WIN_MOVE_RESOLUTION_PERIOD = 2000
 
+# Threads reading folders contents during a local scan, and how many folders
+# can be read ahead of their comparison with the database
+SCAN_THREADS = 4
+SCAN_READ_AHEAD = 64
+
 TEXT_EDIT_TMP_FILE_PATTERN = r".*\.rtf\.sb\-(\w)+\-(\w)+$"
 
 
@@ -71,6 +81,9 @@ def __init__(self, engine: "Engine", dao: "EngineDAO", /) -> None:
         self.local = self.engine.local
         self.lock = Lock()
         self.watchdog_queue: Queue = Queue()
+        self._events = EventCoalescer(delay=Options.fs_events_delay)
+        # Database children of folders being scanned, fetched by batches
+        self._scan_db_children: Dict[Path, DocPairs] = {}
 
         # Delay for the scheduled recursive scans of
         # a created / modified / moved folder under Windows
@@ -91,8 +104,13 @@ def __init__(self, engine: "Engine", dao: "EngineDAO", /) -> None:
 
         self._event_handler: Optional[DriveFSEventHandler] = None
         self._observer: api.BaseObserver = None
-        self._delete_events: Dict[str, Tuple[int, DocPair]] = {}
-        self._folder_scan_events: Dict[Path, Tuple[float, DocPair]] = {}
+        # Windows delete events by remote reference, due at the end of the move
+        # resolution period, and folders to scan by path with their last
+        # modification time, due at the end of the folder scan delay.
+        self._delete_events: DelayedQueue[str, DocPair] = DelayedQueue()
+        self._folder_scan_events: DelayedQueue[
+            Path, Tuple[float, DocPair]
+        ] = DelayedQueue()
 
     def _execute(self) -> None:
         try:
@@ -106,25 +124,25 @@ def _execute(self) -> None:
             if LINUX:
                 self._update_local_status()
 
-            if WINDOWS:
-                # Check dequeue and folder scan only every 100 loops (1s)
-                now = current_milli_time()
-                self._win_delete_interval = self._win_folder_scan_interval = now
-
             while "working":
                 self._interact()
                 sleep(1)
 
-                while not self.watchdog_queue.empty():
-                    self.handle_watchdog_event(self.watchdog_queue.get())
+                while "events":
+                    self._events.feed(self.watchdog_queue)
+                    events = self._events.pop_ready()
+                    if not events:
+                        break
+                    for evt in events:
+                        self.handle_watchdog_event(evt)
 
-                    if WINDOWS:
-                        self._win_delete_check()
-                        self._win_folder_scan_check()
+                        if WINDOWS:
+                            self._win_delete_check()
+                            self._win_folder_scan_check()
 
-                    # If there are a _lot_ of FS events, it is better to let Qt handling
-                    # some app events. Else the GUI will not be responsive enough.
-                    self._interact()
+                        # If there are a _lot_ of FS events, it is better to let Qt handling
+                        # some app events. Else the GUI will not be responsive enough.
+                        self._interact()
 
                 if WINDOWS:
                     self._win_delete_check()
@@ -140,7 +158,7 @@ def _update_local_status(self) -> None:
         """Fetch State of each local file then update sync status."""
         local = self.local
         send_sync_status = self.engine.manager.osi.send_sync_status
-        doc_pairs = self.dao.get_states_from_partial_local(ROOT)
+        doc_pairs = self.dao.get_states_from_partial_local(ROOT, columns=STATUS_COLUMNS)
 
         # Skip the first as it is the ROOT
         for doc_pair in doc_pairs[1:]:
@@ -154,25 +172,21 @@ def get_win_queue_size(self) -> int:
         return len(self._delete_events)
 
     def _win_delete_check(self) -> None:
-        elapsed = current_milli_time() - WIN_MOVE_RESOLUTION_PERIOD
-        if self._win_delete_interval >= elapsed:
+        if not self._delete_events.has_due(current_milli_time()):
             return
 
         with self.lock:
             self._win_dequeue_delete()
-        self._win_delete_interval = current_milli_time()
 
     @tooltip("Dequeue delete")
     def _win_dequeue_delete(self) -> None:
         try:
-            for evt in self._delete_events.copy().values():
-                evt_time, evt_pair = evt
-                if current_milli_time() - evt_time < WIN_MOVE_RESOLUTION_PERIOD:
-                    log.info(
-                        "Win: ignoring delete event as waiting for move resolution "
-                        f"period expiration: {evt!r}"
-                    )
-                    continue
+            while "due events":
+                evt = self._delete_events.pop_due(current_milli_time())
+                if not evt:
+                    break
+
+                evt_pair = evt[1]
                 if not self.local.exists(evt_pair.local_path):
                     log.info(f"Win: handling watchdog delete for event: {evt!r}")
                     self._handle_watchdog_delete(evt_pair)
@@ -186,7 +200,6 @@ def _win_dequeue_delete(self) -> None:
                         log.info(f"Win: handling watchdog delete for event: {evt!r}")
                         self._handle_watchdog_delete(evt_pair)
                 log.info(f"Win: dequeuing delete event: {evt!r}")
-                del self._delete_events[evt_pair.remote_ref]
         except ThreadInterrupt:
             raise
         except Exception:
@@ -199,27 +212,21 @@ def get_win_folder_scan_size(self) -> int:
         return len(self._folder_scan_events)
 
     def _win_folder_scan_check(self) -> None:
-        elapsed = current_milli_time() - self._windows_folder_scan_delay
-        if self._win_folder_scan_interval >= elapsed:
+        if not self._folder_scan_events.has_due(current_milli_time()):
             return
 
         with self.lock:
             self._win_dequeue_folder_scan()
-        self._win_folder_scan_interval = current_milli_time()
 
     @tooltip("Dequeue folder scan")
     def _win_dequeue_folder_scan(self) -> None:
         try:
-            events = self._folder_scan_events.copy().items()
-            for local_path, (evt_time, evt_pair) in events:
-                delay = current_milli_time() - evt_time
-                if delay < self._windows_folder_scan_delay:
-                    log.info(
-                        "Win: ignoring folder to scan as waiting for folder scan "
-                        f"delay expiration: {local_path!r}"
-                    )
-                    continue
+            while "due events":
+                evt = self._folder_scan_events.pop_due(current_milli_time())
+                if not evt:
+                    break
 
+                local_path, (evt_time, evt_pair) = evt
                 log.info(f"Win: handling folder to scan: {local_path!r}")
                 self.scan_pair(local_path)
                 local_info = self.local.try_get_info(local_path)
@@ -232,10 +239,9 @@ def _win_dequeue_folder_scan(self) -> None:
                     log.info(
                         f"Re-schedule scan as the folder has been modified since last check: {evt_pair}"
                     )
-                    self._folder_scan_events[local_path] = (mtime, evt_pair)
+                    self._win_schedule_folder_scan_event(local_path, mtime, evt_pair)
                 else:
                     log.info(f"Win: dequeuing folder scan event: {evt_pair!r}")
-                    self._folder_scan_events.pop(local_path, None)
         except ThreadInterrupt:
             raise
         except Exception:
@@ -277,6 +283,8 @@ def get_metrics(self) -> Metrics:
         metrics = super().get_metrics()
         if self._event_handler:
             metrics["fs_events"] = self._event_handler.counter
+        metrics["fs_events_effective"] = self._events.effective
+        metrics["fs_events_ratio"] = round(self._events.ratio, 2)
         return {**metrics, **self._metrics}
 
     def _suspend_queue(self) -> None:
@@ -297,13 +305,13 @@ def scan_pair(self, local_path: Path, /) -> None:
         else:
             log.info(f"Skip inexistent folder scan event for {local_path!r}")
             if WINDOWS:
-                self._folder_scan_events.pop(local_path, None)
+                self._folder_scan_events.remove(local_path)
 
         if to_pause:
             self.engine.queue_manager.resume()
 
     def empty_events(self) -> bool:
-        ret = self.watchdog_queue.empty()
+        ret = self.watchdog_queue.empty() and self._events.empty()
         if WINDOWS:
             ret &= self.win_queue_empty()
             ret &= self.win_folder_scan_empty()
@@ -322,29 +330,97 @@ def get_creation_time(self, child_full_path: Path, /) -> int:
         return 0
 
     def _scan_recursive(self, info: FileInfo, /, *, recursive: bool = True) -> None:
-        if recursive:
-            # Don't interact if only one level
-            self._interact()
+        """
+        Scan the *info* folder, and all its subfolders when *recursive*.
+        New subfolders are always scanned in depth.
+
+        Folders contents are read from the file system by a pool of threads,
+        ahead of their comparison with the database done in the current thread.
+        Database children are fetched for all folders being read at once.
+        """
+        client = self.local
+        todo: Deque[Tuple[FileInfo, bool]] = deque([(info, recursive)])
+        reading: Deque[Tuple[FileInfo, bool, Future]] = deque()
+        self._scan_db_children = {}
 
+        with ThreadPoolExecutor(
+            max_workers=SCAN_THREADS, thread_name_prefix="LocalScan"
+        ) as pool:
+            try:
+                while todo or reading:
+                    while todo and len(reading) < SCAN_READ_AHEAD:
+                        folder, deep = todo.popleft()
+                        future = pool.submit(client.get_children_info, folder.path)
+                        reading.append((folder, deep, future))
+
+                    folder, deep, future = reading.popleft()
+                    if deep:
+                        # Don't interact if only one level
+                        self._interact()
+
+                    log.debug(f"Fetching FS children info of {folder.path!r}")
+                    try:
+                        fs_children_info = future.result()
+                    except OSError:
+                        # The folder has been deleted in the mean time
+                        continue
+
+                    db_children = self._scan_db_children.pop(folder.path, None)
+                    if db_children is None:
+                        paths = [folder.path, *(item[0].path for item in reading)]
+                        log.debug(f"Fetching DB local children of {len(paths)} folders")
+                        self._scan_db_children = self.dao.get_local_children_of(paths)
+                        db_children = self._scan_db_children.pop(folder.path)
+
+                    to_scan_new, to_scan = self._scan_folder(
+                        folder, fs_children_info, db_children
+                    )
+                    todo.extend((child_info, True) for child_info in to_scan_new)
+                    if deep:
+                        todo.extend((child_info, True) for child_info in to_scan)
+            finally:
+                for *_, future in reading:
+                    future.cancel()
+                self._scan_db_children = {}
+
+    def _prefetch_digests(
+        self, fs_children_info: List[FileInfo], children: Dict[str, DocPair], /
+    ) -> None:
+        """Compute the digests _scan_folder() will need, from the hashing pool."""
+        infos = []
+        for child_info in fs_children_info:
+            if child_info.folderish:
+                continue
+            child_pair = children.get(child_info.path.name)
+            if child_pair is None:
+                # Digests of big new files are computed once fully copied
+                if not is_large_file(child_info.size):
+                    infos.append(child_info)
+            elif (
+                child_pair.processor == 0
+                and child_pair.last_local_updated is not None
+                and child_info.last_modification_time.strftime("%Y-%m-%d %H:%M:%S")
+                != child_pair.last_local_updated.split(".")[0]
+            ):
+                infos.append(child_info)
+
+        if len(infos) > 1:
+            hashing.prefetch(infos, callback=self.local.digest_callback)
+
+    def _scan_folder(
+        self, info: FileInfo, fs_children_info: List[FileInfo], db_children: DocPairs, /
+    ) -> Tuple[List[FileInfo], List[FileInfo]]:
+        """
+        Compare the *info* folder children on the file system with the ones
+        in the database, and return new and known subfolders to scan.
+        """
         dao, client = self.dao, self.local
-        # Load all children from DB
-        log.debug(f"Fetching DB local children of {info.path!r}")
-        db_children = dao.get_local_children(info.path)
 
         # Create a list of all children by their name
-        to_scan = []
-        to_scan_new = []
+        to_scan: List[FileInfo] = []
+        to_scan_new: List[FileInfo] = []
         children = {child.local_name: child for child in db_children}
 
-        # Load all children from FS
-        # detect recently deleted children
-        log.debug(f"Fetching FS children info of {info.path!r}")
-        try:
-            fs_children_info = client.get_children_info(info.path)
-        except OSError:
-            # The folder has been deleted in the mean time
-            return
-
         # Get remote children to be able to check if a local child found
         # during the scan is really a new item or if it is just the result
         # of a remote creation performed on the file system but not yet
@@ -355,262 +431,275 @@ def _scan_recursive(self, info: FileInfo, /, *, recursive: bool = True) -> None:
             pairs_ = dao.get_new_remote_children(parent_remote_id)
             remote_children = {pair.remote_name for pair in pairs_}
 
-        # recursively update children
-        for child_info in fs_children_info:
-            child_name = child_info.path.name
-            child_type = "folder" if child_info.folderish else "file"
-            if child_name not in children:
-                try:
-                    remote_id = client.get_remote_id(child_info.path)
-                    if not remote_id:
-                        # Avoid IntegrityError: do not insert a new pair state
-                        # if item is already referenced in the DB
-                        if child_name in remote_children:
-                            log.info(
-                                f"Skip potential new {child_type} as it is the "
-                                f"result of a remote creation: {child_info.path!r}"
-                            )
-                            continue
-                        log.info(f"Found new {child_type} {child_info.path!r}")
-                        self._metrics["new_files"] += 1
-                        dao.insert_local_state(child_info, info.path)
-                    else:
-                        log.info(
-                            "Found potential moved file "
-                            f"{child_info.path!r}[{remote_id}]"
-                        )
-                        doc_pair = dao.get_normal_state_from_remote(remote_id)
-
-                        if doc_pair and client.exists(doc_pair.local_path):
-                            if (
-                                not client.is_case_sensitive()
-                                and str(doc_pair.local_path).lower()
-                                == str(child_info.path).lower()
-                            ):
+        # Digests of new and updated files are computed at the same time, out of
+        # the database transaction
+        self._prefetch_digests(fs_children_info, children)
+
+        # Group the database writes of that folder, children are scanned afterwards
+        with dao.batch():
+            # recursively update children
+            for child_info in fs_children_info:
+                child_name = child_info.path.name
+                child_type = "folder" if child_info.folderish else "file"
+                if child_name not in children:
+                    try:
+                        remote_id = client.get_remote_id(child_info.path)
+                        if not remote_id:
+                            # Avoid IntegrityError: do not insert a new pair state
+                            # if item is already referenced in the DB
+                            if child_name in remote_children:
                                 log.info(
-                                    "Case renaming on a case insensitive filesystem, "
-                                    f"update info and ignore: {doc_pair!r}"
+                                    f"Skip potential new {child_type} as it is the "
+                                    f"result of a remote creation: {child_info.path!r}"
                                 )
-                                if doc_pair.local_name in children:
-                                    del children[doc_pair.local_name]
-                                doc_pair.local_state = "moved"
-                                dao.update_local_state(doc_pair, child_info)
                                 continue
-                            # possible move-then-copy case, NXDRIVE-471
-                            child_full_path = client.abspath(child_info.path)
-                            child_creation_time = self.get_creation_time(
-                                child_full_path
-                            )
-                            doc_full_path = client.abspath(doc_pair.local_path)
-                            doc_creation_time = self.get_creation_time(doc_full_path)
-                            log.debug(
-                                f"child_cre_time={child_creation_time}, "
-                                f"doc_cre_time={doc_creation_time}"
-                            )
-                        if not doc_pair:
-                            log.info(
-                                f"Cannot find reference for {child_info.path!r} in "
-                                "database, put it in locally_created state"
-                            )
+                            log.info(f"Found new {child_type} {child_info.path!r}")
                             self._metrics["new_files"] += 1
                             dao.insert_local_state(child_info, info.path)
-                            self._protected_files[remote_id] = True
-                        elif doc_pair.processor > 0:
-                            log.info(
-                                f"Skip pair as it is being processed: {doc_pair!r}"
-                            )
-                            continue
-                        elif doc_pair.local_path == child_info.path:
+                        else:
                             log.info(
-                                f"Skip pair as it is not a real move: {doc_pair!r}"
+                                "Found potential moved file "
+                                f"{child_info.path!r}[{remote_id}]"
                             )
-                            continue
-                        elif not client.exists(doc_pair.local_path) or (
-                            client.exists(doc_pair.local_path)
-                            and child_creation_time < doc_creation_time
-                        ):
-                            # If file exists at old location, and the file
-                            # at the original location is newer, it is
-                            # moved to the new location earlier then copied
-                            # back
-                            log.info("Found moved file")
-                            doc_pair.local_state = "moved"
-                            dao.update_local_state(doc_pair, child_info)
-                            self._protected_files[doc_pair.remote_ref] = True
-                            if (
-                                client.exists(doc_pair.local_path)
-                                and child_creation_time < doc_creation_time
-                            ):
-                                # Need to put back the new created - need to
-                                # check maybe if already there
+                            # Pairs of other folders may be updated
+                            self._scan_db_children.clear()
+                            doc_pair = dao.get_normal_state_from_remote(remote_id)
+
+                            if doc_pair and client.exists(doc_pair.local_path):
+                                if (
+                                    not client.is_case_sensitive()
+                                    and str(doc_pair.local_path).lower()
+                                    == str(child_info.path).lower()
+                                ):
+                                    log.info(
+                                        "Case renaming on a case insensitive filesystem, "
+                                        f"update info and ignore: {doc_pair!r}"
+                                    )
+                                    if doc_pair.local_name in children:
+                                        del children[doc_pair.local_name]
+                                    doc_pair.local_state = "moved"
+                                    dao.update_local_state(doc_pair, child_info)
+                                    continue
+                                # possible move-then-copy case, NXDRIVE-471
+                                child_full_path = client.abspath(child_info.path)
+                                child_creation_time = self.get_creation_time(
+                                    child_full_path
+                                )
+                                doc_full_path = client.abspath(doc_pair.local_path)
+                                doc_creation_time = self.get_creation_time(
+                                    doc_full_path
+                                )
                                 log.debug(
-                                    "Found a moved file that has been copy/pasted "
-                                    f"back: {doc_pair.local_path!r}"
+                                    f"child_cre_time={child_creation_time}, "
+                                    f"doc_cre_time={doc_creation_time}"
                                 )
-                                client.remove_remote_id(doc_pair.local_path)
-                                dao.insert_local_state(
-                                    client.get_info(doc_pair.local_path),
-                                    doc_pair.local_path.parent,
+                            if not doc_pair:
+                                log.info(
+                                    f"Cannot find reference for {child_info.path!r} in "
+                                    "database, put it in locally_created state"
                                 )
-                        else:
-                            # File still exists - must check the remote_id
-                            old_remote_id = client.get_remote_id(doc_pair.local_path)
-                            if old_remote_id == remote_id:
-                                # Local copy paste
-                                log.info("Found a copy-paste of document")
-                                client.remove_remote_id(child_info.path)
+                                self._metrics["new_files"] += 1
                                 dao.insert_local_state(child_info, info.path)
+                                self._protected_files[remote_id] = True
+                            elif doc_pair.processor > 0:
+                                log.info(
+                                    f"Skip pair as it is being processed: {doc_pair!r}"
+                                )
+                                continue
+                            elif doc_pair.local_path == child_info.path:
+                                log.info(
+                                    f"Skip pair as it is not a real move: {doc_pair!r}"
+                                )
+                                continue
+                            elif not client.exists(doc_pair.local_path) or (
+                                client.exists(doc_pair.local_path)
+                                and child_creation_time < doc_creation_time
+                            ):
+                                # If file exists at old location, and the file
+                                # at the original location is newer, it is
+                                # moved to the new location earlier then copied
+                                # back
+                                log.info("Found moved file")
+                                doc_pair.local_state = "moved"
+                                dao.update_local_state(doc_pair, child_info)
+                                self._protected_files[doc_pair.remote_ref] = True
+                                if (
+                                    client.exists(doc_pair.local_path)
+                                    and child_creation_time < doc_creation_time
+                                ):
+                                    # Need to put back the new created - need to
+                                    # check maybe if already there
+                                    log.debug(
+                                        "Found a moved file that has been copy/pasted "
+                                        f"back: {doc_pair.local_path!r}"
+                                    )
+                                    client.remove_remote_id(doc_pair.local_path)
+                                    dao.insert_local_state(
+                                        client.get_info(doc_pair.local_path),
+                                        doc_pair.local_path.parent,
+                                    )
                             else:
-                                # Moved and renamed
-                                log.info(f"Moved and renamed: {doc_pair!r}")
-                                old_pair = dao.get_normal_state_from_remote(
-                                    old_remote_id
+                                # File still exists - must check the remote_id
+                                old_remote_id = client.get_remote_id(
+                                    doc_pair.local_path
                                 )
-                                if old_pair is not None:
+                                if old_remote_id == remote_id:
+                                    # Local copy paste
+                                    log.info("Found a copy-paste of document")
+                                    client.remove_remote_id(child_info.path)
+                                    dao.insert_local_state(child_info, info.path)
+                                else:
+                                    # Moved and renamed
+                                    log.info(f"Moved and renamed: {doc_pair!r}")
+                                    old_pair = dao.get_normal_state_from_remote(
+                                        old_remote_id
+                                    )
+                                    if old_pair is not None:
+                                        old_pair.local_state = "moved"
+                                        # Check digest also
+                                        digest = child_info.get_digest()
+                                        if old_pair.local_digest != digest:
+                                            old_pair.local_digest = digest
+                                        dao.update_local_state(
+                                            old_pair,
+                                            client.get_info(doc_pair.local_path),
+                                        )
+                                        self._protected_files[
+                                            old_pair.remote_ref
+                                        ] = True
+                                    doc_pair.local_state = "moved"
+                                    # Check digest also
+                                    digest = child_info.get_digest()
+                                    if doc_pair.local_digest != digest:
+                                        doc_pair.local_digest = digest
+                                    dao.update_local_state(doc_pair, child_info)
+                                    self._protected_files[doc_pair.remote_ref] = True
+                        if child_info.folderish:
+                            to_scan_new.append(child_info)
+                    except ThreadInterrupt:
+                        raise
+                    except Exception:
+                        log.exception(
+                            f"Error during recursive scan of {child_info.path!r}, "
+                            "ignoring until next full scan"
+                        )
+                        continue
+                else:
+                    child_pair = children.pop(child_name)
+                    try:
+                        last_mtime = child_info.last_modification_time.strftime(
+                            "%Y-%m-%d %H:%M:%S"
+                        )
+                        if (
+                            child_pair.processor == 0
+                            and child_pair.last_local_updated is not None
+                            and last_mtime
+                            != child_pair.last_local_updated.split(".")[0]
+                        ):
+                            log.debug(f"Update file {child_info.path!r}")
+                            remote_ref = client.get_remote_id(child_pair.local_path)
+                            if remote_ref and not child_pair.remote_ref:
+                                log.info(
+                                    "Possible race condition between remote and local "
+                                    f"scan, let's refresh pair: {child_pair!r}"
+                                )
+                                refreshed = dao.get_state_from_id(child_pair.id)
+                                if refreshed:
+                                    child_pair = refreshed
+                                    if not child_pair.remote_ref:
+                                        log.info(
+                                            "Pair not yet handled by remote scan "
+                                            "(remote_ref is None) but existing remote_id "
+                                            f"xattr, let's set it to None: {child_pair!r}"
+                                        )
+                                        client.remove_remote_id(child_pair.local_path)
+                                        remote_ref = ""
+                            if remote_ref != child_pair.remote_ref:
+                                # Load correct doc_pair | Put the others one back
+                                # to children
+                                log.warning(
+                                    "Detected file substitution: "
+                                    f"{child_pair.local_path!r} "
+                                    f"({remote_ref}/{child_pair.remote_ref})"
+                                )
+                                # Pairs of other folders may be updated
+                                self._scan_db_children.clear()
+                                if not remote_ref:
+                                    if not child_info.folderish:
+                                        # Alternative stream or xattr can have
+                                        # been removed by external software or user
+                                        digest = child_info.get_digest()
+                                        if child_pair.local_digest != digest:
+                                            child_pair.local_digest = digest
+                                            child_pair.local_state = "modified"
+
+                                    """
+                                    NXDRIVE-668: Here we might be in the case
+                                    of a new folder/file with the same name
+                                    as the old name of a renamed folder/file,
+                                    typically:
+                                      - initial state: subfolder01
+                                      - rename subfolder01 to subfolder02
+                                      - create subfolder01
+                                    => substitution will be detected when scanning
+                                    subfolder01, so we need to set the remote ID
+                                    and update the local state to avoid performing
+                                    a wrong locally_created operation leading to
+                                    an IntegrityError.  This is true for folders
+                                    and files.
+                                    """
+                                    client.set_remote_id(
+                                        child_pair.local_path, child_pair.remote_ref
+                                    )
+                                    dao.update_local_state(child_pair, child_info)
+                                    if child_info.folderish:
+                                        to_scan.append(child_info)
+                                    continue
+
+                                old_pair = dao.get_normal_state_from_remote(remote_ref)
+                                if old_pair is None:
+                                    dao.insert_local_state(child_info, info.path)
+                                else:
                                     old_pair.local_state = "moved"
                                     # Check digest also
                                     digest = child_info.get_digest()
                                     if old_pair.local_digest != digest:
                                         old_pair.local_digest = digest
-                                    dao.update_local_state(
-                                        old_pair, client.get_info(doc_pair.local_path)
-                                    )
+                                    dao.update_local_state(old_pair, child_info)
                                     self._protected_files[old_pair.remote_ref] = True
-                                doc_pair.local_state = "moved"
-                                # Check digest also
+                                self._delete_files[child_pair.remote_ref] = child_pair
+                            if not child_info.folderish:
                                 digest = child_info.get_digest()
-                                if doc_pair.local_digest != digest:
-                                    doc_pair.local_digest = digest
-                                dao.update_local_state(doc_pair, child_info)
-                                self._protected_files[doc_pair.remote_ref] = True
-                    if child_info.folderish:
-                        to_scan_new.append(child_info)
-                except ThreadInterrupt:
-                    raise
-                except Exception:
-                    log.exception(
-                        f"Error during recursive scan of {child_info.path!r}, "
-                        "ignoring until next full scan"
-                    )
-                    continue
-            else:
-                child_pair = children.pop(child_name)
-                try:
-                    last_mtime = child_info.last_modification_time.strftime(
-                        "%Y-%m-%d %H:%M:%S"
-                    )
-                    if (
-                        child_pair.processor == 0
-                        and child_pair.last_local_updated is not None
-                        and last_mtime != child_pair.last_local_updated.split(".")[0]
-                    ):
-                        log.debug(f"Update file {child_info.path!r}")
-                        remote_ref = client.get_remote_id(child_pair.local_path)
-                        if remote_ref and not child_pair.remote_ref:
-                            log.info(
-                                "Possible race condition between remote and local "
-                                f"scan, let's refresh pair: {child_pair!r}"
-                            )
-                            refreshed = dao.get_state_from_id(child_pair.id)
-                            if refreshed:
-                                child_pair = refreshed
-                                if not child_pair.remote_ref:
-                                    log.info(
-                                        "Pair not yet handled by remote scan "
-                                        "(remote_ref is None) but existing remote_id "
-                                        f"xattr, let's set it to None: {child_pair!r}"
-                                    )
-                                    client.remove_remote_id(child_pair.local_path)
-                                    remote_ref = ""
-                        if remote_ref != child_pair.remote_ref:
-                            # Load correct doc_pair | Put the others one back
-                            # to children
-                            log.warning(
-                                "Detected file substitution: "
-                                f"{child_pair.local_path!r} "
-                                f"({remote_ref}/{child_pair.remote_ref})"
-                            )
-                            if not remote_ref:
-                                if not child_info.folderish:
-                                    # Alternative stream or xattr can have
-                                    # been removed by external software or user
-                                    digest = child_info.get_digest()
-                                    if child_pair.local_digest != digest:
-                                        child_pair.local_digest = digest
-                                        child_pair.local_state = "modified"
-
-                                """
-                                NXDRIVE-668: Here we might be in the case
-                                of a new folder/file with the same name
-                                as the old name of a renamed folder/file,
-                                typically:
-                                  - initial state: subfolder01
-                                  - rename subfolder01 to subfolder02
-                                  - create subfolder01
-                                => substitution will be detected when scanning
-                                subfolder01, so we need to set the remote ID
-                                and update the local state to avoid performing
-                                a wrong locally_created operation leading to
-                                an IntegrityError.  This is true for folders
-                                and files.
-                                """
-                                client.set_remote_id(
-                                    child_pair.local_path, child_pair.remote_ref
-                                )
-                                dao.update_local_state(child_pair, child_info)
-                                if child_info.folderish:
-                                    to_scan.append(child_info)
-                                continue
+                                if child_pair.local_digest != digest:
+                                    child_pair.local_digest = digest
+                                    child_pair.local_state = "modified"
+                            self._metrics["update_files"] += 1
+                            dao.update_local_state(child_pair, child_info)
+                        if child_info.folderish:
+                            to_scan.append(child_info)
+                    except Exception as e:
+                        log.exception(
+                            f"Error with pair {child_pair!r}, increasing error"
+                        )
+                        self.increase_error(child_pair, "SCAN RECURSIVE", exception=e)
+                        continue
 
-                            old_pair = dao.get_normal_state_from_remote(remote_ref)
-                            if old_pair is None:
-                                dao.insert_local_state(child_info, info.path)
-                            else:
-                                old_pair.local_state = "moved"
-                                # Check digest also
-                                digest = child_info.get_digest()
-                                if old_pair.local_digest != digest:
-                                    old_pair.local_digest = digest
-                                dao.update_local_state(old_pair, child_info)
-                                self._protected_files[old_pair.remote_ref] = True
-                            self._delete_files[child_pair.remote_ref] = child_pair
-                        if not child_info.folderish:
-                            digest = child_info.get_digest()
-                            if child_pair.local_digest != digest:
-                                child_pair.local_digest = digest
-                                child_pair.local_state = "modified"
-                        self._metrics["update_files"] += 1
-                        dao.update_local_state(child_pair, child_info)
-                    if child_info.folderish:
-                        to_scan.append(child_info)
-                except Exception as e:
-                    log.exception(f"Error with pair {child_pair!r}, increasing error")
-                    self.increase_error(child_pair, "SCAN RECURSIVE", exception=e)
+            for deleted in children.values():
+                if (
+                    deleted.pair_state == "remotely_created"
+                    or deleted.remote_state == "created"
+                ):
                     continue
+                log.info(f"Found deleted file {deleted.local_path!r}")
+                # May need to count the children to be ok
+                self._metrics["delete_files"] += 1
+                if not deleted.remote_ref:
+                    dao.remove_state(deleted)
+                else:
+                    self._delete_files[deleted.remote_ref] = deleted
+                self.remove_void_transfers(deleted)
 
-        for deleted in children.values():
-            if (
-                deleted.pair_state == "remotely_created"
-                or deleted.remote_state == "created"
-            ):
-                continue
-            log.info(f"Found deleted file {deleted.local_path!r}")
-            # May need to count the children to be ok
-            self._metrics["delete_files"] += 1
-            if not deleted.remote_ref:
-                dao.remove_state(deleted)
-            else:
-                self._delete_files[deleted.remote_ref] = deleted
-            self.remove_void_transfers(deleted)
-
-        for child_info in to_scan_new:
-            self._scan_recursive(child_info)
-
-        if not recursive:
-            return
-
-        for child_info in to_scan:
-            self._scan_recursive(child_info)
+        return to_scan_new, to_scan
 
     @tooltip("Setup watchdog")
     def _setup_watchdog(self) -> None:
@@ -665,9 +754,10 @@ def _handle_delete_on_known_pair(self, doc_pair: DocPair, /) -> None:
             # Delay on Windows the delete event
             log.info(f"Add pair to delete events: {doc_pair!r}")
             with self.lock:
-                self._delete_events[doc_pair.remote_ref] = (
-                    current_milli_time(),
+                self._delete_events.schedule(
+                    doc_pair.remote_ref,
                     doc_pair,
+                    current_milli_time() + WIN_MOVE_RESOLUTION_PERIOD,
                 )
             return
 
@@ -786,9 +876,9 @@ def _handle_move_on_known_pair(
                     "Update folders to scan queue: move "
                     f"from {old_local_path!r} to {rel_path!r}"
                 )
-                self._folder_scan_events.pop(old_local_path, None)
+                self._folder_scan_events.remove(old_local_path)
                 t = mktime(local_info.last_modification_time.timetuple())
-                self._folder_scan_events[rel_path] = t, doc_pair
+                self._win_schedule_folder_scan_event(rel_path, t, doc_pair)
 
     def _handle_watchdog_event_on_known_pair(
         self, doc_pair: DocPair, evt: FileSystemEvent, rel_path: Path, /
@@ -1226,12 +1316,12 @@ def handle_watchdog_event(self, evt: FileSystemEvent, /) -> None:
                             )
                             # Should be cleaned
                             if not moved:
-                                doc_pair = self._delete_events[local_info.remote_ref][1]
+                                doc_pair = self._delete_events[local_info.remote_ref]
                                 doc_pair.local_state = "moved"
                                 dao.update_local_state(
                                     doc_pair, client.get_info(rel_path)
                                 )
-                            del self._delete_events[local_info.remote_ref]
+                            self._delete_events.remove(local_info.remote_ref)
                             return
 
                 if from_pair is not None:
@@ -1282,18 +1372,25 @@ def handle_watchdog_event(self, evt: FileSystemEvent, /) -> None:
     def _schedule_win_folder_scan(self, doc_pair: DocPair, /) -> None:
         # On Windows schedule another recursive scan to make sure I/Os finished
         # ex: copy/paste, move
-        if self._win_folder_scan_interval <= 0 or self._windows_folder_scan_delay <= 0:
+        if self._windows_folder_scan_delay <= 0:
             return
 
         with self.lock:
             local_info = self.local.try_get_info(doc_pair.local_path)
             if local_info:
                 log.info(f"Add pair to folder scan events: {doc_pair!r}")
-                self._folder_scan_events[doc_pair.local_path] = (
+                self._win_schedule_folder_scan_event(
+                    doc_pair.local_path,
                     mktime(local_info.last_modification_time.timetuple()),
                     doc_pair,
                 )
 
+    def _win_schedule_folder_scan_event(
+        self, local_path: Path, mtime: float, doc_pair: DocPair, /
+    ) -> None:
+        due = current_milli_time() + self._windows_folder_scan_delay
+        self._folder_scan_events.schedule(local_path, (mtime, doc_pair), due)
+
 
 class DriveFSEventHandler(PatternMatchingEventHandler):
     def __init__(
@@ -2,8 +2,10 @@
 from datetime import datetime
 from logging import getLogger
 from operator import attrgetter, itemgetter
+from queue import Empty, Full, Queue
+from threading import Event, Thread
 from time import monotonic, sleep
-from typing import TYPE_CHECKING, Any, Dict, Optional, Set, Tuple
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Set, Tuple
 
 from nuxeo.exceptions import BadQuery, HTTPError, Unauthorized
 
@@ -35,6 +37,23 @@
 log = getLogger(__name__)
 COLLECTION_SYNC_ROOT_FACTORY_NAME = "collectionSyncRootFolderItemFactory"
 
+# Scroll pages fetched ahead of their handling during a remote scroll scan
+SCROLL_PREFETCH = 2
+
+
+def _ref_endings(remote_ref: str, /) -> Iterator[str]:
+    """
+    Yield the *remote_ref* and all its endings at a "#" boundary, the ways
+    events can partially refer to it: "factory#repo#uid" gives "factory#repo#uid",
+    "#repo#uid", "repo#uid", "#uid" and "uid".
+    """
+    yield remote_ref
+    idx = remote_ref.find("#")
+    while idx >= 0:
+        yield remote_ref[idx:]
+        yield remote_ref[idx + 1 :]
+        idx = remote_ref.find("#", idx + 1)
+
 
 class RemoteWatcher(EngineWorker):
     initiate = pyqtSignal()
@@ -57,6 +76,13 @@ def __init__(self, engine: "Engine", dao: "EngineDAO", /) -> None:
         self._last_remote_full_scan: Optional[datetime] = self.dao.get_config(
             "remote_last_full_scan"
         )
+        # Time spent by stage of the scroll scans, in seconds
+        self._scroll_metrics: Dict[str, float] = {
+            "fetch": 0.0,
+            "wait": 0.0,
+            "handle": 0.0,
+        }
+        self._scroll_batches = 0
 
     def get_metrics(self) -> Metrics:
         metrics = super().get_metrics()
@@ -65,6 +91,9 @@ def get_metrics(self) -> Metrics:
         metrics["last_root_definitions"] = self._last_root_definitions
         metrics["last_remote_full_scan"] = self._last_remote_full_scan
         metrics["next_polling"] = self._next_check
+        metrics["scroll_batches"] = self._scroll_batches
+        for stage, elapsed in self._scroll_metrics.copy().items():
+            metrics[f"scroll_{stage}_time"] = int(elapsed * 1000)
         return metrics
 
     def _execute(self) -> None:
@@ -249,74 +278,82 @@ def sorting_func(descendant: RemoteFileInfo) -> Tuple[int, str, str]:
             db_descendants = self.dao.get_remote_descendants(remote_parent_path)
         descendants = {desc.remote_ref: desc for desc in db_descendants}
 
-        to_process = []
-        scroll_id = None
-
-        while "Scrolling":
-            # Scroll through a batch of descendants
-            log.debug(
-                f"Scrolling through at most [{BATCH_SIZE}] descendants "
-                f"of {remote_info.name!r} ({remote_info.uid})"
-            )
-            scroll_res = self.engine.remote.scroll_descendants(
-                remote_info.uid, scroll_id, batch_size=BATCH_SIZE
-            )
+        # Pairs by remote reference, to find parents without a query by descendant
+        pairs = {doc_pair.remote_ref: doc_pair}
+        for desc in db_descendants:
+            pairs.setdefault(desc.remote_ref, desc)
 
-            descendants_info = scroll_res["descendants"]
-            if not descendants_info:
-                break
+        def get_parent_pair(remote_ref: str, /) -> Optional[DocPair]:
+            pair = pairs.get(remote_ref)
+            if not pair:
+                # A folder created during the scan
+                pair = self.dao.get_normal_state_from_remote(remote_ref)
+                if pair:
+                    pairs[remote_ref] = pair
+            return pair
 
-            log.debug(
-                f"Remote scroll request retrieved {len(descendants_info)} descendants "
-                f"for {remote_info.name!r} ({remote_info.uid})"
-            )
+        to_process = []
+        metrics = self._scroll_metrics
+        before = metrics.copy()
+        batches = 0
 
-            scroll_id = scroll_res["scroll_id"]
+        for descendants_info in self._scroll_descendants(remote_info):
+            start = monotonic()
+            batches += 1
+            self._scroll_batches += 1
 
             # Results are not necessarily sorted
             descendants_info = sorted(descendants_info, key=sorting_func)
 
             # Handle descendants
-            for descendant_info in descendants_info:
-                if self.filtered(descendant_info):
-                    log.info(f"Ignoring banned document {descendant_info}")
-                    descendants.pop(descendant_info.uid, None)
-                    continue
-
-                if self.dao.is_filter(descendant_info.path):
-                    log.debug(f"Skipping filtered document {descendant_info}")
-                    descendants.pop(descendant_info.uid, None)
-                    continue
-
-                if descendant_info.digest == "notInBinaryStore":
-                    log.debug(
-                        f"Skipping unsyncable document {descendant_info} (digest is 'notInBinaryStore')"
-                    )
-                    self.engine.send_metric("sync", "skip", "notInBinaryStore")
-                    descendants.pop(descendant_info.uid, None)
-                    continue
-
-                log.debug(f"Handling remote descendant {descendant_info!r}")
-                if descendant_info.uid in descendants:
-                    descendant_pair = descendants.pop(descendant_info.uid)
-                    if self._check_modified(descendant_pair, descendant_info):
-                        descendant_pair.remote_state = "modified"
-                    if self.dao.update_remote_state(descendant_pair, descendant_info):
-                        self.remove_void_transfers(descendant_pair)
-                    continue
+            unsyncable = 0
+            with self.dao.batch():
+                for descendant_info in descendants_info:
+                    if self.filtered(descendant_info):
+                        log.info(f"Ignoring banned document {descendant_info}")
+                        descendants.pop(descendant_info.uid, None)
+                        continue
+
+                    if self.dao.is_filter(descendant_info.path):
+                        log.debug(f"Skipping filtered document {descendant_info}")
+                        descendants.pop(descendant_info.uid, None)
+                        continue
+
+                    if descendant_info.digest == "notInBinaryStore":
+                        log.debug(
+                            f"Skipping unsyncable document {descendant_info} (digest is 'notInBinaryStore')"
+                        )
+                        unsyncable += 1
+                        descendants.pop(descendant_info.uid, None)
+                        continue
+
+                    log.debug(f"Handling remote descendant {descendant_info!r}")
+                    if descendant_info.uid in descendants:
+                        descendant_pair = descendants.pop(descendant_info.uid)
+                        if self._check_modified(descendant_pair, descendant_info):
+                            descendant_pair.remote_state = "modified"
+                        if self.dao.update_remote_state(
+                            descendant_pair, descendant_info
+                        ):
+                            self.remove_void_transfers(descendant_pair)
+                        continue
+
+                    parent_pair = get_parent_pair(descendant_info.parent_uid)
+                    if not parent_pair:
+                        log.debug(
+                            "Cannot find parent pair of remote descendant, "
+                            f"postponing processing of {descendant_info}"
+                        )
+                        to_process.append(descendant_info)
+                        continue
 
-                parent_pair = self.dao.get_normal_state_from_remote(
-                    descendant_info.parent_uid
-                )
-                if not parent_pair:
-                    log.debug(
-                        "Cannot find parent pair of remote descendant, "
-                        f"postponing processing of {descendant_info}"
+                    self._find_remote_child_match_or_create(
+                        parent_pair, descendant_info
                     )
-                    to_process.append(descendant_info)
-                    continue
 
-                self._find_remote_child_match_or_create(parent_pair, descendant_info)
+            # Sent outside of the batch as it is a network call
+            for _ in range(unsyncable):
+                self.engine.send_metric("sync", "skip", "notInBinaryStore")
 
             """
             # That code is kept for information purpose as it seems to be a good idea to stop now (see NXDRIVE-1636)
@@ -330,31 +367,124 @@ def sorting_func(descendant: RemoteFileInfo) -> Tuple[int, str, str]:
                 break
             """
 
+            metrics["handle"] += monotonic() - start
+
             # Check if synchronization thread was suspended
             self._interact()
 
+        elapsed = {stage: metrics[stage] - before[stage] for stage in metrics}
+        log.info(
+            f"Scrolled through {batches} batches of {remote_info.name!r} "
+            f"({remote_info.uid}): fetching took {elapsed['fetch']:.1f}s, "
+            f"handling {elapsed['handle']:.1f}s and waiting for the server "
+            f"{elapsed['wait']:.1f}s"
+        )
+
         if to_process:
             log.debug(
                 f"Processing [{len(to_process)}] postponed descendants of "
                 f"{remote_info.name!r} ({remote_info.uid})"
             )
-            for descendant_info in sorted(to_process, key=sorting_func):
-                parent_pair = self.dao.get_normal_state_from_remote(
-                    descendant_info.parent_uid
-                )
-                if not parent_pair:
-                    log.warning(
-                        "Cannot find parent pair of postponed remote descendant, "
-                        f"ignoring {descendant_info}"
-                    )
-                    continue
+            with self.dao.batch():
+                for descendant_info in sorted(to_process, key=sorting_func):
+                    parent_pair = get_parent_pair(descendant_info.parent_uid)
+                    if not parent_pair:
+                        log.warning(
+                            "Cannot find parent pair of postponed remote descendant, "
+                            f"ignoring {descendant_info}"
+                        )
+                        continue
 
-                self._find_remote_child_match_or_create(parent_pair, descendant_info)
+                    self._find_remote_child_match_or_create(
+                        parent_pair, descendant_info
+                    )
 
         # Delete remaining
-        for deleted in descendants.values():
-            self.dao.delete_remote_state(deleted)
-            self.remove_void_transfers(deleted)
+        with self.dao.batch():
+            for deleted in descendants.values():
+                self.dao.delete_remote_state(deleted)
+                self.remove_void_transfers(deleted)
+
+    def _scroll_descendants(
+        self, remote_info: RemoteFileInfo, /
+    ) -> Iterator[List[RemoteFileInfo]]:
+        """
+        Yield batches of descendants of *remote_info*.
+
+        Batches are fetched by a dedicated thread, at most SCROLL_PREFETCH
+        batches ahead of their handling, so that network calls and database
+        changes overlap. The thread stops as soon as the generator is closed.
+        """
+        pages: Queue = Queue(maxsize=SCROLL_PREFETCH)
+        stop = Event()
+        metrics = self._scroll_metrics
+
+        def put(item: Any) -> bool:
+            # Wait for the consumer to make room, unless it is gone
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=1)
+                    return True
+                except Full:
+                    pass
+            return False
+
+        def fetch() -> None:
+            scroll_id = None
+            try:
+                while not stop.is_set():
+                    # Scroll through a batch of descendants
+                    log.debug(
+                        f"Scrolling through at most [{BATCH_SIZE}] descendants "
+                        f"of {remote_info.name!r} ({remote_info.uid})"
+                    )
+                    start = monotonic()
+                    scroll_res = self.engine.remote.scroll_descendants(
+                        remote_info.uid, scroll_id, batch_size=BATCH_SIZE
+                    )
+                    metrics["fetch"] += monotonic() - start
+
+                    descendants_info = scroll_res["descendants"]
+                    if not descendants_info:
+                        break
+
+                    log.debug(
+                        f"Remote scroll request retrieved {len(descendants_info)} "
+                        f"descendants for {remote_info.name!r} ({remote_info.uid})"
+                    )
+
+                    scroll_id = scroll_res["scroll_id"]
+                    if not put(descendants_info):
+                        return
+            except Exception as exc:
+                # Raised again in the watcher thread
+                put(exc)
+            else:
+                put(None)
+
+        fetcher = Thread(target=fetch, name=f"RemoteScroll-{remote_info.uid}")
+        fetcher.daemon = True
+        fetcher.start()
+
+        try:
+            while "Scrolling":
+                start = monotonic()
+                while "waiting":
+                    try:
+                        page = pages.get(timeout=1)
+                        break
+                    except Empty:
+                        # Check if synchronization thread was suspended
+                        self._interact()
+                metrics["wait"] += monotonic() - start
+
+                if page is None:
+                    return
+                if isinstance(page, Exception):
+                    raise page
+                yield page
+        finally:
+            stop.set()
 
     def _scan_remote_recursive(
         self,
@@ -792,7 +922,7 @@ def _update_remote_states(self) -> None:
             event_id = change.get("eventId")
             remote_ref = change["fileSystemItemId"]
 
-            if any(refreshed_ref.endswith(remote_ref) for refreshed_ref in refreshed):
+            if remote_ref in refreshed:
                 log.debug("A more recent version was already processed")
                 continue
 
@@ -1010,7 +1140,7 @@ def _update_remote_states(self) -> None:
                     )
 
                 updated = True
-                refreshed.add(remote_ref)
+                refreshed.update(_ref_endings(remote_ref))
 
             if new_info and not updated:
                 # Handle new document creations
@@ -1040,7 +1170,7 @@ def _update_remote_states(self) -> None:
                             )
 
                     created = True
-                    refreshed.add(remote_ref)
+                    refreshed.update(_ref_endings(remote_ref))
                     break
 
                 if not created:
@@ -1,10 +1,11 @@
 import webbrowser
 from logging import getLogger
 from pathlib import Path
-from typing import TYPE_CHECKING, Dict, List, Optional, Union
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Union
 
 from ..constants import APP_NAME, INVALID_CHARS
 from ..engine.engine import Engine
+from ..engine.workers import Runner
 from ..feature import Feature
 from ..options import Options
 from ..qt import constants as qt
@@ -28,11 +29,12 @@
     QRegExpValidator,
     QSize,
     Qt,
+    QThreadPool,
     QVBoxLayout,
     pyqtSignal,
 )
 from ..translator import Translator
-from ..utils import find_icon, get_tree_list, sizeof_fmt
+from ..utils import find_icon, sizeof_fmt, walk_tree
 from .folders_model import FilteredDocuments, FoldersOnly
 from .folders_treeview import DocumentTreeView, FolderTreeView
 
@@ -238,6 +240,12 @@ class FoldersDialog(DialogMixin):
 
     newCtxTransfer = pyqtSignal(list)
 
+    # A selected folder was counted, maybe partially: path, count and size
+    pathCounted = pyqtSignal(object, int, int)
+
+    # Update labels every *count_batch_size* children counted
+    count_batch_size = 1_000
+
     def __init__(
         self, application: "Application", engine: Engine, path: Optional[Path], /
     ) -> None:
@@ -247,7 +255,11 @@ def __init__(
         self.setWindowFlags(self.windowFlags() & ~qt.WindowStaysOnTopHint)
 
         self.path: Optional[Path] = None
+
+        # Selected files and folders, their children are planned by the engine
         self.paths: Dict[Path, int] = {}
+        # Number of files and folders, and size, of each selected path
+        self._totals: Dict[Path, Tuple[int, int]] = {}
 
         self.remote_folder_ref = self.engine.dao.get_config(
             "dt_last_remote_location_ref", default=""
@@ -274,6 +286,9 @@ def __init__(
         self.vertical_layout.addWidget(self._add_group_options())
         self.vertical_layout.addWidget(self.button_box)
 
+        # Selected folders are counted in the background
+        self.pathCounted.connect(self._update_totals)
+
         # Compute overall size and count, and check the button state
         self._process_additionnal_local_paths([str(path)] if path else [])
 
@@ -293,12 +308,12 @@ def keyPressEvent(self, event: QKeyEvent) -> None:
     @property
     def overall_count(self) -> int:
         """Compute total number of files and folders."""
-        return len(self.paths.keys())
+        return sum(count for count, _ in self._totals.values())
 
     @property
     def overall_size(self) -> int:
         """Compute all local paths contents size."""
-        return sum(self.paths.values())
+        return sum(size for _, size in self._totals.values())
 
     def open_menu(self, position: QPoint) -> None:
         """Open a context menu at the provided *position*."""
@@ -493,13 +508,11 @@ def _find_folders_duplicates(self) -> List[str]:
         parent = self.remote_folder_ref
         folders: List[str] = []
 
-        all_paths = self.paths.keys()
         folders.extend(
             path.name
-            for path in all_paths
+            for path in self.paths
             if (
-                path.parent not in all_paths
-                and path.is_dir()
+                path.is_dir()
                 and self.engine.remote.exists_in_parent(parent, path.name, True)
             )
         )
@@ -608,19 +621,30 @@ def _process_additionnal_local_paths(self, paths: List[str], /) -> None:
                 continue
 
             # Prevent to upload twice the same file
-            if path in self.paths.keys():
+            if path in self.paths or any(
+                parent in self.paths for parent in path.parents
+            ):
                 continue
 
-            # Save the path
+            # Save the path, its children are planned by the engine
             if path.is_dir():
-                for file_path, size in get_tree_list(path):
-                    self.paths[file_path] = size
+                # Children of that folder selected before are part of it
+                for child in [p for p in self.paths if path in p.parents]:
+                    del self.paths[child]
+                    del self._totals[child]
+                    if self.path == child:
+                        self.path = path
+                self.paths[path] = 0
+                self._totals[path] = (1, 0)
+                # Count its children without freezing the GUI
+                QThreadPool.globalInstance().start(Runner(self._count_children, path))
             else:
                 try:
                     self.paths[path] = path.stat().st_size
                 except OSError:
                     log.warning(f"Error calling stat() on {path!r}", exc_info=True)
                     continue
+                self._totals[path] = (1, self.paths[path])
 
             self.last_local_selected_location = path.parent
 
@@ -628,7 +652,43 @@ def _process_additionnal_local_paths(self, paths: List[str], /) -> None:
             if not self.path:
                 self.path = path
 
-        # Update labels with new information
+        self._update_local_group()
+
+    def _count_children(self, path: Path, /) -> None:
+        """Count the files and folders of a selected folder, from a thread of the pool."""
+        count = size = 0
+        try:
+            for _, _, file_size in walk_tree(path):
+                count += 1
+                size += file_size
+                if not count % self.count_batch_size:
+                    self.pathCounted.emit(path, count, size)
+            if not count or count % self.count_batch_size:
+                self.pathCounted.emit(path, count, size)
+        except RuntimeError:
+            # RuntimeError: wrapped C/C++ object of type FoldersDialog has been deleted
+            # The window was closed before the end of the count.
+            pass
+
+    def _update_totals(self, path: Path, count: int, size: int, /) -> None:
+        """Update the count and size of a selected folder, sent by _count_children()."""
+        if path not in self._totals:
+            # One of its parents was selected since then
+            return
+
+        if count:
+            self._totals[path] = (count, size)
+        else:
+            # Nothing can be transferred from that folder (symlink, no access, ...)
+            del self.paths[path]
+            del self._totals[path]
+            if self.path == path:
+                self.path = next(iter(self.paths), None)
+
+        self._update_local_group()
+
+    def _update_local_group(self) -> None:
+        """Update labels with new information, and check the button state."""
         self.local_path.setText(self._files_display())
         self.local_paths_size_lbl.setText(sizeof_fmt(self.overall_size))
 
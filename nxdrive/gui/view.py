@@ -199,7 +199,8 @@ def get_progress(self, row: Dict[str, Any], /) -> str:
         E.g: 10.0 MiB / 42.0 MiB [24%]
         """
         size = row["filesize"]
-        if row["transfer_type"] == "download":
+        # The temporary file of a segmented download is preallocated
+        if row["transfer_type"] == "download" and not row.get("segments"):
             try:
                 progress = row["tmpname"].stat().st_size
             except FileNotFoundError:
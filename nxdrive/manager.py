@@ -49,10 +49,15 @@
 from .feature import Feature
 from .metrics.utils import current_os, user_agent
 from .notification import DefaultNotificationService
-from .objects import Binder, EngineDef, Metrics, Session
+from .objects import STATUS_COLUMNS, Binder, EngineDef, Metrics, Session
 from .options import DEFAULT_LOG_LEVEL_FILE, Options
 from .osi import AbstractOSIntegration
-from .poll_workers import DatabaseBackupWorker, ServerOptionsUpdater, SyncAndQuitWorker
+from .poll_workers import (
+    DatabaseBackupWorker,
+    DatabaseMaintenanceWorker,
+    ServerOptionsUpdater,
+    SyncAndQuitWorker,
+)
 from .qt.imports import QT_VERSION_STR, QObject, pyqtSignal, pyqtSlot
 from .updater import updater
 from .updater.constants import Login
@@ -152,6 +157,7 @@ def __init__(self, home: Path, /) -> None:
         self._engine_types: Dict[str, Type[Engine]] = {"NXDRIVE": Engine}
         self.engines: Dict[str, Engine] = {}
         self.db_backup_worker: Optional[DatabaseBackupWorker] = None
+        self.db_maintenance_worker: Optional[DatabaseMaintenanceWorker] = None
 
         self.proxy: Proxy = self._save_or_load_proxy()
         log.info(f"Proxy configuration is {self.proxy!r}")
@@ -216,6 +222,7 @@ def __init__(self, home: Path, /) -> None:
 
         # Create the server's configuration getter verification thread
         self._create_db_backup_worker()
+        self._create_db_maintenance_worker()
 
         # Setup analytics tracker
         self.tracker = self.create_tracker()
@@ -297,8 +304,13 @@ def get_metrics(self) -> Metrics:
             "os": current_os(full=True),
             "machine": machine(),
             "appname": APP_NAME,
+            **self._get_extension_metrics(),
         }
 
+    def _get_extension_metrics(self) -> Metrics:
+        listener = getattr(self, "_extension_listener", None)
+        return listener.get_metrics() if listener else {}
+
     def _restart_needed(self) -> None:
         """Simple helper to set the attribute's value.
         That value will be used in other components.
@@ -405,6 +417,10 @@ def _create_db_backup_worker(self) -> None:
         if self.db_backup_worker:
             self.started.connect(self.db_backup_worker.thread.start)
 
+    def _create_db_maintenance_worker(self) -> None:
+        self.db_maintenance_worker = DatabaseMaintenanceWorker(self)
+        self.started.connect(self.db_maintenance_worker.thread.start)
+
     @if_frozen
     def _create_extension_listener(self) -> None:
         self._extension_listener = self.osi.get_extension_listener()
@@ -963,6 +979,7 @@ def remove_engine_dbs(self, uid: str) -> None:
             main_db,
             main_db.with_suffix(".db-shm"),
             main_db.with_suffix(".db-wal"),
+            main_db.with_suffix(".db.shutdown"),
         ):
             try:
                 file.unlink(missing_ok=True)
@@ -1058,7 +1075,7 @@ def send_sync_status(self, path: Path, /) -> None:
 
             r_path = path.relative_to(engine.local_folder)
             dao = engine.dao
-            states = dao.get_local_children(r_path)
+            states = dao.get_local_children(r_path, columns=STATUS_COLUMNS)
             self.osi.send_content_sync_status(states, path)
             return
 
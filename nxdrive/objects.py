@@ -1,12 +1,23 @@
 import hashlib
 import unicodedata
 from collections import namedtuple
+from contextlib import suppress
 from dataclasses import dataclass, field
 from datetime import datetime
 from pathlib import Path
-from sqlite3 import Row
+from sqlite3 import Cursor, Row
 from time import time
-from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Union
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
 
 from dateutil import parser
 from dateutil.tz import tzlocal
@@ -39,6 +50,44 @@ class Binder(NamedTuple):
 # List of filters from the database
 Filters = List[str]
 
+
+class FilterTrie:
+    """Prefix tree of filtered paths: tell if a path is filtered in O(depth).
+
+    A path is filtered when it, or one of its parents, is part of the tree.
+    """
+
+    __slots__ = ("_root",)
+
+    # Key of nodes ending a filter, it cannot be a path part
+    _END = ""
+
+    def __init__(self, paths: Filters = None, /) -> None:
+        self._root: Dict[str, Any] = {}
+        for path in paths or []:
+            self.add(path)
+
+    def __contains__(self, path: str, /) -> bool:
+        node = self._root
+        for part in self._parts(path):
+            if self._END in node:
+                return True
+            node = node.get(part)
+            if node is None:
+                return False
+        return self._END in node
+
+    def add(self, path: str, /) -> None:
+        node = self._root
+        for part in self._parts(path):
+            node = node.setdefault(part, {})
+        node[self._END] = {}
+
+    @staticmethod
+    def _parts(path: str, /) -> List[str]:
+        return [part for part in path.split("/") if part]
+
+
 # Metrics
 Metrics = Dict[str, Any]
 
@@ -324,15 +373,115 @@ def get_blob(self, xpath: str, /) -> Optional[Blob]:
         return Blob.from_dict(attachment) if attachment else None
 
 
-class DocPair(Row):
+# Columns of the States table
+STATES_COLUMNS = (
+    "id",
+    "last_local_updated",
+    "last_remote_updated",
+    "local_digest",
+    "remote_digest",
+    "local_path",
+    "remote_ref",
+    "local_parent_path",
+    "remote_parent_ref",
+    "remote_parent_path",
+    "local_name",
+    "remote_name",
+    "doc_type",
+    "size",
+    "folderish",
+    "local_state",
+    "remote_state",
+    "pair_state",
+    "remote_can_create_child",
+    "remote_can_delete",
+    "remote_can_rename",
+    "remote_can_update",
+    "last_remote_modifier",
+    "last_sync_date",
+    "error_count",
+    "last_sync_error_date",
+    "last_error",
+    "last_error_details",
+    "version",
+    "processor",
+    "last_transfer",
+    "creation_date",
+    "duplicate_behavior",
+    "session",
+    "priority",
+)
+
+# Columns needed by the OS integration to display the status of a pair,
+# see osi/extension.py::get_formatted_status()
+STATUS_COLUMNS = (
+    "id",
+    "local_path",
+    "local_name",
+    "error_count",
+    "local_state",
+    "pair_state",
+    "processor",
+)
+
+
+# Columns storing paths, parsed into Path objects on first access
+_PATH_COLUMNS = ("local_path", "local_parent_path")
+
+
+class _PathColumn:
+    """
+    A DocPair path attribute. The raw value is stored without the leading slash,
+    it is parsed into a Path only one time, when first accessed.
+    """
+
+    def __set_name__(self, owner: type, name: str, /) -> None:
+        self.raw = f"_{name}_raw"
+        self.parsed = f"_{name}"
+
+    def __get__(self, obj: Any, owner: type = None, /) -> Any:
+        if obj is None:
+            return self
+        try:
+            return getattr(obj, self.parsed)
+        except AttributeError:
+            path = Path((getattr(obj, self.raw) or "").lstrip("/"))
+            setattr(obj, self.parsed, path)
+            return path
+
+    def __set__(self, obj: Any, value: Any, /) -> None:
+        setattr(obj, self.parsed, value)
+
+
+class DocPair:
+    """
+    A row fetched from the engine database, mostly from the States table.
+
+    Values are materialized once per row into slots: paths are parsed only one
+    time, and reading an attribute is a plain slot access. Other columns (from
+    other tables, aggregates, ...) are reachable as attributes too. Columns left
+    out of a projection raise AttributeError.
+
+    The raw row stays available with the sqlite3.Row API (`pair["column"]`,
+    `pair[0]`, `keys()`), and the comparison is done on the raw values.
+    """
+
+    __slots__ = (
+        *(name for name in STATES_COLUMNS if name not in _PATH_COLUMNS),
+        *(f"_{name}{suffix}" for name in _PATH_COLUMNS for suffix in ("", "_raw")),
+        "error_next_try",  # Not a column, it is set by the QueueManager
+        "_fields",
+        "_row",
+    )
+
     id: int
     last_local_updated: str
     last_remote_updated: str
     local_digest: Optional[str]
     remote_digest: str
-    local_path: Path
+    local_path = _PathColumn()
     remote_ref: str
-    local_parent_path: Path
+    local_parent_path = _PathColumn()
     remote_parent_ref: str
     remote_parent_path: str
     local_name: str
@@ -360,26 +509,64 @@ class DocPair(Row):
     creation_date: str
     duplicate_behavior: str
     session: int
+    priority: int
+
+    def __init__(self, cursor: Cursor, row: Tuple[Any, ...], /) -> None:
+        fields, materialize = _get_layout(cursor)
+        self._fields = fields
+        self._row = row
+        materialize(self, row)
 
     def __repr__(self) -> str:
-        return (
-            f"<{type(self).__name__}[{self.id!r}]"
-            f" local_path={self.local_path!r},"
-            f" local_parent_path={self.local_parent_path!r},"
-            f" remote_ref={self.remote_ref!r},"
-            f" local_state={self.local_state!r},"
-            f" remote_state={self.remote_state!r},"
-            f" pair_state={self.pair_state!r},"
-            f" last_error={self.last_error!r}"
-            ">"
+        attrs = ", ".join(
+            f"{name}={getattr(self, name, None)!r}"
+            for name in (
+                "local_path",
+                "local_parent_path",
+                "remote_ref",
+                "local_state",
+                "remote_state",
+                "pair_state",
+                "last_error",
+            )
         )
+        return f"<{type(self).__name__}[{getattr(self, 'id', None)!r}] {attrs}>"
 
-    def __getattr__(self, name: str, /) -> Optional[Union[str, Path]]:
-        if name in ("local_path", "local_parent_path"):
-            return Path((self[name] or "").lstrip("/"))
-        if name == "remote_ref":
-            return self[name] or ""
-        return self[name]  # type: ignore
+    def __getattr__(self, name: str, /) -> Any:
+        # Only called for columns without a slot, or not part of the query
+        if name.startswith("_"):
+            raise AttributeError(name)
+        try:
+            return self._row[self._fields.index(name)]
+        except ValueError:
+            raise AttributeError(
+                f"{type(self).__name__!r} object has no column {name!r}"
+            ) from None
+
+    def __getitem__(self, key: Union[int, str], /) -> Any:
+        if isinstance(key, str):
+            try:
+                key = self._fields.index(key)
+            except ValueError:
+                raise IndexError("No item with that key") from None
+        return self._row[key]
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self._row)
+
+    def __len__(self) -> int:
+        return len(self._row)
+
+    def __eq__(self, other: object, /) -> bool:
+        if not isinstance(other, DocPair):
+            return NotImplemented
+        return self._fields == other._fields and self._row == other._row
+
+    def __hash__(self) -> int:
+        return hash((self._fields, self._row))
+
+    def keys(self) -> List[str]:
+        return list(self._fields)
 
     def export(self) -> Dict[str, Any]:
         result: Dict[str, Any] = {
@@ -432,6 +619,59 @@ def update_state(self, local_state: str, remote_state: str) -> None:
 
 DocPairs = List[DocPair]
 
+# Materialization functions of DocPair, by query columns
+_MATERIALIZERS: Dict[Tuple[str, ...], Callable] = {}
+
+
+def _get_materializer(fields: Tuple[str, ...], /) -> Callable:
+    """
+    Return the function setting all DocPair attributes from a row of the *fields*
+    columns. Like namedtuple and dataclasses do, its code is generated: a single
+    unpacking is many times faster than setting attributes one by one in a loop.
+    """
+    try:
+        return _MATERIALIZERS[fields]
+    except KeyError:
+        pass
+
+    targets = []
+    for name in fields:
+        if name in _PATH_COLUMNS:
+            targets.append(f"obj._{name}_raw")
+        elif name in STATES_COLUMNS:
+            targets.append(f"obj.{name}")
+        else:
+            # Other columns are only kept in the raw row
+            targets.append("_")
+    code = "def materialize(obj, row):\n"
+    code += f"    {', '.join(targets)}, = row\n" if targets else "    pass\n"
+    if "remote_ref" in fields:
+        code += "    obj.remote_ref = obj.remote_ref or ''\n"
+
+    namespace: Dict[str, Any] = {}
+    exec(code, namespace)
+    materialize: Callable = namespace["materialize"]
+    _MATERIALIZERS[fields] = materialize
+    return materialize
+
+
+def _get_layout(cursor: Cursor, /) -> Tuple[Tuple[str, ...], Callable]:
+    """
+    Return the column names of the *cursor* query, and the function to
+    materialize its rows into DocPair. It is computed once per query.
+    """
+    description = cursor.description
+    cached = getattr(cursor, "_doc_pair_layout", None)
+    if cached and cached[0] is description:
+        return cached[1], cached[2]
+
+    fields = tuple(column[0] for column in description)
+    materialize = _get_materializer(fields)
+    with suppress(AttributeError):
+        # Not possible on a plain sqlite3.Cursor, it will be computed for each row
+        cursor._doc_pair_layout = (description, fields, materialize)  # type: ignore
+    return fields, materialize
+
 
 class EngineDef(Row):
     local_folder: Path
@@ -476,6 +716,8 @@ class Download(Transfer):
     transfer_type: str = field(init=False, default="download")
     tmpname: Optional[Path] = None
     url: Optional[str] = None
+    segment_size: int = 0
+    segments: Optional[bytes] = None
 
 
 @dataclass
@@ -229,21 +229,35 @@ class MetaOptions(type):
         "chunk_limit": (20, "default"),
         "chunk_size": (20, "default"),
         "chunk_upload": (True, "default"),
+        "chunk_upload_threads": (4, "default"),
         "client_version": (None, "default"),
         "custom_metrics": (True, "default"),
         "custom_metrics_poll_interval": (60 * 15, "default"),
+        "database_auto_vacuum_conversion": (False, "default"),
         "database_batch_size": (256, "default"),
+        "database_cache_size": (-16_000, "default"),
+        "database_mmap_size": (64 * 1024 * 1024, "default"),
+        "database_readers": (4, "default"),
+        "database_synchronous": ("NORMAL", "default"),
+        "database_write_batch_delay": (250, "default"),
+        "database_write_batch_size": (500, "default"),
         "debug": (False, "default"),
         "debug_pydev": (False, "default"),
         "delay": (30, "default"),
         "deletion_behavior": ("unsync", "default"),
+        "digest_cache_size": (200_000, "default"),
         "disabled_file_integrity_check": (False, "default"),
         "disallowed_types_for_dt": (__doctypes_no_dt, "default"),
+        "download_segment_size": (8, "default"),
+        "download_segment_threads": (4, "default"),
+        "dt_folder_threads": (4, "default"),
         "dt_hide_personal_space": (False, "default"),
         "findersync_batch_size": (50, "default"),
         "feature_systray_history": (-1, "default"),
         "force_locale": (None, "default"),
+        "fs_events_delay": (500, "default"),
         "handshake_timeout": (60, "default"),
+        "hashing_threads": (4, "default"),
         "home": (__home, "default"),
         "ignored_files": (__files, "default"),
         "ignored_prefixes": (__prefixes, "default"),
@@ -266,9 +280,12 @@ class MetaOptions(type):
         "oauth2_token_endpoint": (None, "default"),
         "protocol_url": (None, "default"),
         "proxy_server": (None, "default"),
+        "queue_buffer_size": (1_000, "default"),
         "remote_repo": ("default", "default"),
         "res_dir": (_get_resources_dir(), "default"),
         "session_uid": (str(uuid4()), "default"),
+        "small_files_batch_size": (0, "default"),
+        "small_files_size_limit": (100, "default"),
         "ssl_no_verify": (False, "default"),
         "startup_page": ("drive_login.jsp", "default"),
         "sync_and_quit": (False, "default"),
@@ -577,6 +594,12 @@ def validate_chunk_size(value: int, /) -> int:
     )
 
 
+def validate_chunk_upload_threads(value: int, /) -> int:
+    if 0 < value <= 16:
+        return value
+    raise ValueError(f"Chunk upload threads must be between 1 and 16 (got {value!r})")
+
+
 def validate_client_version(value: str, /) -> str:
     """The minimum version which implements the Centralized channel is 4.2.0,
     downgrades below this version are not allowed.
@@ -598,6 +621,81 @@ def validate_use_sentry(value: bool, /) -> bool:
     )
 
 
+def validate_database_readers(value: int, /) -> int:
+    if value > 0:
+        return value
+    raise ValueError(f"Database readers must be above 0 (got {value!r})")
+
+
+def validate_database_synchronous(value: str, /) -> str:
+    value = value.upper()
+    if value in ("OFF", "NORMAL", "FULL", "EXTRA"):
+        return value
+    raise ValueError(f"Unknown database synchronous mode {value!r}")
+
+
+def validate_digest_cache_size(value: int, /) -> int:
+    if value >= 0:
+        return value
+    raise ValueError(f"Digest cache size must be positive (got {value!r})")
+
+
+def validate_download_segment_size(value: int, /) -> int:
+    if 0 < value <= 1024:
+        return value
+    raise ValueError(
+        f"Download segment size must be between 1 MiB and 1024 MiB (got {value!r})"
+    )
+
+
+def validate_download_segment_threads(value: int, /) -> int:
+    if 0 < value <= 16:
+        return value
+    raise ValueError(
+        f"Download segment threads must be between 1 and 16 (got {value!r})"
+    )
+
+
+def validate_dt_folder_threads(value: int, /) -> int:
+    if 0 < value <= 32:
+        return value
+    raise ValueError(
+        f"Direct Transfer folder threads must be between 1 and 32 (got {value!r})"
+    )
+
+
+def validate_fs_events_delay(value: int, /) -> int:
+    if value >= 0:
+        return value
+    raise ValueError(f"File system events delay must be positive (got {value!r})")
+
+
+def validate_hashing_threads(value: int, /) -> int:
+    if 0 < value <= 32:
+        return value
+    raise ValueError(f"Hashing threads must be between 1 and 32 (got {value!r})")
+
+
+def validate_queue_buffer_size(value: int, /) -> int:
+    if value > 0:
+        return value
+    raise ValueError(f"Queue buffer size must be above 0 (got {value!r})")
+
+
+def validate_small_files_batch_size(value: int, /) -> int:
+    if 0 <= value <= 1000:
+        return value
+    raise ValueError(
+        f"Small files batch size must be between 0 and 1000 (got {value!r})"
+    )
+
+
+def validate_small_files_size_limit(value: int, /) -> int:
+    if value > 0:
+        return value
+    raise ValueError(f"Small files size limit must be above 0 (got {value!r})")
+
+
 def _validate_deletion_behavior(value: str, /) -> str:
     if value in ("unsync", "delete_server"):
         return value
@@ -650,8 +748,20 @@ def _callback_synchronization_enabled(new_value: bool) -> None:
 
 Options.checkers["chunk_limit"] = validate_chunk_limit
 Options.checkers["chunk_size"] = validate_chunk_size
+Options.checkers["chunk_upload_threads"] = validate_chunk_upload_threads
 Options.checkers["client_version"] = validate_client_version
+Options.checkers["database_readers"] = validate_database_readers
+Options.checkers["database_synchronous"] = validate_database_synchronous
 Options.checkers["deletion_behavior"] = _validate_deletion_behavior
+Options.checkers["digest_cache_size"] = validate_digest_cache_size
+Options.checkers["download_segment_size"] = validate_download_segment_size
+Options.checkers["download_segment_threads"] = validate_download_segment_threads
+Options.checkers["dt_folder_threads"] = validate_dt_folder_threads
+Options.checkers["fs_events_delay"] = validate_fs_events_delay
+Options.checkers["hashing_threads"] = validate_hashing_threads
+Options.checkers["queue_buffer_size"] = validate_queue_buffer_size
+Options.checkers["small_files_batch_size"] = validate_small_files_batch_size
+Options.checkers["small_files_size_limit"] = validate_small_files_size_limit
 Options.checkers["use_sentry"] = validate_use_sentry
 Options.checkers["sync_root_max_level"] = validate_sync_root_max_level_limits
 Options.checkers["tmp_file_limit"] = validate_tmp_file_limit
@@ -16,6 +16,7 @@ class DarwinExtensionListener(ExtensionListener):
     - "get-status" with the path of the file whose status
       we want to retrieve as parameter.
     - "trigger-watch" to get all the local folders to watch.
+    - "get-statuses" with a list of paths, to retrieve their statuses at once.
     """
 
     explorer_name = "Finder"
@@ -24,6 +25,7 @@ def __init__(self, manager: "Manager") -> None:
         super().__init__(manager)
         self.handlers["get-status"] = self.handle_status
         self.handlers["trigger-watch"] = self.handle_trigger_watch
+        self.handlers["get-statuses"] = self.handle_statuses
 
     def handle_status(self, path: Any, /) -> None:
         if not isinstance(path, str):
@@ -1,12 +1,17 @@
 import json
 import stat
+import unicodedata
+from collections import OrderedDict
 from enum import Enum
+from functools import partial
 from logging import getLogger
 from pathlib import Path
-from typing import TYPE_CHECKING, Callable, Dict, Optional
+from threading import Lock
+from time import monotonic
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Set, Tuple
 
 from ..engine.engine import Engine
-from ..objects import DocPair
+from ..objects import DocPair, Metrics
 from ..qt import constants as qt
 from ..qt.imports import QHostAddress, QHostInfo, QTcpServer, QTcpSocket, pyqtSignal
 from ..utils import force_decode, force_encode
@@ -56,11 +61,22 @@ class ExtensionListener(QTcpServer):
         ...
     }
     It will look for the callable associated with the command in its `handlers` dict.
+
+    File browsers ask for the status of every visible file on each redraw: the
+    states of the last requested paths are kept in memory, and the engines
+    databases tell which ones changed (see EngineDAO.watch_states()).
     """
 
     listening = pyqtSignal()
     explorer_name = ""
 
+    # Maximum number of states kept in memory
+    states_cache_size = 10_000
+
+    # Upper bounds of the latency histogram buckets, in milliseconds
+    latency_buckets = (1, 10, 100)
+    latency_labels = ("<1ms", "<10ms", "<100ms", ">=100ms")
+
     def __init__(self, manager: "Manager") -> None:
         super().__init__()
         self.manager = manager
@@ -69,6 +85,14 @@ def __init__(self, manager: "Manager") -> None:
         self.handlers: Dict[str, Callable] = {}
         self.newConnection.connect(self._handle_connection)
 
+        # Absolute path -> (engine UID, state)
+        self._states: "OrderedDict[Path, Tuple[str, Optional[DocPair]]]" = OrderedDict()
+        self._states_lock = Lock()
+        self._watched_engines: Set[str] = set()
+        self._cache_hits = 0
+        self._cache_misses = 0
+        self._latencies: Dict[str, List[int]] = {}
+
     @staticmethod
     def host_to_addr(host: str, /) -> QHostAddress:  # type: ignore[return]
         """Get the IPv4 address of a given hostname.
@@ -157,7 +181,11 @@ def _handle_content(self, content: str, /) -> Optional[str]:
             log.info(f"No handler for the listener command {cmd}")
             return None
 
-        response = handler(value)
+        start = monotonic()
+        try:
+            response = handler(value)
+        finally:
+            self._record_latency(cmd, (monotonic() - start) * 1000)
         return json.dumps(response)
 
     def get_engine(self, path: Path, /) -> Optional[Engine]:
@@ -166,6 +194,90 @@ def get_engine(self, path: Path, /) -> Optional[Engine]:
                 return engine
         return None
 
+    def get_status(self, path: Path, /) -> Optional[Dict[str, str]]:
+        """Return the JSON-compatible status of *path*, if it is synchronized by an engine."""
+        state = self._get_state(path)
+        if not state:
+            return None
+        return get_formatted_status(state, path)
+
+    def handle_statuses(
+        self, paths: Any, /
+    ) -> Optional[List[Optional[Dict[str, str]]]]:
+        """Return the statuses of several *paths* at once, like the content of a folder."""
+        if not isinstance(paths, list):
+            return None
+        return [
+            self.get_status(self._to_path(path)) if isinstance(path, str) else None
+            for path in paths
+        ]
+
+    @staticmethod
+    def _to_path(path: str, /) -> Path:
+        """Paths received from file browsers, as stored in the database."""
+        return Path(unicodedata.normalize("NFC", path))
+
+    def get_metrics(self) -> Metrics:
+        return {
+            "extension_cache_hits": self._cache_hits,
+            "extension_cache_misses": self._cache_misses,
+            "extension_latency": {
+                cmd: dict(zip(self.latency_labels, histogram))
+                for cmd, histogram in self._latencies.items()
+            },
+        }
+
+    def _get_state(self, path: Path, /) -> Optional[DocPair]:
+        with self._states_lock:
+            cached = self._states.get(path)
+            # The engine may have been removed since then
+            if cached and cached[0] in self.manager.engines:
+                self._states.move_to_end(path)
+                self._cache_hits += 1
+                return cached[1]
+
+        self._cache_misses += 1
+        engine = self.get_engine(path)
+        if not engine:
+            return None
+
+        dao = engine.dao
+        if engine.uid not in self._watched_engines:
+            dao.watch_states(partial(self._state_changed, engine.local_folder))
+            self._watched_engines.add(engine.uid)
+
+        r_path = path.relative_to(engine.local_folder)
+        if not dao.lock.acquire(blocking=False):
+            # Do not wait for a write transaction, nor cache a state being modified
+            return dao.get_state_from_local(r_path)
+        try:
+            # Holding the lock, no change can happen until the state is cached
+            state = dao.get_state_from_local(r_path, from_write=True)
+            with self._states_lock:
+                self._states[path] = (engine.uid, state)
+                if len(self._states) > self.states_cache_size:
+                    self._states.popitem(last=False)
+            return state
+        finally:
+            dao.lock.release()
+
+    def _state_changed(self, local_folder: Path, local_path: str, /) -> None:
+        """Called by engines databases, see EngineDAO.watch_states()."""
+        with self._states_lock:
+            if not local_path:
+                self._states.clear()
+            else:
+                self._states.pop(local_folder / local_path.lstrip("/"), None)
+
+    def _record_latency(self, cmd: str, elapsed: float, /) -> None:
+        histogram = self._latencies.setdefault(cmd, [0] * len(self.latency_labels))
+        for idx, bound in enumerate(self.latency_buckets):
+            if elapsed < bound:
+                break
+        else:
+            idx = len(self.latency_buckets)
+        histogram[idx] += 1
+
 
 def get_formatted_status(state: DocPair, path: Path, /) -> Optional[Dict[str, str]]:
     """For a given file and its state info, get a JSON-compatible status."""
@@ -0,0 +1,170 @@
+"""
+Sync status emblems of local files, set from a background thread.
+
+Emblems are GIO metadata (metadata::emblems), stored by the GVFS metadata
+daemon. Sync threads only queue the files to update: the last status queued
+for a file wins, and the emblem is only set when it changed since the last
+time it was set (only the most recent statuses are remembered). Emblems are
+set by batches, in-process with the GIO bindings when available (PyGObject),
+else with one "gio set" call per file.
+"""
+import subprocess
+from collections import OrderedDict
+from logging import getLogger
+from pathlib import Path
+from threading import Condition, Lock, Thread
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ...objects import DocPair
+from ..extension import Status, get_formatted_status, icon_status
+
+__all__ = ("EmblemService",)
+
+log = getLogger(__name__)
+
+# List of (path, emblem)
+Emblems = List[Tuple[str, str]]
+
+
+def gio_set_emblems() -> Optional[Callable[[Emblems], None]]:
+    """Return a function setting emblems with the GIO bindings, if available."""
+    try:
+        import gi
+
+        gi.require_version("Gio", "2.0")
+        from gi.repository import Gio
+    except (ImportError, ValueError):
+        return None
+
+    def set_emblems(emblems: Emblems, /) -> None:
+        for path, emblem in emblems:
+            info = Gio.FileInfo()
+            info.set_attribute_stringv("metadata::emblems", [emblem])
+            try:
+                Gio.File.new_for_path(path).set_attributes_from_info(
+                    info, Gio.FileQueryInfoFlags.NONE, None
+                )
+            except Exception:
+                log.warning(
+                    f"Could not set the {emblem} emblem on {path!r}", exc_info=True
+                )
+
+    return set_emblems
+
+
+def subprocess_set_emblems(emblems: Emblems, /) -> None:
+    """Set emblems with the gio command, it handles only one file at a time."""
+    for path, emblem in emblems:
+        cmd = ["gio", "set", "-t", "stringv", path, "metadata::emblems", emblem]
+        try:
+            subprocess.check_call(cmd)
+        except Exception:
+            log.warning(f"Could not set the {emblem} emblem on {path!r}", exc_info=True)
+
+
+class EmblemService:
+    """Set the sync status emblems of local files, from a background thread.
+
+    *set_emblems* receives batches of (path, emblem) to apply, defaulting
+    to the GIO bindings, or the gio command when they are not installed.
+    """
+
+    # Maximum number of emblems set at once
+    batch_size = 500
+
+    # Maximum number of statuses kept in memory
+    statuses_cache_size = 10_000
+
+    def __init__(self, *, set_emblems: Callable[[Emblems], None] = None) -> None:
+        self.set_emblems = set_emblems or gio_set_emblems() or subprocess_set_emblems
+
+        # Number of emblems set since the start
+        self.sent = 0
+
+        # Last status set by path, along with the inode of the file
+        self._statuses: "OrderedDict[str, Tuple[Status, int]]" = OrderedDict()
+        self._pending: Dict[str, Tuple[DocPair, Path]] = {}
+        self._condition = Condition()
+        self._apply_lock = Lock()
+        self._stopped = False
+        self._thread: Optional[Thread] = None
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__} sent={self.sent}, pending={len(self._pending)}>"
+
+    def send(self, doc_pair: DocPair, path: Path, /) -> None:
+        """Queue the update of the emblem of *path*, it replaces a pending one."""
+        with self._condition:
+            self._pending[str(path)] = (doc_pair, path)
+            if not self._thread:
+                self._thread = Thread(target=self._run, name="Emblems", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def flush(self) -> None:
+        """Apply all pending updates from the current thread."""
+        while "pending":
+            with self._condition:
+                batch = self._next_batch()
+            if not batch:
+                break
+            self._apply(batch)
+
+    def stop(self) -> None:
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if self._thread:
+            self._thread.join()
+
+    def _next_batch(self) -> List[Tuple[DocPair, Path]]:
+        batch = []
+        for key in list(self._pending)[: self.batch_size]:
+            batch.append(self._pending.pop(key))
+        return batch
+
+    def _run(self) -> None:
+        while "running":
+            with self._condition:
+                while not (self._pending or self._stopped):
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                batch = self._next_batch()
+            try:
+                self._apply(batch)
+            except Exception:
+                log.exception("Error while setting emblems")
+
+    def _apply(self, batch: List[Tuple[DocPair, Path]], /) -> None:
+        # Only one batch at a time, statuses are set in the queued order
+        with self._apply_lock:
+            emblems: Emblems = []
+            statuses = self._statuses
+            for doc_pair, path in batch:
+                key = str(path)
+                try:
+                    # A file deleted and created again has no emblem anymore
+                    inode = path.stat().st_ino
+                except OSError:
+                    inode = 0
+                formatted = get_formatted_status(doc_pair, path)
+                if not formatted:
+                    # The file does not exist anymore
+                    statuses.pop(key, None)
+                    continue
+
+                status = (Status(int(formatted["value"])), inode)
+                if statuses.get(key) == status:
+                    statuses.move_to_end(key)
+                    continue
+                statuses[key] = status
+                statuses.move_to_end(key)
+                if len(statuses) > self.statuses_cache_size:
+                    statuses.popitem(last=False)
+                emblems.append((key, icon_status[status[0]]))
+
+            if emblems:
+                log.debug(f"Setting {len(emblems)} emblems")
+                self.set_emblems(emblems)
+                self.sent += len(emblems)
@@ -4,13 +4,13 @@
 import subprocess
 from logging import getLogger
 from pathlib import Path
-from typing import TYPE_CHECKING, Dict, Optional
+from typing import TYPE_CHECKING, Optional
 
 from ...constants import APP_NAME, NXDRIVE_SCHEME
 from ...objects import DocPair
 from ...utils import find_icon, if_frozen
 from .. import AbstractOSIntegration
-from ..extension import Status, get_formatted_status, icon_status
+from .emblems import EmblemService
 
 __all__ = ("LinuxIntegration",)
 
@@ -26,6 +26,7 @@ class LinuxIntegration(AbstractOSIntegration):
     def __init__(self, manager: Optional["Manager"], /):
         super().__init__(manager)
         self._icons_to_emblems()
+        self._emblems = EmblemService()
 
     @staticmethod
     def cb_get() -> str:
@@ -117,37 +118,15 @@ def register_protocol_handlers(self) -> None:
     @if_frozen
     def send_sync_status(self, doc_pair: DocPair, path: Path, /) -> None:
         """
-        Set the sync status of a file.
+        Set the sync status of a file, from the emblems thread.
 
         :param state: current local state of the file
         :param path: full path of the file
         """
-        try:
-            status = get_formatted_status(doc_pair, path)
-            if status:
-                log.debug(f"Setting status to {path!r}: {status}")
-                self._set_icon(status)
-        except Exception:
-            log.exception("Error while setting the status to {path!r}", exc_info=True)
-
-    def _set_icon(self, status: Dict[str, str], /) -> None:
-        """Call gio command to set folder emblem metadata."""
-        value = Status(int(status["value"]))
-        path = status["path"]
-        emblem = icon_status[value]
-        cmd = [
-            "gio",
-            "set",
-            "-t",
-            "stringv",
-            str(path),
-            "metadata::emblems",
-            emblem,
-        ]
-        try:
-            subprocess.check_call(cmd)
-        except Exception:
-            log.warning(f"Could not set the {emblem} emblem on {path!r}", exc_info=True)
+        self._emblems.send(doc_pair, path)
+
+    def cleanup(self) -> None:
+        self._emblems.stop()
 
     def _icons_to_emblems(self) -> None:
         """
@@ -1,5 +1,4 @@
 import json
-import unicodedata
 from logging import getLogger
 from pathlib import Path
 from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set
@@ -8,7 +7,7 @@
 
 from ...constants import CONFIG_REGISTRY_KEY
 from ...utils import force_encode
-from ..extension import ExtensionListener, get_formatted_status
+from ..extension import ExtensionListener
 from . import registry
 
 if TYPE_CHECKING:
@@ -55,6 +54,7 @@ class WindowsExtensionListener(ExtensionListener):
     Currently accepted commands are:
     - "getFileIconId" with the path of the file whose status
       we want to retrieve as parameter.
+    - "getFileIconIds" with a list of paths, to retrieve their statuses at once.
     """
 
     explorer_name = "Explorer"
@@ -62,6 +62,7 @@ class WindowsExtensionListener(ExtensionListener):
     def __init__(self, manager: "Manager") -> None:
         super().__init__(manager)
         self.handlers["getFileIconId"] = self.handle_status
+        self.handlers["getFileIconIds"] = self.handle_statuses
 
     def _parse_payload(self, payload: bytes, /) -> str:
         return payload.replace(b"\0", b"").decode("cp1252")
@@ -72,15 +73,4 @@ def _format_response(self, response: str, /) -> bytes:
     def handle_status(self, path: Any, /) -> Optional[Dict[str, str]]:
         if not isinstance(path, str):
             return None
-        path = Path(unicodedata.normalize("NFC", path))
-
-        engine = self.get_engine(path)
-        if not engine:
-            return None
-
-        r_path = path.relative_to(engine.local_folder)
-        state = engine.dao.get_state_from_local(r_path)
-
-        if not state:
-            return None
-        return get_formatted_status(state, path)
+        return self.get_status(self._to_path(path))
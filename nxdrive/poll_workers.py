@@ -1,14 +1,17 @@
 import logging
-from typing import TYPE_CHECKING
+from time import monotonic
+from typing import TYPE_CHECKING, List
 
 from .behavior import Behavior
 from .engine.workers import PollWorker
 from .options import Options
+from .qt.constants import LowestPriority
 from .qt.imports import pyqtSignal, pyqtSlot
 from .updater.constants import UPDATE_STATUS_UPDATING
 from .utils import normalize_and_expand_path
 
 if TYPE_CHECKING:
+    from .dao.base import BaseDAO  # noqa
     from .manager import Manager  # noqa
 
 
@@ -40,6 +43,63 @@ def _poll(self) -> bool:
         return True
 
 
+class DatabaseMaintenanceWorker(PollWorker):
+    """Class for the maintenance of the manager and engine databases.
+
+    It replaces the checks and the VACUUM that were done when opening them:
+    free pages are returned to the file system by small steps while engines
+    are idle (only on databases using the incremental auto-vacuum), and a full
+    integrity check is done once a day.
+    """
+
+    # Full integrity check delay, in seconds
+    integrity_check_delay = 24 * 60 * 60
+
+    # Maximum duration of incremental vacuum steps on each poll, in seconds
+    vacuum_duration = 5
+
+    def __init__(self, manager: "Manager", /):
+        """Check every 10 minutes."""
+        super().__init__(10 * 60, "DatabaseMaintenance")
+        self.manager = manager
+        # The first check is done on start, to cover the quick checks done at opening
+        self._next_integrity_check = 0.0
+
+    def _execute(self) -> None:
+        # Do not compete with the synchronization threads
+        self.thread.setPriority(LowestPriority)
+        super()._execute()
+
+    def _get_daos(self, *, idle: bool = False) -> List["BaseDAO"]:
+        daos: List["BaseDAO"] = [self.manager.dao] if self.manager.dao else []
+        for engine in self.manager.engines.copy().values():
+            if engine.dao and not (idle and engine.is_syncing()):
+                daos.append(engine.dao)
+        return daos
+
+    @pyqtSlot(result=bool)
+    def _poll(self) -> bool:
+        """Perform the maintenance."""
+
+        if not self.manager:
+            return False
+
+        if monotonic() >= self._next_integrity_check:
+            for dao in self._get_daos():
+                self._interact()
+                dao.check_integrity()
+            self._next_integrity_check = monotonic() + self.integrity_check_delay
+
+        for dao in self._get_daos(idle=True):
+            end = monotonic() + self.vacuum_duration
+            while monotonic() < end:
+                self._interact()
+                if not dao.incremental_vacuum():
+                    break
+
+        return True
+
+
 class ServerOptionsUpdater(PollWorker):
     """Class for checking the server's config.json updates."""
 
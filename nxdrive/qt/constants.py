@@ -14,6 +14,7 @@
     QSystemTrayIcon,
     Qt,
     QTextEdit,
+    QThread,
     QValidator,
 )
 
@@ -44,6 +45,7 @@
 ItemIsSelectable = Qt.ItemFlag.ItemIsSelectable
 Key_Escape = Qt.Key_Escape
 LeftToRight = Qt.LayoutDirection.LeftToRight
+LowestPriority = QThread.Priority.LowestPriority
 MiddleClick = QSystemTrayIcon.ActivationReason.MiddleClick
 MouseButtonPress = QEvent.Type.MouseButtonPress
 MouseFocusReason = Qt.FocusReason.MouseFocusReason
@@ -25,8 +25,10 @@
     Callable,
     Dict,
     Generator,
+    Iterable,
     List,
     Optional,
+    Sequence,
     Tuple,
     Union,
 )
@@ -37,8 +39,10 @@
 
 from .constants import (
     APP_NAME,
+    DIGEST_BUFFER_SIZE,
     DOC_UID_REG,
     FILE_BUFFER_SIZE,
+    LINUX,
     MAC,
     UNACCESSIBLE_HASH,
     WINDOWS,
@@ -261,6 +265,28 @@ def get_tree_list(path: Path, /) -> Generator[Tuple[Path, int], None, None]:
 
     Note: this function cannot be decorated with lru_cache().
     """
+    for local_path, _, size in walk_tree(path):
+        yield local_path, size
+
+
+def _is_ignored_for_dt(name: str, /) -> bool:
+    """Check if a file or folder *name* must be skipped by the Direct Transfer."""
+    name = name.lower()
+    return name.startswith(Options.ignored_prefixes) or name.endswith(
+        Options.ignored_suffixes
+    )
+
+
+def walk_tree(path: Path, /) -> Generator[Tuple[Path, bool, int], None, None]:
+    """
+    Walk the tree of a given *path*, depth-first, using os.scandir().
+    Each entry will yield a tuple (local_path, is_dir, size), a folder
+    is always yielded before its children.
+
+    There is one opened scandir() iterator by level of the tree, and only
+    the data of the current entry is kept: the memory usage does not depend
+    on the number of files.
+    """
     try:
         it = os.scandir(path)
     except OSError:
@@ -268,28 +294,31 @@ def get_tree_list(path: Path, /) -> Generator[Tuple[Path, int], None, None]:
         return
 
     # Check that the path can be processed
-    path_lower = path.name.lower()
-    if path_lower.startswith(Options.ignored_prefixes) or path_lower.endswith(
-        Options.ignored_suffixes
-    ):
+    if _is_ignored_for_dt(path.name):
         log.debug(f"Ignored path for Direct Transfer: {str(path)!r}")
+        it.close()
         return
 
     if path.is_symlink():
         log.debug(f"Ignored symlink path for Direct Transfer: {str(path)!r}")
+        it.close()
         return
 
     # First, yield the folder itself
-    yield path, 0
+    yield path, True, 0
 
     # Then, yield its children
-    with it:
-        for entry in it:
+    iterators = [it]
+    try:
+        while iterators:
+            entry = next(iterators[-1], None)
+            if entry is None:
+                # All children of the current folder were yielded
+                iterators.pop().close()
+                continue
+
             # Check the path can be processed
-            entry_lower = entry.name.lower()
-            if entry_lower.startswith(Options.ignored_prefixes) or entry_lower.endswith(
-                Options.ignored_suffixes
-            ):
+            if _is_ignored_for_dt(entry.name):
                 log.debug(f"Ignored path for Direct Transfer: {entry.path!r}")
                 continue
 
@@ -304,10 +333,25 @@ def get_tree_list(path: Path, /) -> Generator[Tuple[Path, int], None, None]:
                 continue
 
             if is_dir:
-                yield from get_tree_list(Path(entry.path))
+                try:
+                    iterators.append(os.scandir(entry.path))
+                except OSError:
+                    log.warning(f"Cannot browse {entry.path!r}")
+                    continue
+                yield Path(entry.path), True, 0
             elif entry.is_file():
-                file = Path(entry.path)
-                yield file, file.stat().st_size
+                try:
+                    size = entry.stat().st_size
+                except OSError:
+                    log.warning(
+                        f"Error calling stat() on {entry.path!r}", exc_info=True
+                    )
+                    continue
+                yield Path(entry.path), False, size
+    finally:
+        # The walk may be stopped early
+        for it in iterators:
+            it.close()
 
 
 @lru_cache(maxsize=32)
@@ -328,7 +372,7 @@ def get_value(value: str, /) -> Union[bool, float, str, Tuple[str, ...]]:
 
 
 def grouper(
-    iterable: List[Any], count: int, /
+    iterable: Iterable[Any], count: int, /
 ) -> Generator[Tuple[Any, ...], None, None]:
     """grouper("ABCDEFG", 3) --> ('ABC') ('DEF') ('G',)."""
     it = iter(iterable)
@@ -1142,25 +1186,148 @@ def compute_digest(
 
     Note: this function must not be decorated with lru_cache().
     """
-    h = get_digest_hash(digest_func)
-    if not h:
-        raise UnknownDigest(digest_func)
+    return compute_digests(path, (digest_func,), callback=callback)[digest_func]
+
+
+def compute_digests(
+    path: Path,
+    digest_funcs: Sequence[str],
+    /,
+    *,
+    callback: Callable = None,
+    buffer_size: int = DIGEST_BUFFER_SIZE,
+) -> Dict[str, str]:
+    """Compute the digests of *path* for all *digest_funcs*, in a single read of the file.
 
+    The file is read into the same buffer over and over. hashlib releases the GIL
+    while hashing big buffers, so that several files can be hashed from several threads.
+    mmap() is not used: a file truncated in the mean time would crash the process (SIGBUS).
+    """
+    hashes = {}
+    for digest_func in digest_funcs:
+        h = get_digest_hash(digest_func)
+        if not h:
+            raise UnknownDigest(digest_func)
+        hashes[digest_func] = h
+
+    buf = bytearray(buffer_size)
     try:
-        with safe_long_path(path).open(mode="rb") as f:
+        with memoryview(buf) as view, safe_long_path(path).open(
+            mode="rb", buffering=0
+        ) as f:
             while "computing":
                 if callable(callback):
                     callback(path)
-                buf = f.read(FILE_BUFFER_SIZE)
-                if not buf:
+                size = f.readinto(buf)
+                if not size:
                     break
-                h.update(buf)
+                with view[:size] as data:
+                    for h in hashes.values():
+                        h.update(data)
     except (OSError, MemoryError):
         # MemoryError happens randomly, dunno why but this is
         # not an issue as the hash will be recomputed later
-        return UNACCESSIBLE_HASH
+        return {digest_func: UNACCESSIBLE_HASH for digest_func in hashes}
+
+    return {digest_func: str(h.hexdigest()) for digest_func, h in hashes.items()}
+
+
+class StreamDigest:
+    """Compute the digests of a content while it is written, for several digest functions at once.
+    Unknown digest functions are ignored.
+    """
+
+    def __init__(self, *digest_funcs: str) -> None:
+        self._hashes = {}
+        for digest_func in digest_funcs:
+            h = get_digest_hash(digest_func) if digest_func else None
+            if h:
+                self._hashes[digest_func] = h
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__} digest_funcs={list(self._hashes)}>"
 
-    return str(h.hexdigest())
+    def update(self, data: bytes, /) -> None:
+        for h in self._hashes.values():
+            h.update(data)
+
+    def update_from_file(self, path: Path, /, *, start: int = 0, end: int) -> None:
+        """Add the content of *path* from the byte *start* to *end* (excluded),
+        as when resuming a download.
+        """
+        with safe_long_path(path).open(mode="rb") as f:
+            f.seek(start)
+            left = end - start
+            while left > 0:
+                buf = f.read(min(FILE_BUFFER_SIZE, left))
+                if not buf:
+                    break
+                self.update(buf)
+                left -= len(buf)
+
+    def hexdigest(self, digest_func: str, /) -> Optional[str]:
+        h = self._hashes.get(digest_func)
+        return str(h.hexdigest()) if h else None
+
+    def digests(self) -> Dict[str, str]:
+        return {func: str(h.hexdigest()) for func, h in self._hashes.items()}
+
+
+def clone_file(src: Path, dst: Path, /) -> str:
+    """Copy the content of *src* to *dst*, without metadata (like shutil.copyfile()).
+
+    On GNU/Linux, the file is first cloned: both files share the same data blocks
+    until one is modified (reflink, on Btrfs, XFS, ...). Else, the kernel copies
+    the data itself with copy_file_range(), what also allows server-side copies
+    on network file systems. shutil.copyfile() is the last resort, it uses
+    sendfile() on GNU/Linux and a buffered copy elsewhere.
+
+    Return the way used: "reflink", "copy_file_range" or "copy".
+    """
+    import shutil
+
+    if LINUX and _clone_file_linux(src, dst):
+        return "reflink"
+    if LINUX and _copy_file_range(src, dst):
+        return "copy_file_range"
+
+    shutil.copyfile(src, dst)
+    return "copy"
+
+
+def _clone_file_linux(src: Path, dst: Path, /) -> bool:
+    import fcntl
+
+    # FICLONE from linux/fs.h
+    ficlone = 0x40049409
+
+    with safe_long_path(src).open(mode="rb") as fsrc, dst.open(mode="wb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), ficlone, fsrc.fileno())
+        except OSError:
+            # Not supported by the file system, or files on different file systems
+            return False
+    return True
+
+
+def _copy_file_range(src: Path, dst: Path, /) -> bool:
+    if not hasattr(os, "copy_file_range"):
+        return False
+
+    with safe_long_path(src).open(mode="rb") as fsrc, dst.open(mode="wb") as fdst:
+        size = os.fstat(fsrc.fileno()).st_size
+        copied = 0
+        try:
+            while copied < size:
+                sent = os.copy_file_range(fsrc.fileno(), fdst.fileno(), size - copied)
+                if not sent:
+                    # Some file systems (procfs, sysfs, ...) copy nothing without failing
+                    break
+                copied += sent
+        except OSError:
+            # Not supported by the kernel or the file system
+            return False
+    return copied == size
 
 
 def digest_status(digest: str) -> DigestStatus:
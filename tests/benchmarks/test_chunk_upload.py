@@ -0,0 +1,113 @@
+"""
+Upload a file in chunks to a local stand-in of the Nuxeo batch handler,
+answering each request after a simulated network latency. Compare chunks
+sent one after the other (the upload handler of the Python client) against
+several chunks in flight (the ChunkEngine).
+
+The stand-in only implements what a chunked upload needs: the blob state
+(GET) and the chunk upload (POST).
+"""
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from time import sleep
+
+import pytest
+from nuxeo.client import Nuxeo
+from nuxeo.handlers.default import ChunkUploader
+from nuxeo.models import Batch, FileBlob
+
+from nxdrive.client.uploader.chunks import get_chunk_engine
+
+CHUNK_SIZE = 256 * 1024
+CHUNKS = 32
+LATENCY = 0.05  # seconds, per request
+
+
+class BatchHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, data=None):
+        body = json.dumps(data).encode() if data is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _blob(self):
+        server = self.server
+        with server.lock:
+            uploaded = sorted(server.chunks)
+        return {
+            "uploaded": "true",
+            "fileIdx": "0",
+            "uploadType": "chunked",
+            "uploadedChunkIds": [str(idx) for idx in uploaded],
+            "chunkCount": str(server.chunk_count),
+        }
+
+    def do_GET(self):
+        sleep(LATENCY)
+        if self.server.chunks:
+            self._reply(200, self._blob())
+        else:
+            self._reply(404)
+
+    def do_POST(self):
+        data = self.rfile.read(int(self.headers["Content-Length"]))
+        sleep(LATENCY)
+        server = self.server
+        with server.lock:
+            server.chunk_count = int(self.headers["X-Upload-Chunk-Count"])
+            server.chunks[int(self.headers["X-Upload-Chunk-Index"])] = data
+        self._reply(201, self._blob())
+
+
+@pytest.fixture(scope="module")
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), BatchHandler)
+    httpd.daemon_threads = True
+    httpd.lock = Lock()
+    httpd.chunks = {}
+    httpd.chunk_count = 0
+    thread = Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture(scope="module")
+def file(tmp_path_factory):
+    path = tmp_path_factory.mktemp("upload") / "file.bin"
+    path.write_bytes(b"".join(bytes([idx]) * CHUNK_SIZE for idx in range(CHUNKS)))
+    return path
+
+
+def upload(server, file, workers):
+    server.chunks.clear()
+    host = f"http://127.0.0.1:{server.server_port}/nuxeo/"
+    service = Nuxeo(host=host, auth=("Administrator", "Administrator")).uploads
+    batch = Batch(batchId="batch", service=service)
+    uploader = ChunkUploader(service, batch, FileBlob(str(file)), CHUNK_SIZE)
+
+    if workers > 1:
+        chunks = get_chunk_engine(uploader, workers=workers).iter_upload()
+    else:
+        chunks = uploader.iter_upload()
+    for _ in chunks:
+        pass
+    return uploader
+
+
+@pytest.mark.parametrize("workers", [1, 4, 8])
+def test_chunk_upload(workers, server, file, benchmark):
+    uploader = benchmark.pedantic(upload, args=(server, file, workers), rounds=3)
+
+    assert uploader.is_complete()
+    content = b"".join(server.chunks[idx] for idx in range(CHUNKS))
+    assert content == file.read_bytes()
@@ -0,0 +1,67 @@
+"""
+Get the digest of every file of an unchanged tree, as a full rescan does when
+modification times cannot be trusted (after a restart, a clock change, ...).
+Compare the digests computed from the file contents against the ones from the
+DigestCache, already filled by a previous scan.
+
+The tree is 1 GiB here: computing digests costs the size of the tree, and
+the cache only costs the number of files (one stat() and one query each),
+so the gap widens with a 50 GB tree of the same count of files.
+"""
+import os
+from time import time
+
+import pytest
+
+from nxdrive.client.local import LocalClient
+from nxdrive.constants import ROOT
+from nxdrive.dao.engine import EngineDAO
+from nxdrive.engine.digest_cache import DigestCache
+
+FOLDERS = 16
+FILES_PER_FOLDER = 32
+FILE_SIZE = 2 * 1024 * 1024  # 1 GiB in total
+
+
+@pytest.fixture(scope="module")
+def tree(tmp_path_factory):
+    root = tmp_path_factory.mktemp("digests")
+    local = root / "local"
+    mtime = time() - 3600
+    for folder in range(FOLDERS):
+        path = local / f"folder-{folder}"
+        path.mkdir(parents=True)
+        for file in range(FILES_PER_FOLDER):
+            child = path / f"file-{file}.bin"
+            child.write_bytes(os.urandom(FILE_SIZE))
+            os.utime(child, (mtime, mtime))
+
+    dao = EngineDAO(root / "ndrive_digests.db")
+    yield local, dao
+    dao.dispose()
+
+
+def rescan(local):
+    digests = []
+    for folder in local.get_children_info(ROOT):
+        for child in local.get_children_info(folder.path):
+            digests.append(child.get_digest())
+    return digests
+
+
+@pytest.mark.parametrize("cached", [False, True])
+def test_rescan_digests(cached, tree, benchmark):
+    root, dao = tree
+    cache = DigestCache(dao) if cached else None
+    local = LocalClient(root, digest_cache=cache)
+    if cache:
+        # Filled by a previous scan
+        rescan(local)
+        cache.hits = cache.misses = 0
+
+    digests = benchmark.pedantic(rescan, args=(local,), rounds=3)
+
+    assert len(digests) == FOLDERS * FILES_PER_FOLDER
+    if cache:
+        assert not cache.misses
+        benchmark.extra_info.update(cache.get_metrics())
@@ -0,0 +1,112 @@
+"""
+Direct Transfer planning of a folder of 20,000 files (200 folders of 100 files).
+
+The former implementation walked the whole tree in the FoldersDialog, kept all
+paths, then built, sorted and inserted all items before queueing the first one.
+The engine now walks the tree itself with os.scandir() and queues the items
+by batch, while walking.
+
+The delay before the first item is queued, and the memory peak of the
+planning, are in the "extra_info" of the results.
+"""
+import os
+import tracemalloc
+from time import perf_counter
+from types import SimpleNamespace
+
+import pytest
+
+from nxdrive.dao.engine import EngineDAO
+from nxdrive.engine.engine import Engine
+from nxdrive.options import Options
+from nxdrive.utils import get_tree_list, grouper
+
+FOLDERS = 200
+FILES = 100
+
+
+@pytest.fixture(scope="module")
+def tree(tmp_path_factory):
+    root = tmp_path_factory.mktemp("tree") / "root"
+    for folder in range(FOLDERS):
+        path = root / f"folder-{folder}"
+        path.mkdir(parents=True)
+        for file in range(FILES):
+            (path / f"file-{file}.txt").touch()
+    return root
+
+
+class QueueManager:
+    def __init__(self):
+        self.first = 0.0
+        self.count = 0
+
+    def push(self, _):
+        if not self.count:
+            self.first = perf_counter()
+        self.count += 1
+
+
+def former(engine, root):
+    local_paths = {path: size for path, size in get_tree_list(root)}
+    all_paths = local_paths.keys()
+    items = [
+        (
+            path.as_posix(),
+            path.parent.as_posix(),
+            path.name,
+            path.is_dir(),
+            size,
+            "/remote",
+            "ref",
+            None,
+            "create",
+            "todo" if path.parent in all_paths else "unknown",
+        )
+        for path, size in sorted(local_paths.items())
+    ]
+    description = os.path.basename(items[0][0])
+    session_uid = engine.dao.create_session(
+        "/remote", "ref", len(items), engine.uid, description
+    )
+    current_max_row_id = -1
+    for batch_items in grouper(items, Options.database_batch_size):
+        row_id = engine.dao.plan_many_direct_transfer_items(batch_items, session_uid)
+        if current_max_row_id == -1:
+            current_max_row_id = row_id
+    engine.dao.queue_many_direct_transfer_items(current_max_row_id)
+
+
+def streaming(engine, root):
+    Engine._direct_transfer(engine, {root: 0}, "/remote", "ref", "title")
+
+
+@pytest.mark.parametrize("func", [former, streaming])
+def test_planning(func, tree, tmp_path, benchmark):
+    engine = SimpleNamespace(
+        uid="engine",
+        doc_container_type="Folder",
+        handle_session_status=lambda _: None,
+        _save_last_dt_session_infos=lambda *_: None,
+        _walk_direct_transfer=Engine._walk_direct_transfer,
+    )
+    delays, peaks = [], []
+
+    def setup():
+        engine.dao = EngineDAO(tmp_path / f"ndrive-{len(delays)}.db")
+        engine.dao.queue_manager = QueueManager()
+        return (engine, tree), {}
+
+    def run(engine, root):
+        tracemalloc.start()
+        start = perf_counter()
+        func(engine, root)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        delays.append(engine.dao.queue_manager.first - start)
+        assert engine.dao.queue_manager.count == 1 + FOLDERS * (1 + FILES)
+        engine.dao.dispose()
+
+    benchmark.pedantic(run, setup=setup, rounds=3)
+    benchmark.extra_info["first_queued"] = min(delays)
+    benchmark.extra_info["memory_peak"] = min(peaks)
@@ -0,0 +1,82 @@
+"""
+Materialize 100,000 States rows and read their attributes: compare the
+__slots__ based DocPair against the former sqlite3.Row based one.
+"""
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+from nxdrive.dao.base import AutoRetryConnection
+from nxdrive.dao.engine import EngineDAO
+from nxdrive.objects import DocPair
+
+ROWS = 100_000
+
+
+class RowDocPair(sqlite3.Row):
+    """The former implementation."""
+
+    def __getattr__(self, name):
+        if name in ("local_path", "local_parent_path"):
+            return Path((self[name] or "").lstrip("/"))
+        if name == "remote_ref":
+            return self[name] or ""
+        return self[name]
+
+
+FACTORIES = {"row": RowDocPair, "slots": DocPair}
+
+
+@pytest.fixture(scope="module")
+def db(tmp_path_factory):
+    db = tmp_path_factory.mktemp("dao") / "ndrive_pairs.db"
+    EngineDAO(db).dispose()
+    with sqlite3.connect(db) as conn:
+        conn.executemany(
+            "INSERT INTO States (local_path, local_parent_path, local_name, remote_ref,"
+            " pair_state) VALUES (?, ?, ?, ?, 'synchronized')",
+            (
+                (f"/folder/file-{idx}", "/folder", f"file-{idx}", f"ref-{idx}")
+                for idx in range(ROWS)
+            ),
+        )
+    conn.close()
+    return db
+
+
+def _fetch(db, factory, columns="*"):
+    conn = sqlite3.connect(db, factory=AutoRetryConnection)
+    conn.row_factory = factory
+    try:
+        return conn.cursor().execute(f"SELECT {columns} FROM States").fetchall()
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize("kind", FACTORIES)
+def test_materialization(kind, db, benchmark):
+    pairs = benchmark.pedantic(_fetch, args=(db, FACTORIES[kind]), rounds=5)
+    assert len(pairs) == ROWS
+
+
+def test_materialization_projection(db, benchmark):
+    columns = EngineDAO._projection(("id", "local_path", "pair_state"))
+    pairs = benchmark.pedantic(_fetch, args=(db, DocPair, columns), rounds=5)
+    assert len(pairs) == ROWS
+
+
+@pytest.mark.parametrize("kind", FACTORIES)
+def test_attribute_access(kind, db, benchmark):
+    pairs = _fetch(db, FACTORIES[kind])
+
+    def read():
+        for pair in pairs:
+            pair.local_path
+            pair.local_parent_path
+            pair.remote_ref
+            pair.pair_state
+            pair.folderish
+
+    benchmark.pedantic(read, rounds=5)
+    assert pairs[-1].local_path == Path(f"folder/file-{ROWS - 1}")
@@ -0,0 +1,44 @@
+"""
+Write a downloaded content to a file and get its digest. Compare the file
+read again after the download, once to check its integrity and once to get
+the local digest of the synchronized file, against the digest computed while
+the content is written (the StreamDigest).
+"""
+from hashlib import md5
+
+import pytest
+
+from nxdrive.constants import FILE_BUFFER_SIZE
+from nxdrive.utils import StreamDigest, compute_digest
+
+SIZE = 256 * 1024 * 1024
+CHUNK = bytes(range(256)) * (FILE_BUFFER_SIZE // 256)
+DIGEST = md5(CHUNK * (SIZE // FILE_BUFFER_SIZE)).hexdigest()
+
+
+def write(file_out, streamed=None):
+    with file_out.open("wb") as f:
+        for _ in range(SIZE // FILE_BUFFER_SIZE):
+            f.write(CHUNK)
+            if streamed:
+                streamed.update(CHUNK)
+
+
+def read_again(file_out):
+    write(file_out)
+    assert compute_digest(file_out, "md5") == DIGEST  # Integrity check
+    return compute_digest(file_out, "md5")  # Local digest
+
+
+def streaming(file_out):
+    streamed = StreamDigest("md5")
+    write(file_out, streamed)
+    assert streamed.hexdigest("md5") == DIGEST
+    return streamed.hexdigest("md5")
+
+
+@pytest.mark.parametrize("func", [read_again, streaming])
+def test_download_digest(func, tmp_path, benchmark):
+    file_out = tmp_path / "file.tmp"
+    digest = benchmark.pedantic(func, args=(file_out,), rounds=3)
+    assert digest == DIGEST
@@ -0,0 +1,155 @@
+"""
+Direct Transfer of a tree of 585 folders (a folder of 8 folders of 8 folders of
+8 folders), each sub-folder holding a file, to a server answering in 5 ms.
+
+The former implementation created one folder at a time, on the local folders
+processor: each folder waited for the previous one to be created before its
+own request was sent. Folders are now created level by level from a pool of
+Options.dt_folder_threads threads, their children being released by batch.
+
+The delay before half of the files are released is in the "extra_info" of
+the results.
+"""
+from collections import deque
+from pathlib import Path
+from threading import Lock
+from time import perf_counter, sleep
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+import pytest
+
+from nxdrive.client.uploader.direct_transfer import DirectTransferUploader
+from nxdrive.dao.engine import EngineDAO
+from nxdrive.engine.engine import Engine
+from nxdrive.engine.processor import Processor
+from nxdrive.options import Options
+
+WIDTH = 8
+DEPTH = 3
+LATENCY = 0.005
+FOLDERS = sum(WIDTH**level for level in range(1, DEPTH + 1))
+
+
+@pytest.fixture(scope="module")
+def tree(tmp_path_factory):
+    root = tmp_path_factory.mktemp("tree") / "root"
+    folders = [root]
+    for _ in range(DEPTH):
+        folders = [
+            folder / f"folder-{idx}" for folder in folders for idx in range(WIDTH)
+        ]
+        for folder in folders:
+            folder.mkdir(parents=True)
+            (folder / "file.txt").touch()
+    return root
+
+
+class QueueManager:
+    """Keep released folders, count released files."""
+
+    def __init__(self):
+        self.folders = deque()
+        self.files = 0
+        self.half = 0.0
+
+    def push(self, pair):
+        if pair.folderish:
+            self.folders.append(pair)
+            return
+        self.files += 1
+        if self.files == FOLDERS // 2:
+            self.half = perf_counter()
+
+
+class Remote:
+    def __init__(self, dao):
+        self.dao = dao
+        self._lock = Lock()
+        self._count = 0
+
+    def upload_folder(self, parent, params, **kwargs):
+        sleep(LATENCY)
+        with self._lock:
+            self._count += 1
+            uid = f"uid-{self._count}"
+        return {"path": f"{parent}/{params['title']}", "uid": uid}
+
+
+class FolderCreator:
+    """The Direct Transfer folders creation stage of a Processor."""
+
+    thread_id = 42
+    dt_folders_per_level = Processor.dt_folders_per_level
+    _direct_transfer_folders = Processor._direct_transfer_folders
+    _direct_transfer_folders_level = Processor._direct_transfer_folders_level
+    _direct_transfer_folders_created = Processor._direct_transfer_folders_created
+    _create_dt_folder = Processor._create_dt_folder
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.dao = engine.dao
+        self.remote = Remote(self.dao)
+        self._interact = Mock()
+        self._postpone_pair = Mock()
+
+
+def plan(tree, tmp_path_factory):
+    dao = EngineDAO(tmp_path_factory.mktemp("db") / "ndrive.db")
+    dao.queue_manager = QueueManager()
+    engine = SimpleNamespace(
+        uid="engine",
+        dao=dao,
+        doc_container_type="Folder",
+        handle_session_status=Mock(),
+        manager=Mock(),
+        _save_last_dt_session_infos=Mock(),
+        _walk_direct_transfer=Engine._walk_direct_transfer,
+    )
+    Engine._direct_transfer(engine, {tree: 0}, "/remote", "ref", "title")
+    # Planned items were queued, only released ones are counted
+    dao.queue_manager = QueueManager()
+    return engine
+
+
+def former(engine, tree):
+    """One folder at a time, in the order they are released."""
+    dao = engine.dao
+    uploader = DirectTransferUploader(FolderCreator(engine).remote)
+    folders = dao.queue_manager.folders
+    folders.append(dao.get_state_from_local(tree))
+    while folders:
+        pair = folders.popleft()
+        uploader.upload(Path(f"/{pair.local_path}"), doc_pair=pair)
+        dao.remove_state(pair, recursive=False)
+        dao.update_session(pair.session)
+
+
+def by_level(engine, tree):
+    dao = engine.dao
+    pair = dao.get_state_from_local(tree)
+    FolderCreator(engine)._direct_transfer_folders(
+        dao.acquire_state(FolderCreator.thread_id, pair.id)
+    )
+
+
+@Options.mock()
+@pytest.mark.parametrize("threads", [1, 4, 16])
+def test_folders_creation(threads, tree, tmp_path_factory, benchmark):
+    Options.dt_folder_threads = max(threads, 2)
+    func = former if threads == 1 else by_level
+    engines = []
+
+    def setup():
+        engines.append(plan(tree, tmp_path_factory))
+        engines[-1].start = perf_counter()
+        return (engines[-1], tree), {}
+
+    benchmark.pedantic(func, setup=setup, rounds=3)
+
+    for engine in engines:
+        assert engine.dao.get_session(1).uploaded_items == FOLDERS + 1
+        assert engine.dao.queue_manager.files == FOLDERS
+        engine.dao.dispose()
+    delays = [engine.dao.queue_manager.half - engine.start for engine in engines]
+    benchmark.extra_info["half_files_released_s"] = sum(delays) / len(delays)
@@ -0,0 +1,75 @@
+"""
+Sync status emblems set on GNU/Linux, with a backend only counting them.
+
+The scenario is a startup (the status of every file is sent), then the sync
+of every file (its status is sent before and after the sync), then a restart
+of the local watcher (the status of every file is sent again).
+
+The former implementation set every emblem sent, each one being a "gio set"
+process. The EmblemService only sets the last emblem of a file, and only when
+it changed. Emblems set per synced file are in the "extra_info" of the results.
+"""
+from collections import namedtuple
+
+import pytest
+
+from nxdrive.osi.extension import Status, get_formatted_status, icon_status
+from nxdrive.osi.linux.emblems import EmblemService
+
+FILES = 2_000
+
+DocPair = namedtuple(
+    "DocPair",
+    "error_count, local_state, pair_state, processor",
+    defaults=(0, "", "", 0),
+)
+
+SYNCING = DocPair(processor=42)
+SYNCED = DocPair(local_state="synchronized")
+
+
+@pytest.fixture(scope="module")
+def files(tmp_path_factory):
+    root = tmp_path_factory.mktemp("emblems")
+    files = [root / f"file-{idx}.txt" for idx in range(FILES)]
+    for file in files:
+        file.touch()
+    return files
+
+
+def scenario(send, files):
+    for file in files:
+        send(SYNCED, file)
+    for file in files:
+        send(SYNCING, file)
+        send(SYNCED, file)
+    for file in files:
+        send(SYNCED, file)
+
+
+def former(files):
+    emblems = []
+
+    def send_sync_status(doc_pair, path):
+        status = get_formatted_status(doc_pair, path)
+        if status:
+            emblems.append((path, icon_status[Status(int(status["value"]))]))
+
+    scenario(send_sync_status, files)
+    return len(emblems)
+
+
+def service(files):
+    emblems = []
+    emblem_service = EmblemService(set_emblems=emblems.extend)
+    scenario(emblem_service.send, files)
+    emblem_service.flush()
+    emblem_service.stop()
+    return len(emblems)
+
+
+@pytest.mark.parametrize("func", [former, service])
+def test_emblems(func, files, benchmark):
+    emblems = benchmark.pedantic(func, args=(files,), rounds=3)
+    benchmark.extra_info["emblems_per_file"] = emblems / FILES
+    assert emblems <= 4 * FILES
@@ -0,0 +1,46 @@
+"""
+Update 10,000 rows one statement at a time: compare autocommit mode (one
+transaction per statement) against the EngineDAO.batch() transactions.
+"""
+import sqlite3
+from contextlib import nullcontext
+
+import pytest
+
+from nxdrive.dao.engine import EngineDAO
+
+ROWS = 10_000
+
+
+@pytest.fixture(scope="module")
+def dao(tmp_path_factory):
+    db = tmp_path_factory.mktemp("dao") / "ndrive_batch.db"
+    EngineDAO(db).dispose()
+    with sqlite3.connect(db) as conn:
+        conn.executemany(
+            "INSERT INTO States (local_path, local_parent_path, local_name, remote_ref)"
+            " VALUES (?, '/', ?, ?)",
+            ((f"/file-{idx}", f"file-{idx}", f"ref-{idx}") for idx in range(ROWS)),
+        )
+    conn.close()
+
+    dao = EngineDAO(db)
+    yield dao
+    dao.dispose()
+
+
+@pytest.mark.parametrize("mode", ["autocommit", "batch"])
+def test_update_rows(mode, dao, benchmark):
+    c = dao._get_read_connection().cursor()
+    ids = [row.id for row in c.execute("SELECT id FROM States")]
+    assert len(ids) == ROWS
+
+    def update():
+        with dao.batch() if mode == "batch" else nullcontext():
+            for row_id in ids:
+                dao.update_remote_name(row_id, f"name-{row_id}")
+
+    benchmark.pedantic(update, rounds=3)
+
+    metrics = dao.get_metrics()
+    assert metrics["db_write_statements"] >= ROWS
@@ -0,0 +1,144 @@
+"""
+Compare the cost of the hottest EngineDAO lookups on a big States table,
+without (schema version 22) and with (schema version 23) the secondary indexes.
+"""
+import shutil
+import sqlite3
+
+import pytest
+
+from nxdrive.dao.engine import EngineDAO
+
+ROWS = 1_000_000
+FILES_PER_FOLDER = 1_000
+FOLDER = ROWS // FILES_PER_FOLDER // 2  # The one used for lookups
+
+INDEXES = (
+    "idx_states_local_path",
+    "idx_states_local_parent_path",
+    "idx_states_remote_parent_ref",
+    "idx_states_remote_parent_path",
+    "idx_states_pair_state",
+    "idx_states_processor",
+    "idx_states_to_sync",
+)
+
+
+class QueueManager:
+    """Minimal queue manager, only counting pairs to handle."""
+
+    def __init__(self):
+        self.count = 0
+
+    def add_backlog(self, count, **_):
+        self.count += count
+
+
+def _rows(count):
+    folders = count // FILES_PER_FOLDER
+    for folder in range(folders):
+        ref = f"ref-{folder}"
+        yield (
+            f"/folder-{folder}",
+            "/",
+            f"folder-{folder}",
+            1,
+            ref,
+            "root",
+            "/root",
+            "synchronized",
+        )
+        for file in range(FILES_PER_FOLDER - 1):
+            if file % 100 == 0:
+                state = "locally_modified"
+            elif file % 333 == 0:
+                state = "unsynchronized"
+            else:
+                state = "synchronized"
+            yield (
+                f"/folder-{folder}/file-{file}.txt",
+                f"/folder-{folder}",
+                f"file-{file}.txt",
+                0,
+                f"ref-{folder}-{file}",
+                ref,
+                f"/root/{ref}",
+                state,
+            )
+
+
+@pytest.fixture(scope="module")
+def databases(tmp_path_factory):
+    tmp = tmp_path_factory.mktemp("dao")
+    after = tmp / "ndrive_after.db"
+
+    # Create the schema, then fill the States table with synthetic data
+    EngineDAO(after).dispose()
+    with sqlite3.connect(after) as conn:
+        conn.executemany(
+            "INSERT INTO States (local_path, local_parent_path, local_name, folderish,"
+            " remote_ref, remote_parent_ref, remote_parent_path, pair_state)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            _rows(ROWS),
+        )
+    conn.close()
+
+    # The same database, as it was before the indexes migration
+    before = tmp / "ndrive_before.db"
+    shutil.copyfile(after, before)
+    with sqlite3.connect(before) as conn:
+        for index in INDEXES:
+            conn.execute(f"DROP INDEX {index}")
+    conn.close()
+
+    daos = {"before": EngineDAO(before), "after": EngineDAO(after)}
+    yield daos
+    for dao in daos.values():
+        dao.dispose()
+
+
+@pytest.mark.parametrize("schema", ["before", "after"])
+def test_get_state_from_local(schema, databases, benchmark):
+    dao = databases[schema]
+    path = f"/folder-{FOLDER}/file-42.txt"
+    assert benchmark(dao.get_state_from_local, path)
+
+
+@pytest.mark.parametrize("schema", ["before", "after"])
+def test_get_local_children(schema, databases, benchmark):
+    dao = databases[schema]
+    children = benchmark(dao.get_local_children, f"/folder-{FOLDER}")
+    assert len(children) == FILES_PER_FOLDER - 1
+
+
+@pytest.mark.parametrize("schema", ["before", "after"])
+def test_get_remote_children(schema, databases, benchmark):
+    dao = databases[schema]
+    children = benchmark(dao.get_remote_children, f"ref-{FOLDER}")
+    assert len(children) == FILES_PER_FOLDER - 1
+
+
+@pytest.mark.parametrize("schema", ["before", "after"])
+def test_get_normal_state_from_remote(schema, databases, benchmark):
+    dao = databases[schema]
+    assert benchmark(dao.get_normal_state_from_remote, f"ref-{FOLDER}-42")
+
+
+@pytest.mark.parametrize("schema", ["before", "after"])
+def test_get_unsynchronized_count(schema, databases, benchmark):
+    dao = databases[schema]
+    assert benchmark(dao.get_unsynchronized_count) > 0
+
+
+@pytest.mark.parametrize("schema", ["before", "after"])
+def test_register_queue_manager(schema, databases, benchmark):
+    dao = databases[schema]
+    manager = QueueManager()
+    benchmark(dao.register_queue_manager, manager)
+    assert manager.count > 0
+
+
+@pytest.mark.parametrize("schema", ["before", "after"])
+def test_release_processor(schema, databases, benchmark):
+    dao = databases[schema]
+    assert not benchmark(dao.release_processor, 42)
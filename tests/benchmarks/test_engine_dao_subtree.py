@@ -0,0 +1,123 @@
+"""
+Moving a folder with 100,000 descendants: compare the range-based subtree
+conditions used by EngineDAO against the former `LIKE 'path/%'` predicates.
+"""
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+from nxdrive.dao.adapters import adapt_path
+from nxdrive.dao.engine import EngineDAO
+
+DESCENDANTS = 100_000
+OTHERS = 400_000
+FILES_PER_FOLDER = 1_000
+
+
+def _folder(name, ref, count):
+    """Generate rows of a *name* folder with *count* descendants."""
+    yield (f"/{name}", "/", name, 1, ref, "/root")
+    for folder in range(count // FILES_PER_FOLDER):
+        folder_ref = f"{ref}-{folder}"
+        parent = f"/{name}/sub-{folder}"
+        yield (parent, f"/{name}", f"sub-{folder}", 1, folder_ref, f"/root/{ref}")
+        for file in range(FILES_PER_FOLDER - 1):
+            yield (
+                f"{parent}/file-{file}",
+                parent,
+                f"file-{file}",
+                0,
+                f"{folder_ref}-{file}",
+                f"/root/{ref}/{folder_ref}",
+            )
+
+
+@pytest.fixture(scope="module")
+def dao(tmp_path_factory):
+    db = tmp_path_factory.mktemp("dao") / "ndrive_subtree.db"
+    EngineDAO(db).dispose()
+    with sqlite3.connect(db) as conn:
+        sql = (
+            "INSERT INTO States (local_path, local_parent_path, local_name, folderish,"
+            " remote_ref, remote_parent_path) VALUES (?, ?, ?, ?, ?, ?)"
+        )
+        conn.executemany(sql, _folder("big", "big", DESCENDANTS))
+        conn.executemany(sql, _folder("others", "others", OTHERS))
+    conn.close()
+
+    dao = EngineDAO(db)
+    yield dao
+    dao.dispose()
+
+
+def _move_like(dao, doc_pair, new_name, new_path):
+    """The former implementation of update_local_parent_path()."""
+    with dao.lock:
+        c = dao._get_write_connection().cursor()
+        path = adapt_path(new_path / new_name)
+        old = adapt_path(doc_pair.local_path)
+        count = len(old)
+        rpath = f"{doc_pair.remote_parent_path}/{doc_pair.remote_ref}"
+        c.execute(
+            "UPDATE States"
+            f"  SET local_parent_path = '{path}' || substr(local_parent_path, {count + 1}),"
+            f"      local_path = '{path}' || substr(local_path, {count + 1})"
+            f" WHERE (local_parent_path LIKE '{old}/%' OR local_parent_path = '{old}')"
+            f"   AND remote_parent_path LIKE '{rpath}%'"
+        )
+        c.execute(
+            "UPDATE States SET local_parent_path = ? WHERE id = ?",
+            (new_path, doc_pair.id),
+        )
+
+
+def _move_range(dao, doc_pair, new_name, new_path):
+    dao.update_local_parent_path(doc_pair, new_name, new_path)
+
+
+def _set_local_path(dao, row_id, path):
+    """The Processor refreshes the moved folder path itself, mimic it."""
+    with dao.lock:
+        dao._get_write_connection().execute(
+            "UPDATE States SET local_path = ? WHERE id = ?", (path, row_id)
+        )
+
+
+@pytest.mark.parametrize("func", [_move_like, _move_range])
+def test_move_folder(func, dao, benchmark):
+    def move_back_and_forth():
+        pair = dao.get_normal_state_from_remote("big")
+        func(dao, pair, "moved", Path("/"))
+        _set_local_path(dao, pair.id, "/moved")
+
+        pair = dao.get_normal_state_from_remote("big")
+        func(dao, pair, "big", Path("/"))
+        _set_local_path(dao, pair.id, "/big")
+
+    benchmark.pedantic(move_back_and_forth, rounds=5)
+
+    children = dao.get_local_children(Path("/big"))
+    assert len(children) == DESCENDANTS // FILES_PER_FOLDER
+    assert dao.get_state_from_local(Path("/big/sub-0/file-0"))
+
+
+@pytest.mark.parametrize("predicate", ["like", "range"])
+def test_select_small_subtree(predicate, dao, benchmark):
+    """Selecting a small subtree is where the index range shines the most."""
+    pair = dao.get_state_from_local(Path("/big/sub-42"))
+    if predicate == "like":
+        sql = (
+            "SELECT * FROM States"
+            " WHERE (local_parent_path LIKE '/big/sub-42/%'"
+            "        OR local_parent_path = '/big/sub-42')"
+            "   AND remote_parent_path LIKE '/root/big/big-42%'"
+        )
+        params = ()
+    else:
+        condition, params = dao._get_recursive_condition(pair)
+        sql = f"SELECT * FROM States {condition}"
+
+    c = dao._get_read_connection().cursor()
+    rows = benchmark(lambda: c.execute(sql, params).fetchall())
+    assert len(rows) == FILES_PER_FOLDER - 1
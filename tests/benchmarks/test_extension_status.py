@@ -0,0 +1,68 @@
+"""
+Statuses asked by a file browser for a folder of 1,000 synchronized files,
+redrawn 10 times.
+
+The former implementation found the engine and queried the database for each
+file, one request per file. The ExtensionListener now answers from its states
+cache, all files of a request at once.
+"""
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from nxdrive.dao.engine import EngineDAO
+from nxdrive.osi.extension import ExtensionListener, get_formatted_status
+
+FILES = 1_000
+REDRAWS = 10
+
+
+@pytest.fixture(scope="module")
+def listener(tmp_path_factory):
+    root = tmp_path_factory.mktemp("statuses")
+    local_folder = root / "Drive"
+    local_folder.mkdir()
+    for idx in range(FILES):
+        (local_folder / f"file-{idx}.txt").touch()
+
+    dao = EngineDAO(root / "ndrive.db")
+    with dao.lock:
+        dao._get_write_connection().executemany(
+            "INSERT INTO States (local_path, local_parent_path, folderish,"
+            " local_state, pair_state) VALUES (?, '/', 0, ?, ?)",
+            (
+                (f"/file-{idx}.txt", "synchronized", "synchronized")
+                for idx in range(FILES)
+            ),
+        )
+
+    engine = SimpleNamespace(uid="engine", dao=dao, local_folder=local_folder)
+    listener = ExtensionListener(SimpleNamespace(engines={"engine": engine}))
+    listener.handlers["status"] = lambda path: former(listener, path)
+    listener.handlers["statuses"] = listener.handle_statuses
+    yield listener, [str(local_folder / f"file-{idx}.txt") for idx in range(FILES)]
+    dao.dispose()
+
+
+def former(listener, path):
+    path = listener._to_path(path)
+    engine = listener.get_engine(path)
+    state = engine.dao.get_state_from_local(path.relative_to(engine.local_folder))
+    return get_formatted_status(state, path)
+
+
+def one_request_per_file(listener, paths):
+    for _ in range(REDRAWS):
+        for path in paths:
+            listener._handle_content(json.dumps({"command": "status", "value": path}))
+
+
+def cached_batches(listener, paths):
+    for _ in range(REDRAWS):
+        listener._handle_content(json.dumps({"command": "statuses", "value": paths}))
+
+
+@pytest.mark.parametrize("func", [one_request_per_file, cached_batches])
+def test_statuses(func, listener, benchmark):
+    benchmark.pedantic(func, args=listener, rounds=3)
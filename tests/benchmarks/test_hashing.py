@@ -0,0 +1,100 @@
+"""
+Throughput of the local digests computation.
+
+- Buffer strategies to read a file: the former read() of 1 MiB chunks, the
+  readinto() of 8 MiB chunks in a reused buffer, and a memory-mapped file.
+- The local md5 and the remote sha256 computed in two reads of the file, or
+  in a single one.
+- Several files hashed one after the other, or at the same time from the
+  HashingService pool (only faster with several CPUs).
+"""
+import hashlib
+import mmap
+from pathlib import Path
+
+import pytest
+
+from nxdrive.client.local import LocalClient
+from nxdrive.constants import DIGEST_BUFFER_SIZE, FILE_BUFFER_SIZE
+from nxdrive.engine.hashing import HashingService
+from nxdrive.utils import compute_digest, compute_digests
+
+SIZE = 256 * 1024 * 1024
+FILES = 8
+
+
+@pytest.fixture(scope="module")
+def big_file(tmp_path_factory):
+    file = tmp_path_factory.mktemp("hashing") / "big.bin"
+    chunk = bytes(range(256)) * (FILE_BUFFER_SIZE // 256)
+    with file.open("wb") as f:
+        for _ in range(SIZE // FILE_BUFFER_SIZE):
+            f.write(chunk)
+    return file
+
+
+def read_1mib(file):
+    h = hashlib.md5()
+    with file.open("rb") as f:
+        while "reading":
+            buffer = f.read(FILE_BUFFER_SIZE)
+            if not buffer:
+                break
+            h.update(buffer)
+    return h.hexdigest()
+
+
+def readinto_8mib(file):
+    return compute_digests(file, ("md5",))["md5"]
+
+
+def memory_mapped(file):
+    h = hashlib.md5()
+    with file.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        for start in range(0, len(m), DIGEST_BUFFER_SIZE):
+            h.update(m[start : start + DIGEST_BUFFER_SIZE])
+    return h.hexdigest()
+
+
+@pytest.mark.parametrize("func", [read_1mib, readinto_8mib, memory_mapped])
+def test_buffer_strategy(func, big_file, benchmark):
+    digest = benchmark.pedantic(func, args=(big_file,), rounds=3)
+    assert digest == compute_digest(big_file, "md5")
+
+
+def two_passes(file):
+    return {func: compute_digest(file, func) for func in ("md5", "sha256")}
+
+
+def single_pass(file):
+    return compute_digests(file, ("md5", "sha256"))
+
+
+@pytest.mark.parametrize("func", [two_passes, single_pass])
+def test_several_digests(func, big_file, benchmark):
+    digests = benchmark.pedantic(func, args=(big_file,), rounds=3)
+    assert digests == two_passes(big_file)
+
+
+@pytest.fixture(scope="module")
+def local(tmp_path_factory):
+    folder = tmp_path_factory.mktemp("files")
+    for idx in range(FILES):
+        (folder / f"file-{idx}.bin").write_bytes(bytes([idx]) * (SIZE // FILES))
+    return LocalClient(folder)
+
+
+def serial(local):
+    return [info.get_digest() for info in local.get_children_info(Path("."))]
+
+
+def pool(local):
+    infos = local.get_children_info(Path("."))
+    HashingService().prefetch(infos)
+    return [info.get_digest() for info in infos]
+
+
+@pytest.mark.parametrize("func", [serial, pool])
+def test_several_files(func, local, benchmark):
+    digests = benchmark.pedantic(func, args=(local,), rounds=3)
+    assert digests == serial(local)
@@ -0,0 +1,80 @@
+"""
+Reuse a content already synchronized instead of downloading it again.
+
+- The lookup of a synchronized file with the same digest, in a database of
+  100,000 pairs, without and with the idx_states_duplicates index.
+- The copy of a 256 MiB file: a buffered copy, shutil.copyfile() (sendfile()
+  on GNU/Linux), and clone_file() (a reflink on Btrfs/XFS, else
+  copy_file_range()). A reflink does not depend on the file size: on ext4,
+  only the in-kernel copy is measured.
+"""
+import os
+import shutil
+from hashlib import md5
+
+import pytest
+
+from nxdrive.constants import FILE_BUFFER_SIZE
+from nxdrive.dao.engine import EngineDAO
+from nxdrive.utils import clone_file
+
+PAIRS = 100_000
+SIZE = 256 * 1024 * 1024
+
+
+@pytest.fixture(scope="module")
+def dao(tmp_path_factory):
+    dao = EngineDAO(tmp_path_factory.mktemp("duplicates") / "ndrive.db")
+    c = dao._get_write_connection().cursor()
+    c.executemany(
+        "INSERT INTO States (local_path, local_parent_path, folderish,"
+        " local_digest, remote_digest, pair_state) VALUES (?, '/', 0, ?, ?, ?)",
+        (
+            (
+                f"/file-{idx}.bin",
+                md5(str(idx).encode()).hexdigest(),
+                md5(str(idx).encode()).hexdigest(),
+                "synchronized" if idx % 10 else "remotely_modified",
+            )
+            for idx in range(PAIRS)
+        ),
+    )
+    yield dao
+    dao.dispose()
+
+
+def lookups(dao):
+    for idx in range(1, PAIRS, PAIRS // 100):
+        assert dao.get_valid_duplicate_file(md5(str(idx).encode()).hexdigest())
+
+
+@pytest.mark.parametrize("indexed", [False, True])
+def test_lookup(indexed, dao, benchmark):
+    c = dao._get_write_connection().cursor()
+    if indexed:
+        dao._create_state_indexes(c)
+    else:
+        c.execute("DROP INDEX IF EXISTS idx_states_duplicates")
+    benchmark.pedantic(lookups, args=(dao,), rounds=3)
+
+
+@pytest.fixture(scope="module")
+def src(tmp_path_factory):
+    file = tmp_path_factory.mktemp("copies") / "src.bin"
+    chunk = os.urandom(FILE_BUFFER_SIZE)
+    with file.open("wb") as f:
+        for _ in range(SIZE // FILE_BUFFER_SIZE):
+            f.write(chunk)
+    return file
+
+
+def buffered(src, dst):
+    with src.open("rb") as fsrc, dst.open("wb") as fdst:
+        shutil.copyfileobj(fsrc, fdst, FILE_BUFFER_SIZE)
+
+
+@pytest.mark.parametrize("func", [buffered, shutil.copyfile, clone_file])
+def test_copy(func, src, benchmark):
+    dst = src.with_name(f"dst-{func.__name__}.bin")
+    benchmark.pedantic(func, args=(src, dst), rounds=3)
+    assert dst.stat().st_size == SIZE
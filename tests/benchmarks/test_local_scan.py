@@ -0,0 +1,142 @@
+"""
+Full local scan of an unchanged tree of 200,000 files: compare the former
+serial scan (Path.iterdir() then get_info() on each child, one database
+query per folder) against the os.scandir() based one, serial and parallel.
+"""
+import os
+import sqlite3
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+from nxdrive.client.local import LocalClient
+from nxdrive.constants import ROOT
+from nxdrive.dao.engine import EngineDAO
+from nxdrive.engine.watcher import local_watcher
+from nxdrive.engine.watcher.local_watcher import LocalWatcher
+
+FOLDERS = 20
+SUBFOLDERS = 10
+FILES_PER_FOLDER = 1_000  # 200,000 files
+
+
+def _paths():
+    """Paths of the tree, a folder before its children."""
+    for folder in range(FOLDERS):
+        parent = Path(f"folder-{folder}")
+        yield parent
+        for subfolder in range(SUBFOLDERS):
+            path = parent / f"sub-{subfolder}"
+            yield path
+            for file in range(FILES_PER_FOLDER):
+                yield path / f"file-{file}.txt"
+
+
+def _create_tree(root):
+    for path in _paths():
+        if path.suffix:
+            (root / path).write_bytes(b"data")
+        else:
+            (root / path).mkdir()
+
+
+def _rows(root):
+    """Generate the synchronized pairs of the tree, once it is complete:
+    creating children changes the modification time of their folder."""
+    for path in _paths():
+        yield _row(root, path)
+
+
+def _row(root, path):
+    mtime = datetime.utcfromtimestamp((root / path).stat().st_mtime)
+    return (
+        f"/{path.as_posix()}",
+        f"/{path.parent.as_posix()}".replace("/.", "/"),
+        path.name,
+        int((root / path).is_dir()),
+        str(mtime),
+    )
+
+
+@pytest.fixture(scope="module")
+def tree(tmp_path_factory):
+    root = tmp_path_factory.mktemp("scan")
+    local = root / "local"
+    local.mkdir()
+    _create_tree(local)
+    db = root / "ndrive_scan.db"
+    EngineDAO(db).dispose()
+    with sqlite3.connect(db) as conn:
+        conn.executemany(
+            "INSERT INTO States (local_path, local_parent_path, local_name, folderish,"
+            " last_local_updated, local_state, remote_state, pair_state)"
+            " VALUES (?, ?, ?, ?, ?, 'synchronized', 'synchronized', 'synchronized')",
+            _rows(local),
+        )
+    conn.close()
+
+    dao = EngineDAO(db)
+    yield LocalClient(local), dao
+    dao.dispose()
+
+
+class Watcher:
+    """Only what the scan needs from a LocalWatcher."""
+
+    _scan_recursive = LocalWatcher._scan_recursive
+    _scan_folder = LocalWatcher._scan_folder
+    _prefetch_digests = LocalWatcher._prefetch_digests
+
+    def __init__(self, local, dao):
+        self.local = local
+        self.dao = dao
+        self._metrics = defaultdict(int)
+        self._delete_files = {}
+        self._protected_files = {}
+        self._scan_db_children = {}
+        self.folders = 0
+
+    def _interact(self):
+        self.folders += 1
+
+
+class FormerWatcher(Watcher):
+    """The former implementation."""
+
+    def _children_info(self, ref):
+        local = self.local
+        return [
+            local.get_info(ref / child.name)
+            for child in sorted(local.abspath(ref).iterdir())
+            if not (local.is_ignored(ref, child.name) or local.is_temp_file(child))
+        ]
+
+    def _scan_recursive(self, info, /, *, recursive=True):
+        self._interact()
+        db_children = self.dao.get_local_children(info.path)
+        fs_children_info = self._children_info(info.path)
+        to_scan_new, to_scan = self._scan_folder(info, fs_children_info, db_children)
+        for child_info in to_scan_new + to_scan:
+            self._scan_recursive(child_info)
+
+
+@pytest.mark.parametrize("model", ["former", "scandir", "parallel"])
+def test_full_scan(model, tree, benchmark, monkeypatch):
+    local, dao = tree
+    if model == "scandir":
+        monkeypatch.setattr(local_watcher, "SCAN_THREADS", 1)
+
+    def scan():
+        watcher = (FormerWatcher if model == "former" else Watcher)(local, dao)
+        watcher._scan_recursive(local.get_info(ROOT))
+        return watcher
+
+    watcher = benchmark.pedantic(scan, rounds=2)
+
+    # Nothing changed, every folder was scanned
+    assert watcher.folders == 1 + FOLDERS * (1 + SUBFOLDERS)
+    assert not any(watcher._metrics.values())
+    assert not watcher._delete_files
+    benchmark.extra_info["cpus"] = os.cpu_count()
@@ -0,0 +1,73 @@
+"""
+Start the QueueManager with 300,000 pairs to handle: compare the former
+in-memory queues, filled with every pair at startup, against the paged
+queues backed by the database.
+"""
+import sqlite3
+from queue import Queue
+from unittest.mock import Mock
+
+import pytest
+
+from nxdrive.dao.engine import EngineDAO
+from nxdrive.engine.queue_manager import QueueItem, QueueManager
+
+ROWS = 300_000
+FILES_PER_FOLDER = 1_000
+
+
+def _rows(count):
+    for folder in range(count // FILES_PER_FOLDER):
+        yield (f"/folder-{folder}", "/", 1, 0, "synchronized")
+        for file in range(FILES_PER_FOLDER - 1):
+            state = "remotely_modified" if file % 2 else "locally_modified"
+            yield (
+                f"/folder-{folder}/file-{file}",
+                f"/folder-{folder}",
+                0,
+                (file * 7919) % 100_000,
+                state,
+            )
+
+
+@pytest.fixture(scope="module")
+def dao(tmp_path_factory):
+    db = tmp_path_factory.mktemp("dao") / "ndrive_queue.db"
+    EngineDAO(db).dispose()
+    with sqlite3.connect(db) as conn:
+        conn.executemany(
+            "INSERT INTO States (local_path, local_parent_path, folderish, size,"
+            " pair_state) VALUES (?, ?, ?, ?, ?)",
+            _rows(ROWS),
+        )
+    conn.close()
+
+    dao = EngineDAO(db)
+    yield dao
+    dao.dispose()
+
+
+def _start_in_memory(dao):
+    """The former implementation: load and push every pair."""
+    queues = {key: Queue() for key in ("local", "remote")}
+    c = dao._get_read_connection().cursor()
+    query = (
+        "SELECT id, local_path, local_parent_path, folderish, pair_state FROM States"
+        f" WHERE {dao._get_to_sync_condition()}"
+        " ORDER BY local_path ASC"
+    )
+    for pair in c.execute(query).fetchall():
+        side = "local" if pair.pair_state.startswith("locally") else "remote"
+        queues[side].put(QueueItem(pair.id, pair.folderish, pair.pair_state))
+    return queues["local"].get()
+
+
+def _start_paged(dao):
+    manager = QueueManager(Mock(), dao)
+    return manager._get_local_file()
+
+
+@pytest.mark.parametrize("func", [_start_in_memory, _start_paged])
+def test_startup_first_item(func, dao, benchmark):
+    item = benchmark.pedantic(func, args=(dao,), rounds=3)
+    assert item.pair_state == "locally_modified"
@@ -0,0 +1,115 @@
+"""
+Handle 20,000 no-op pairs with 4 processors: compare the former polling
+processors, ending on an empty queue and re-created on new items, against
+the long-lived processors waiting for new items on a condition variable.
+"""
+from queue import Empty, Queue
+from threading import Lock, Thread
+from time import sleep
+from unittest.mock import Mock
+
+import pytest
+
+from nxdrive.dao.engine import EngineDAO
+from nxdrive.engine.queue_manager import QueueItem, QueueManager
+from nxdrive.options import Options
+
+ITEMS = 20_000
+PROCESSORS = 4
+BURST = 1_000  # Items are pushed by bursts, like a scan does
+
+
+class PollingQueueManager:
+    """The former implementation."""
+
+    def __init__(self):
+        self.queue = Queue()
+        self.threads = []
+        self.handled = 0
+        self.lock = Lock()
+
+    def push(self, item):
+        self.queue.put(item)
+        # newItem -> launch_processors()
+        self.threads = [thread for thread in self.threads if thread.is_alive()]
+        while len(self.threads) < PROCESSORS:
+            thread = Thread(target=self.processor)
+            thread.start()
+            self.threads.append(thread)
+
+    def _get(self):
+        if self.queue.empty():
+            return None
+        try:
+            return self.queue.get(True, 3)
+        except Empty:
+            return None
+
+    def processor(self):
+        while self._get():
+            with self.lock:
+                self.handled += 1
+
+    def run(self):
+        for idx in range(ITEMS):
+            self.push(QueueItem(idx, False, "locally_modified"))
+            if idx % BURST == 0:
+                sleep(0.001)
+        while self.handled < ITEMS:
+            sleep(0.001)
+
+
+class WakeupQueueManager:
+    def __init__(self, dao):
+        self.manager = QueueManager(Mock(), dao)
+        self.handled = 0
+        self.lock = Lock()
+        self.threads = [Thread(target=self.processor) for _ in range(PROCESSORS)]
+        for thread in self.threads:
+            thread.start()
+
+    def processor(self):
+        while self.handled < ITEMS:
+            if self.manager._next_item(self.manager._get_file):
+                with self.lock:
+                    self.handled += 1
+
+    def run(self):
+        for idx in range(ITEMS):
+            self.manager.push_ref(idx, False, "locally_modified")
+            if idx % BURST == 0:
+                sleep(0.001)
+        while self.handled < ITEMS:
+            sleep(0.001)
+        # Release idle processors
+        self.manager._wake_up()
+        for thread in self.threads:
+            thread.join()
+
+
+@pytest.fixture(scope="module")
+def dao(tmp_path_factory):
+    dao = EngineDAO(tmp_path_factory.mktemp("dao") / "ndrive_wakeup.db")
+    yield dao
+    dao.dispose()
+
+
+@Options.mock()
+@pytest.mark.parametrize("model", ["polling", "wakeup"])
+def test_handle_items(model, dao, benchmark):
+    # All items in memory, there are no pairs in the database
+    Options.queue_buffer_size = ITEMS
+
+    def setup():
+        impl = PollingQueueManager() if model == "polling" else WakeupQueueManager(dao)
+        return (impl,), {}
+
+    def run(impl):
+        impl.run()
+        return impl
+
+    impl = benchmark.pedantic(run, setup=setup, rounds=3)
+    assert impl.handled == ITEMS
+    if benchmark.stats:
+        # None with --benchmark-disable
+        benchmark.extra_info["items_per_second"] = ITEMS / benchmark.stats.stats.mean
@@ -0,0 +1,85 @@
+"""
+Replay a change summary of 100,000 events on 20,000 documents, as the
+RemoteWatcher does: skip events of documents already refreshed, and events
+of filtered documents. Compare the former checks (all refreshed references
+compared with endswith(), all filters with startswith()) against the hashed
+references and the FilterTrie.
+
+The summary is synthetic, shaped like a real one: most recent events first,
+full references in events of existing documents and partial ones in events
+of deleted documents.
+"""
+import random
+
+import pytest
+
+from nxdrive.engine.watcher.remote_watcher import _ref_endings
+from nxdrive.objects import FilterTrie
+
+EVENTS = 100_000
+DOCUMENTS = 20_000
+FILTERS = 500
+FACTORY = "defaultFileSystemItemFactory#default#"
+ROOT = "/org.nuxeo.drive.service.impl.DefaultTopLevelFolderItemFactory#"
+
+
+def _path(doc):
+    return f"{ROOT}/ws-{doc % 100}/folder-{doc % 1000}/{FACTORY}{doc}"
+
+
+@pytest.fixture(scope="module")
+def summary():
+    rnd = random.Random(42)
+    changes = []
+    for event in range(EVENTS):
+        doc = rnd.randrange(DOCUMENTS)
+        deleted = rnd.random() < 0.05
+        changes.append(
+            {
+                "eventDate": EVENTS - event,
+                "fileSystemItemId": f"default#{doc}" if deleted else f"{FACTORY}{doc}",
+                "path": _path(doc),
+            }
+        )
+    filters = [
+        f"{ROOT}/ws-{ws % 100}/folder-{ws}/" for ws in rnd.sample(range(1000), FILTERS)
+    ]
+    return changes, filters
+
+
+def replay_former(changes, filters):
+    refreshed = set()
+    for change in changes:
+        remote_ref = change["fileSystemItemId"]
+        if any(refreshed_ref.endswith(remote_ref) for refreshed_ref in refreshed):
+            continue
+        path = f"{change['path']}/"
+        if any(path.startswith(_filter) for _filter in filters):
+            continue
+        refreshed.add(remote_ref)
+    return len(refreshed)
+
+
+def replay(changes, filters):
+    refreshed = set()
+    handled = 0
+    trie = FilterTrie(filters)
+    for change in changes:
+        remote_ref = change["fileSystemItemId"]
+        if remote_ref in refreshed:
+            continue
+        if change["path"] in trie:
+            continue
+        refreshed.update(_ref_endings(remote_ref))
+        handled += 1
+    return handled
+
+
+@pytest.mark.parametrize("model", ["former", "hashed"])
+def test_replay_changes(model, summary, benchmark):
+    changes, filters = summary
+    func = replay_former if model == "former" else replay
+    handled = benchmark.pedantic(func, args=(changes, filters), rounds=1)
+
+    # Both skip the same events
+    assert handled == replay(changes, filters)
@@ -0,0 +1,91 @@
+"""
+Download a file from a local stand-in server honouring byte ranges, with a
+bandwidth limit on each connection, as seen with many proxies and remote
+servers. Compare the download of the whole file in one stream against the
+download of segments from several connections (the SegmentedDownloader).
+"""
+import re
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from threading import Thread
+from time import sleep
+
+import pytest
+import requests
+
+from nxdrive.client.segments import SegmentedDownloader, SegmentMap, preallocate
+from nxdrive.engine.activity import Action, DownloadAction
+
+SIZE = 16 * 1024 * 1024
+SEGMENT_SIZE = 2 * 1024 * 1024
+BANDWIDTH = 16 * 1024 * 1024  # bytes per second and per connection
+BLOCK = 64 * 1024
+CONTENT = bytes(range(256)) * (SIZE // 256)
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        start, end = 0, SIZE - 1
+        match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if match:
+            start = int(match.group(1))
+            end = int(match.group(2) or end)
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{SIZE}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+
+        for offset in range(start, end + 1, BLOCK):
+            self.wfile.write(CONTENT[offset : min(offset + BLOCK, end + 1)])
+            sleep(BLOCK / BANDWIDTH)
+
+
+@pytest.fixture(scope="module")
+def url():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    httpd.daemon_threads = True
+    Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_port}/file"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def download_stream(session, url, file_out):
+    with session.get(url, stream=True) as resp, file_out.open("wb") as f:
+        for chunk in resp.iter_content(chunk_size=BLOCK):
+            f.write(chunk)
+
+
+def download_segments(session, url, file_out, workers):
+    def fetch(start, end):
+        headers = {"Range": f"bytes={start}-{end}"}
+        return session.get(url, headers=headers, stream=True)
+
+    preallocate(file_out, SIZE)
+    segments = SegmentMap(SIZE, SEGMENT_SIZE)
+    action = DownloadAction(Path("file"), SIZE)
+    try:
+        SegmentedDownloader(segments, file_out, fetch, workers=workers).run(action)
+    finally:
+        Action.finish_action()
+
+
+@pytest.mark.parametrize("workers", [1, 4, 8])
+def test_download(workers, url, tmp_path, benchmark):
+    file_out = tmp_path / "file.tmp"
+    with requests.Session() as session:
+        if workers == 1:
+            args = (session, url, file_out)
+            benchmark.pedantic(download_stream, args=args, rounds=3)
+        else:
+            args = (session, url, file_out, workers)
+            benchmark.pedantic(download_segments, args=args, rounds=3)
+
+    assert file_out.read_bytes() == CONTENT
@@ -0,0 +1,171 @@
+"""
+Direct Transfer of 200 files of 1 KiB, to a local stand-in of the Nuxeo batch
+upload API answering each request after 5 ms.
+
+The former implementation sent each file with its own batch: one request to
+create the batch, one to upload the blob, one to create the document, along
+with the transfer saved in the database. The small files mode uploads the
+blobs of up to 50 files in one batch, creates their documents with one
+request, and saves their results in one transaction.
+
+Files sent per second are in the "extra_info" of the results.
+"""
+import json
+import re
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from time import perf_counter, sleep
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+from nuxeo.client import Nuxeo
+
+from nxdrive.client.uploader.direct_transfer import DirectTransferUploader
+from nxdrive.dao.engine import EngineDAO
+from nxdrive.utils import grouper
+
+FILES = 200
+SIZE = 1024
+LATENCY = 0.005
+BATCH_SIZE = 50
+
+
+class StandIn(BaseHTTPRequestHandler):
+    """The batch upload endpoints, documents are only counted."""
+
+    blobs = {}
+
+    def log_message(self, *_):
+        pass
+
+    def _reply(self, data):
+        sleep(LATENCY)
+        body = json.dumps(data).encode()
+        self.send_response(201)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _document(self):
+        return {"entity-type": "document", "uid": str(uuid4()), "facets": []}
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        path = self.path.split("/upload", 1)[1].strip("/")
+
+        if not path:
+            batch_id = str(uuid4())
+            self.blobs[batch_id] = 0
+            self._reply({"batchId": batch_id})
+        elif match := re.fullmatch(r"([^/]+)/(\d+)", path):
+            self.blobs[match[1]] += 1
+            self._reply(
+                {
+                    "uploaded": "true",
+                    "fileIdx": match[2],
+                    "uploadedSize": str(length),
+                    "uploadType": "normal",
+                }
+            )
+        elif match := re.fullmatch(r"([^/]+)/\d+/execute/.+", path):
+            self._reply(self._document())
+        elif match := re.fullmatch(r"([^/]+)/execute/.+", path):
+            entries = [self._document() for _ in range(self.blobs[match[1]])]
+            self._reply({"entity-type": "documents", "entries": entries})
+
+
+@pytest.fixture(scope="module")
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_port}/nuxeo/"
+    httpd.shutdown()
+
+
+@pytest.fixture(scope="module")
+def files(tmp_path_factory):
+    folder = tmp_path_factory.mktemp("small-files")
+    files = []
+    for idx in range(FILES):
+        file = folder / f"file-{idx}.txt"
+        file.write_bytes(b"x" * SIZE)
+        files.append(file)
+    return files
+
+
+def planned(tmp_path, server, files, idx):
+    """A database with the Direct Transfer of all *files* planned."""
+    dao = EngineDAO(tmp_path / f"ndrive-{idx}.db")
+    session = dao.create_session("/ws", "ws-ref", FILES, "engine", "small-files")
+    dao.plan_many_direct_transfer_items(
+        tuple(
+            (
+                file.as_posix(),
+                file.parent.as_posix(),
+                file.name,
+                False,
+                SIZE,
+                "/ws",
+                "ws-ref",
+                None,
+                "create",
+                "unknown",
+            )
+            for file in files
+        ),
+        session,
+    )
+    nuxeo = Nuxeo(host=server, auth=("user", "password"))
+    remote = SimpleNamespace(
+        dao=dao,
+        client=nuxeo.client,
+        uploads=nuxeo.uploads,
+        execute=lambda **kwargs: nuxeo.operations.execute(check_params=False, **kwargs),
+        upload_callback=(),
+    )
+    doc_pairs = [dao.get_state_from_local(file) for file in files]
+    return DirectTransferUploader(remote), doc_pairs
+
+
+def one_batch_per_file(uploader, doc_pairs, files):
+    dao = uploader.dao
+    for file, doc_pair in zip(files, doc_pairs):
+        uploader.upload(file, doc_pair=doc_pair, engine_uid="engine")
+        # As Processor._direct_transfer_end() does
+        with dao.batch():
+            dao.remove_transfer("upload", doc_pair=doc_pair.id, is_direct_transfer=True)
+            dao.remove_state(doc_pair, recursive=False)
+        dao.update_session(doc_pair.session)
+
+
+def small_files(uploader, doc_pairs, files):
+    dao = uploader.dao
+    for group in grouper(list(zip(files, doc_pairs)), BATCH_SIZE):
+        docs = uploader.upload_small_files(list(group), engine_uid="engine")
+        # As Processor._direct_transfer_small_files() does
+        with dao.batch():
+            for (_, doc_pair), doc in zip(group, docs):
+                dao.save_session_item(doc_pair.session, doc)
+                dao.remove_state(doc_pair, recursive=False)
+        dao.update_session(group[0][1].session, count=len(group))
+
+
+@pytest.mark.parametrize("func", [one_batch_per_file, small_files])
+def test_upload(func, server, files, tmp_path, benchmark):
+    durations = []
+
+    def setup():
+        return planned(tmp_path, server, files, len(durations)), {}
+
+    def run(uploader, doc_pairs):
+        start = perf_counter()
+        func(uploader, doc_pairs, files)
+        durations.append(perf_counter() - start)
+        assert uploader.dao.get_session(1).uploaded_items == FILES
+        uploader.dao.dispose()
+
+    benchmark.pedantic(run, setup=setup, rounds=3)
+    benchmark.extra_info["files_per_second"] = FILES / min(durations)
@@ -39,6 +39,9 @@ def buggy_db(database, *args, **kwargs):
 
     monkeypatch.setattr("nxdrive.dao.base.fix_db", buggy_db)
 
+    # Simulate a crash, databases are not checked after a clean shutdown
+    (home / "manager.db.shutdown").unlink()
+
     # Before NXDRIVE-1574, there was an error when restoring the DB:
     #    AttributeError: 'ManagerDAO' object has no attribute '_lock'
     # This should not be the case anymore.
@@ -53,6 +56,7 @@ def restore_db(self):
 
     restored = False
     monkeypatch.setattr(BaseDAO, "restore_backup", restore_db)
+    (home / "manager.db.shutdown").unlink()
 
     with manager_factory(home=home, with_engine=False) as manager:
         assert (home / "manager.db").exists()
@@ -68,23 +72,24 @@ def test_delete_old_backups(tmp):
     db.touch()
 
     today = int(datetime.now().timestamp())
-    yesterday = today - 86400
+    # The start of the day before yesterday (backups are kept by periods since epoch)
+    older = (today // 86400 - 2) * 86400
 
     for i in range(3):
         # Creating 3 files with timestamps of today
         (backups / f"manager.db_{today - i * 1000}").touch()
-        # And 3 files with timestamps of yesterday
-        (backups / f"manager.db_{yesterday - i * 1000}").touch()
+        # And 3 files with timestamps of the same older day
+        (backups / f"manager.db_{older + i * 1000}").touch()
 
     sleep(1)
     nxdrive.dao.utils.save_backup(db)
 
     remaining_backups = sorted(backups.glob("manager.db_*"))
 
-    # # of the previous ones should remain + the new one
-    assert len(remaining_backups) == 4
-    # The oldest should be more recent than the yesterday timestamp
-    assert int(remaining_backups[0].name.split("_")[-1]) > yesterday
+    # The ones of today should remain, only the most recent of the older
+    # day is kept, + the new one
+    assert len(remaining_backups) == 5
+    assert remaining_backups[0].name == f"manager.db_{older + 2000}"
     # The newest should be more recent than the today timestamp
     assert int(remaining_backups[-1].name.split("_")[-1]) > today
 
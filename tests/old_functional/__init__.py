@@ -26,7 +26,7 @@ def patch_nxdrive_objects():
     # will not work.
     import nxdrive.dao.utils
 
-    nxdrive.dao.utils.save_backup = lambda *args: True
+    nxdrive.dao.utils.save_backup = lambda *args, **kwargs: True
 
     from nxdrive.poll_workers import ServerOptionsUpdater
 
@@ -58,6 +58,8 @@ def requeue_errors(self) -> None:
         with self._error_lock:
             for doc_pair in self._on_error_queue.values():
                 doc_pair.error_next_try = 0
+                self._on_error_queue.schedule(doc_pair.id, doc_pair, 0)
+        self._arm_error_timer()
 
     Manager.dispose_all = dispose_all
     Manager.unbind_all = unbind_all
@@ -1,8 +1,10 @@
 from pathlib import Path
 from time import sleep
+from unittest.mock import Mock
 
 import pytest
 
+from nxdrive.direct_edit import DirectEdit
 from nxdrive.engine.blocklist_queue import BlocklistItem, BlocklistQueue
 
 
@@ -47,3 +49,16 @@ def test_delay():
     assert item.path == Path("Item2")
     assert item.count == 3
     assert not list(queue.get())
+
+
+def test_direct_edit_metrics(tmp_path):
+    direct_edit = DirectEdit(Mock(), tmp_path)
+    metrics = direct_edit.get_metrics()
+    assert metrics["error_queue_due"] == 0
+    assert metrics["error_queue_parked"] == 0
+
+    # A document failed to be uploaded, it waits for its next try
+    direct_edit._error_queue.push(Path("Item1"))
+    metrics = direct_edit.get_metrics()
+    assert metrics["error_queue_due"] == 0
+    assert metrics["error_queue_parked"] == 1
@@ -1,12 +1,20 @@
+from threading import Lock
+from time import sleep
+from types import SimpleNamespace
 from unittest.mock import Mock
 from uuid import uuid4
 
 import pytest
 import requests
-from nuxeo.models import FileBlob
+from nuxeo.exceptions import HTTPError
+from nuxeo.handlers.default import ChunkUploader
+from nuxeo.handlers.s3 import ChunkUploaderS3
+from nuxeo.models import Batch, FileBlob
 
 from nxdrive.client.remote_client import Remote
 from nxdrive.client.uploader import BaseUploader
+from nxdrive.client.uploader.chunks import ChunkEngineS3, get_chunk_engine
+from nxdrive.client.uploader.direct_transfer import DirectTransferUploader
 
 
 @pytest.fixture
@@ -48,3 +56,177 @@ def mock_transfer_autoType_file(*args, **kwargs):
         baseuploader.link_blob_to_doc(
             "Filemanager.Import", upload, FileBlob(str(file)), False
         )
+
+
+class FakeServer:
+    """Store chunks as a batch handler does, and count parallel requests."""
+
+    def __init__(self, *, drop=()):
+        self.chunks = {}
+        self.drop = set(drop)
+        self.running = self.max_running = 0
+        self.lock = Lock()
+
+    def store(self, index, data):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        sleep(0.05)
+        with self.lock:
+            self.running -= 1
+            if index in self.drop:
+                # Lost once, it has to be sent again
+                self.drop.remove(index)
+            else:
+                self.chunks[index] = data
+            return sorted(self.chunks)
+
+    def send_data(self, name, data, path, chunked, index, headers, **kwargs):
+        uploaded = self.store(index, data)
+        return Mock(fileIdx="0", uploadedChunkIds=[str(idx) for idx in uploaded])
+
+    def upload_part(self, PartNumber, Body, **kwargs):
+        self.store(PartNumber, Body)
+        return {"ETag": f"etag-{PartNumber}"}
+
+    def content(self):
+        return b"".join(self.chunks[index] for index in sorted(self.chunks))
+
+
+def _service(server, chunk_count):
+    service = Mock(headers={}, send_data=server.send_data)
+    service.state.side_effect = lambda *_, **__: (chunk_count, sorted(server.chunks))
+    return service
+
+
+@pytest.mark.parametrize("drop", [(), (3, 7)])
+def test_chunk_engine(tmp_path, drop):
+    file = tmp_path / "file.bin"
+    file.write_bytes(bytes(range(256)) * 4)
+    server = FakeServer(drop=drop)
+    service = _service(server, 16)
+    uploader = ChunkUploader(service, Batch(batchId="batch"), FileBlob(str(file)), 64)
+
+    progress = [
+        len(up.blob.uploadedChunkIds)
+        for up in get_chunk_engine(uploader, workers=4).iter_upload()
+    ]
+
+    assert server.max_running == 4
+    assert len(progress) == 16 + len(drop)
+    assert server.content() == file.read_bytes()
+    assert uploader.is_complete()
+    assert uploader.batch.blobs[0] is uploader.blob
+
+
+def test_chunk_engine_resume(tmp_path):
+    file = tmp_path / "file.bin"
+    file.write_bytes(bytes(range(256)) * 4)
+    server = FakeServer()
+    server.chunks = {
+        idx: file.read_bytes()[idx * 64 : (idx + 1) * 64] for idx in range(10)
+    }
+    service = _service(server, 16)
+    uploader = ChunkUploader(service, Batch(batchId="batch"), FileBlob(str(file)), 64)
+
+    sent = [
+        up.blob.uploadedChunkIds[-1]
+        for up in get_chunk_engine(uploader, workers=4).iter_upload()
+    ]
+
+    # Only the missing chunks were sent
+    assert len(sent) == 6
+    assert server.content() == file.read_bytes()
+    assert uploader.is_complete()
+
+
+def test_chunk_engine_s3(tmp_path):
+    part_size = 5 * 1024 * 1024
+    file = tmp_path / "file.bin"
+    file.write_bytes(b"".join(bytes([idx]) * part_size for idx in range(4)) + b"end")
+    server = FakeServer()
+    s3_client = Mock(upload_part=server.upload_part)
+    s3_client.create_multipart_upload.return_value = {"UploadId": "mpu"}
+    s3_client.complete_multipart_upload.return_value = {"ETag": "final"}
+    batch = Batch(
+        batchId="batch",
+        extraInfo={"bucket": "bucket", "baseKey": "base/", "region": "eu-west-1"},
+        key="key",
+    )
+    uploader = ChunkUploaderS3(
+        Mock(headers={}), batch, FileBlob(str(file)), part_size, s3_client=s3_client
+    )
+
+    engine = get_chunk_engine(uploader, workers=3)
+    assert isinstance(engine, ChunkEngineS3)
+    assert len(list(engine.iter_upload())) == 5
+
+    assert server.max_running == 3
+    assert server.content() == file.read_bytes()
+    assert batch.etag == "final"
+
+    # Parts are listed in order, whatever the order they were sent
+    parts = s3_client.complete_multipart_upload.call_args.kwargs["MultipartUpload"]
+    assert parts["Parts"] == [
+        {"ETag": f"etag-{idx}", "PartNumber": idx} for idx in range(1, 6)
+    ]
+
+
+def _small_files(tmp_path, count):
+    files = []
+    for idx in range(count):
+        file = tmp_path / f"file-{idx}.txt"
+        file.write_bytes(b"x" * idx)
+        doc_pair = SimpleNamespace(
+            id=idx + 1,
+            session=1,
+            remote_parent_path="/default-domain/ws",
+            remote_parent_ref="ws-ref",
+            duplicate_behavior="override",
+        )
+        files.append((file, doc_pair))
+    return files
+
+
+def _small_files_uploader(entries):
+    client = Mock(api_path="api/v1")
+    client.request.return_value.json.return_value = entries
+    remote = SimpleNamespace(
+        dao=Mock(),
+        client=client,
+        uploads=Mock(**{"batch.return_value": Batch(batchId="batch-id")}),
+    )
+    uploader = DirectTransferUploader(remote)
+    uploader.upload_chunks = Mock()
+    return uploader
+
+
+def test_upload_small_files(tmp_path):
+    files = _small_files(tmp_path, 3)
+    docs = [{"uid": f"doc-{idx}"} for idx in range(3)]
+    uploader = _small_files_uploader({"entity-type": "documents", "entries": docs})
+
+    assert uploader.upload_small_files(files, engine_uid="engine") == docs
+
+    # One batch, one blob upload by file, one call to create all documents
+    uploader.remote.uploads.batch.assert_called_once()
+    uploaded = [call.args[0] for call in uploader.upload_chunks.call_args_list]
+    assert [transfer.path for transfer in uploaded] == [file for file, _ in files]
+    assert {transfer.batch_obj.uid for transfer in uploaded} == {"batch-id"}
+    assert not uploader.dao.save_dt_upload.called
+
+    (method, path), kwargs = uploader.remote.client.request.call_args
+    assert method == "POST"
+    assert path == "api/v1/upload/batch-id/execute/FileManager.Import"
+    assert kwargs["data"] == {
+        "params": {"overwite": True},
+        "context": {"currentDocument": "/default-domain/ws"},
+    }
+
+
+def test_upload_small_files_missing_documents(tmp_path):
+    files = _small_files(tmp_path, 2)
+    uploader = _small_files_uploader({"entity-type": "document", "uid": "doc"})
+
+    with pytest.raises(HTTPError):
+        uploader.upload_small_files(files)
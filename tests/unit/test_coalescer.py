@@ -0,0 +1,160 @@
+from queue import Queue
+from unittest.mock import patch
+
+import pytest
+from watchdog.events import (
+    DirCreatedEvent,
+    DirDeletedEvent,
+    DirModifiedEvent,
+    FileClosedEvent,
+    FileCreatedEvent,
+    FileDeletedEvent,
+    FileModifiedEvent,
+    FileMovedEvent,
+)
+
+from nxdrive.engine.watcher.coalescer import EventCoalescer
+
+
+def _coalesce(*events, delay=0):
+    coalescer = EventCoalescer(delay=delay)
+    for event in events:
+        coalescer.add(event, now=1)
+    return coalescer.pop_ready(now=1)
+
+
+@pytest.fixture(autouse=True)
+def trust_created():
+    # Created events are not trusted on macOS
+    with patch.object(EventCoalescer, "_trust_created", True):
+        yield
+
+
+def test_created_modified():
+    events = _coalesce(
+        FileCreatedEvent("/a"),
+        FileModifiedEvent("/a"),
+        FileClosedEvent("/a"),
+        FileModifiedEvent("/a"),
+        DirCreatedEvent("/b"),
+        DirModifiedEvent("/b"),
+    )
+    assert events == [FileCreatedEvent("/a"), DirCreatedEvent("/b")]
+
+
+def test_created_deleted():
+    events = _coalesce(
+        FileModifiedEvent("/a"),
+        FileCreatedEvent("/b"),
+        FileModifiedEvent("/b"),
+        FileDeletedEvent("/b"),
+        FileDeletedEvent("/a"),
+    )
+    assert events == [FileDeletedEvent("/a")]
+
+
+def test_deleted_created_is_kept():
+    events = _coalesce(
+        FileDeletedEvent("/a"),
+        FileCreatedEvent("/a"),
+        FileModifiedEvent("/a"),
+    )
+    assert events == [FileDeletedEvent("/a"), FileCreatedEvent("/a")]
+
+
+def test_move_chains():
+    events = _coalesce(
+        FileCreatedEvent("/a.tmp"),
+        FileMovedEvent("/a.tmp", "/a"),
+        FileMovedEvent("/b", "/c"),
+        FileMovedEvent("/c", "/d"),
+        FileMovedEvent("/e", "/f"),
+        FileMovedEvent("/f", "/e"),
+    )
+    assert events == [FileCreatedEvent("/a"), FileMovedEvent("/b", "/d")]
+
+
+def test_move_ends_merging():
+    events = _coalesce(
+        FileModifiedEvent("/a"),
+        FileMovedEvent("/b", "/a"),
+        FileModifiedEvent("/a"),
+    )
+    assert events == [
+        FileModifiedEvent("/a"),
+        FileMovedEvent("/b", "/a"),
+        FileModifiedEvent("/a"),
+    ]
+
+
+def test_created_deleted_directory():
+    events = _coalesce(
+        FileDeletedEvent("/d/old"),
+        DirCreatedEvent("/d"),
+        FileCreatedEvent("/d/f"),
+        DirCreatedEvent("/d/s"),
+        FileModifiedEvent("/d/s/g"),
+        FileMovedEvent("/x", "/d/y"),
+        FileDeletedEvent("/d/y"),
+        DirDeletedEvent("/d"),
+    )
+    # The file moved from "/x" is still gone from there
+    assert events == [FileDeletedEvent("/d/old"), FileMovedEvent("/x", "/d/y")]
+
+
+def test_debounce():
+    coalescer = EventCoalescer(delay=500)
+    queue = Queue()
+    queue.put(FileCreatedEvent("/a"))
+    queue.put(FileCreatedEvent("/b"))
+    with patch(
+        "nxdrive.engine.watcher.coalescer.current_milli_time", return_value=1_000
+    ):
+        coalescer.feed(queue)
+    coalescer.add(FileModifiedEvent("/a"), now=1_400)
+
+    # "/a" is still busy, "/b" does not have to wait for it
+    assert coalescer.pop_ready(now=1_600) == [FileCreatedEvent("/b")]
+    assert not coalescer.empty()
+    assert coalescer.pop_ready(now=1_900) == [FileCreatedEvent("/a")]
+    assert coalescer.pop_ready(now=1_900) == []
+    assert coalescer.empty()
+    assert coalescer.ratio == 1.5
+
+    # A path modified continuously is released anyway
+    for now in range(2_000, 7_100, 100):
+        coalescer.add(FileModifiedEvent("/c"), now=now)
+        if coalescer.pop_ready(now=now):
+            break
+    assert now == 7_000
+
+
+def test_related_events_wait():
+    coalescer = EventCoalescer(delay=500)
+    for event in (
+        DirCreatedEvent("/a/b"),
+        FileCreatedEvent("/a/b/c"),
+        FileCreatedEvent("/a/e"),
+        FileMovedEvent("/x", "/a/b/y"),
+        FileDeletedEvent("/x"),
+        FileDeletedEvent("/a"),
+        FileCreatedEvent("/z"),
+    ):
+        coalescer.add(event, now=1_000)
+    coalescer.add(DirModifiedEvent("/a/b"), now=1_400)
+
+    # Events on "/a/b", its parents and its children wait for it, and so do
+    # events on the paths of the ones waiting
+    assert coalescer.pop_ready(now=1_600) == [
+        FileCreatedEvent("/a/e"),
+        FileCreatedEvent("/z"),
+    ]
+    assert len(coalescer) == 5
+    assert coalescer.pop_ready(now=1_900) == [
+        DirCreatedEvent("/a/b"),
+        FileCreatedEvent("/a/b/c"),
+        FileMovedEvent("/x", "/a/b/y"),
+        FileDeletedEvent("/x"),
+        FileDeletedEvent("/a"),
+    ]
+    assert coalescer.empty()
@@ -0,0 +1,66 @@
+from nxdrive.engine.delayed_queue import DelayedQueue
+
+
+def _pop_all(queue, now):
+    keys = []
+    while "there are due items":
+        item = queue.pop_due(now)
+        if not item:
+            return keys
+        keys.append(item[0])
+
+
+def test_delayed_queue_order():
+    queue = DelayedQueue()
+    assert not queue
+    assert queue.next_due() is None
+    assert not queue.pop_due(100)
+
+    queue.schedule("c", "value-c", 30)
+    queue.schedule("a", "value-a", 10)
+    queue.schedule("b", "value-b", 20)
+    queue.schedule("a2", "value-a2", 10)
+    assert len(queue) == 4
+    assert "a" in queue
+    assert queue["b"] == "value-b"
+    assert queue.next_due() == 10
+
+    # Due times must be passed, same due times keep the insertion order
+    assert not queue.has_due(10)
+    assert queue.has_due(11)
+    assert queue.due_count(21) == 3
+    assert queue.parked_count(21) == 1
+    assert _pop_all(queue, 21) == ["a", "a2", "b"]
+    assert queue.get("c") == "value-c"
+    assert _pop_all(queue, 31) == ["c"]
+    assert not queue
+
+
+def test_delayed_queue_reschedule_and_remove():
+    queue = DelayedQueue()
+    queue.schedule("a", 1, 10)
+    queue.schedule("b", 2, 20)
+
+    # Postpone "a", its former entry is ignored
+    queue.schedule("a", 3, 40)
+    assert len(queue) == 2
+    assert queue.next_due() == 20
+    assert queue.due_count(30) == 1
+
+    assert queue.remove("b") == 2
+    assert queue.remove("b") is None
+    assert queue.next_due() == 40
+    assert not queue.pop_due(30)
+    assert queue.pop_due(41) == ("a", 3)
+
+
+def test_delayed_queue_purge():
+    queue = DelayedQueue()
+    for due in range(1_000):
+        queue.schedule("key", due, due)
+
+    # Stale entries do not pile up
+    assert len(queue) == 1
+    assert len(queue._heap) < 100
+    assert queue.values() == [999]
+    assert queue.due_count(1_000) == 1
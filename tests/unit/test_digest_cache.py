@@ -0,0 +1,123 @@
+import os
+from pathlib import Path
+from time import time
+
+from nxdrive.client.local import LocalClient
+from nxdrive.engine.digest_cache import DigestCache
+from nxdrive.options import Options
+from nxdrive.utils import compute_digest
+
+# Old enough to be cached
+MTIME = time() - 3600
+
+
+def _file(path: Path, content: bytes, mtime: float = MTIME) -> Path:
+    path.write_bytes(content)
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def _count(dao) -> int:
+    c = dao._get_read_connection().cursor()
+    return c.execute("SELECT COUNT(*) FROM DigestCache").fetchone()[0]
+
+
+def test_digest_cache(engine_dao, tmp_path):
+    file = _file(tmp_path / "file.txt", b"content")
+    with engine_dao("test_engine.db") as dao:
+        cache = DigestCache(dao)
+
+        digest = cache.get_digest(file, "md5")
+        assert digest == compute_digest(file, "md5")
+        assert (cache.hits, cache.misses) == (0, 1)
+
+        # The file did not change, its digest is not computed again
+        assert cache.get_digest(file, "md5") == digest
+        assert (cache.hits, cache.misses) == (1, 1)
+
+        # Digests are cached by algorithm
+        assert cache.get_digest(file, "sha256") == compute_digest(file, "sha256")
+        assert (cache.hits, cache.misses) == (1, 2)
+
+        # A modified file has a new digest, replacing the cached one
+        _file(file, b"new content", mtime=MTIME + 1)
+        assert cache.get_digest(file, "md5") == compute_digest(file, "md5")
+        assert (cache.hits, cache.misses) == (1, 3)
+        assert _count(dao) == 2
+
+        # The cache is kept in the database
+        cache = DigestCache(dao)
+        assert cache.get_digest(file, "md5") == compute_digest(file, "md5")
+        assert cache.get_metrics() == {"digest_cache_hits": 1, "digest_cache_misses": 0}
+
+
+def test_digest_cache_recent_file(engine_dao, tmp_path):
+    """The digest of a file modified right now is not cached."""
+    file = _file(tmp_path / "file.txt", b"content", mtime=time())
+    with engine_dao("test_engine.db") as dao:
+        cache = DigestCache(dao)
+        cache.get_digest(file, "md5")
+        cache.get_digest(file, "md5")
+        assert (cache.hits, cache.misses) == (0, 2)
+        assert not _count(dao)
+
+
+def test_digest_cache_unaccessible(engine_dao, tmp_path):
+    with engine_dao("test_engine.db") as dao:
+        cache = DigestCache(dao)
+        cache.get_digest(tmp_path / "ghost.txt", "md5")
+        assert not _count(dao)
+
+
+@Options.mock()
+def test_digest_cache_disabled(engine_dao, tmp_path):
+    Options.set("digest_cache_size", 0, setter="manual")
+    file = _file(tmp_path / "file.txt", b"content")
+    with engine_dao("test_engine.db") as dao:
+        cache = DigestCache(dao)
+        assert cache.get_digest(file, "md5") == compute_digest(file, "md5")
+        assert (cache.hits, cache.misses) == (0, 0)
+        assert not _count(dao)
+
+
+@Options.mock()
+def test_digest_cache_eviction(engine_dao, tmp_path):
+    Options.set("digest_cache_size", 2, setter="manual")
+    files = [_file(tmp_path / f"file{idx}.txt", b"content" * idx) for idx in range(3)]
+    with engine_dao("test_engine.db") as dao:
+        cache = DigestCache(dao)
+        cache.evict_interval = 1
+        cache.touch_batch_size = 1
+
+        for file in files[:2]:
+            cache.get_digest(file, "md5")
+
+        # Use the first file again, the second one becomes the least recently used
+        c = dao._get_write_connection().cursor()
+        c.execute("UPDATE DigestCache SET last_used = last_used - 10")
+        cache.get_digest(files[0], "md5")
+        assert cache.hits == 1
+
+        cache.get_digest(files[2], "md5")
+        assert _count(dao) == 2
+
+        cache.get_digest(files[0], "md5")
+        cache.get_digest(files[2], "md5")
+        assert cache.hits == 3
+        cache.get_digest(files[1], "md5")
+        assert cache.misses == 4
+
+
+def test_local_client_digest_cache(engine_dao, tmp_path):
+    _file(tmp_path / "file.txt", b"content")
+    with engine_dao("test_engine.db") as dao:
+        cache = DigestCache(dao)
+        local = LocalClient(tmp_path, digest_cache=cache)
+
+        for _ in range(3):
+            info = local.get_info(Path("file.txt"))
+            assert info.get_digest() == compute_digest(info.filepath, "md5")
+        assert (cache.hits, cache.misses) == (2, 1)
+        # The digest is kept on the FileInfo, the cache is only used for the new one
+        assert local.is_equal_digests(None, info.get_digest(), Path("file.txt"))
+        assert cache.hits == 3
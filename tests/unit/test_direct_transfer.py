@@ -0,0 +1,243 @@
+from pathlib import Path
+from threading import Lock
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+import pytest
+
+from nxdrive.constants import TransferStatus
+from nxdrive.dao.engine import EngineDAO
+from nxdrive.engine.engine import Engine
+from nxdrive.engine.processor import Processor
+from nxdrive.options import Options
+
+
+@pytest.fixture()
+def planner(tmp_path):
+    dao = EngineDAO(tmp_path / "ndrive.db")
+    dao.queue_manager = Mock()
+    engine = SimpleNamespace(
+        uid="engine",
+        dao=dao,
+        doc_container_type="Folder",
+        handle_session_status=Mock(),
+        _save_last_dt_session_infos=Mock(),
+        _walk_direct_transfer=Engine._walk_direct_transfer,
+    )
+
+    def plan(local_paths):
+        Engine._direct_transfer(engine, local_paths, "/remote", "ref", "title")
+        return engine
+
+    yield plan
+    dao.dispose()
+
+
+def _tree(root):
+    for folder in ("a", "a/b", "c"):
+        (root / folder).mkdir(parents=True)
+        for idx in range(3):
+            (root / folder / f"file-{idx}.txt").write_bytes(b"x" * idx)
+    single = root.parent / "single.txt"
+    single.write_bytes(b"data")
+    return single
+
+
+@Options.mock()
+def test_direct_transfer_planning(planner, tmp_path):
+    Options.database_batch_size = 4
+    root = tmp_path / "root"
+    single = _tree(root)
+
+    engine = planner({root: 0, single: 4})
+    dao = engine.dao
+
+    # 1 + 3 folders + 9 files, and the file
+    session = dao.get_session(1)
+    assert session.total_items == session.planned_items == 14
+    assert session.description == "root (+1)"
+    assert session.status is TransferStatus.ONGOING
+
+    # Items were queued by batch, a folder always before its children
+    pushed = [call.args[0] for call in dao.queue_manager.push.call_args_list]
+    assert len(pushed) == 14
+    paths = [Path(f"/{pair.local_path}") for pair in pushed]
+    for path in paths:
+        if path not in (root, single):
+            assert paths.index(path.parent) < paths.index(path)
+
+    # Only the selected paths are waiting for nothing
+    ready = {path for path, pair in zip(paths, pushed) if pair.remote_state != "todo"}
+    assert ready == {root, single}
+    assert dao.get_state_from_local(root / "a" / "b" / "file-2.txt").size == 2
+
+    # The session is done with its last item
+    for _ in range(14):
+        session = dao.update_session(1)
+    assert session.status is TransferStatus.DONE
+
+
+def test_direct_transfer_planning_with_all_paths(planner, tmp_path):
+    """Children given along with their folder are planned only one time."""
+    root = tmp_path / "root"
+    _tree(root)
+    local_paths = {path: 0 for path in [root, *root.glob("**/*")]}
+
+    engine = planner(local_paths)
+
+    assert engine.dao.get_session(1).total_items == len(local_paths)
+    assert engine.dao.queue_manager.push.call_count == len(local_paths)
+
+
+def test_direct_transfer_planning_empty(planner, tmp_path):
+    """An ignored folder has nothing to transfer."""
+    hidden = tmp_path / ".hidden"
+    hidden.mkdir()
+    engine = planner({hidden: 0})
+
+    session = engine.dao.get_session(1)
+    assert session.total_items == 0
+    assert session.status is TransferStatus.CANCELLED
+    engine.handle_session_status.assert_called_once()
+
+
+def _acquire(dao, path):
+    return dao.acquire_state(FolderCreator.thread_id, dao.get_state_from_local(path).id)
+
+
+class FolderCreator:
+    """The Direct Transfer folders creation stage of a Processor."""
+
+    thread_id = 42
+    dt_folders_per_level = Processor.dt_folders_per_level
+    _direct_transfer_folders = Processor._direct_transfer_folders
+    _direct_transfer_folders_level = Processor._direct_transfer_folders_level
+    _direct_transfer_folders_created = Processor._direct_transfer_folders_created
+    _create_dt_folder = Processor._create_dt_folder
+
+    def __init__(self, engine, fail=()):
+        self.engine = engine
+        self.dao = engine.dao
+        self._interact = Mock()
+        self._postpone_pair = Mock()
+        self.created = []
+        lock = Lock()
+
+        def upload_folder(parent, params, **kwargs):
+            if params["title"] in fail:
+                raise ConnectionError(params["title"])
+            with lock:
+                self.created.append(f"{parent}/{params['title']}")
+                idx = len(self.created)
+            return {"path": f"{parent}/{params['title']}", "uid": f"uid-{idx}"}
+
+        self.remote = Mock(dao=self.dao, upload_folder=upload_folder)
+        engine.manager = Mock()
+
+
+@Options.mock()
+def test_direct_transfer_folders(planner, tmp_path):
+    """Folders are created level by level, each one releasing its children."""
+    root = tmp_path / "root"
+    _tree(root)
+    engine = planner({root: 0})
+    dao = engine.dao
+    creator = FolderCreator(engine)
+
+    assert creator._direct_transfer_folders(_acquire(dao, root))
+
+    assert creator.created[0] == f"/remote/{root.name}"
+    assert set(creator.created[1:3]) == {
+        f"/remote/{root.name}/a",
+        f"/remote/{root.name}/c",
+    }
+    assert creator.created[3] == f"/remote/{root.name}/a/b"
+
+    # Only files are left, all released with the path of their folder
+    for folder in ("a", "a/b", "c"):
+        assert not dao.get_state_from_local(root / folder)
+        for idx in range(3):
+            pair = dao.get_state_from_local(root / folder / f"file-{idx}.txt")
+            assert pair.remote_state == "unknown"
+            assert pair.remote_parent_path == f"/remote/{root.name}/{folder}"
+    assert dao.get_session(1).uploaded_items == 4
+    creator._postpone_pair.assert_not_called()
+
+
+@Options.mock()
+def test_direct_transfer_folders_errors(planner, tmp_path):
+    """A folder that cannot be created is postponed, its children are left waiting."""
+    root = tmp_path / "root"
+    _tree(root)
+    engine = planner({root: 0})
+    dao = engine.dao
+    creator = FolderCreator(engine, fail=("a",))
+
+    assert creator._direct_transfer_folders(_acquire(dao, root))
+
+    assert creator.created == [f"/remote/{root.name}", f"/remote/{root.name}/c"]
+    postponed = creator._postpone_pair.call_args.args[0]
+    assert postponed.local_name == "a"
+    assert dao.get_state_from_local(root / "a" / "b").remote_state == "todo"
+    assert dao.get_session(1).uploaded_items == 2
+
+    # The error of the folder handled by the processor is raised
+    creator = FolderCreator(engine, fail=("a",))
+    with pytest.raises(ConnectionError):
+        creator._direct_transfer_folders(postponed)
+
+
+@Options.mock()
+def test_direct_transfer_folders_disabled(planner, tmp_path):
+    Options.dt_folder_threads = 1
+    root = tmp_path / "root"
+    root.mkdir()
+    engine = planner({root: 0})
+    creator = FolderCreator(engine)
+
+    assert not creator._direct_transfer_folders(_acquire(engine.dao, root))
+    assert not creator.created
+
+
+class SmallFilesUploader:
+    """The Direct Transfer small files stage of a Processor."""
+
+    thread_id = 42
+    _direct_transfer_small_files = Processor._direct_transfer_small_files
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.dao = engine.dao
+        self.remote = Mock(dao=self.dao)
+        self.remote.uploads.has_s3.return_value = False
+        engine.manager = Mock()
+
+
+@Options.mock()
+def test_direct_transfer_small_files(planner, tmp_path):
+    """Files uploaded in a single batch are part of the analytics."""
+    Options.small_files_batch_size = 50
+    files = []
+    for idx in range(3):
+        file = tmp_path / f"file-{idx}.txt"
+        file.write_bytes(b"x" * idx)
+        files.append(file)
+    engine = planner({file: idx for idx, file in enumerate(files)})
+    dao = engine.dao
+    uploader = SmallFilesUploader(engine)
+    doc_pair = _acquire(dao, files[0])
+
+    with patch("nxdrive.engine.processor.DirectTransferUploader") as cls:
+        cls.return_value.upload_small_files.side_effect = lambda files, **_: [
+            {"uid": f"uid-{idx}"} for idx in range(len(files))
+        ]
+        assert uploader._direct_transfer_small_files(doc_pair, files[0])
+
+    assert not any(dao.get_state_from_local(file) for file in files)
+    assert len(dao.get_session_items(doc_pair.session)) == 3
+    stats = engine.manager.directTransferStats.emit
+    assert sorted(call.args for call in stats.call_args_list) == [
+        (False, 0),
+        (False, 1),
+        (False, 2),
+    ]
@@ -0,0 +1,91 @@
+from collections import namedtuple
+from time import sleep
+
+from nxdrive.osi.linux.emblems import EmblemService
+
+DocPair = namedtuple(
+    "DocPair",
+    "error_count, local_state, pair_state, processor",
+    defaults=(0, "", "", 0),
+)
+
+SYNCING = DocPair(processor=42)
+SYNCED = DocPair(local_state="synchronized")
+
+
+def _service():
+    emblems = []
+    service = EmblemService(set_emblems=emblems.extend)
+    return service, emblems
+
+
+def test_unchanged_emblems_are_skipped(tmp_path):
+    file = tmp_path / "file.txt"
+    file.touch()
+    service, emblems = _service()
+
+    service.send(SYNCED, file)
+    service.flush()
+    service.send(SYNCED, file)
+    service.flush()
+    assert emblems == [(str(file), "emblem-nuxeo_synced")]
+
+    service.send(DocPair(error_count=1), file)
+    service.flush()
+    assert emblems[1:] == [(str(file), "emblem-nuxeo_error")]
+    assert service.sent == 2
+    service.stop()
+
+
+def test_pending_updates_are_coalesced(tmp_path):
+    files = [tmp_path / f"file-{idx}.txt" for idx in range(3)]
+    service, emblems = _service()
+    service.batch_size = 2
+
+    with service._condition:
+        # The background thread cannot take updates meanwhile
+        for file in files:
+            file.touch()
+            service.send(SYNCING, file)
+            service.send(SYNCED, file)
+        service.send(SYNCED, tmp_path / "deleted.txt")
+
+    service.flush()
+    assert emblems == [(str(file), "emblem-nuxeo_synced") for file in files]
+    service.stop()
+
+
+def test_emblems_thread(tmp_path):
+    file = tmp_path / "file.txt"
+    file.touch()
+    service, emblems = _service()
+
+    service.send(SYNCED, file)
+    for _ in range(50):
+        if emblems:
+            break
+        sleep(0.1)
+    service.stop()
+
+    assert emblems == [(str(file), "emblem-nuxeo_synced")]
+    assert not service._thread.is_alive()
+
+
+def test_statuses_cache_is_bounded(tmp_path):
+    files = [tmp_path / f"file-{idx}.txt" for idx in range(3)]
+    service, emblems = _service()
+    service.statuses_cache_size = 2
+
+    for file in files:
+        file.touch()
+        service.send(SYNCED, file)
+        service.flush()
+    assert list(service._statuses) == [str(file) for file in files[1:]]
+
+    # The oldest status was forgotten, its emblem is set again
+    service.send(SYNCED, files[0])
+    service.send(SYNCED, files[2])
+    service.flush()
+    assert emblems[3:] == [(str(files[0]), "emblem-nuxeo_synced")]
+    assert list(service._statuses) == [str(files[0]), str(files[2])]
+    service.stop()
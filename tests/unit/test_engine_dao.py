@@ -3,11 +3,19 @@
 from datetime import datetime
 from multiprocessing import RLock
 from pathlib import Path
+from threading import Thread
+from time import sleep
 from unittest.mock import Mock, patch
 from uuid import uuid4
 
+import pytest
+
 from nxdrive.constants import TransferStatus
+from nxdrive.dao.engine import EngineDAO
 from nxdrive.dao.migrations.migration import MigrationInterface
+from nxdrive.dao.utils import DAY, prune_backups, restore_backup
+from nxdrive.objects import Download, Upload
+from nxdrive.options import Options
 
 from ..markers import windows_only
 
@@ -210,6 +218,129 @@ def test_corrupted_database(engine_dao):
         assert len(cols) == 3
 
 
+def test_shutdown_marker(engine_dao):
+    with engine_dao("engine_migration.db") as dao:
+        assert "integrity_check" in dao.startup_timings
+        assert "migrations" in dao.get_metrics()["db_startup_timings"]
+        db = dao.db
+        marker = db.with_name(f"{db.name}.shutdown")
+        dao.dispose()
+        assert marker.read_text() == "clean"
+
+        # Clean shutdown: no check at all
+        with patch("nxdrive.dao.base.fix_db") as fix_db:
+            dao = EngineDAO(db)
+            dao.dispose()
+        fix_db.assert_not_called()
+        assert "integrity_check" not in dao.startup_timings
+
+        # Crash: quick check
+        marker.unlink()
+        with patch("nxdrive.dao.base.fix_db") as fix_db:
+            dao = EngineDAO(db)
+            dao.dispose()
+        fix_db.assert_called_once_with(db, quick=True)
+
+        # Integrity check failed while syncing: full check
+        with patch("nxdrive.dao.base.is_healthy", return_value=False):
+            dao = EngineDAO(db)
+            assert not dao.check_integrity()
+        assert marker.read_text() == "corrupted"
+        dao.dispose()
+        assert marker.read_text() == "corrupted"
+        with patch("nxdrive.dao.base.fix_db") as fix_db:
+            dao = EngineDAO(db)
+        fix_db.assert_called_once_with(db, quick=False)
+        assert dao.check_integrity()
+
+
+@Options.mock()
+def test_incremental_vacuum(engine_dao):
+    with engine_dao("engine_migration.db") as dao:
+        c = dao._get_write_connection().cursor()
+
+        # Older databases are not converted while running
+        assert not dao.incremental_vacuum()
+        assert c.execute("PRAGMA auto_vacuum").fetchone()[0] == 0
+        assert not dao.get_metrics()["db_incremental_vacuum"]
+
+        # Nor at opening, unless asked to, after a clean shutdown
+        db = dao.db
+        dao.dispose()
+        dao = EngineDAO(db)
+        assert not dao.get_metrics()["db_incremental_vacuum"]
+        dao.dispose()
+        Options.database_auto_vacuum_conversion = True
+        db.with_name(f"{db.name}.shutdown").unlink()
+        dao = EngineDAO(db)
+        assert "auto_vacuum_conversion" not in dao.startup_timings
+        dao.dispose()
+        dao = EngineDAO(db)
+        assert "auto_vacuum_conversion" in dao.startup_timings
+        assert dao.get_metrics()["db_incremental_vacuum"]
+
+        c = dao._get_write_connection().cursor()
+        assert c.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+        c.executemany(
+            "INSERT INTO Configuration (name, value) VALUES (?, ?)",
+            ((f"dummy-{idx}", "x" * 1000) for idx in range(1000)),
+        )
+        c.execute("DELETE FROM Configuration WHERE name LIKE 'dummy-%'")
+        free = c.execute("PRAGMA freelist_count").fetchone()[0]
+        assert free > 10
+
+        assert dao.incremental_vacuum(pages=10) == free - 10
+        assert not dao.incremental_vacuum(pages=free)
+        dao.dispose()
+
+
+def test_save_backup(engine_dao):
+    with engine_dao("engine_migration.db") as dao:
+        backups = dao.db.with_name("backups")
+        assert dao.save_backup()
+        assert len(list(backups.iterdir())) == 1
+
+        # Nothing changed since the last backup
+        assert not dao.save_backup()
+
+        dao.store_int("dummy", 42)
+        sleep(1)
+        assert dao.save_backup()
+        assert len(list(backups.iterdir())) == 2
+
+        # Restore the most recent usable backup
+        latest = max(backups.iterdir())
+        latest.write_bytes(b"corrupted")
+        dao.dispose()
+        assert restore_backup(dao.db)
+        dao = EngineDAO(dao.db)
+        assert dao.get_int("dummy") == 0
+        assert dao.get_conflict_count() == 3
+        dao.dispose()
+
+
+def test_prune_backups(tmp_path):
+    db = tmp_path / "manager.db"
+    backups = tmp_path / "backups"
+    backups.mkdir()
+    now = 100 * DAY
+    for hours in range(0, 24 * 40, 6):
+        (backups / f"manager.db_{now - hours * 3600}").touch()
+    (backups / "manager.db_1234-wal").touch()
+
+    prune_backups(db, now=now)
+
+    ages = sorted(
+        (now - int(backup.name.split("_")[-1])) // 3600
+        for backup in backups.glob("manager.db_*")
+        if backup.name.split("_")[-1].isdigit()
+    )
+    # All backups of the last day, then one a day for a week, then one a week
+    assert ages == [0, 6, 12, 18, 24, 30, 54, 78, 102, 126, 150, 168, 222, 390, 558]
+    assert (backups / "manager.db_1234-wal").is_file()
+
+
 def test_errors(engine_dao):
     with engine_dao("engine_migration.db") as dao:
         assert dao.get_error_count() == 1
@@ -266,6 +397,20 @@ def test_reinit_processors(engine_dao):
         assert not state.processor
 
 
+def test_reinit_states_indexes(engine_dao):
+    query = (
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'States'"
+    )
+    with engine_dao("engine_migration.db") as dao:
+        indexes = {row[0] for row in dao._get_read_connection().execute(query)}
+        assert "idx_states_queue" in indexes
+        assert "idx_states_duplicates" in indexes
+
+        # Indexes created by migrations are created again with the table
+        dao.reinit_states()
+        assert {row[0] for row in dao._get_read_connection().execute(query)} == indexes
+
+
 def test_engine_init_db(engine_dao):
     with engine_dao("engine_migration.db") as dao:
         assert len(dao.get_filters()) == 2  # There are 2 default filters existing
@@ -371,7 +516,7 @@ def test_migration_db_v1(engine_dao):
         c = dao._get_read_connection().cursor()
 
         cols = c.execute("PRAGMA table_info('States')").fetchall()
-        assert len(cols) == 34
+        assert len(cols) == 35
 
         cols = c.execute("SELECT * FROM States").fetchall()
         assert len(cols) == 63
@@ -385,7 +530,7 @@ def test_migration_db_v1_with_duplicates(engine_dao):
         assert not rows
 
         cols = c.execute("PRAGMA table_info('States')").fetchall()
-        assert len(cols) == 34
+        assert len(cols) == 35
         assert dao.get_config("remote_last_event_log_id") is None
         assert dao.get_config("remote_last_full_scan") is None
 
@@ -536,6 +681,8 @@ def test_db_init_at_v21(tmp_path, engine_dao):
         old_migration_state = cursor.execute(
             "select name from sqlite_master where type = 'table'"
         ).fetchall()
+        # Plus the tables of later migrations
+        upgrade_state.append(("DigestCache",))
         assert sorted(old_migration_state) == sorted(upgrade_state)
 
 
@@ -594,9 +741,498 @@ def test_db_init_at_v22(tmp_path, engine_dao):
         old_migration_state = cursor.execute(
             "select name from sqlite_master where type = 'table'"
         ).fetchall()
+        # Plus the tables of later migrations
+        upgrade_state.append(("DigestCache",))
         assert sorted(old_migration_state) == sorted(upgrade_state)
 
 
+def test_db_init_at_v23(tmp_path, engine_dao):
+    """Check the States indexes migration and that hot queries do use them."""
+    tmp_database = Path(tmp_path / str(uuid4()))
+    with sqlite3.connect(tmp_database) as conn:
+        cursor = conn.cursor()
+
+        from nxdrive.dao.migrations.engine import engine_migrations
+
+        migration21, migration22, migration23 = list(engine_migrations.values())[:3]
+        migration21.upgrade(cursor)
+        migration22.upgrade(cursor)
+
+        sql = (
+            "select name from sqlite_master where type = 'index' and name like 'idx_%'"
+        )
+        assert not cursor.execute(sql).fetchall()
+
+        migration23.upgrade(cursor)
+        assert len(cursor.execute(sql).fetchall()) == 7
+
+        migration23.downgrade(cursor)
+        assert not cursor.execute(sql).fetchall()
+
+    with engine_dao(tmp_database) as dao:
+        cursor = dao._get_read_connection().cursor()
+        assert cursor.execute("PRAGMA user_version").fetchone()[0] >= 23
+
+        for query, index in (
+            ("SELECT * FROM States WHERE local_path = ?", "idx_states_local_path"),
+            (
+                "SELECT * FROM States WHERE local_parent_path = ?",
+                "idx_states_local_parent_path",
+            ),
+            (
+                "SELECT * FROM States WHERE remote_parent_ref = ?",
+                "idx_states_remote_parent_ref",
+            ),
+            ("SELECT * FROM States WHERE processor = ?", "idx_states_processor"),
+            (
+                "SELECT COUNT(*) FROM States WHERE pair_state = ?",
+                "idx_states_pair_state",
+            ),
+            (
+                "SELECT * FROM States"
+                f" WHERE {dao._get_to_sync_condition()} AND session = ?"
+                " ORDER BY local_path ASC",
+                "idx_states_to_sync",
+            ),
+        ):
+            plan = cursor.execute(f"EXPLAIN QUERY PLAN {query}", (0,)).fetchall()
+            assert index in plan[0][3]
+
+        # Indexes must survive a States table re-initialization
+        # (plus the ones of the queue, the digest cache and the duplicates)
+        dao.reinit_states()
+        assert len(cursor.execute(sql).fetchall()) == 10
+
+
+def test_db_init_at_v24(tmp_path, engine_dao):
+    """Check the queue migration and that the queue pages do use the new index."""
+    tmp_database = Path(tmp_path / str(uuid4()))
+    with sqlite3.connect(tmp_database) as conn:
+        cursor = conn.cursor()
+
+        from nxdrive.dao.migrations.engine import engine_migrations
+
+        migrations = list(engine_migrations.values())[:4]
+        for migration in migrations[:3]:
+            migration.upgrade(cursor)
+
+        columns = "select name from pragma_table_info('States')"
+        assert ("priority",) not in cursor.execute(columns).fetchall()
+
+        migration24 = migrations[3]
+        migration24.upgrade(cursor)
+        assert ("priority",) in cursor.execute(columns).fetchall()
+
+        migration24.downgrade(cursor)
+        assert ("priority",) not in cursor.execute(columns).fetchall()
+
+    with engine_dao(tmp_database) as dao:
+        cursor = dao._get_read_connection().cursor()
+        assert cursor.execute("PRAGMA user_version").fetchone()[0] >= 24
+
+        query = (
+            "SELECT id FROM States"
+            f" WHERE {dao._get_to_sync_condition()} AND folderish = 0"
+            "   AND (priority, size, id) > (?, ?, ?)"
+            " ORDER BY priority, size, id"
+        )
+        plan = cursor.execute(f"EXPLAIN QUERY PLAN {query}", (0, 0, 0)).fetchall()
+        assert "idx_states_queue" in plan[0][3]
+        assert not any("TEMP B-TREE" in step[3] for step in plan)
+
+
+def test_get_valid_duplicate_file(engine_dao):
+    """Duplicates are found from the idx_states_duplicates index."""
+    with engine_dao("test_engine.db") as dao:
+        c = dao._get_write_connection().cursor()
+        c.execute("DELETE FROM States")
+        c.executemany(
+            "INSERT INTO States (id, local_path, local_parent_path, folderish,"
+            " local_digest, remote_digest, pair_state)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                (1, "/new.txt", "/", 0, "abc", "abc", "locally_created"),
+                (2, "/modified.txt", "/", 0, "abc", "def", "synchronized"),
+                (3, "/done.txt", "/", 0, "abc", "abc", "synchronized"),
+            ),
+        )
+
+        assert dao.get_valid_duplicate_file("abc").id == 3
+        assert not dao.get_valid_duplicate_file("def")
+
+        cursor = dao._get_read_connection().cursor()
+        plan = cursor.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM States"
+            " WHERE local_digest = ? AND remote_digest = ?"
+            "   AND pair_state = 'synchronized'",
+            ("abc", "abc"),
+        ).fetchall()
+        assert "idx_states_duplicates" in plan[0][3]
+
+
+def test_download_segments(engine_dao):
+    with engine_dao("test_engine.db") as dao:
+        columns = "select name from pragma_table_info('Downloads')"
+        cursor = dao._get_read_connection().cursor()
+        assert "segments" in [row[0] for row in cursor.execute(columns)]
+
+        download = Download(
+            None,
+            Path("/file.bin"),
+            TransferStatus.ONGOING,
+            "engine",
+            tmpname=Path("/file.bin.tmp"),
+            url="http://localhost/file.bin",
+        )
+        dao.save_download(download)
+        assert dao.get_download(path=download.path).segments is None
+
+        download.filesize = 42
+        download.segment_size = 8
+        download.segments = b"\x15"
+        dao.set_download_segments(download)
+
+        saved = dao.get_download(path=download.path)
+        assert saved.filesize == 42
+        assert saved.segment_size == 8
+        assert saved.segments == b"\x15"
+
+
+def test_get_queue_page(engine_dao):
+    with engine_dao("test_engine.db") as dao:
+        c = dao._get_write_connection().cursor()
+        c.execute("DELETE FROM States")
+        c.executemany(
+            "INSERT INTO States (id, local_path, local_parent_path, folderish,"
+            " size, pair_state, priority, processor) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                (1, "/new", "/", 1, 0, "locally_created", 1, 0),
+                (2, "/new/child.txt", "/new", 0, 1, "locally_created", 1, 0),
+                (3, "/big.bin", "/", 0, 1024, "locally_modified", 1, 0),
+                (4, "/small.txt", "/", 0, 10, "locally_created", 1, 0),
+                (5, "/user.bin", "/", 0, 2048, "locally_modified", 0, 0),
+                (6, "/busy.txt", "/", 0, 1, "locally_modified", 1, 42),
+                (7, "/remote.txt", "/", 0, 1, "remotely_modified", 1, 0),
+                (8, "/done.txt", "/", 0, 1, "synchronized", 1, 0),
+            ),
+        )
+
+        def ids(**kwargs):
+            return [
+                pair.id
+                for pair in dao.get_queue_page(local=True, folderish=False, **kwargs)
+            ]
+
+        # User-requested first, then small files before big ones.
+        # Children of a folder in creation, and acquired pairs, are skipped.
+        assert ids(limit=10) == [5, 4, 3]
+
+        # Keyset pagination
+        assert ids(limit=2) == [5, 4]
+        pair = dao.get_state_from_id(4)
+        assert ids(limit=2, after=(pair.priority, pair.size, pair.id)) == [3]
+
+        assert [
+            pair.id
+            for pair in dao.get_queue_page(local=False, folderish=False, limit=10)
+        ] == [7]
+        assert [
+            pair.id for pair in dao.get_queue_page(local=True, folderish=True, limit=10)
+        ] == [1]
+
+        # Once synchronized, the priority is reset
+        pair = dao.get_state_from_id(5)
+        dao.synchronize_state(pair)
+        assert dao.get_state_from_id(5).priority == 1
+
+        dao.prioritize_state(pair)
+        assert pair.priority == dao.get_state_from_id(5).priority == 0
+
+
+def _insert_tree(dao):
+    """Insert a small tree with tricky names, return the pair of the "Fold'er_%" folder."""
+    c = dao._get_write_connection().cursor()
+    for local_path, local_parent_path, remote_ref, remote_parent_path in (
+        ("/Fold'er_%", "/", "ref-1", "/root"),
+        ("/Fold'er_%/child", "/Fold'er_%", "ref-2", "/root/ref-1"),
+        ("/Fold'er_%/child/file", "/Fold'er_%/child", "ref-3", "/root/ref-1/ref-2"),
+        # Siblings sharing the same prefix, they must never be impacted
+        ("/Fold'er_%2", "/", "ref-10", "/root"),
+        ("/Fold'er_%2/file", "/Fold'er_%2", "ref-11", "/root/ref-10"),
+        ("/Fold'erX%/file", "/Fold'erX%", "ref-12", "/root/ref-1X"),
+    ):
+        c.execute(
+            "INSERT INTO States (local_path, local_parent_path, local_name, remote_ref,"
+            " remote_parent_path, folderish, pair_state) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                local_path,
+                local_parent_path,
+                os.path.basename(local_path),
+                remote_ref,
+                remote_parent_path,
+                not local_path.endswith("file"),
+                "synchronized",
+            ),
+        )
+    return dao.get_state_from_local(Path("/Fold'er_%"))
+
+
+def test_subtree_update_local_parent_path(engine_dao):
+    with engine_dao("test_engine.db") as dao:
+        folder = _insert_tree(dao)
+
+        dao.update_local_parent_path(folder, "Moved", Path("/new"))
+
+        child = dao.get_normal_state_from_remote("ref-2")
+        assert child.local_path == Path("new/Moved/child")
+        assert child.local_parent_path == Path("new/Moved")
+        file = dao.get_normal_state_from_remote("ref-3")
+        assert file.local_path == Path("new/Moved/child/file")
+        assert file.local_parent_path == Path("new/Moved/child")
+
+        for ref in ("ref-11", "ref-12"):
+            assert "Moved" not in str(dao.get_normal_state_from_remote(ref).local_path)
+
+
+def test_get_local_children_of(engine_dao):
+    with engine_dao("test_engine.db") as dao:
+        _insert_tree(dao)
+        paths = [Path(), Path("Fold'er_%"), Path("Fold'er_%/child"), Path("empty")]
+        children = dao.get_local_children_of(paths, columns=("local_path",))
+        assert list(children) == paths
+        for path in paths:
+            assert sorted(pair.local_path for pair in children[path]) == sorted(
+                pair.local_path for pair in dao.get_local_children(path)
+            )
+        assert [pair.local_path for pair in children[paths[1]]] == [
+            Path("Fold'er_%/child")
+        ]
+        assert not children[paths[3]]
+
+
+def test_subtree_update_remote_parent_path(engine_dao):
+    with engine_dao("test_engine.db") as dao:
+        folder = _insert_tree(dao)
+
+        dao.update_remote_parent_path(folder, "/other")
+
+        assert dao.get_normal_state_from_remote("ref-1").remote_parent_path == "/other"
+        child = dao.get_normal_state_from_remote("ref-2")
+        assert child.remote_parent_path == "/other/ref-1"
+        file = dao.get_normal_state_from_remote("ref-3")
+        assert file.remote_parent_path == "/other/ref-1/ref-2"
+        other = dao.get_normal_state_from_remote("ref-12")
+        assert other.remote_parent_path == "/root/ref-1X"
+
+
+def test_subtree_replace_local_paths(engine_dao):
+    with engine_dao("test_engine.db") as dao:
+        _insert_tree(dao)
+
+        dao.replace_local_paths(Path("/Fold'er_%"), Path("/fold'er_%"))
+
+        file = dao.get_normal_state_from_remote("ref-3")
+        assert file.local_path == Path("fold'er_%/child/file")
+        assert file.local_parent_path == Path("fold'er_%/child")
+        other = dao.get_normal_state_from_remote("ref-11")
+        assert other.local_path == Path("Fold'er_%2/file")
+
+
+def test_subtree_remove_state(engine_dao):
+    with engine_dao("test_engine.db") as dao:
+        folder = _insert_tree(dao)
+        count = dao.get_count("")
+
+        dao.remove_state(folder)
+
+        assert dao.get_count("") == count - 3
+        assert dao.get_normal_state_from_remote("ref-11")
+        assert dao.get_normal_state_from_remote("ref-12")
+
+        folder = dao.get_normal_state_from_remote("ref-10")
+        dao.remove_state(folder, remote_recursion=True)
+        assert not dao.get_normal_state_from_remote("ref-11")
+        assert dao.get_normal_state_from_remote("ref-12")
+
+
+def test_subtree_mark_descendants_remotely_created(engine_dao):
+    with engine_dao("test_engine.db") as dao:
+        folder = _insert_tree(dao)
+
+        dao.mark_descendants_remotely_created(folder)
+
+        for ref in ("ref-1", "ref-2", "ref-3"):
+            pair = dao.get_normal_state_from_remote(ref)
+            assert pair.pair_state == "remotely_created"
+        for ref in ("ref-10", "ref-11", "ref-12"):
+            pair = dao.get_normal_state_from_remote(ref)
+            assert pair.pair_state == "synchronized"
+
+
+def _other_connection_count(dao):
+    """Count States rows as seen from another connection (i.e. committed rows)."""
+    with sqlite3.connect(dao.db) as conn:
+        return conn.execute("SELECT COUNT(*) FROM States").fetchone()[0]
+
+
+def test_batch_commit_on_exit(engine_dao):
+    with engine_dao("test_engine.db") as dao:
+        count = _other_connection_count(dao)
+        metrics = dao.get_metrics()
+
+        with dao.batch():
+            _insert_tree(dao)
+            with dao.batch():
+                dao.remove_state(dao.get_normal_state_from_remote("ref-12"))
+
+            # Changes are visible from the same thread only
+            assert dao.get_normal_state_from_remote("ref-3")
+            assert _other_connection_count(dao) == count
+
+        assert _other_connection_count(dao) == count + 5
+        assert not dao._get_read_connection().in_transaction
+
+        new_metrics = dao.get_metrics()
+        assert new_metrics["db_write_transactions"] == (
+            metrics["db_write_transactions"] + 1
+        )
+        # 6 insertions and 1 deletion
+        assert new_metrics["db_write_statements"] == metrics["db_write_statements"] + 7
+        assert new_metrics["db_statements_per_transaction"] > 0
+
+
+def test_batch_commit_on_error(engine_dao):
+    with engine_dao("test_engine.db") as dao:
+        count = _other_connection_count(dao)
+
+        with pytest.raises(ValueError), dao.batch():
+            _insert_tree(dao)
+            raise ValueError("Mock'ed error")
+
+        # Like with autocommit, statements done before the error are kept
+        assert _other_connection_count(dao) == count + 6
+
+
+@Options.mock()
+def test_batch_size(engine_dao):
+    Options.database_write_batch_size = 2
+
+    with engine_dao("test_engine.db") as dao:
+        metrics = dao.get_metrics()
+
+        with dao.batch():
+            # 2 statements each: a full transaction is committed in the middle of
+            # a call, the rest of the call is in autocommit mode
+            for idx in range(5):
+                dao.update_config(f"key-{idx}", idx)
+
+        new_metrics = dao.get_metrics()
+        assert new_metrics["db_write_statements"] == (
+            metrics["db_write_statements"] + 10
+        )
+        assert new_metrics["db_write_transactions"] == (
+            metrics["db_write_transactions"] + 7
+        )
+        assert dao.get_config("key-4") == "4"
+
+
+def test_write_metrics(engine_dao):
+    with engine_dao("test_engine.db") as dao:
+        # Writes done while opening are not counted
+        metrics = dao.get_metrics()
+        assert metrics["db_write_statements"] == metrics["db_write_transactions"] == 0
+
+        with dao.batch():
+            # Reads from the writer connection are not writes
+            dao.get_state_from_id(1, from_write=True)
+            assert not dao._get_write_connection().in_transaction
+
+            # Statements are counted, not DAO calls
+            dao.update_config("key", "value")
+            assert dao._get_write_connection().in_transaction
+
+        metrics = dao.get_metrics()
+        assert metrics["db_write_statements"] == 2
+        assert metrics["db_write_transactions"] == 1
+
+
+@Options.mock()
+def test_batch_yields_the_lock(engine_dao):
+    """Other threads can write between the transactions of a batch."""
+    Options.database_write_batch_size = 2
+
+    with engine_dao("test_engine.db") as dao:
+        done = []
+
+        def writer():
+            dao.update_config("other", "value")
+            done.append(calls)
+
+        calls = 0
+        thread = Thread(target=writer)
+        with dao.batch():
+            dao.update_config("key-0", 0)
+            thread.start()
+            while thread.is_alive() and calls < 1000:
+                calls += 1
+                dao.update_config(f"key-{calls}", calls)
+
+        thread.join()
+        assert done[0] < 1000
+        assert dao.get_config("other") == "value"
+
+
+def test_readers_pool(engine_dao):
+    with engine_dao("test_engine.db") as dao:
+        reader = dao._get_read_connection()
+        assert reader is not dao._get_write_connection()
+
+        # Readers are read-only
+        with pytest.raises(sqlite3.OperationalError):
+            reader.execute("DELETE FROM States")
+
+        # The pool is bounded
+        readers = set()
+
+        def read():
+            readers.add(dao._get_read_connection())
+            assert dao.get_states_from_partial_local(Path())
+
+        threads = [Thread(target=read) for _ in range(Options.database_readers * 2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(readers) <= Options.database_readers
+        assert dao.get_metrics()["db_readers"] == Options.database_readers
+
+        # In a batch, the current thread reads its own changes from the writer
+        with dao.batch():
+            dao.update_config("foo", "bar")
+            assert dao._get_read_connection() is dao._get_write_connection()
+            assert dao.get_config("foo") == "bar"
+        assert dao._get_read_connection() is reader
+
+
+def test_lock_waits(engine_dao):
+    with engine_dao("test_engine.db") as dao:
+        assert dao.get_metrics()["db_lock_waits"] == {}
+
+        def write():
+            dao.update_config("foo", "bar")
+
+        with dao.lock:
+            thread = Thread(target=write, name="Writer-1")
+            thread.start()
+            thread.join(0.05)
+        thread.join()
+
+        waits = dao.get_metrics()["db_lock_waits"]
+        assert list(waits) == ["Writer"]
+        assert sum(waits["Writer"].values()) == 1
+        assert not waits["Writer"]["<1ms"]
+
+
 def test_migration_interface():
     """Test done for code coverage of the abstract class."""
     with patch.object(
@@ -627,3 +1263,108 @@ def test_update_upload_requestid(engine_dao, upload):
         engine_dao.update_upload_requestid(dao, upload)
 
         assert previous_request_id != upload.request_uid
+
+
+def test_direct_transfer_planning(engine_dao):
+    """Children planned after their folder was created are not waiting for it."""
+    with engine_dao("test_engine.db") as dao:
+        dao.queue_manager = Mock()
+        session = dao.create_session("/remote", "ref", 1, "engine", "folder")
+
+        def item(path, remote_state):
+            path = Path(path)
+            return (
+                path.as_posix(),
+                path.parent.as_posix(),
+                path.name,
+                False,
+                0,
+                "/remote",
+                "ref",
+                None,
+                "create",
+                remote_state,
+            )
+
+        with dao.direct_transfer_planning():
+            dao.plan_many_direct_transfer_items(
+                (item("/folder", "unknown"), item("/folder/early.txt", "todo")),
+                session,
+            )
+            dao.increase_session_counts(session, 2)
+            dao.update_remote_parent_path_dt(
+                Path("/folder"), "/remote/folder", "folder-ref"
+            )
+            dao.plan_many_direct_transfer_items(
+                (item("/folder/late.txt", "todo"), item("/other/file.txt", "todo")),
+                session,
+            )
+            dao.increase_session_counts(session, 2)
+        assert not dao._dt_folders
+
+        for name in ("early.txt", "late.txt"):
+            doc_pair = dao.get_state_from_local(Path("folder") / name)
+            assert doc_pair.remote_state == "unknown"
+            assert doc_pair.remote_parent_path == "/remote/folder"
+            assert doc_pair.remote_parent_ref == "folder-ref"
+        assert dao.get_state_from_local(Path("other/file.txt")).remote_state == "todo"
+
+        # The session has one more item until the planning is done
+        assert dao.get_session(session).total_items == 5
+        assert dao.decrease_session_counts(session).total_items == 4
+
+
+def test_acquire_dt_small_files(engine_dao):
+    with engine_dao("test_engine.db") as dao:
+        session = dao.create_session("/remote", "ref", 7, "engine", "folder")
+        items = [
+            # local_path, folderish, size, duplicate_behavior, remote_state
+            ("/folder/a.txt", False, 10, "create", "unknown"),
+            ("/folder/b.txt", False, 20, "create", "unknown"),
+            ("/folder/c.txt", False, 30, "create", "unknown"),
+            ("/folder/big.bin", False, 1_000, "create", "unknown"),
+            ("/folder/sub", True, 0, "create", "unknown"),
+            ("/folder/override.txt", False, 10, "override", "unknown"),
+            ("/folder/sub/d.txt", False, 10, "create", "todo"),
+        ]
+        dao.plan_many_direct_transfer_items(
+            tuple(
+                (
+                    path,
+                    Path(path).parent.as_posix(),
+                    Path(path).name,
+                    folderish,
+                    size,
+                    "/remote",
+                    "ref",
+                    None,
+                    behavior,
+                    remote_state,
+                )
+                for path, folderish, size, behavior, remote_state in items
+            ),
+            session,
+        )
+        first = dao.get_state_from_local(Path("folder/a.txt"))
+
+        # c.txt has a paused transfer, it has its own batch
+        dao.save_dt_upload(
+            Upload(
+                None,
+                Path("/folder/c.txt"),
+                TransferStatus.PAUSED,
+                engine="engine",
+                is_direct_transfer=True,
+                doc_pair=dao.get_state_from_local(Path("folder/c.txt")).id,
+            )
+        )
+
+        acquired = dao.acquire_dt_small_files(42, first, 100, 10)
+        assert [str(pair.local_path) for pair in acquired] == ["folder/b.txt"]
+        assert dao.get_state_from_id(acquired[0].id).processor == 42
+
+        # Already acquired
+        assert not dao.acquire_dt_small_files(43, first, 100, 10)
+
+        dao.release_state(42)
+        assert len(dao.acquire_dt_small_files(43, first, 100, 10)) == 1
@@ -1,5 +1,9 @@
+import json
 import pathlib
 from collections import namedtuple
+from pathlib import Path
+from threading import Thread
+from types import SimpleNamespace
 from unittest.mock import patch
 
 import pytest
@@ -76,3 +80,98 @@ def test_get_formatted_status_file_not_found():
     doc_pair = DocPair()
     path = pathlib.Path("./inexistent")
     assert get_formatted_status(doc_pair, path) is None
+
+
+def _listener(dao, local_folder):
+    engine = SimpleNamespace(uid="engine", dao=dao, local_folder=local_folder)
+    return ExtensionListener(SimpleNamespace(engines={"engine": engine}))
+
+
+def _write(dao, sql, *args):
+    with dao.lock:
+        dao._get_write_connection().execute(sql, args)
+
+
+def test_status_cache(engine_dao, tmp_path):
+    local_folder = tmp_path / "Drive"
+    file = local_folder / "file.txt"
+    file.parent.mkdir()
+    file.touch()
+
+    with engine_dao("test_engine.db") as dao:
+        _write(
+            dao,
+            "INSERT INTO States (local_path, local_parent_path, local_name, folderish,"
+            " local_state, remote_state, pair_state)"
+            " VALUES ('/file.txt', '/', 'file.txt', 0, 'synchronized',"
+            " 'synchronized', 'synchronized')",
+        )
+        listener = _listener(dao, local_folder)
+        synced = {"path": str(file), "value": str(Status.SYNCED.value)}
+
+        assert listener.get_status(file) == synced
+        with patch.object(dao, "get_state_from_local") as query:
+            assert listener.get_status(file) == synced
+            assert not query.called
+
+        # Columns not used by the status do not clear the cache
+        _write(dao, "UPDATE States SET last_transfer = 'upload'")
+        assert listener.get_status(file) == synced
+        metrics = listener.get_metrics()
+        assert metrics["extension_cache_hits"] == 2
+        assert metrics["extension_cache_misses"] == 1
+
+        _write(dao, "UPDATE States SET error_count = 1")
+        error = {"path": str(file), "value": str(Status.ERROR.value)}
+        assert listener.get_status(file) == error
+
+        # A write transaction is pending: the state is not cached
+        _write(dao, "UPDATE States SET error_count = 0")
+        with dao.batch():
+            _write(dao, "UPDATE States SET error_count = 2")
+            thread = Thread(target=listener.get_status, args=(file,))
+            thread.start()
+            thread.join()
+        assert not listener._states
+
+        _write(dao, "DELETE FROM States WHERE local_path = '/file.txt'")
+        assert listener.get_status(file) is None
+        assert file in listener._states
+
+        dao.reinit_states()
+        assert not listener._states
+
+
+def test_status_batch(engine_dao, tmp_path):
+    local_folder = tmp_path / "Drive"
+    local_folder.mkdir()
+
+    with engine_dao("test_engine.db") as dao:
+        values = []
+        for idx in range(3):
+            (local_folder / f"file-{idx}.txt").touch()
+            values.append(f"('/file-{idx}.txt', '/', 0, 'synchronized')")
+        _write(
+            dao,
+            "INSERT INTO States (local_path, local_parent_path, folderish, local_state)"
+            f" VALUES {', '.join(values)}",
+        )
+        listener = _listener(dao, local_folder)
+        listener.states_cache_size = 2
+        listener.handlers["statuses"] = listener.handle_statuses
+
+        paths = [str(local_folder / f"file-{idx}.txt") for idx in range(3)]
+        response = listener._handle_content(
+            json.dumps({"command": "statuses", "value": [*paths, 42, "/elsewhere"]})
+        )
+        value = str(Status.SYNCED.value)
+        assert json.loads(response) == [
+            *({"path": path, "value": value} for path in paths),
+            None,
+            None,
+        ]
+
+        # Least recently used states are removed
+        assert list(listener._states) == [Path(path) for path in paths[1:]]
+        latency = listener.get_metrics()["extension_latency"]["statuses"]
+        assert sum(latency.values()) == 1
@@ -0,0 +1,78 @@
+from pathlib import Path
+from threading import Event
+from unittest.mock import patch
+
+import pytest
+
+from nxdrive.client.local import LocalClient
+from nxdrive.engine.hashing import HashingService
+from nxdrive.exceptions import ThreadInterrupt
+from nxdrive.utils import compute_digest
+
+
+@pytest.fixture()
+def local(tmp_path):
+    for idx in range(8):
+        (tmp_path / f"file-{idx}.bin").write_bytes(bytes([idx]) * 1024 * (idx + 1))
+    return LocalClient(tmp_path)
+
+
+def test_get_digests(local):
+    hashing = HashingService()
+    info = local.get_info(Path("file-1.bin"))
+
+    digests = hashing.get_digests(info, "md5", "sha256")
+    assert digests == {
+        "md5": compute_digest(info.filepath, "md5"),
+        "sha256": compute_digest(info.filepath, "sha256"),
+    }
+
+    # Digests are kept on the FileInfo, the file is not read again
+    with patch("nxdrive.client.local.base.compute_digests") as compute:
+        assert info.get_digest() == digests["md5"]
+        assert info.get_digest(digest_func="sha256") == digests["sha256"]
+        assert not compute.called
+
+
+def test_iter_digests(local):
+    hashing = HashingService()
+    infos = local.get_children_info(Path("."))
+    assert len(infos) == 8
+
+    computed = dict(hashing.iter_digests(infos, "sha1"))
+    assert len(computed) == 8
+    for info, digests in computed.items():
+        assert digests == {"sha1": compute_digest(info.filepath, "sha1")}
+
+    # The local digest function by default
+    hashing.prefetch(infos)
+    with patch("nxdrive.client.local.base.compute_digests") as compute:
+        for info in infos:
+            assert info.get_digest() == compute_digest(info.filepath, "md5")
+        assert not compute.called
+
+
+def test_iter_digests_callback(local):
+    """The callback of the waiting thread stops the computation."""
+    hashing = HashingService()
+    hashing.poll_interval = 0.01
+    infos = local.get_children_info(Path("."))
+    started = Event()
+
+    def slow(*args, callback=None, **kwargs):
+        started.set()
+        while "stopped":
+            callback(args[0])
+
+    def callback(_):
+        if started.is_set():
+            raise ThreadInterrupt()
+
+    with patch("nxdrive.client.local.base.compute_digests", new=slow):
+        with pytest.raises(ThreadInterrupt):
+            for _ in hashing.iter_digests(infos, callback=callback):
+                pass
+
+    # Pool threads are available again
+    info = infos[0]
+    assert hashing.get_digests(info) == {"md5": compute_digest(info.filepath, "md5")}
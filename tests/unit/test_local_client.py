@@ -79,3 +79,26 @@ def test_xattr_error_invalid_start_byte(tmp_path):
     raw_value, result_needed = b"fdrpMACS\x80", "fdrpMACS"
     local.set_path_remote_id(file, raw_value)
     assert local.get_path_remote_id(file) == result_needed
+
+
+def test_get_children_info(tmp_path):
+    local = LocalClient(tmp_path)
+    (tmp_path / "b.txt").write_bytes(b"bar\n")
+    (tmp_path / "a").mkdir()
+    (tmp_path / "c.lock").write_bytes(b"banned")
+    (tmp_path / "broken").symlink_to(tmp_path / "inexistent")
+    local.set_remote_id(pathlib.Path("b.txt"), "ref-b")
+
+    # Same information as get_info(), banned and vanished files are skipped
+    children = local.get_children_info(ROOT)
+    assert [child.path for child in children] == [
+        pathlib.Path("a"),
+        pathlib.Path("b.txt"),
+    ]
+    for child in children:
+        info = local.get_info(child.path)
+        assert child.folderish is info.folderish
+        assert child.size == info.size
+        assert child.last_modification_time == info.last_modification_time
+        assert child.remote_ref == info.remote_ref
+    assert children[1].remote_ref == "ref-b"
@@ -1,10 +1,20 @@
+import sqlite3
 from datetime import datetime
+from pathlib import Path
 from typing import Any, Dict
 
 import pytest
 
+from nxdrive.dao.base import AutoRetryConnection
 from nxdrive.exceptions import DriveError
-from nxdrive.objects import Blob, NuxeoDocumentInfo, RemoteFileInfo, SubTypeEnricher
+from nxdrive.objects import (
+    Blob,
+    DocPair,
+    FilterTrie,
+    NuxeoDocumentInfo,
+    RemoteFileInfo,
+    SubTypeEnricher,
+)
 
 
 @pytest.fixture(scope="session")
@@ -288,3 +298,93 @@ def test_without_subtype_enricher(enricher):
             "nxdrive.exceptions.DriveError: This Doctype is missing mandatory information:"
         )
         assert enricherList.facets is None
+
+
+@pytest.fixture()
+def pairs_conn():
+    conn = sqlite3.connect(":memory:", factory=AutoRetryConnection)
+    conn.row_factory = DocPair
+    conn.execute(
+        "CREATE TABLE States (id INTEGER, local_path VARCHAR,"
+        " local_parent_path VARCHAR, remote_ref VARCHAR, pair_state VARCHAR)"
+    )
+    conn.execute(
+        "INSERT INTO States VALUES (1, '/folder/file', '/folder', NULL, 'synchronized')"
+    )
+    yield conn
+    conn.close()
+
+
+def test_doc_pair(pairs_conn):
+    pair = pairs_conn.cursor().execute("SELECT * FROM States").fetchone()
+
+    # Attributes are materialized, paths are parsed once
+    assert pair.local_path == Path("folder/file")
+    assert pair.local_path is pair.local_path
+    assert pair.local_parent_path == Path("folder")
+    assert pair.remote_ref == ""
+    assert pair.pair_state == "synchronized"
+
+    # The sqlite3.Row API works on raw values
+    assert pair["local_path"] == "/folder/file"
+    assert pair[0] == 1
+    assert pair.keys()[:2] == ["id", "local_path"]
+    assert len(pair) == 5
+    with pytest.raises(IndexError):
+        pair["unknown"]
+
+    # Pairs are updated in place by the engine
+    pair.pair_state = "locally_modified"
+    pair.local_path = Path("folder/renamed")
+    assert pair.pair_state == "locally_modified"
+    assert pair.local_path == Path("folder/renamed")
+
+    # Comparison is done on raw values
+    assert pair == pairs_conn.cursor().execute("SELECT * FROM States").fetchone()
+    assert repr(pair).startswith("<DocPair[1] local_path=")
+
+
+def test_doc_pair_projection_and_other_columns(pairs_conn):
+    pair = pairs_conn.cursor().execute("SELECT id, pair_state FROM States").fetchone()
+    assert pair.id == 1
+    assert pair.pair_state == "synchronized"
+    with pytest.raises(AttributeError):
+        pair.local_path
+    with pytest.raises(AttributeError):
+        pair.remote_ref
+    assert "local_path=None" in repr(pair)
+
+    # Columns outside of the States table are reachable too
+    row = pairs_conn.cursor().execute("SELECT COUNT(*) AS count FROM States").fetchone()
+    assert row.count == 1
+    assert row[0] == 1
+
+
+@pytest.mark.parametrize(
+    "path, filtered",
+    [
+        ("/", False),
+        ("/org/", False),
+        ("/org/root/", False),
+        ("/org/root/ws-1/", True),
+        ("/org/root/ws-1/doc", True),
+        ("/org/root/ws-10/", False),
+        ("/org/root/ws-2/folder/", False),
+        ("/org/root/ws-2/folder/sub/", True),
+        ("/other/", True),
+        ("/other/sub/sub/", True),
+    ],
+)
+def test_filter_trie(path, filtered):
+    filters = ["/org/root/ws-1/", "/org/root/ws-2/folder/sub/", "/other/"]
+    trie = FilterTrie(filters)
+
+    assert (path in trie) is filtered
+    # Same result as checking all filters
+    path_ = path if path.endswith("/") else f"{path}/"
+    assert any(path_.startswith(_filter) for _filter in filters) is filtered
+
+
+def test_filter_trie_root():
+    assert "/anything/" in FilterTrie(["/"])
+    assert "/anything/" not in FilterTrie()
@@ -295,6 +295,14 @@ def test_str_utf8():
     [
         ("chunk_limit", -42, 42),
         ("chunk_size", 1024 * 5 + 1, 16),
+        ("chunk_upload_threads", 17, 8),
+        ("digest_cache_size", -1, 1000),
+        ("download_segment_size", 0, 32),
+        ("download_segment_threads", 17, 8),
+        ("dt_folder_threads", 0, 8),
+        ("hashing_threads", 0, 8),
+        ("small_files_batch_size", 1001, 50),
+        ("small_files_size_limit", 0, 1024),
         ("tmp_file_limit", -42.0, 42.0),
     ],
 )
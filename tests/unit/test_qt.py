@@ -1,7 +1,37 @@
+from unittest.mock import Mock
+
 import pytest
 
-from nxdrive.gui.folders_dialog import regexp_validator
+from nxdrive.gui.folders_dialog import FoldersDialog, regexp_validator
 from nxdrive.qt.constants import Acceptable, Invalid
+from nxdrive.qt.imports import QObject, QThreadPool, pyqtSignal
+
+
+class LocalPaths(QObject):
+    """The local paths selection of a FoldersDialog."""
+
+    pathCounted = pyqtSignal(object, int, int)
+    count_batch_size = 2
+
+    overall_count = FoldersDialog.overall_count
+    overall_size = FoldersDialog.overall_size
+    _files_display = FoldersDialog._files_display
+    _process_additionnal_local_paths = FoldersDialog._process_additionnal_local_paths
+    _count_children = FoldersDialog._count_children
+    _update_totals = FoldersDialog._update_totals
+    _update_local_group = FoldersDialog._update_local_group
+
+    def __init__(self):
+        super().__init__()
+        self.path = None
+        self.paths = {}
+        self._totals = {}
+        self.local_path = Mock()
+        self.local_paths_size_lbl = Mock()
+        self.button_ok_state = Mock()
+        self.counts = []
+        self.pathCounted.connect(self._update_totals)
+        self.pathCounted.connect(lambda *args: self.counts.append(args))
 
 
 @pytest.mark.parametrize(
@@ -34,3 +64,39 @@ def test_regexp_validator_should_pass(input_data):
 def test_regexp_validator_should_not_pass(input_data):
     validator = regexp_validator()
     assert validator.validate(input_data, 0)[0] == Invalid
+
+
+def test_folders_counted_in_background(app, tmp_path):
+    folder = tmp_path / "folder"
+    (folder / "sub").mkdir(parents=True)
+    for name in ("a.txt", "b.txt", "sub/c.txt"):
+        (folder / name).write_bytes(b"12345")
+    (folder / "sub" / "file.txt").write_bytes(b"1")
+    link = tmp_path / "link"
+    link.symlink_to(folder, target_is_directory=True)
+
+    dialog = LocalPaths()
+    dialog._process_additionnal_local_paths([str(folder / "sub"), str(folder)])
+
+    # Only the selected folder is known, its children are not counted yet
+    assert dialog.paths == {folder: 0}
+    assert dialog.overall_count == 1
+
+    QThreadPool.globalInstance().waitForDone()
+    app.processEvents()
+
+    # The sub-folder count is dropped: it is part of the folder selected after it
+    counts = [(count, size) for path, count, size in dialog.counts if path == folder]
+    # The folder, its sub-folder and 4 files, updated every 2 items
+    assert [count for count, _ in counts] == [2, 4, 6]
+    assert counts[-1] == (6, 16)
+    assert dialog.overall_count == 6
+    assert dialog.overall_size == 16
+    dialog.local_path.setText.assert_called_with(f"{folder} (+5)")
+
+    # Nothing to transfer from a symlink
+    dialog._process_additionnal_local_paths([str(link)])
+    QThreadPool.globalInstance().waitForDone()
+    app.processEvents()
+    assert dialog.paths == {folder: 0}
+    assert dialog.overall_count == 6
@@ -0,0 +1,174 @@
+from threading import Thread
+from time import sleep
+from unittest.mock import Mock
+
+from nxdrive.engine import queue_manager as qm
+from nxdrive.engine.queue_manager import PairQueue, QueueItem, QueueManager
+from nxdrive.options import Options
+
+
+def _insert_pairs(dao, *pairs):
+    """Replace all pairs by (id, folderish, size, pair_state, priority) ones."""
+    c = dao._get_write_connection().cursor()
+    c.execute("DELETE FROM States")
+    c.executemany(
+        "INSERT INTO States (id, local_path, local_parent_path, folderish, size,"
+        " pair_state, priority) VALUES (?, '/file-' || ?, '/', ?, ?, ?, ?)",
+        ((row_id, row_id, *data) for row_id, *data in pairs),
+    )
+
+
+def _drain(queue):
+    items = []
+    while "there are items":
+        item = queue.get()
+        if item is None:
+            return items
+        items.append(item.id)
+        assert len(queue._heap) <= Options.queue_buffer_size
+
+
+@Options.mock()
+def test_pair_queue_paging(engine_dao):
+    Options.queue_buffer_size = 2
+    with engine_dao("test_engine.db") as dao:
+        _insert_pairs(
+            dao,
+            (1, 0, 300, "locally_created", 1),
+            (2, 0, 100, "locally_modified", 1),
+            (3, 0, 900, "locally_created", 0),
+            (4, 0, 200, "locally_created", 1),
+            (5, 0, 100, "remotely_created", 1),
+            (6, 1, 0, "locally_created", 1),
+        )
+        queue = PairQueue(dao, local=True, folderish=False)
+        assert queue.empty()
+
+        # Nothing is loaded until needed
+        queue.add_backlog(4)
+        assert not queue.empty()
+        assert queue.qsize() == 4
+        assert not queue._heap
+
+        # User-requested first, then smallest files first
+        assert _drain(queue) == [3, 2, 4, 1]
+        assert queue.empty()
+        assert queue.qsize() == 0
+
+
+@Options.mock()
+def test_pair_queue_overflow(engine_dao):
+    Options.queue_buffer_size = 2
+    with engine_dao("test_engine.db") as dao:
+        _insert_pairs(
+            dao,
+            (1, 0, 300, "locally_created", 1),
+            (2, 0, 200, "locally_created", 1),
+            (3, 0, 100, "locally_created", 1),
+        )
+        queue = PairQueue(dao, local=True, folderish=False)
+
+        queue.put(QueueItem(1, False, "locally_created", size=300))
+        queue.put(QueueItem(1, False, "locally_created", size=300))
+        queue.put(QueueItem(2, False, "locally_created", size=200))
+        assert len(queue.queue) == 2
+        assert [item.id for item in queue.queue] == [2, 1]
+
+        # The buffer is full, the item is only in the database now
+        queue.put(QueueItem(3, False, "locally_created", size=100))
+        assert len(queue.queue) == 2
+        assert queue.qsize() == 3
+
+        assert queue.get().id == 2
+        assert queue.get().id == 1
+        dao._get_write_connection().execute(
+            "UPDATE States SET pair_state = 'synchronized' WHERE id IN (1, 2)"
+        )
+
+        # Handled pairs are not loaded again
+        assert _drain(queue) == [3]
+        assert queue.empty()
+
+
+def test_get_file_fairness(engine_dao):
+    with engine_dao("test_engine.db") as dao:
+        _insert_pairs(dao)
+        manager = QueueManager(Mock(), dao)
+        for row_id in range(1, 5):
+            manager.push_ref(row_id, False, "locally_modified")
+        for row_id in range(5, 9):
+            manager.push_ref(row_id, False, "remotely_modified")
+        manager.push_ref(9, False, "remotely_modified", priority=0)
+        manager.push_ref(10, True, "remotely_created")
+        assert manager.get_overall_size() == 10
+
+        # User-requested first, then local and remote files take turns
+        ids = [manager._get_file().id for _ in range(9)]
+        assert ids == [9, 1, 5, 2, 6, 3, 7, 4, 8]
+        assert manager._get_file() is None
+        assert manager._get_remote_folder().id == 10
+
+
+def test_next_item_wakeup(engine_dao, monkeypatch):
+    # Without a wake up, the test would wait for the timeout and fail
+    monkeypatch.setattr(qm, "IDLE_TIMEOUT", 30)
+
+    with engine_dao("test_engine.db") as dao:
+        _insert_pairs(dao)
+        manager = QueueManager(Mock(), dao)
+        handled = []
+
+        def processor():
+            while len(handled) < 2:
+                item = manager._next_item(manager._get_file)
+                if item:
+                    handled.append(item.id)
+
+        thread = Thread(target=processor)
+        thread.start()
+        sleep(0.2)
+        assert not manager.is_active()
+
+        manager.push_ref(1, False, "locally_modified")
+        manager.push_ref(2, False, "remotely_modified")
+        thread.join(10)
+        assert not thread.is_alive()
+        assert sorted(handled) == [1, 2]
+
+        # The last item is still being handled
+        assert manager.is_active()
+        assert manager.get_metrics()["busy_processors"] == 1
+
+        # Nothing is returned from a suspended queue
+        manager.suspend()
+        manager.push_ref(3, False, "locally_modified")
+        monkeypatch.setattr(qm, "IDLE_TIMEOUT", 0)
+        assert manager._next_item(manager._get_file) is None
+        manager.resume()
+        assert manager._next_item(manager._get_file).id == 3
+
+
+def test_error_queue(app, engine_dao):
+    with engine_dao("test_engine.db") as dao:
+        _insert_pairs(
+            dao,
+            (1, 0, 10, "locally_modified", 1),
+            (2, 0, 10, "locally_modified", 1),
+        )
+        manager = QueueManager(Mock(), dao)
+        manager.push_error(dao.get_state_from_id(1), interval=-2)
+        manager.push_error(dao.get_state_from_id(2), interval=3600)
+        assert manager._is_on_error(1)
+
+        metrics = manager.get_metrics()
+        assert metrics["error_queue"] == 2
+        assert metrics["error_queue_due"] == 1
+        assert metrics["error_queue_parked"] == 1
+        assert manager._error_timer.isActive()
+
+        # Only the due pair is pushed back, the timer waits for the next one
+        manager._on_error_timer()
+        assert not manager._is_on_error(1)
+        assert manager._is_on_error(2)
+        assert manager._get_file().id == 1
+        assert manager._error_timer.remainingTime() > 3_000_000
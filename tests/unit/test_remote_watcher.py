@@ -0,0 +1,86 @@
+from time import sleep
+from unittest.mock import Mock
+
+import pytest
+
+from nxdrive.engine.watcher import remote_watcher
+from nxdrive.engine.watcher.remote_watcher import RemoteWatcher, _ref_endings
+from nxdrive.exceptions import ScrollDescendantsError
+
+
+def _watcher(pages):
+    """Only what the scroll needs from a RemoteWatcher, *pages* are returned in order."""
+    watcher = Mock()
+    watcher._scroll_metrics = {"fetch": 0.0, "wait": 0.0, "handle": 0.0}
+    responses = [
+        {"descendants": page, "scroll_id": f"scroll-{idx}"}
+        for idx, page in enumerate(pages)
+    ]
+    watcher.engine.remote.scroll_descendants.side_effect = responses + [
+        {"descendants": [], "scroll_id": None}
+    ]
+    return watcher
+
+
+def _scroll(watcher):
+    return RemoteWatcher._scroll_descendants(watcher, Mock(uid="root"))
+
+
+def test_scroll_descendants():
+    pages = [["a", "b"], ["c"], ["d", "e"], ["f"]]
+    watcher = _watcher(pages)
+
+    assert list(_scroll(watcher)) == pages
+
+    # Each scroll request continues the previous one
+    calls = watcher.engine.remote.scroll_descendants.call_args_list
+    assert [call.args[1] for call in calls] == [None] + [
+        f"scroll-{idx}" for idx in range(len(pages))
+    ]
+    assert watcher._scroll_metrics["fetch"] > 0
+
+
+def test_scroll_descendants_error():
+    watcher = _watcher([["a"]])
+    error = ScrollDescendantsError(Mock())
+    watcher.engine.remote.scroll_descendants.side_effect = [
+        {"descendants": ["a"], "scroll_id": "scroll-0"},
+        error,
+    ]
+
+    batches = _scroll(watcher)
+    assert next(batches) == ["a"]
+    with pytest.raises(ScrollDescendantsError):
+        next(batches)
+
+
+def test_scroll_descendants_backpressure(monkeypatch):
+    monkeypatch.setattr(remote_watcher, "SCROLL_PREFETCH", 1)
+    pages = [[str(idx)] for idx in range(10)]
+    watcher = _watcher(pages)
+    scroll = watcher.engine.remote.scroll_descendants
+
+    batches = _scroll(watcher)
+    assert next(batches) == pages[0]
+    sleep(0.5)
+
+    # One page in the queue, and one waiting for room
+    assert scroll.call_count == 3
+
+    # Closing the generator stops the fetcher
+    batches.close()
+    sleep(1.5)
+    assert scroll.call_count == 3
+
+
+def test_ref_endings():
+    ref = "defaultFileSystemItemFactory#default#1234"
+    endings = set(_ref_endings(ref))
+    assert endings == {
+        ref,
+        "#default#1234",
+        "default#1234",
+        "#1234",
+        "1234",
+    }
+    assert all(ref.endswith(ending) for ending in endings)
@@ -0,0 +1,438 @@
+from functools import partial
+from hashlib import md5, sha1, sha256
+from pathlib import Path
+from threading import Lock
+from unittest.mock import Mock
+
+import pytest
+from nuxeo.exceptions import CorruptedFile, HTTPError
+
+from nxdrive.client.remote_client import Remote
+from nxdrive.client.segments import (
+    SegmentedDownloader,
+    SegmentMap,
+    content_range_size,
+    preallocate,
+)
+from nxdrive.engine.activity import Action, DownloadAction
+from nxdrive.engine.processor import Processor
+from nxdrive.exceptions import ThreadInterrupt
+from nxdrive.objects import Download
+from nxdrive.options import Options
+from nxdrive.utils import StreamDigest
+
+SEGMENT = 1024 * 1024
+CONTENT = bytes(range(256)) * (SEGMENT * 5 // 256) + b"tail"
+
+
+class FakeResponse:
+    def __init__(self, content, start=None, end=None, *, chunk_size=64 * 1024):
+        self.status_code = 200 if start is None else 206
+        self.headers = {"Content-Length": str(len(content))}
+        if start is not None:
+            self.headers["Content-Range"] = f"bytes {start}-{end}/{len(content)}"
+            content = content[start : end + 1]
+        self.content = content
+        self.chunk_size = chunk_size
+
+    def iter_content(self, chunk_size):
+        for idx in range(0, len(self.content), self.chunk_size):
+            yield self.content[idx : idx + self.chunk_size]
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class FakeServer:
+    """Answer ranged GET requests, keep track of the requested ranges."""
+
+    def __init__(self, content, *, ranges=True):
+        self.content = content
+        self.ranges_support = ranges
+        self.requested = []
+        self.lock = Lock()
+
+    def fetch(self, start, end):
+        with self.lock:
+            self.requested.append((start, end))
+        return FakeResponse(self.content, start, end)
+
+    def request(self, method, path, headers=None, **kwargs):
+        if not self.ranges_support or "Range" not in (headers or {}):
+            return FakeResponse(self.content)
+        start, end = headers["Range"][len("bytes=") :].split("-")
+        end = int(end) if end else len(self.content) - 1
+        return self.fetch(int(start), min(end, len(self.content) - 1))
+
+
+def test_segment_map():
+    segments = SegmentMap(10 * SEGMENT + 1, SEGMENT)
+    assert segments.count == 11
+    assert segments.range(0) == (0, SEGMENT - 1)
+    assert segments.range(10) == (10 * SEGMENT, 10 * SEGMENT)
+    assert segments.missing() == list(range(11))
+
+    segments.add(3)
+    segments.add(10)
+    assert 3 in segments
+    assert 4 not in segments
+    assert segments.stored_size() == SEGMENT + 1
+
+    # The bitmap is enough to resume
+    copy = SegmentMap(10 * SEGMENT + 1, SEGMENT, bitmap=segments.to_bytes())
+    assert copy.missing() == [0, 1, 2, 4, 5, 6, 7, 8, 9]
+    assert not copy.is_complete()
+
+    # An unexpected bitmap is ignored
+    assert SegmentMap(SEGMENT * 20, SEGMENT, bitmap=b"\xff").missing() == list(
+        range(20)
+    )
+
+
+def test_content_range_size():
+    assert content_range_size(FakeResponse(CONTENT, 0, 9)) == len(CONTENT)
+    assert content_range_size(FakeResponse(CONTENT)) is None
+    assert content_range_size(None) is None
+
+
+def test_segmented_downloader(tmp_path):
+    file_out = tmp_path / "file.tmp"
+    preallocate(file_out, len(CONTENT))
+    assert file_out.stat().st_size == len(CONTENT)
+
+    server = FakeServer(CONTENT)
+    segments = SegmentMap(len(CONTENT), SEGMENT)
+    saved = []
+    callback = Mock()
+    streamed = StreamDigest("md5")
+    action = DownloadAction(Path("file"), len(CONTENT))
+    try:
+        SegmentedDownloader(segments, file_out, server.fetch, workers=3).run(
+            action,
+            callbacks=(callback,),
+            saved=lambda segments: saved.append(segments.to_bytes()),
+            first=(0, server.fetch(*segments.range(0))),
+            digest=streamed,
+        )
+    finally:
+        Action.finish_action()
+
+    assert file_out.read_bytes() == CONTENT
+    assert streamed.hexdigest("md5") == md5(CONTENT).hexdigest()
+    assert segments.is_complete()
+    assert len(saved) == segments.count
+    assert action.progress == len(CONTENT)
+    assert sorted(action.segment_speeds) == list(range(segments.count))
+    # Callbacks are called for each chunk of data
+    assert callback.call_count == sum(
+        -(-(end - start + 1) // (64 * 1024))
+        for start, end in map(segments.range, range(segments.count))
+    )
+    # Each segment was requested once
+    assert sorted(server.requested) == [segments.range(i) for i in range(6)]
+
+
+def test_segmented_downloader_error(tmp_path):
+    file_out = tmp_path / "file.tmp"
+    preallocate(file_out, len(CONTENT))
+    server = FakeServer(CONTENT)
+    segments = SegmentMap(len(CONTENT), SEGMENT)
+
+    def fetch(start, end):
+        if start == 2 * SEGMENT:
+            raise ConnectionError("Mocked error")
+        return server.fetch(start, end)
+
+    action = DownloadAction(Path("file"), len(CONTENT))
+    try:
+        with pytest.raises(ConnectionError):
+            SegmentedDownloader(segments, file_out, fetch, workers=2).run(action)
+    finally:
+        Action.finish_action()
+
+    # Segments already stored are kept
+    assert 2 not in segments
+    assert segments.missing() != list(range(segments.count))
+
+
+class SegmentsProcessor:
+    """A Processor handling one pair, downloaded with *download*."""
+
+    thread_id = 42
+    _execute = Processor._execute
+
+    def __init__(self, doc_pair, download):
+        self._items = [doc_pair]
+        self.dao = Mock()
+        self.engine = Mock()
+        self._postpone_pair = Mock()
+        self.increase_error = Mock()
+        self._handle_pair_handler_exception = Mock()
+        self._synchronize_remotely_modified = lambda _: download()
+
+    def _get_item(self):
+        return self._items.pop() if self._items else None
+
+    def _get_next_doc_pair(self, item):
+        return item
+
+    def check_pair_state(self, _):
+        return True
+
+    def _handle_doc_pair_sync(self, doc_pair, sync_handler):
+        sync_handler(doc_pair)
+
+    def _interact(self):
+        # Stop once the pair is handled
+        raise ThreadInterrupt()
+
+
+@pytest.mark.parametrize("truncated", [True, False])
+def test_segment_error_postpones_the_pair(tmp_path, truncated):
+    """A truncated segment, or an unexpected response, is a connection error: retried later."""
+    file_out = tmp_path / "file.tmp"
+    preallocate(file_out, len(CONTENT))
+    server = FakeServer(CONTENT)
+    segments = SegmentMap(len(CONTENT), SEGMENT)
+
+    def fetch(start, end):
+        resp = server.fetch(start, end)
+        if start == 2 * SEGMENT:
+            if truncated:
+                resp.content = resp.content[:-10]
+            else:
+                resp = FakeResponse(CONTENT)
+        return resp
+
+    def download():
+        action = DownloadAction(Path("file"), len(CONTENT))
+        try:
+            SegmentedDownloader(segments, file_out, fetch, workers=2).run(action)
+        finally:
+            Action.finish_action()
+
+    doc_pair = Mock(pair_state="remotely_modified", local_state="synchronized")
+    processor = SegmentsProcessor(doc_pair, download)
+    with pytest.raises(ThreadInterrupt):
+        processor._execute()
+
+    processor._postpone_pair.assert_called_once_with(doc_pair, "CONNECTION_ERROR")
+    processor.increase_error.assert_not_called()
+    processor._handle_pair_handler_exception.assert_not_called()
+    processor.dao.release_state.assert_called_once_with(42)
+
+
+def _remote(server, download=None):
+    remote = Mock()
+    remote.client.host = "http://localhost/"
+    remote.client.request.side_effect = server.request
+    remote.dao.get_download.return_value = download
+    remote.download_callback = ()
+    remote._download_segments = partial(Remote._download_segments, remote)
+    remote._save_to_file = partial(Remote._save_to_file, remote)
+    remote.check_integrity = partial(Remote.check_integrity, remote)
+    return remote
+
+
+@Options.mock()
+def test_download_segments(tmp_path):
+    Options.set("download_segment_size", 1, setter="manual")
+    Options.set("tmp_file_limit", 1.0, setter="manual")
+    file_out = tmp_path / "file.tmp"
+    server = FakeServer(CONTENT)
+    remote = _remote(server)
+
+    Remote.download(remote, "http://localhost/file", Path("file"), file_out, "")
+    assert file_out.read_bytes() == CONTENT
+    assert len(server.requested) == 6
+
+    # The map of segments was saved after each segment
+    download = remote.dao.set_download_segments.call_args.args[0]
+    assert download.filesize == len(CONTENT)
+    assert download.segment_size == SEGMENT
+    assert SegmentMap(len(CONTENT), SEGMENT, bitmap=download.segments).is_complete()
+
+
+@Options.mock()
+def test_download_segments_resume(tmp_path):
+    Options.set("download_segment_size", 1, setter="manual")
+    Options.set("tmp_file_limit", 1.0, setter="manual")
+    file_out = tmp_path / "file.tmp"
+    preallocate(file_out, len(CONTENT))
+    segments = SegmentMap(len(CONTENT), SEGMENT)
+    with file_out.open("r+b") as f:
+        for index in (0, 1, 4):
+            start, end = segments.range(index)
+            f.seek(start)
+            f.write(CONTENT[start : end + 1])
+            segments.add(index)
+    download = Download(
+        1,
+        Path("file"),
+        None,
+        None,
+        tmpname=file_out,
+        filesize=len(CONTENT),
+        segment_size=SEGMENT,
+        segments=segments.to_bytes(),
+    )
+    server = FakeServer(CONTENT)
+    remote = _remote(server, download)
+    digests = {"md5": ""}
+
+    Remote.download(
+        remote,
+        "http://localhost/file",
+        Path("file"),
+        file_out,
+        sha256(CONTENT).hexdigest(),
+        digests=digests,
+    )
+
+    # Only missing segments were downloaded
+    assert sorted(server.requested) == [segments.range(i) for i in (2, 3, 5)]
+    assert file_out.read_bytes() == CONTENT
+    # Digests cover segments of the previous run too
+    assert digests == {
+        "md5": md5(CONTENT).hexdigest(),
+        "sha256": sha256(CONTENT).hexdigest(),
+    }
+
+
+@Options.mock()
+def test_download_segments_no_ranges(tmp_path):
+    """The server does not honour ranges, the file is downloaded in one go."""
+    Options.set("download_segment_size", 1, setter="manual")
+    Options.set("tmp_file_limit", 1.0, setter="manual")
+    file_out = tmp_path / "file.tmp"
+    server = FakeServer(CONTENT, ranges=False)
+    remote = _remote(server)
+
+    Remote.download(remote, "http://localhost/file", Path("file"), file_out, "")
+
+    assert file_out.read_bytes() == CONTENT
+    assert not server.requested
+    assert not remote.dao.set_download_segments.called
+
+
+class EmptyFileServer(FakeServer):
+    """A range on an empty file is not satisfiable."""
+
+    def __init__(self):
+        super().__init__(b"")
+        self.headers = []
+
+    def request(self, method, path, headers=None, **kwargs):
+        self.headers.append(headers)
+        if "Range" in (headers or {}):
+            raise HTTPError(status=416)
+        return super().request(method, path, headers=headers, **kwargs)
+
+
+@pytest.mark.parametrize("size", [None, 0])
+@Options.mock()
+def test_download_empty_file(tmp_path, size):
+    """Empty files are not probed when their size is known, else the probe error is ignored."""
+    file_out = tmp_path / "file.tmp"
+    server = EmptyFileServer()
+    remote = _remote(server)
+
+    Remote.download(
+        remote, "http://localhost/file", Path("file"), file_out, "", size=size
+    )
+
+    assert file_out.read_bytes() == b""
+    assert len(server.headers) == (1 if size == 0 else 2)
+    assert "Range" not in (server.headers[-1] or {})
+
+
+@pytest.mark.parametrize("tmp_file_limit", [0.0, 100.0])
+@Options.mock()
+def test_download_digests(tmp_path, tmp_file_limit):
+    """The file integrity is checked and the digests are set without reading the file."""
+    Options.set("download_segment_threads", 1, setter="manual")
+    Options.set("tmp_file_limit", tmp_file_limit, setter="manual")
+    file_out = tmp_path / "file.tmp"
+    remote = _remote(FakeServer(CONTENT))
+    digests = {"md5": "", "sha1": ""}
+
+    Remote.download(
+        remote,
+        "http://localhost/file",
+        Path("file"),
+        file_out,
+        md5(CONTENT).hexdigest(),
+        digests=digests,
+    )
+
+    assert file_out.read_bytes() == CONTENT
+    assert digests["md5"] == md5(CONTENT).hexdigest()
+    assert digests["sha1"] == sha1(CONTENT).hexdigest()
+
+
+@Options.mock()
+def test_download_resume_digests(tmp_path):
+    """A resumed download only reads the bytes already stored to compute digests."""
+    Options.set("download_segment_threads", 1, setter="manual")
+    Options.set("tmp_file_limit", 1.0, setter="manual")
+    file_out = tmp_path / "file.tmp"
+    file_out.write_bytes(CONTENT[: SEGMENT + 42])
+    server = FakeServer(CONTENT)
+    remote = _remote(server)
+    digests = {"md5": ""}
+
+    Remote.download(
+        remote,
+        "http://localhost/file",
+        Path("file"),
+        file_out,
+        md5(CONTENT).hexdigest(),
+        digests=digests,
+    )
+
+    assert server.requested == [(SEGMENT + 42, len(CONTENT) - 1)]
+    assert file_out.read_bytes() == CONTENT
+    assert digests["md5"] == md5(CONTENT).hexdigest()
+
+
+@pytest.mark.parametrize("tmp_file_limit", [0.0, 100.0])
+@Options.mock()
+def test_download_corrupted(tmp_path, tmp_file_limit):
+    Options.set("download_segment_threads", 1, setter="manual")
+    Options.set("tmp_file_limit", tmp_file_limit, setter="manual")
+    file_out = tmp_path / "file.tmp"
+    remote = _remote(FakeServer(CONTENT))
+    digests = {"md5": ""}
+
+    with pytest.raises(CorruptedFile):
+        Remote.download(
+            remote,
+            "http://localhost/file",
+            Path("file"),
+            file_out,
+            md5(b"something else").hexdigest(),
+            digests=digests,
+        )
+
+    # The untrustable file is removed, and digests are not set
+    assert not file_out.exists()
+    assert digests == {"md5": ""}
+
+    # Unless the check is disabled
+    Options.set("disabled_file_integrity_check", True, setter="manual")
+    Remote.download(
+        remote,
+        "http://localhost/file",
+        Path("file"),
+        file_out,
+        md5(b"something else").hexdigest(),
+        digests=digests,
+    )
+    assert file_out.read_bytes() == CONTENT
+    assert digests == {"md5": md5(CONTENT).hexdigest()}
@@ -113,14 +113,14 @@ def test_compute_digest(tmp, size, digest_func, result):
 
 
 def test_compute_digest_with_callback(tmp):
-    from nxdrive.constants import FILE_BUFFER_SIZE
+    from nxdrive.constants import DIGEST_BUFFER_SIZE
 
     folder = tmp()
     folder.mkdir()
 
     file = folder / "file.bin"
     file.touch()
-    file.write_bytes(b"0" * 4 * FILE_BUFFER_SIZE)
+    file.write_bytes(b"0" * 4 * DIGEST_BUFFER_SIZE)
 
     def callback(*_):
         nonlocal called
@@ -148,6 +148,73 @@ def test_compute_digest_error(tmp):
     assert digest == UNACCESSIBLE_HASH
 
 
+def test_compute_digests(tmp):
+    from nxdrive.constants import UNACCESSIBLE_HASH
+    from nxdrive.exceptions import UnknownDigest
+
+    folder = tmp()
+    folder.mkdir()
+    file = folder / "file.bin"
+    file.write_bytes(b"0" * 1000)
+
+    # All digests from a single read, whatever the buffer size
+    digests = nxdrive.utils.compute_digests(file, ("md5", "sha256"), buffer_size=64)
+    assert digests == {
+        "md5": "88bb69a5d5e02ec7af5f68d82feb1f1d",
+        "sha256": nxdrive.utils.compute_digest(file, "sha256"),
+    }
+
+    digests = nxdrive.utils.compute_digests(folder / "ghost", ("md5", "sha1"))
+    assert digests == {"md5": UNACCESSIBLE_HASH, "sha1": UNACCESSIBLE_HASH}
+
+    with pytest.raises(UnknownDigest):
+        nxdrive.utils.compute_digests(file, ("md5", "unknown_digest_func"))
+
+
+def test_stream_digest(tmp):
+    folder = tmp()
+    folder.mkdir()
+    file = folder / "file.bin"
+    file.write_bytes(b"0" * 1024 * 1024 * 3)
+
+    streamed = nxdrive.utils.StreamDigest("md5", "sha256", "unknown", "")
+    streamed.update_from_file(file, end=1024)
+    streamed.update_from_file(file, start=1024, end=1024 * 1024 * 2)
+    streamed.update(b"0" * 1024 * 1024)
+
+    for digest_func in ("md5", "sha256"):
+        expected = nxdrive.utils.compute_digest(file, digest_func)
+        assert streamed.hexdigest(digest_func) == expected
+    assert streamed.hexdigest("unknown") is None
+    assert list(streamed.digests()) == ["md5", "sha256"]
+
+
+def test_clone_file(tmp_path):
+    src = tmp_path / "src.bin"
+    src.write_bytes(os.urandom(1024 * 1024))
+    dst = tmp_path / "dst.bin"
+
+    how = nxdrive.utils.clone_file(src, dst)
+    assert dst.read_bytes() == src.read_bytes()
+    if nxdrive.utils.LINUX:
+        assert how in ("reflink", "copy_file_range")
+    else:
+        assert how == "copy"
+
+
+def test_clone_file_fallbacks(tmp_path):
+    src = tmp_path / "src.bin"
+    src.write_bytes(os.urandom(1024 * 1024))
+    dst = tmp_path / "dst.bin"
+    dst.write_bytes(b"previous content, longer than the new one" * 100_000)
+
+    with patch("nxdrive.utils.LINUX", new=True), patch(
+        "nxdrive.utils._clone_file_linux", return_value=False
+    ), patch("os.copy_file_range", return_value=0, create=True):
+        assert nxdrive.utils.clone_file(src, dst) == "copy"
+    assert dst.read_bytes() == src.read_bytes()
+
+
 @pytest.mark.parametrize(
     "path, pid",
     [
@@ -772,6 +839,48 @@ def is_dir():
     assert tree == expected
 
 
+def test_walk_tree(fs):
+    # "fs" is the reference to the fake file system
+    fs.create_file("/fake/file.txt", contents="abc")
+    fs.create_file("/fake/folder/sub-folder/file.txt", contents="abcdef")
+    fs.create_file("/fake/folder/.hidden.txt")
+
+    tree = list(nxdrive.utils.walk_tree(Path("/fake")))
+    assert sorted(tree) == [
+        (Path("/fake"), True, 0),
+        (Path("/fake/file.txt"), False, 3),
+        (Path("/fake/folder"), True, 0),
+        (Path("/fake/folder/sub-folder"), True, 0),
+        (Path("/fake/folder/sub-folder/file.txt"), False, 6),
+    ]
+
+    # A folder is always yielded before its children
+    paths = [path for path, *_ in tree]
+    for path in paths[1:]:
+        assert paths.index(path.parent) < paths.index(path)
+
+
+def test_walk_tree_stopped_early(tmp_path):
+    (tmp_path / "folder" / "sub-folder").mkdir(parents=True)
+    iterators = []
+    real_scandir = os.scandir
+
+    def scandir(path):
+        iterators.append(real_scandir(path))
+        return iterators[-1]
+
+    with patch("os.scandir", new=scandir):
+        walker = nxdrive.utils.walk_tree(tmp_path)
+        assert next(walker) == (tmp_path, True, 0)
+        assert next(walker) == (tmp_path / "folder", True, 0)
+        walker.close()
+
+    # Opened iterators are closed
+    assert len(iterators) == 2
+    for it in iterators:
+        assert next(it, None) is None
+
+
 @Options.mock()
 def test_if_frozen_decorator():
     @nxdrive.utils.if_frozen